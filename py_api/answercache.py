@@ -0,0 +1,182 @@
+"""
+This module provides a content-addressed cache of LLM results: generated questions and grid answers.
+
+A result is stored under a key hashing everything that determines it: the kind of call, the SHA-256 of the input
+text (a transcript, or the questions collected from a project's transcripts), the question(s) asked, the prompt
+template values read from the environment, the model and any other settings the caller passes. Changing any of
+them produces a new key, so an outdated result is never returned; unused entries simply expire after
+``ANSWER_CACHE_TTL_DAYS``.
+
+Results are stored in the ``answercache`` Mongo collection (shared by all workers and instances) or in a local
+SQLite file. Every lookup can be bypassed per call; a bypassed call still stores its fresh result. With a
+``SingleFlight``, concurrent fetches of the same key share one lookup and one LLM call.
+
+Environment:
+    - ``ANSWER_CACHE_BACKEND``: ``mongo``, ``sqlite`` or ``off`` (mongo).
+    - ``ANSWER_CACHE_TTL_DAYS``: Days an entry is kept (30).
+    - ``ANSWER_CACHE_PATH``: SQLite file of the sqlite backend (``<system temp>/uxr-answer-cache.sqlite3``).
+    - ``ANSWER_CACHE_MB``: Size limit of the sqlite backend (512).
+
+Classes:
+    - AnswerCache: Looks up and stores LLM results by key.
+
+Functions:
+    - answer_key: Builds the cache key of an LLM call.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from cache import SQLiteCache
+
+KEY_VERSION = 1
+
+
+def answer_key(kind, text, question=None, env=(), **settings):
+    """
+    Builds the cache key of an LLM call.
+
+    Args:
+        kind (str): Kind of call, e.g. ``grid`` or ``transcript_questions``.
+        text (str): Input text; only its SHA-256 goes into the key.
+        question (optional): Question or questions asked (JSON-serializable).
+        env (iterable): Names of the environment variables holding the prompt templates and model; their
+            current values go into the key.
+        **settings: Other values that change the result (e.g. number of questions, map-reduce settings).
+
+    Returns:
+        str: ``<kind>:<hex SHA-256>``.
+    """
+    payload = json.dumps({
+        "v": KEY_VERSION,
+        "kind": kind,
+        "text": hashlib.sha256((text or "").encode()).hexdigest(),
+        "question": question,
+        "env": {name: os.getenv(name) for name in env},
+        "settings": settings,
+    }, sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+class AnswerCache:
+    """
+    Looks up and stores LLM results by key.
+
+    Args:
+        collection: Async (motor) collection used by the mongo backend.
+        backend (str, optional): ``mongo``, ``sqlite`` or ``off`` (``ANSWER_CACHE_BACKEND``).
+        flights (SingleFlight, optional): Coalesces concurrent fetches of the same key, per key kind.
+    """
+    def __init__(self, collection, backend=None, flights=None):
+        self.collection = collection
+        self.flights = flights
+        self.backend = (backend or os.getenv("ANSWER_CACHE_BACKEND", "mongo")).lower()
+        if self.backend not in ("mongo", "sqlite", "off"):
+            raise RuntimeError(f"Unknown ANSWER_CACHE_BACKEND: {self.backend}")
+        self.ttl = float(os.getenv("ANSWER_CACHE_TTL_DAYS", 30)) * 86400
+        self.store = None
+        if self.backend == "sqlite":
+            path = os.getenv("ANSWER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "uxr-answer-cache.sqlite3"))
+            self.store = SQLiteCache(path, "answers", int(os.getenv("ANSWER_CACHE_MB", 512)) * 2 ** 20, default_ttl=self.ttl)
+        self.lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "bypassed": 0, "errors": 0,
+                         "saved_calls": 0, "saved_tokens": 0}
+
+    async def start(self):
+        """
+        Creates the TTL index of the mongo backend.
+        """
+        if self.backend != "mongo":
+            return
+        try:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            print(f"Answer cache TTL index not created: {e}")
+
+    async def fetch(self, key, produce, bypass=False):
+        """
+        Returns the result stored under ``key``, producing and storing it if needed.
+
+        Args:
+            key (str): Key from ``answer_key``.
+            produce (callable): Coroutine function returning ``(result, usage)``: the JSON-serializable result
+                and the LLM ``calls`` and prompt ``tokens`` it took, counted as saved on later hits.
+            bypass (bool, optional): Skip the lookup and refresh the stored result.
+
+        Returns:
+            The result, shared with concurrent fetches of the same key. Results read from the cache went through
+            JSON, so dictionary keys are strings.
+        """
+        if self.flights is None:
+            return await self._fetch(key, produce, bypass)
+        # Refreshes are coalesced among themselves only, so they never return a result read from the cache.
+        namespace = key.split(":", 1)[0] + ("_refresh" if bypass else "")
+        return await self.flights.do(namespace, key, lambda: self._fetch(key, produce, bypass))
+
+    async def _fetch(self, key, produce, bypass):
+        if self.backend == "off":
+            result, _ = await produce()
+            return result
+        if bypass:
+            self._count("bypassed")
+        else:
+            self._count("lookups")
+            entry = await self._get(key)
+            if entry is not None:
+                self._count("hits", entry.get("calls", 1), entry.get("tokens", 0))
+                return json.loads(entry["result"])
+            self._count("misses")
+
+        result, usage = await produce()
+        entry = {"result": json.dumps(result, default=str), "tokens": usage.get("tokens", 0), "calls": usage.get("calls", 1)}
+        try:
+            await self._set(key, entry)
+        except Exception as e:
+            # A result that cannot be stored is still returned.
+            self._count("errors")
+            print(f"Answer cache entry {key} not stored: {e}")
+        return result
+
+    def stats(self):
+        """
+        Returns the lookup counters, the hit rate and the LLM calls and tokens saved by hits.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        counters["backend"] = self.backend
+        counters["hit_rate"] = round(counters["hits"] / counters["lookups"], 3) if counters["lookups"] else 0.0
+        return counters
+
+    def _count(self, name, calls=0, tokens=0):
+        with self.lock:
+            self.counters[name] += 1
+            self.counters["saved_calls"] += calls
+            self.counters["saved_tokens"] += tokens
+
+    async def _get(self, key):
+        try:
+            if self.store is not None:
+                return await asyncio.to_thread(self.store.get, key)
+            entry = await self.collection.find_one_and_update(
+                {"_id": key, "expires_at": {"$gt": datetime.utcnow()}},
+                {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}}
+            )
+            return entry
+        except Exception as e:
+            self._count("errors")
+            print(f"Answer cache lookup failed: {e}")
+            return None
+
+    async def _set(self, key, entry):
+        if self.store is not None:
+            await asyncio.to_thread(self.store.set, key, entry)
+            return
+        now = datetime.utcnow()
+        await self.collection.replace_one({"_id": key}, {
+            **entry, "hits": 0, "created_at": now, "expires_at": now + timedelta(seconds=self.ttl),
+        }, upsert=True)
@@ -6,10 +6,16 @@ getting answers to questions, and handling chat sessions with context from trans
 
 Modules:
     - process_file: Process a file by extracting its transcript.
+    - submit_transcription_job / get_job_status / get_job_result: Run transcriptions as background jobs.
+    - metrics: Runtime counters of the shared components.
+    - generate_transcript_questions: Generate the questions asked in a transcript.
     - generate_questions: Generate questions based on project transcripts.
     - get_answer: Get an answer to a question based on project transcripts.
     - get_single_answer: Get an answer to a question based on a single transcript.
     - get_all_answer_single_transcript_grid: Get answers to multiple questions based on a single transcript in a grid format.
+    - get_answer_grid: Stream answers to multiple questions for many transcripts as NDJSON.
+    - build_transcript_artifacts: Build the derived artifacts of a transcript (turns, summary, chunks).
+    - get_transcript_turns: Get the speaker turns of a transcript in a time range, with their text positions.
     - chat: Handle a chat session by generating responses based on chat history and context.
 
 Error Codes:
@@ -21,6 +27,9 @@ Error Codes:
     705: Cannot find Transcript ID.
     706: Transcript text is empty.
     707: Cannot find session ID.
+    708: Cannot find job ID.
+    709: Job has not finished yet.
+    710: No speaker turns stored for the transcript.
     300: Failed to extract text from PDF.
     301: Failed to extract text from DOCX.
     302: Failed to read TXT file.
@@ -28,10 +37,14 @@ Error Codes:
     304: Diarized transcript not found in the API response.
     305: Failed to transcribe audio.
     306: Unsupported file type.
+    307: Scratch space quota exhausted.
     400: Failed to generate questions from LLM.
     401: Failed to generate answers from LLM.
     402: Failed to generate answers from LLM in chat.
     403: Failed to stream chat.
+    404: Failed to summarize chat history.
+    405: Failed to embed text.
+    406: Failed to summarize transcript.
     600: Couldn't download file from S3 link.
     601: Failed to start transcription job.
     602: Transcription job failed.
@@ -39,8 +52,9 @@ Error Codes:
 """
 
 import os
-import threading
-import uuid
+import json
+import time
+import asyncio
 
 from bson import ObjectId
 from dotenv import load_dotenv
@@ -51,47 +65,54 @@ from fastapi.responses import StreamingResponse
 
 from utils import *
 from init import *
+from extraction import shutdown_extraction_pool
+from s3upload import stream_url_to_s3_async
+from scratch import ScratchSpace, MEDIA_SIZE_FACTOR
+from dedup import TranscriptStore, content_key
+from chatlog import ChatTurnWriter, turn_update
+from chatstream import ChatStreamer
+from context import ContextWindow, group_turns, count_tokens
+from retrieval import RetrievalIndex, format_passages
+from embeddings import make_embedder
+from grid import GridRunner
+from answercache import AnswerCache, answer_key
+from singleflight import SingleFlight
+from questionagg import QuestionAggregator, top_clusters, format_clusters
+from artifacts import TranscriptArtifacts
+from transcript import Transcript, TranscriptTurns
+from jobs import TranscriptionJobManager, job_to_dict, JOB_QUEUED, JOB_COMPLETED, JOB_FAILED
 load_dotenv()
 
-db, client, app, s3 = init_classes()
-MAX_CHAT_HISTORY_SAVE_LENGTH, CHAT_SESSION_CACHE_DICT, CHAT_TRANSCRIPT_CACHE_DICT = init_cache()
-
-cleanup_thread = threading.Thread(target=cleanup_cache, args=(CHAT_SESSION_CACHE_DICT, CHAT_TRANSCRIPT_CACHE_DICT), daemon=True)
-cleanup_thread.start()
+db, client, app, s3, http_client = init_classes()
+MAX_CHAT_HISTORY_SAVE_LENGTH, CHAT_SESSION_CACHE, CHAT_TRANSCRIPT_CACHE = init_cache()
 
 @app.post("/upload-s3file-to-s3bucket/{session_id}")
 async def upload_s3file_to_s3bucket(session_id: str, request: s3Upload):
-    TEMP_DIR = './temp/'
+    """
+    Copy a bot recording from a presigned URL into the S3 bucket.
+
+    The response body is streamed straight into an S3 multipart upload, so the recording is never written to
+    disk and the event loop is not blocked while it is transferred.
+
+    Args:
+        session_id (str): Session the recording belongs to.
+        request (s3Upload): Presigned URL of the recording and the destination key.
+
+    Returns:
+        str: S3 URL of the uploaded recording.
+
+    Raises:
+        HTTPException: If the file type is unsupported or the transfer fails.
+    """
     S3_BUCKET = 'papyrus-ml-mvp1-uxr'
-    os.makedirs(TEMP_DIR, exist_ok=True)
 
     file_extension = str(request.bot_url).split("?")[0].split(".")[-1].lower()
 
     if os.path.splitext(request.s3_file_path)[1] != '' and file_extension in ["mp3", "mp4", "wav"]:
-
-        unique_id = uuid.uuid4().hex
-        local_filename = os.path.basename(request.bot_url.split("?")[0])
-        local_file_path = os.path.join(TEMP_DIR, f"{unique_id}_{local_filename}")
-
         try:
-            response = requests.get(request.bot_url, stream=True)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=501,
-                    detail="Failed to download file from presigned URL",
-                )
-
-            with open(local_file_path, "wb") as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
-
-            with open(local_file_path, "rb") as file:
-                s3.upload_fileobj(file, S3_BUCKET, request.s3_file_path)
+            await stream_url_to_s3_async(request.bot_url, s3, S3_BUCKET, request.s3_file_path, http_client)
         except Exception as e:
-            raise HTTPException(status_code=501, detail=f"Error processing bot url to s3 with message: {str(e)}")
-        finally:
-            if os.path.exists(local_file_path):
-                os.remove(local_file_path)
+            raise HTTPException(status_code=501, detail=f"Error processing bot url to s3 with message: {getattr(e, 'detail', str(e))}")
         s3_path = f"s3://{S3_BUCKET}/{request.s3_file_path}"
         return s3_path
     else:
@@ -100,11 +121,147 @@ async def upload_s3file_to_s3bucket(session_id: str, request: s3Upload):
                 detail="Unsupported file type or s3 save path is not a file path",
             )
 
+ALLOWED_FILE_TYPES = ["mp3", "mp4", "wav", "pdf", "docx", "txt"]
+# Environment variables changing how Sarvam transcribes a recording (streaming, chunking, silence detection); their
+# values are part of the transcript store keys, next to the normalization settings.
+SARVAM_TRANSCRIBE_ENV = ("SARVAM_STREAMING", "SARVAM_CHUNKED", "SARVAM_CHUNK_SECONDS", "SARVAM_CHUNK_OVERLAP",
+                         "SARVAM_SILENCE_DB", "SARVAM_SILENCE_SECONDS")
+# Environment variables holding the question prompts and models; their values are part of the answer cache keys.
+QUESTION_ENV = ("QUESTION_PROMPT", "QUESTION_PROMPT_FORMAT", "QUESTION_PROMPT_ROLE", "QUESTION_MODEL", "QUESTION_MAX_TOKENS")
+QUESTION_AGG_ENV = ("QUESTION_AGG_PROMPT", "QUESTION_AGG_PROMPT_FORMAT", "QUESTION_AGG_PROMPT_ROLE", "QUESTION_AGG_MODEL",
+                    "QUESTION_AGG_MAX_TOKENS")
+
+def check_file_type(url):
+    """
+    Returns the file extension of ``url`` or raises if the file type is not supported.
+    """
+    file_extension = str(url).split(".")[-1].lower()
+    if file_extension not in ALLOWED_FILE_TYPES:
+        raise HTTPException(status_code=306, detail=f"Unsupported file type. Allowed types: {', '.join(ALLOWED_FILE_TYPES)}")
+    return file_extension
+
+async def run_transcription(transcript_id: str, request: dict):
+    """
+    Extracts the transcript of a file based on the file type and method specified in the request.
+
+    Identical media with the same transcription parameters (method, language, speakers and the normalization and
+    chunking settings) is transcribed once: the result is kept in the
+    ``transcriptcache`` collection and concurrent requests for the same content share one run. The speaker
+    turns of audio transcripts are stored in the ``transcriptturns`` collection. The transcript is added to the
+    loaded retrieval indexes of the projects it belongs to, and its artifacts are built in the background.
+
+    Args:
+        transcript_id (str): Transcript the file belongs to.
+        request (dict): Serialized ``transcribeCall``.
+
+    Returns:
+        str: The extracted transcript.
+    """
+    request = transcribeCall(**request)
+    file_extension = check_file_type(request.url)
+    if not transcript_store.enabled:
+        transcript = await transcribe_request(request, file_extension)
+    else:
+        if file_extension in ["mp3", "mp4", "wav"]:
+            params = {"method": request.transcribe_method, "lang": request.transcribe_lang, "speakers": request.transcribe_speaker_number}
+            # A transcript made with other normalization or chunking settings is not reused.
+            method = 'aws' if request.transcribe_method == 'aws' else 'sarvam'
+            params["audio"] = list(audio_settings(method))
+            if method == 'sarvam':
+                params["settings"] = {name: os.getenv(name) for name in SARVAM_TRANSCRIBE_ENV}
+        else:
+            params = {"method": "extract"}
+        fingerprint = await asyncio.to_thread(media_fingerprint, request.url)
+        key = content_key(fingerprint, **params)
+        transcript = await transcript_store.fetch(key, lambda: transcribe_stored(request, file_extension))
+        if isinstance(transcript, dict):
+            transcript = Transcript.from_document(transcript)
+
+    turns = None
+    if isinstance(transcript, Transcript):
+        turns = transcript
+        try:
+            await transcript_turns.save(transcript_id, turns)
+        except Exception as e:
+            print(f"Speaker turns of transcript {transcript_id} not stored: {e}")
+        transcript = await asyncio.to_thread(turns.to_text)
+
+    try:
+        await retrieval_index.ingest(transcript_id, transcript)
+    except Exception as e:
+        print(f"Transcript {transcript_id} not added to the retrieval index: {e}")
+    transcript_artifacts.schedule(transcript_id, transcript, turns)
+    return transcript
+
+async def transcribe_request(request: transcribeCall, file_extension: str):
+    """
+    Transcribes or extracts the text of a file, without looking at the transcript store.
+
+    Args:
+        request (transcribeCall): The transcription request.
+        file_extension (str): Checked extension of the file.
+
+    Returns:
+        Transcript | str: The speaker turns of audio, the text of documents.
+    """
+    # The transcription and extraction helpers are blocking (boto3, requests, ffmpeg), so they run in a worker thread.
+    if file_extension in ["mp3", "mp4", "wav"] and request.transcribe_method == 'aws':
+        transcript = await asyncio.to_thread(transcribe_aws, request.url, file_extension, request.transcribe_lang, request.transcribe_speaker_number)
+    elif file_extension in ["mp3", "mp4", "wav"] and os.getenv('SARVAM_STREAMING', 'on') != 'off':
+        transcript = await asyncio.to_thread(transcribe_s3_sarvam_streaming, request.url, file_extension, request.transcribe_lang)
+    else:
+        # Each request downloads into its own scratch session, which is removed however the request ends.
+        with scratch_space.session() as scratch:
+            size = await asyncio.to_thread(s3_object_size, request.url)
+            await scratch.reserve(size * (MEDIA_SIZE_FACTOR if file_extension in ['mp4', "mp3", "wav"] else 1))
+            temp_file_path = await asyncio.to_thread(s3_to_temp, request.url, scratch)
+            if file_extension == "pdf":
+                transcript = await asyncio.to_thread(extract_text_from_pdf, temp_file_path)
+            elif file_extension == "docx":
+                transcript = await asyncio.to_thread(extract_text_from_docx, temp_file_path)
+            elif file_extension == "txt":
+                transcript = await asyncio.to_thread(extract_text_from_txt, temp_file_path)
+            elif file_extension in ['mp4', "mp3", "wav"]:
+                transcript = await asyncio.to_thread(transcribe_audio_sarvam, temp_file_path, file_extension, request.transcribe_lang)
+    return transcript
+
+async def transcribe_stored(request: transcribeCall, file_extension: str):
+    """
+    ``transcribe_request`` for the transcript store, which keeps speaker turns as their compact document.
+    """
+    transcript = await transcribe_request(request, file_extension)
+    return transcript.to_document() if isinstance(transcript, Transcript) else transcript
+
+scratch_space = ScratchSpace()
+transcript_store = TranscriptStore(db.transcriptcache)
+transcription_jobs = TranscriptionJobManager(db.transcriptionjobs, run_transcription, http_client)
+app.add_event_handler("startup", transcription_jobs.start)
+app.add_event_handler("shutdown", transcription_jobs.stop)
+app.add_event_handler("shutdown", shutdown_extraction_pool)
+chat_writer = ChatTurnWriter(db.chatsessions)
+context_window = ContextWindow(client)
+retrieval_index = RetrievalIndex(db, embedder=make_embedder(client))
+single_flight = SingleFlight()
+answer_cache = AnswerCache(db.answercache, flights=single_flight)
+question_aggregator = QuestionAggregator(db.questionaggregates)
+grid_runner = GridRunner(client, cache=answer_cache)
+transcript_turns = TranscriptTurns(db.transcriptturns)
+transcript_artifacts = TranscriptArtifacts(db.transcriptartifacts, client, turns=transcript_turns)
+chat_streamer = ChatStreamer()
+summary_tasks = {}
+chat_saves = {}
+app.add_event_handler("startup", answer_cache.start)
+app.add_event_handler("startup", chat_writer.start)
+app.add_event_handler("shutdown", chat_writer.stop)
+
 @app.post("/transcribe-file/{transcript_id}")
 async def process_file(transcript_id: str, request: transcribeCall):
     """
     Process a file by extracting its transcript based on the file type and method specified in the request.
 
+    The work runs on the background job pool; this endpoint waits for the job and returns its result.
+    Use ``/jobs/transcribe-file/{transcript_id}`` to get a job id back immediately instead.
+
     Args:
         request (FileProcessing): The request object containing the file URL, method, and transcription language.
 
@@ -114,49 +271,187 @@ async def process_file(transcript_id: str, request: transcribeCall):
     Raises:
         HTTPException: If the file type is unsupported or if there is an error during transcription.
     """
-    allowed_types = ["mp3", "mp4", "wav", "pdf", "docx", "txt"]
-    file_extension = str(request.url).split(".")[-1].lower()
-    if file_extension not in allowed_types:
-        raise HTTPException(status_code=306, detail=f"Unsupported file type. Allowed types: {', '.join(allowed_types)}")
-    
-    if file_extension in ["mp3", "mp4", "wav"] and request.transcribe_method == 'aws':
-        transcript = transcribe_aws(request.url, file_extension, request.transcribe_lang, request.transcribe_speaker_number)
-    else:
-        temp_file_path = s3_to_temp(request.url)
-        if file_extension == "pdf":
-            transcript = extract_text_from_pdf(temp_file_path)
-        elif file_extension == "docx":
-            transcript = extract_text_from_docx(temp_file_path)
-        elif file_extension == "txt":
-            transcript = extract_text_from_txt(temp_file_path)
-        elif file_extension in ['mp4', "mp3", "wav"]:
-            transcript = transcribe_audio_sarvam(temp_file_path, file_extension, request.transcribe_lang)
-    
-    return {"transcript": transcript}
+    check_file_type(request.url)
+    job_id = await transcription_jobs.submit(transcript_id, request.model_dump(), request.callback_url)
+    job = await transcription_jobs.wait(job_id)
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+    if job["status"] != JOB_COMPLETED:
+        raise HTTPException(status_code=709, detail=f"Job {job_id} is still {job['status']}")
+    return job["result"]
+
+@app.post("/jobs/transcribe-file/{transcript_id}", status_code=202)
+async def submit_transcription_job(transcript_id: str, request: transcribeCall):
+    """
+    Queue a transcription job and return its id without waiting for the transcription.
+
+    Args:
+        transcript_id (str): Transcript the file belongs to.
+        request (transcribeCall): The transcription request. ``callback_url`` receives the job once it finishes.
+
+    Returns:
+        dict: The job id and its status.
+    """
+    check_file_type(request.url)
+    job_id = await transcription_jobs.submit(transcript_id, request.model_dump(), request.callback_url)
+    return {"job_id": job_id, "status": JOB_QUEUED}
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """
+    Get the status of a transcription job.
+
+    Raises:
+        HTTPException: If the job does not exist.
+    """
+    job = await transcription_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=708, detail=f"Cannot find job ID: {job_id}")
+    return job_to_dict(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Get the result of a finished transcription job.
+
+    Raises:
+        HTTPException: If the job does not exist, is not finished yet, or failed.
+    """
+    job = await transcription_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=708, detail=f"Cannot find job ID: {job_id}")
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+    if job["status"] != JOB_COMPLETED:
+        raise HTTPException(status_code=709, detail=f"Job {job_id} is still {job['status']}")
+    return job_to_dict(job, include_result=True)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Get runtime counters of the shared components (pollers, caches, queues).
+    """
+    return {
+        "transcribe_poller": transcribe_poller.stats(),
+        "audio_normalization": normalization_stats.snapshot(),
+        "transcript_dedup": transcript_store.stats(),
+        "scratch_space": scratch_space.stats(),
+        "chat_session_cache": await asyncio.to_thread(CHAT_SESSION_CACHE.stats),
+        "chat_transcript_cache": await asyncio.to_thread(CHAT_TRANSCRIPT_CACHE.stats),
+        "chat_writes": chat_writer.stats(),
+        "chat_stream": chat_streamer.stats(),
+        "chat_context": context_window.stats(),
+        "retrieval": retrieval_index.stats(),
+        "grid": grid_runner.stats(),
+        "answer_cache": answer_cache.stats(),
+        "question_aggregates": question_aggregator.stats(),
+        "single_flight": single_flight.stats(),
+        "transcript_artifacts": transcript_artifacts.stats(),
+        "transcript_turns": transcript_turns.stats(),
+        "llm": client.stats(),
+    }
+
+@app.post("/transcript-artifacts/{transcript_id}")
+async def build_transcript_artifacts(transcript_id: str, force: bool = False):
+    """
+    Build the derived artifacts of a transcript, or return the stored ones if they are still fresh.
+
+    Artifacts are built after every transcription; this endpoint builds them for transcripts added another way
+    and rebuilds them on demand.
+
+    Args:
+        transcript_id (str): The transcript ID.
+        force (bool, optional): Build them again even if the stored ones are fresh.
+
+    Returns:
+        dict: The summary, token counts and speaker statistics, and the number of turns and chunks.
+
+    Raises:
+        HTTPException: If the transcript cannot be found or is empty.
+    """
+    transcript = await transcript_text(transcript_id)
+    if not transcript:
+        raise HTTPException(status_code=706, detail=f"Transcript ID: {transcript_id} Empty")
+    artifacts = await transcript_artifacts.build(transcript_id, transcript, force=force)
+    return {
+        "version": artifacts["version"],
+        "tokens": artifacts["tokens"],
+        "summary": artifacts["summary"],
+        "summary_kind": artifacts["summary_kind"],
+        "speaker_stats": artifacts["speaker_stats"],
+        "turns": len(artifacts["turns"]["start"]),
+        "chunks": len(artifacts["chunks"]),
+    }
+
+@app.get("/transcript-turns/{transcript_id}")
+async def get_transcript_turns(transcript_id: str, start_ms: int = 0, end_ms: int = None):
+    """
+    Get the speaker turns of a transcript in a time range, e.g. to cite the moment of a quote.
+
+    Args:
+        transcript_id (str): The transcript ID.
+        start_ms (int, optional): Start of the range in milliseconds.
+        end_ms (int, optional): End of the range in milliseconds (the end of the recording).
+
+    Returns:
+        dict: The speakers and duration of the transcript, and the turns overlapping the range with their
+        speaker, times, text and ``start``/``end`` position in the transcript text.
+
+    Raises:
+        HTTPException: If no turns are stored for the transcript (documents, transcripts made before turns
+            were stored).
+    """
+    turns = await transcript_turns.load(transcript_id)
+    if turns is None:
+        raise HTTPException(status_code=710, detail=f"No speaker turns stored for Transcript ID: {transcript_id}")
+    if end_ms is None:
+        end_ms = turns.duration_ms + 1
+    indexes = turns.between(start_ms, end_ms)
+    spans = await asyncio.to_thread(turns.spans) if indexes else []
+    items = []
+    for index in indexes:
+        speaker, turn_start, turn_end, text = turns[index]
+        items.append({"speaker": speaker, "start_ms": turn_start, "end_ms": turn_end, "text": text,
+                      "start": spans[index][0], "end": spans[index][1]})
+    return {"speakers": turns.speakers, "duration_ms": turns.duration_ms, "turns": items}
 
 @app.post("/generate-transcript-questions/{transcript_id}")
-async def generate_transcript_questions(transcript_id: str):
-    try:
-        transcript = db.transcripts.find_one({"_id": ObjectId(transcript_id)})
-    except Exception as e:
-        raise HTTPException(status_code=705, detail=f"Cannot find transcript ID: {transcript_id}")
-    
-    try:
-        transcript = transcript.get("text")
-    except Exception as e:
+async def generate_transcript_questions(transcript_id: str, no_cache: bool = False):
+    """
+    Generate the questions asked in a transcript.
+
+    Results are cached by transcript text, prompt and model; ``no_cache`` asks the LLM again.
+
+    Args:
+        transcript_id (str): The transcript ID.
+        no_cache (bool, optional): Bypass the answer cache.
+
+    Returns:
+        dict: A dictionary containing the generated questions.
+
+    Raises:
+        HTTPException: If the transcript cannot be found or the questions cannot be generated.
+    """
+    transcript = await transcript_text(transcript_id)
+    if transcript is None:
         raise HTTPException(status_code=706, detail=f"Transcript ID: {transcript_id} Empty")
     
     try:
         transcript = transcript.replace('"', '\"').replace("'", "\'")
         prompt = f"Question to be answered: {os.getenv('QUESTION_PROMPT')} \n\n Answer Format Rules: {os.getenv('QUESTION_PROMPT_FORMAT')} \n\n Transcript as context: {transcript}"
 
-        response = client.chat.completions.create(
-            model=os.getenv("QUESTION_MODEL"),
-            messages=[{"role": os.getenv("QUESTION_PROMPT_ROLE"), "content": prompt}],
-            max_tokens=int(os.getenv("QUESTION_MAX_TOKENS")),
-            n=1
-        )
-        generated_questions = eval(response.choices[0].message.content.strip())
+        async def produce():
+            response = await client.chat.completions.create(
+                model=os.getenv("QUESTION_MODEL"),
+                messages=[{"role": os.getenv("QUESTION_PROMPT_ROLE"), "content": prompt}],
+                max_tokens=int(os.getenv("QUESTION_MAX_TOKENS")),
+                n=1
+            )
+            usage = {"calls": 1, "tokens": await asyncio.to_thread(count_tokens, prompt, os.getenv("QUESTION_MODEL"))}
+            return eval(response.choices[0].message.content.strip()), usage
+
+        key = answer_key("transcript_questions", transcript, env=QUESTION_ENV)
+        generated_questions = await answer_cache.fetch(key, produce, bypass=no_cache)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to generate questions from LLM with error: {e}")
     return {'questions': generated_questions}
@@ -166,8 +461,12 @@ async def generate_questions(project_id:str, request: generateQuestions):
     """
     Generate questions based on the transcripts associated with a project.
 
+    The transcripts' questions are read with one query and merged into the project's de-duplicated question
+    aggregate (only new or changed transcripts are merged). The most asked questions are sent to the LLM, and
+    the result is cached by those questions, ``num_q``, prompt and model; ``no_cache`` asks the LLM again.
+
     Args:
-        request (ProjectIDRequest): The request object containing the project ID.
+        request (generateQuestions): The number of questions and the cache bypass flag.
 
     Returns:
         dict: A dictionary containing the generated questions.
@@ -175,41 +474,52 @@ async def generate_questions(project_id:str, request: generateQuestions):
     Raises:
         HTTPException: If there is an error finding the project, transcripts, or generating questions.
     """
-    try:
-        project = db.projects.find_one({"_id": ObjectId(project_id)})
-    except Exception as e:
-        raise HTTPException(status_code=700, detail=f"Cannot find project ID: {project_id}")
+    async def collect_clusters():
+        try:
+            project = await db.projects.find_one({"_id": ObjectId(project_id)}, {"transcripts": 1})
+        except Exception as e:
+            project = None
+        if project is None:
+            raise HTTPException(status_code=700, detail=f"Cannot find project ID: {project_id}")
 
-    try:
-        transcript_ids = project.get("transcripts", [])
-    except Exception as e:
-        raise HTTPException(status_code=701, detail="No transcripts found for the project")
+        try:
+            transcript_ids = [ObjectId(tid) for tid in project.get("transcripts", [])]
+        except Exception as e:
+            raise HTTPException(status_code=701, detail="No transcripts found for the project")
 
-    all_transcripts_questions = ""
-    for i, transcript_id in enumerate(transcript_ids):
         try:
-            transcript = db.transcripts.find_one({"_id": ObjectId(transcript_id)})
+            found = await db.transcripts.find({"_id": {"$in": transcript_ids}}, {"questions": 1}).to_list(length=None)
         except Exception as e:
-            raise HTTPException(status_code=702, detail=f"Error finding transcript {transcript_id}: {str(e)}")
-        
+            raise HTTPException(status_code=702, detail=f"Error finding transcripts: {str(e)}")
+
         try:
-            file_ques = transcript.get("questions")
-            all_transcripts_questions += f"Transcript {i} \n Questions asked in transcript: {file_ques})\n\n"
+            return top_clusters(await question_aggregator.update(
+                project_id, {str(t["_id"]): t.get("questions") for t in found if t.get("questions")}
+            ))
         except Exception as e:
-            raise HTTPException(status_code=703, detail=f"Error processing transcript {transcript_id}: {str(e)}")
+            raise HTTPException(status_code=703, detail=f"Error processing transcript questions: {str(e)}")
+
+    # Researchers opening the same project at once share the reads and the aggregate update.
+    clusters = await single_flight.do("project_question_clusters", project_id, collect_clusters)
+    if not clusters:
+        raise HTTPException(status_code=704, detail="No valid content found in transcripts")
 
-    if not all_transcripts_questions:
-        raise HTTPException(status_code=704, detail="No valid content found in transcripts") 
-    
     try:
-        prompt = "\n\n".join([os.getenv("QUESTION_AGG_PROMPT").replace('<n>', str(request.num_q)), os.getenv("QUESTION_AGG_PROMPT_FORMAT"), all_transcripts_questions])
-        response = client.chat.completions.create(
-            model=os.getenv("QUESTION_AGG_MODEL"),
-            messages=[{"role": os.getenv("QUESTION_AGG_PROMPT_ROLE"), "content": prompt}],
-            max_tokens=int(os.getenv("QUESTION_AGG_MAX_TOKENS")),
-            n=1
-        )
-        generated_questions = eval(response.choices[0].message.content.strip())
+        prompt = "\n\n".join([os.getenv("QUESTION_AGG_PROMPT").replace('<n>', str(request.num_q)), os.getenv("QUESTION_AGG_PROMPT_FORMAT"), format_clusters(clusters)])
+
+        async def produce():
+            response = await client.chat.completions.create(
+                model=os.getenv("QUESTION_AGG_MODEL"),
+                messages=[{"role": os.getenv("QUESTION_AGG_PROMPT_ROLE"), "content": prompt}],
+                max_tokens=int(os.getenv("QUESTION_AGG_MAX_TOKENS")),
+                n=1
+            )
+            usage = {"calls": 1, "tokens": await asyncio.to_thread(count_tokens, prompt, os.getenv("QUESTION_AGG_MODEL"))}
+            return eval(response.choices[0].message.content.strip()), usage
+
+        # Keyed by the context exactly as the prompt shows it (questions and their counts).
+        key = answer_key("project_questions", format_clusters(clusters), env=QUESTION_AGG_ENV, num_q=request.num_q)
+        generated_questions = await answer_cache.fetch(key, produce, bypass=request.no_cache)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to generate questions from LLM with error: {e}")
     return generated_questions
@@ -228,41 +538,174 @@ async def get_answer(transcript_id:str, request: QuestionSingleRequestGrid):
     Raises:
         HTTPException: If there is an error finding the transcript or generating the answers.
     """
+    text = await transcript_text(transcript_id)
+    if text is None:
+        raise HTTPException(status_code=706, detail="Transcript text is empty")
+
+    answer = await grid_runner.answer(text, request.question, bypass_cache=request.no_cache)
+    return answer
+
+@app.post("/get-all-answer-grid")
+async def get_answer_grid(request: QuestionGridRequest):
+    """
+    Get answers to multiple questions for many transcripts, streamed cell by cell as NDJSON.
+
+    The transcripts are the given ``transcript_ids``, or those of ``project_id``. Their texts are read with one
+    query and the LLM calls run concurrently, within the shared ``GRID_CONCURRENCY`` and ``GRID_RATE_LIMIT``
+    limits, and answers already in the answer cache are not asked again unless ``no_cache`` is set. Every line of the response is one JSON object:
+
+        - ``{"transcript_id", "question_id", "answer"}`` for an answered cell
+        - ``{"transcript_id", "question_id", "error": {"status_code", "detail"}}`` for a cell that failed
+          (705 missing transcript, 706 empty transcript, 401 LLM failure)
+        - ``{"done": true, "cells", "answered", "failed", "seconds"}`` last
+
+    Args:
+        request (QuestionGridRequest): The questions and the project or transcripts.
+
+    Returns:
+        StreamingResponse: The cells, as they complete.
+
+    Raises:
+        HTTPException: If the project cannot be found or has no transcripts.
+    """
+    started = time.perf_counter()
+    transcript_ids = request.transcript_ids
+    if not transcript_ids:
+        try:
+            project = await db.projects.find_one({"_id": ObjectId(request.project_id)}, {"transcripts": 1})
+        except Exception as e:
+            project = None
+        if project is None:
+            raise HTTPException(status_code=700, detail=f"Cannot find project ID: {request.project_id}")
+        transcript_ids = [str(tid) for tid in project.get("transcripts", [])]
+        if not transcript_ids:
+            raise HTTPException(status_code=701, detail="No transcripts found for the project")
+
     try:
-        transcript = db.transcripts.find_one({"_id": ObjectId(transcript_id)})
+        found = await db.transcripts.find(
+            {"_id": {"$in": [ObjectId(tid) for tid in transcript_ids]}}, {"text": 1}
+        ).to_list(length=None)
     except Exception as e:
-        raise HTTPException(status_code=705, detail=f"Cannot find Transcript ID: {transcript_id}")
+        raise HTTPException(status_code=705, detail=f"Cannot find Transcript IDs: {transcript_ids}")
+    texts = {str(t["_id"]): t.get("text") for t in found}
+
+    def failed_cells(transcript_id, status_code, detail):
+        return [{"transcript_id": transcript_id, "question_id": str(qid), "error": {"status_code": status_code, "detail": detail}}
+                for qid in request.question]
+
+    async def stream_cells():
+        cells = answered = 0
+        for tid in transcript_ids:
+            if tid not in texts:
+                lines = failed_cells(tid, 705, f"Cannot find Transcript ID: {tid}")
+            elif not texts[tid]:
+                lines = failed_cells(tid, 706, "Transcript text is empty")
+            else:
+                continue
+            cells += len(lines)
+            yield "".join(json.dumps(line) + "\n" for line in lines)
+        async for cell in grid_runner.run([(tid, texts[tid]) for tid in transcript_ids if texts.get(tid)], request.question,
+                                         bypass_cache=request.no_cache):
+            cells += 1
+            answered += "answer" in cell
+            yield json.dumps(cell, default=str) + "\n"
+        yield json.dumps({"done": True, "cells": cells, "answered": answered, "failed": cells - answered,
+                          "seconds": round(time.perf_counter() - started, 3)}) + "\n"
+
+    return StreamingResponse(stream_cells(), media_type="application/x-ndjson")
+
+async def chat_transcript_texts(transcript_ids):
+    """
+    Returns the texts of the given transcripts, in order, from the chat transcript cache or Mongo.
+
+    Args:
+        transcript_ids (list): Transcript ids (``str`` or ``ObjectId``).
+
+    Returns:
+        list: The texts of the transcripts that exist.
+
+    Raises:
+        HTTPException: If the transcripts cannot be looked up.
+    """
+    # Texts are cached and read back keyed by the string id, so ObjectIds from chat sessions are converted first.
+    transcript_ids = [str(tid) for tid in transcript_ids]
+    texts = {}
+    for tid in transcript_ids:
+        cached = await asyncio.to_thread(CHAT_TRANSCRIPT_CACHE.get, tid)
+        if cached is not None:
+            texts[tid] = cached["text"]
+    missing = [tid for tid in transcript_ids if tid not in texts]
+
+    async def read_missing(ids):
+        found = await db.transcripts.find({"_id": {"$in": [ObjectId(tid) for tid in ids]}}, {"text": 1}).to_list(length=None)
+        read = {str(t["_id"]): t["text"] for t in found if t.get("text") is not None}
+        for tid, text in read.items():
+            await asyncio.to_thread(CHAT_TRANSCRIPT_CACHE.set, tid, {"text": text})
+        return read
+
+    if missing:
+        # Concurrent misses for the same transcripts share one read.
+        try:
+            texts.update(await single_flight.do_many("transcript", missing, read_missing))
+        except Exception as e:
+            raise HTTPException(status_code=705, detail=f"Cannot find Transcript IDs: {missing}")
+    return [texts[tid] for tid in transcript_ids if tid in texts]
+
+async def transcript_text(transcript_id):
+    """
+    Returns the text of a transcript, sharing the Mongo read with concurrent requests for the same transcript.
+
+    Args:
+        transcript_id (str): Transcript id.
+
+    Returns:
+        str: The text, or ``None`` if the transcript does not exist or has no text.
+
+    Raises:
+        HTTPException: If the transcript cannot be looked up.
+    """
+    async def read():
+        transcript = await db.transcripts.find_one({"_id": ObjectId(transcript_id)}, {"text": 1})
+        return transcript.get("text") if transcript else None
 
     try:
-        transcript_text = transcript.get("text")
-        if transcript_text is None:
-            raise HTTPException(status_code=706, detail="Transcript text is empty")
+        return await single_flight.do("transcript", transcript_id, read)
     except Exception as e:
-        raise HTTPException(status_code=706, detail="Transcript text is empty")
+        raise HTTPException(status_code=705, detail=f"Cannot find Transcript ID: {transcript_id}")
 
+async def update_chat_summary(session_id, model, summary, turns):
+    """
+    Folds ``turns`` into the rolling summary of a chat session and stores it in the session cache and in Mongo.
+
+    Args:
+        session_id (str): Chat session.
+        model (str): Chat model.
+        summary (str): Current summary.
+        turns (list): ``(turn, messages)`` pairs to fold in, oldest first.
+    """
     try:
-        prompt = "\n\n".join([
-            os.getenv("QA_GRID_PROMPT"),
-            f"Context: {transcript_text}",
-            f"Question: {request.question}",
-            f"Answer the question in the following format: {os.getenv('QA_GRID_PROMPT_FORMAT')}"
-        ])
-        response = client.chat.completions.create(
-            model=os.getenv("QA_GRID_MODEL"),
-            messages=[{"role": os.getenv("QA_GRID_PROMPT_ROLE"), "content": prompt}],
-            max_tokens=int(os.getenv("QA_GRID_MAX_TOKENS")),
-            n=1
-        )
-        answer = eval(response.choices[0].message.content.strip())
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Failed to generate answers from LLM with error: {e}")
-    return answer
+        new_summary = await context_window.summarize(model, summary, turns)
+    except HTTPException as e:
+        print(f"Chat summary of session {session_id} not updated: {e.detail}")
+        return
+    summary_upto = turns[-1][0] + 1
+    session = await asyncio.to_thread(CHAT_SESSION_CACHE.get, session_id)
+    if session is not None and session.get("summary_upto", 0) < summary_upto:
+        session["summary"], session["summary_upto"] = new_summary, summary_upto
+        await asyncio.to_thread(CHAT_SESSION_CACHE.set, session_id, session)
+    await chat_writer.submit(
+        {"_id": ObjectId(session_id), "summary_upto": {"$not": {"$gte": summary_upto}}},
+        {"$set": {"summary": new_summary, "summary_upto": summary_upto}}
+    )
 
 @app.post("/chat/{session_id}")
 async def chat(session_id: str, request: ChatRequest):
     """
     Handle a chat session by generating responses based on the chat history and context.
 
+    The reply is relayed in small batches as the LLM streams it (see ``chatstream``); the turn is saved after
+    the stream has ended.
+
     Args:
         request (ChatRequest): The request object containing the session ID, question, and the number of top transcripts to consider.
 
@@ -272,138 +715,145 @@ async def chat(session_id: str, request: ChatRequest):
     Raises:
         HTTPException: If there is an error finding the session, transcripts, or generating the chat responses.
     """
-    if session_id in CHAT_SESSION_CACHE_DICT:
-        session = CHAT_SESSION_CACHE_DICT[session_id]
-    else:
+    started = time.perf_counter()
+    saving = chat_saves.get(session_id)
+    if saving is not None:
+        # The previous turn of this session is still being saved; it has to be part of this one's history.
+        await asyncio.wait({saving})
+    session = await asyncio.to_thread(CHAT_SESSION_CACHE.get, session_id)
+    cache_fill = None
+    if session is None:
         try:
-            session = db.chatsessions.find_one({"_id": ObjectId(session_id)})
+            session = await db.chatsessions.find_one({"_id": ObjectId(session_id)})
         except Exception as e:
             raise HTTPException(status_code=707, detail=f"Cannot find Session ID: {session_id}")
 
-        CHAT_SESSION_CACHE_DICT[session_id] = {
+        # Cached while the context is fetched, rather than before.
+        cache_fill = asyncio.to_thread(CHAT_SESSION_CACHE.set, session_id, {
             "history": session["history"],
             "chat_type": session["chat_type"],
             "project_id": session["project_id"],
             "transcript_id": session["transcript_id"],
             "delete_time": session["delete_time"],
             "num_interactions" : session["num_interactions"],
-            "conversation": session["conversation"]
-        }
+            "conversation": session["conversation"],
+            "summary": session.get("summary", ""),
+            "summary_upto": session.get("summary_upto", 0),
+            "context_ids": session.get("context_ids", [])
+        }, ttl=(session["delete_time"] - datetime.utcnow()).total_seconds() if session["delete_time"] else 30 * 60)
 
     n_itr = int(session['num_interactions'])
     chat_type = session["chat_type"]
-    project_id = session["project_id"]
-    transcript_id = session["transcript_id"]
+    # Sessions hold the project and transcript ids as ObjectIds; indexes, vector stores and transcripts are keyed
+    # by their string ids.
+    project_id = str(session["project_id"]) if session["project_id"] is not None else None
+    transcript_id = str(session["transcript_id"]) if session["transcript_id"] is not None else None
 
     history = session["history"]
     conversation = session["conversation"]
-    context = ""
-
-    if n_itr % int(os.getenv("CHAT_CONTEXT_REPEAT")) == 0:
-        if chat_type == "transcript":
-            if transcript_id in CHAT_TRANSCRIPT_CACHE_DICT:
-                transcript = CHAT_TRANSCRIPT_CACHE_DICT[transcript_id]
-            else:
-                try:
-                    transcript = db.transcripts.find_one({"_id": ObjectId(transcript_id)})
-                except Exception as e:
-                    raise HTTPException(status_code=705, detail=f"Cannot find Transcript ID: {transcript_id}")
-
-                CHAT_TRANSCRIPT_CACHE_DICT[transcript_id] = {
-                    "text": transcript["text"],
-                    "delete_time": datetime.utcnow() + timedelta(minutes=30)
-                }
-            context = f"Transcript: {transcript['text']}"
-        
-        elif chat_type == "project":
-            try:
-                project = db.projects.find_one({"_id": ObjectId(project_id)})
-            except Exception as e:
-                raise HTTPException(status_code=700, detail=f"Cannot find project ID: {project_id}")
-
-            try:
-                transcript_ids = project.get("transcripts", [])
-            except Exception as e:
-                raise HTTPException(status_code=701, detail="No transcripts found for the project")
-            
-            pipeline = [
-                    {
-                        "$search": {
-                            "index": "default", 
-                            "text": {
-                                "query": request.question,
-                                "path": "text" 
-                            }
-                        }
-                    },
-                    {"$match": {"_id": {"$in": [ObjectId(tid) for tid in transcript_ids]}}},
-                    {"$limit": request.top_n}
-                ]
-            top_transcripts = list(db.transcripts.aggregate(pipeline))
-            if not top_transcripts:
-                HTTPException(status_code=704, detail="No valid content found in transcripts")
-            context = "\n\n".join([f"Transcript: {t['text']}" for t in top_transcripts])
-
-        if context:
-            history.append({"role": "system", "content": f"Context: {context}"})
-
-    prompt = "\n\n".join([
+    summary = session.get("summary", "")
+    summary_upto = session.get("summary_upto", 0)
+    context_ids = session.get("context_ids") or []
+    model = os.getenv('CHAT_MODEL')
+
+    # The source context is pinned in the system message of every request. Project chats get the passages of
+    # the project's transcripts that best match each question, from at most top_n transcripts.
+    if chat_type == "project":
+        context = retrieval_index.search(project_id, request.question, max_transcripts=request.top_n)
+    else:
+        context = chat_transcript_texts([transcript_id])
+    if cache_fill is not None:
+        context, _ = await asyncio.gather(context, cache_fill)
+    else:
+        context = await context
+    if chat_type == "project":
+        context_ids = list(dict.fromkeys(p["transcript_id"] for p in context))
+        source = format_passages(context)
+    else:
+        context_ids = [transcript_id]
+        if not context:
+            raise HTTPException(status_code=705, detail=f"Cannot find Transcript ID: {transcript_id}")
+        # Long transcripts are represented by their summary and the chunks matching the question.
+        source = await transcript_artifacts.chat_source(transcript_id, context[0], request.question, model) \
+            or "\n\n".join(f"Transcript: {text}" for text in context)
+
+    instructions = "\n\n".join([
         os.getenv("CHAT_PROMPT"),
-        f"Question: {request.question}",
         f'Format: {os.getenv("CHAT_PROMPT_FORMAT")}'
     ])
-    history.append({"role": "user", "content": prompt})
+    messages, _ = await asyncio.to_thread(
+        context_window.build, model, instructions, source, summary, group_turns(history, summary_upto), request.question
+    )
 
-    def stream_response():
-        try:
-            response = client.chat.completions.create(
-                    model=os.getenv('CHAT_MODEL'),
-                    messages=history,
-                    max_tokens=int(os.getenv('CHAT_MAX_TOKENS')),
-                    n=1,
-                    stream=True
-            )
-        except Exception as e:
-            raise HTTPException(status_code=402, detail=f"Failed to generate answers from LLM in chat with error: {e}") 
-        
-        assistant_response = ""
-        for chunk in response:
-            content = chunk.choices[0].delta.content if chunk.choices[0].delta.content is not None else ""
-            assistant_response += content
-            yield content
-
-        history.append({"role": "assistant", "content": assistant_response})
+    # The completion is started before the response, so a failure is still reported with its status code.
+    try:
+        response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=int(os.getenv('CHAT_MAX_TOKENS')),
+                n=1,
+                stream=True
+        )
+    except Exception as e:
+        raise HTTPException(status_code=402, detail=f"Failed to generate answers from LLM in chat with error: {e}") 
+
+    async def save_turn(assistant_response):
+        turn = n_itr + 1
+        new_history = [
+            {"role": "user", "content": request.question, "turn": turn},
+            {"role": "assistant", "content": assistant_response, "turn": turn}
+        ]
+        history.extend(new_history)
         conversation.append({"role": "user", "message": request.question})
         conversation.append({"role": "bot", "message": assistant_response})
 
         trimmed_history = history[-(MAX_CHAT_HISTORY_SAVE_LENGTH * 2):] 
         new_delete_time = datetime.utcnow() + timedelta(minutes=30)
 
-        db.chatsessions.update_one(
-            {"_id": ObjectId(session_id)},
-            {
-                "$set": {
-                    "last_updated": datetime.utcnow(),
-                    "history": trimmed_history,
-                    "delete_time": new_delete_time,
-                    "chat_type": chat_type,
-                    "project_id": project_id,
-                    "transcript_id": transcript_id,
-                    "num_interactions": n_itr + 1,
-                    "conversation": conversation
-                }
-            },
-            upsert=True
-        )
-        CHAT_SESSION_CACHE_DICT[session_id] = {
+        # A summary update started by an earlier turn may have finished since this request read the session;
+        # keep the newer summary instead of writing back the one read at the start.
+        latest_summary, latest_upto = summary, summary_upto
+        cached = await asyncio.to_thread(CHAT_SESSION_CACHE.get, session_id)
+        if cached is not None and cached.get("summary_upto", 0) > summary_upto:
+            latest_summary, latest_upto = cached["summary"], cached["summary_upto"]
+
+        await asyncio.to_thread(CHAT_SESSION_CACHE.set, session_id, {
             "history": trimmed_history,
             "delete_time": new_delete_time,
             "chat_type": chat_type,
             "project_id": project_id,
             "transcript_id": transcript_id,
-            "num_interactions": n_itr + 1,
-            "conversation": conversation
-        }
+            "num_interactions": turn,
+            "conversation": conversation,
+            "summary": latest_summary,
+            "summary_upto": latest_upto,
+            "context_ids": context_ids
+        })
+        # Only this turn's messages are written, behind the response.
+        await chat_writer.submit(*turn_update(
+            session_id, turn,
+            history=new_history,
+            conversation=conversation[-2:],
+            history_limit=MAX_CHAT_HISTORY_SAVE_LENGTH * 2,
+            fields={"delete_time": new_delete_time, "context_ids": context_ids}
+        ))
+
+        # Older turns are folded into the summary before they fall out of the budget or the saved history.
+        turns = group_turns(trimmed_history, latest_upto)
+        fold = context_window.turns_to_fold(model, turns, max_turns=MAX_CHAT_HISTORY_SAVE_LENGTH)
+        if fold and session_id not in summary_tasks:
+            task = asyncio.create_task(update_chat_summary(session_id, model, latest_summary, turns[:fold]))
+            summary_tasks[session_id] = task
+            task.add_done_callback(lambda _: summary_tasks.pop(session_id, None))
+
+    async def stream_response():
+        parts = []
+        async for text in chat_streamer.relay(response, parts, started):
+            yield text
+        # The turn is saved once the stream is closed, so the last bytes are not held back by it.
+        task = asyncio.create_task(save_turn("".join(parts)))
+        chat_saves[session_id] = task
+        task.add_done_callback(lambda _: chat_saves.pop(session_id, None) if chat_saves.get(session_id) is task else None)
     try:
         return StreamingResponse(stream_response(), media_type="text/plain")
     except Exception as e:
@@ -0,0 +1,428 @@
+"""
+This module derives compact artifacts from a transcript once, when it is ingested, so that consumers do not
+have to re-read and re-send the raw text every time.
+
+The artifacts of a transcript are:
+
+    - turns: the speaker turns of the text, as parallel arrays of speaker, start and end offsets into the text,
+      start and end times in milliseconds (-1 when unknown) and token counts
+    - speakers: turns, tokens and share of the tokens of every speaker
+    - chunks: the retrieval chunks of the text (``split_turns``, ``RETRIEVAL_CHUNK_TOKENS``) with their tokens
+    - summary: an LLM summary of the transcript (summaries of parts merged into one for long transcripts), or an
+      extractive one made of the most central turns when ``ARTIFACT_SUMMARY`` is ``extractive`` or the LLM fails
+
+They are stored in the ``transcriptartifacts`` collection, one document per transcript keyed by its string id,
+with the SHA-256 of the text they were made from and a version hashing everything else that determines them
+(this module's schema, the chunk size, the summary prompt, model and lengths). Artifacts whose text or version no
+longer match are stale: they are not used, and are built again in the background when asked for, so changing a
+prompt recomputes them as transcripts are used.
+
+The turns of an audio transcript are taken from its structured ``Transcript`` (passed in, or loaded from the
+``transcriptturns`` collection), whose speakers, times and spans in the rendered text are already known; the text
+is only parsed back into turns (``parse_turns``) for documents and transcripts stored without structured turns.
+
+Transcript chats use them for long transcripts: instead of the full text cut to the token budget, the prompt
+gets the summary and the chunks that best match the question.
+
+Environment:
+    - ``TRANSCRIPT_ARTIFACTS``: ``on`` (default) or ``off``.
+    - ``ARTIFACT_SUMMARY``: ``llm`` (default) or ``extractive``.
+    - ``ARTIFACT_SUMMARY_MODEL``: Model writing the summaries (``CHAT_SUMMARY_MODEL``, else ``CHAT_MODEL``).
+    - ``ARTIFACT_SUMMARY_PROMPT``: Instructions for the summaries (built-in default).
+    - ``ARTIFACT_SUMMARY_TOKENS``: Longest summary, in tokens (400).
+    - ``ARTIFACT_SUMMARY_INPUT_TOKENS``: Transcript tokens per summary call; longer transcripts are summarized
+      in parts (24000).
+    - ``ARTIFACT_CHAT_FULL_TOKENS``: Transcripts up to this many tokens are still sent whole in chats (16000).
+    - ``ARTIFACT_CHAT_CONTEXT_TOKENS``: Tokens of the best-matching chunks sent with the summary (6000).
+    - ``ARTIFACT_CACHE``: Chunk indexes of recently chatted transcripts kept in memory (64).
+    - ``ARTIFACT_CONCURRENCY``: Artifact builds running at once (4).
+
+Classes:
+    - TranscriptArtifacts: Builds, stores and serves the artifacts of transcripts.
+
+Functions:
+    - parse_turns: Splits a transcript into speaker turns.
+    - speaker_stats: Sums the turns and tokens of every speaker.
+    - extractive_summary: Picks the most central turns of a transcript.
+"""
+
+import os
+import math
+import time
+import asyncio
+import hashlib
+from datetime import datetime
+from collections import Counter, OrderedDict
+
+from fastapi import HTTPException
+
+from context import count_tokens, CHARS_PER_TOKEN
+from retrieval import ProjectIndex, split_turns, tokenize
+from answercache import answer_key
+from transcript import NO_TIME
+
+# Bumped whenever the stored artifacts change shape or are derived differently.
+ARTIFACT_SCHEMA = 2
+ARTIFACT_ENV = ("ARTIFACT_SUMMARY", "ARTIFACT_SUMMARY_MODEL", "ARTIFACT_SUMMARY_PROMPT", "ARTIFACT_SUMMARY_TOKENS",
+                "ARTIFACT_SUMMARY_INPUT_TOKENS", "CHAT_SUMMARY_MODEL", "CHAT_MODEL", "RETRIEVAL_CHUNK_TOKENS")
+MAX_SPEAKER_LABEL = 40
+
+DEFAULT_SUMMARY_PROMPT = (
+    "You summarize a user research interview for a researcher who has not read it. Cover who the participant "
+    "is, the topics discussed, the main pain points, needs and requests, and notable quotes with the speaker. "
+    "Keep numbers and names. Answer with the summary only."
+)
+MERGE_PROMPT = (
+    "The texts below summarize consecutive parts of one user research interview. Merge them into one summary "
+    "of the whole interview, following these instructions: "
+)
+
+
+def parse_turns(text):
+    """
+    Splits a transcript into speaker turns, one per non-empty ``speaker: text`` line.
+
+    A line without a speaker label (e.g. extracted document text) is a turn without speaker.
+
+    Args:
+        text (str): Transcript text.
+
+    Returns:
+        list: ``(speaker, start, end)`` tuples; ``text[start:end]`` is the turn's text without the label.
+    """
+    turns = []
+    position = 0
+    for line in text.splitlines(keepends=True):
+        start, end = position, position + len(line.rstrip())
+        position += len(line)
+        body = line.strip()
+        if not body:
+            continue
+        start += len(line) - len(line.lstrip())
+        speaker, separator, words = body.partition(": ")
+        if separator and len(speaker) < MAX_SPEAKER_LABEL and words.strip():
+            turns.append((speaker, start + len(speaker) + len(separator), end))
+        else:
+            turns.append((None, start, end))
+    return turns
+
+
+def speaker_stats(speakers, turn_speakers, turn_tokens):
+    """
+    Sums the turns and tokens of every speaker.
+
+    Args:
+        speakers (list): Speaker names; turns without speaker are counted as ``"unknown"``.
+        turn_speakers (list): Index into ``speakers`` of every turn, or -1.
+        turn_tokens (list): Tokens of every turn.
+
+    Returns:
+        dict: ``{speaker: {"turns", "tokens", "share"}}``, the share being of all tokens.
+    """
+    stats = {}
+    total = sum(turn_tokens) or 1
+    for speaker, tokens in zip(turn_speakers, turn_tokens):
+        name = speakers[speaker] if speaker >= 0 else "unknown"
+        entry = stats.setdefault(name, {"turns": 0, "tokens": 0})
+        entry["turns"] += 1
+        entry["tokens"] += tokens
+    for entry in stats.values():
+        entry["share"] = round(entry["tokens"] / total, 3)
+    return stats
+
+
+def extractive_summary(texts, max_tokens, model):
+    """
+    Picks the most central turns of a transcript: the turns whose terms are the most frequent in the whole
+    transcript, per term, until ``max_tokens`` are used; returned in transcript order.
+
+    Args:
+        texts (list): Texts of the turns, labelled with their speaker.
+        max_tokens (int): Longest summary.
+        model (str): Model the tokens are counted for.
+
+    Returns:
+        str: The selected turns, one per line.
+    """
+    terms = [tokenize(text) for text in texts]
+    frequency = Counter(term for turn in terms for term in set(turn))
+    scores = [(sum(frequency[term] for term in set(turn)) / math.sqrt(len(turn)), position)
+              for position, turn in enumerate(terms) if len(turn) >= 3]
+    chosen, budget = [], max_tokens
+    for _, position in sorted(scores, reverse=True):
+        tokens = count_tokens(texts[position], model)
+        if tokens > budget:
+            continue
+        chosen.append(position)
+        budget -= tokens
+        if budget < 20:
+            break
+    return "\n".join(texts[position] for position in sorted(chosen))
+
+
+class TranscriptArtifacts:
+    """
+    Builds, stores and serves the artifacts of transcripts.
+
+    Args:
+        collection: Async (motor) ``transcriptartifacts`` collection.
+        client: OpenAI-compatible async client writing the summaries.
+        cache_size (int, optional): Chunk indexes kept for chats (``ARTIFACT_CACHE``).
+        turns (TranscriptTurns, optional): Structured turns of transcripts, used instead of parsing the text.
+    """
+    def __init__(self, collection, client, cache_size=None, turns=None):
+        self.collection = collection
+        self.client = client
+        self.turns = turns
+        self.enabled = os.getenv("TRANSCRIPT_ARTIFACTS", "on") != "off"
+        self.summary_mode = os.getenv("ARTIFACT_SUMMARY", "llm")
+        self.summary_tokens = int(os.getenv("ARTIFACT_SUMMARY_TOKENS", 400))
+        self.summary_input_tokens = int(os.getenv("ARTIFACT_SUMMARY_INPUT_TOKENS", 24000))
+        self.summary_prompt = os.getenv("ARTIFACT_SUMMARY_PROMPT") or DEFAULT_SUMMARY_PROMPT
+        self.chat_full_tokens = int(os.getenv("ARTIFACT_CHAT_FULL_TOKENS", 16000))
+        self.chat_context_tokens = int(os.getenv("ARTIFACT_CHAT_CONTEXT_TOKENS", 6000))
+        self.cache_size = cache_size or int(os.getenv("ARTIFACT_CACHE", 64))
+        self.slots = asyncio.Semaphore(int(os.getenv("ARTIFACT_CONCURRENCY", 4)))
+        self.indexes = OrderedDict()
+        self.building = {}
+        self.counters = {"builds": 0, "build_failures": 0, "build_seconds": 0.0, "fresh": 0, "stale": 0, "missing": 0,
+                         "llm_summaries": 0, "extractive_summaries": 0, "summary_calls": 0, "summary_failures": 0,
+                         "chat_contexts": 0, "chat_full_text": 0, "chat_tokens_saved": 0}
+
+    def version(self):
+        """
+        Returns the version the artifacts built now get; artifacts with another version are stale.
+        """
+        return answer_key("artifacts", "", env=ARTIFACT_ENV, schema=ARTIFACT_SCHEMA)
+
+    def schedule(self, transcript_id, text, transcript=None):
+        """
+        Starts building the artifacts of a transcript in the background, unless they are already being built.
+
+        Args:
+            transcript_id (str): Transcript id.
+            text (str): Transcript text.
+            transcript (Transcript, optional): Structured turns of the text, if known.
+        """
+        transcript_id = str(transcript_id)
+        if not self.enabled or not text or transcript_id in self.building:
+            return
+        task = asyncio.create_task(self._build_logged(transcript_id, text, transcript))
+        self.building[transcript_id] = task
+        task.add_done_callback(lambda _: self.building.pop(transcript_id, None))
+
+    async def build(self, transcript_id, text, force=False, transcript=None):
+        """
+        Returns the artifacts of a transcript, building and storing them unless fresh ones are stored.
+
+        Args:
+            transcript_id (str): Transcript id.
+            text (str): Transcript text.
+            force (bool, optional): Build them again even if the stored ones are fresh.
+            transcript (Transcript, optional): Structured turns of the text; loaded from ``turns`` if not given.
+
+        Returns:
+            dict: The artifacts document.
+        """
+        transcript_id = str(transcript_id)
+        if not force:
+            stored = await self.get(transcript_id, text)
+            if stored is not None:
+                return stored
+        async with self.slots:
+            started = time.perf_counter()
+            text_key = await asyncio.to_thread(self._text_key, text)
+            model = os.getenv("CHAT_MODEL")
+            if transcript is None and self.turns is not None:
+                transcript = await self.turns.load(transcript_id)
+            document = await asyncio.to_thread(self._derive, text, model, transcript)
+            summary, kind = await self._summarize(text, document, model)
+            document.update({
+                "_id": transcript_id,
+                "version": self.version(),
+                "text_key": text_key,
+                "summary": summary,
+                "summary_kind": kind,
+                "summary_tokens": await asyncio.to_thread(count_tokens, summary, model),
+                "created_at": datetime.utcnow(),
+            })
+            await self.collection.replace_one({"_id": transcript_id}, document, upsert=True)
+            self.counters["builds"] += 1
+            self.counters[f"{kind}_summaries"] += 1
+            self.counters["build_seconds"] += time.perf_counter() - started
+            return document
+
+    async def get(self, transcript_id, text, projection=None):
+        """
+        Returns the stored artifacts of a transcript if they are fresh for ``text`` and the current version.
+
+        Args:
+            transcript_id (str): Transcript id.
+            text (str): Current transcript text.
+            projection (dict, optional): Fields to read; ``version`` and ``text_key`` are always read.
+
+        Returns:
+            dict: The artifacts, or None if they are missing or stale.
+        """
+        if projection is not None:
+            projection = dict(projection, version=1, text_key=1)
+        stored = await self.collection.find_one({"_id": str(transcript_id)}, projection)
+        if stored is None:
+            self.counters["missing"] += 1
+            return None
+        if stored.get("version") != self.version() or stored.get("text_key") != await asyncio.to_thread(self._text_key, text):
+            self.counters["stale"] += 1
+            return None
+        self.counters["fresh"] += 1
+        return stored
+
+    async def chat_source(self, transcript_id, text, question, model):
+        """
+        Returns the chat context of a long transcript: its summary and the chunks that best match ``question``.
+
+        Transcripts up to ``ARTIFACT_CHAT_FULL_TOKENS`` tokens, and transcripts whose artifacts are missing or
+        stale (they are then built in the background), get None: the caller sends the full text.
+
+        Args:
+            transcript_id (str): Transcript id.
+            text (str): Transcript text.
+            question (str): Chat question.
+            model (str): Chat model, for the token counts.
+
+        Returns:
+            str: The context, or None.
+        """
+        if not self.enabled or len(text) // CHARS_PER_TOKEN <= self.chat_full_tokens:
+            self.counters["chat_full_text"] += 1
+            return None
+        transcript_id = str(transcript_id)
+        text_key = await asyncio.to_thread(self._text_key, text)
+        cached = self.indexes.get((transcript_id, text_key))
+        if cached is None:
+            stored = await self.get(transcript_id, text, {"chunks": 1, "summary": 1, "tokens": 1})
+            if stored is None:
+                self.schedule(transcript_id, text)
+                self.counters["chat_full_text"] += 1
+                return None
+            if stored["tokens"] <= self.chat_full_tokens:
+                self.counters["chat_full_text"] += 1
+                return None
+            index = ProjectIndex()
+            await asyncio.to_thread(index.add, transcript_id, text, chunks=[chunk["text"] for chunk in stored["chunks"]])
+            cached = (index, stored["summary"], stored["tokens"])
+            self.indexes[(transcript_id, text_key)] = cached
+            while len(self.indexes) > self.cache_size:
+                self.indexes.popitem(last=False)
+        else:
+            self.indexes.move_to_end((transcript_id, text_key))
+        index, summary, tokens = cached
+        passages = await asyncio.to_thread(index.search, question, self.chat_context_tokens)
+        excerpts = "\n...\n".join(p["text"] for p in sorted(passages, key=lambda p: p["position"]))
+        source = f"Transcript summary: {summary}\n\nTranscript excerpts matching the question:\n{excerpts}"
+        self.counters["chat_contexts"] += 1
+        self.counters["chat_tokens_saved"] += max(0, tokens - await asyncio.to_thread(count_tokens, source, model))
+        return source
+
+    def stats(self):
+        """
+        Returns the build and usage counters.
+        """
+        stats = dict(self.counters)
+        stats["build_seconds"] = round(stats["build_seconds"], 3)
+        stats["building"] = len(self.building)
+        stats["cached_indexes"] = len(self.indexes)
+        return stats
+
+    async def _build_logged(self, transcript_id, text, transcript):
+        try:
+            await self.build(transcript_id, text, transcript=transcript)
+        except Exception as e:
+            self.counters["build_failures"] += 1
+            print(f"Artifacts of transcript {transcript_id} not built: {getattr(e, 'detail', e)}")
+
+    def _text_key(self, text):
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _derive(self, text, model, transcript=None):
+        # Everything but the summary: turns, token counts, speaker stats and chunks. The turns come from the
+        # structured transcript when it renders to this very text; otherwise the text is parsed.
+        if transcript is not None and len(transcript) and transcript.to_text() == text:
+            speakers = list(transcript.speakers)
+            turn_speakers = list(transcript.speaker)
+            spans = transcript.spans()
+            starts_ms, ends_ms = list(transcript.start_ms), list(transcript.end_ms)
+        else:
+            speakers, turn_speakers, spans = [], [], []
+            positions = {}
+            for speaker, start, end in parse_turns(text):
+                spans.append((start, end))
+                if speaker is None:
+                    turn_speakers.append(-1)
+                    continue
+                if speaker not in positions:
+                    positions[speaker] = len(speakers)
+                    speakers.append(speaker)
+                turn_speakers.append(positions[speaker])
+            starts_ms = ends_ms = [NO_TIME] * len(spans)
+        turn_tokens = [count_tokens(text[start:end], model) for start, end in spans]
+        chunk_tokens = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", 200))
+        chunks = [{"text": chunk, "tokens": count_tokens(chunk, model)} for chunk in split_turns(text, chunk_tokens)]
+        return {
+            "schema": ARTIFACT_SCHEMA,
+            "tokens": count_tokens(text, model),
+            "speakers": speakers,
+            "turns": {
+                "speaker": turn_speakers,
+                "start": [start for start, _ in spans],
+                "end": [end for _, end in spans],
+                "start_ms": starts_ms,
+                "end_ms": ends_ms,
+                "tokens": turn_tokens,
+            },
+            "speaker_stats": speaker_stats(speakers, turn_speakers, turn_tokens),
+            "chunks": chunks,
+        }
+
+    async def _summarize(self, text, document, model):
+        turns = document["turns"]
+        labelled = [
+            (f"{document['speakers'][speaker]}: " if speaker >= 0 else "") + text[start:end]
+            for speaker, start, end in zip(turns["speaker"], turns["start"], turns["end"])
+        ]
+        if self.summary_mode == "llm":
+            try:
+                return await self._llm_summary(document["chunks"]), "llm"
+            except HTTPException as e:
+                print(f"Transcript summary falls back to an extractive one: {e.detail}")
+        return await asyncio.to_thread(extractive_summary, labelled, self.summary_tokens, model), "extractive"
+
+    async def _llm_summary(self, chunks):
+        # Parts of at most ARTIFACT_SUMMARY_INPUT_TOKENS are summarized in parallel, then merged by one more call.
+        parts, current, size = [], [], 0
+        for chunk in chunks:
+            if current and size + chunk["tokens"] > self.summary_input_tokens:
+                parts.append("\n".join(current))
+                current, size = [], 0
+            current.append(chunk["text"])
+            size += chunk["tokens"]
+        if current:
+            parts.append("\n".join(current))
+        summaries = await asyncio.gather(*(self._ask(self.summary_prompt, f"Transcript:\n{part}") for part in parts))
+        if len(summaries) == 1:
+            return summaries[0]
+        merged = "\n\n".join(f"Part {i + 1}/{len(summaries)}: {summary}" for i, summary in enumerate(summaries))
+        return await self._ask(MERGE_PROMPT + self.summary_prompt, merged)
+
+    async def _ask(self, instructions, content):
+        self.counters["summary_calls"] += 1
+        try:
+            response = await self.client.chat.completions.create(
+                model=os.getenv("ARTIFACT_SUMMARY_MODEL") or os.getenv("CHAT_SUMMARY_MODEL") or os.getenv("CHAT_MODEL"),
+                messages=[{"role": "system", "content": instructions}, {"role": "user", "content": content}],
+                max_tokens=self.summary_tokens,
+                n=1,
+            )
+        except Exception as e:
+            self.counters["summary_failures"] += 1
+            raise HTTPException(status_code=406, detail=f"Failed to summarize transcript with error: {e}")
+        return response.choices[0].message.content.strip()
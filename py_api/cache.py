@@ -0,0 +1,465 @@
+"""
+This module provides the bounded caches for chat sessions and transcripts.
+
+Entries are kept in least-recently-used order and a cache holds at most ``max_bytes`` of value size: storing a
+new entry evicts the least recently used ones until it fits. Every entry carries its own expiry time, which is
+checked when the entry is read, so no background thread has to scan the cache.
+
+All backends share the ``get`` / ``set`` / ``delete`` / ``stats`` interface. ``LRUCache`` lives in process
+memory, so every uvicorn worker has its own copy. ``SQLiteCache`` and ``RedisCache`` are shared by all workers:
+the first stores compressed values in one SQLite file per host, the second in a Redis-protocol server. With a
+shared backend, a session updated by one worker is seen by the next worker that handles the session, and each
+transcript is cached once. Shared backends return a fresh copy of the value on every ``get``. Their calls block
+on disk or network I/O, so callers on the event loop run them in a thread.
+
+Environment:
+    - ``CHAT_CACHE_BACKEND``: ``memory``, ``sqlite`` or ``redis`` (memory).
+    - ``CHAT_CACHE_PATH``: SQLite file of the sqlite backend (``<system temp>/uxr-chat-cache.sqlite3``).
+    - ``CHAT_CACHE_REDIS_URL``: Server of the redis backend (``redis://localhost:6379/0``).
+
+Classes:
+    - LRUCache: Byte-bounded in-process LRU cache with per-entry TTL and hit/miss/eviction counters.
+    - SQLiteCache: Byte-bounded LRU cache in a SQLite file shared by the processes of a host.
+    - RedisCache: Cache in a Redis-protocol server shared by all workers.
+
+Functions:
+    - estimate_size: Estimates the memory held by a value.
+    - make_cache: Creates the cache backend selected by ``CHAT_CACHE_BACKEND``.
+"""
+
+import os
+import sys
+import time
+import zlib
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+from bson import json_util
+
+_MISSING = object()
+
+
+def estimate_size(value):
+    """
+    Estimates the memory held by a value, following dicts, lists, tuples and sets.
+
+    Args:
+        value: The value to measure.
+
+    Returns:
+        int: Approximate size in bytes.
+    """
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return total
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value, size, expires_at):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class LRUCache:
+    """
+    Byte-bounded LRU cache with a time-to-live per entry.
+
+    Args:
+        max_bytes (int): Largest total size of the cached values. Values larger than this are not cached.
+        default_ttl (float, optional): Seconds an entry lives when ``set`` gets no ``ttl`` (None = no expiry).
+        sizeof (callable, optional): Function estimating the size of a value.
+    """
+    def __init__(self, max_bytes, default_ttl=None, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under ``key`` and marks it as recently used, or ``default`` if it is missing
+        or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry.value
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Stores ``value`` under ``key``, evicting least recently used entries until it fits.
+
+        Args:
+            key: Cache key.
+            value: Value to store. Its size is measured now, so re-``set`` a value after growing it.
+            ttl (float, optional): Seconds until the entry expires; defaults to ``default_ttl``. An entry whose
+                ttl is zero or negative is not stored.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        ttl = self.default_ttl if ttl is _MISSING else ttl
+        size = self.sizeof(value)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_bytes or (ttl is not None and ttl <= 0):
+                self.counters["rejected"] += 1
+                return False
+            # Expired entries at the least recently used end go first; they are dropped without a full scan.
+            now = time.monotonic()
+            while self.entries:
+                oldest_key, oldest = next(iter(self.entries.items()))
+                if oldest.expires_at is None or oldest.expires_at > now:
+                    break
+                self._remove(oldest_key)
+                self.counters["expirations"] += 1
+            while self.entries and self.bytes + size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.counters["evictions"] += 1
+            self.entries[key] = _Entry(value, size, None if ttl is None else now + ttl)
+            self.bytes += size
+            self.counters["sets"] += 1
+            return True
+
+    def delete(self, key):
+        """
+        Removes ``key`` from the cache if present.
+        """
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and (entry.expires_at is None or entry.expires_at > time.monotonic())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters, the hit rate and the current size.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self.entries)
+            stats["bytes"] = self.bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["max_bytes"] = self.max_bytes
+        stats["backend"] = "memory"
+        return stats
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+
+
+def _encode(value, level=3):
+    # Extended JSON keeps the datetimes and ObjectIds of Mongo documents without unpickling shared data.
+    return zlib.compress(json_util.dumps(value).encode(), level)
+
+
+def _decode(blob):
+    return json_util.loads(zlib.decompress(blob))
+
+
+class SQLiteCache:
+    """
+    Byte-bounded LRU cache with a time-to-live per entry, stored in a SQLite file.
+
+    All processes opening the same file and ``name`` share the entries. Values are stored as compressed
+    extended JSON, and ``max_bytes`` bounds their compressed size. Writes take SQLite's write lock, so eviction
+    stays correct across processes; reads only refresh an entry's last-use time once per second.
+
+    Args:
+        path (str): SQLite file; created if missing.
+        name (str): Table of this cache, so several caches can share a file.
+        max_bytes (int): Largest total size of the stored values.
+        default_ttl (float, optional): Seconds an entry lives when ``set`` gets no ``ttl`` (None = no expiry).
+        level (int, optional): zlib compression level.
+    """
+    def __init__(self, path, name, max_bytes, default_ttl=None, level=3):
+        self.path = path
+        self.table = f"cache_{name}"
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.level = level
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+        with self._connection() as connection:
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                               "size INTEGER NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_lru ON {self.table} (accessed_at, size)")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expiry ON {self.table} (expires_at)")
+
+    def _connection(self):
+        # One connection per thread and process; a connection inherited through fork is never reused.
+        connection = getattr(self.local, "connection", None)
+        if connection is None or self.local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def get(self, key, default=None):
+        """
+        Returns a copy of the value stored under ``key``, or ``default`` if it is missing or expired.
+        """
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute(f"SELECT value, expires_at, accessed_at FROM {self.table} WHERE key = ?", (str(key),)).fetchone()
+        if row is not None and row[1] is not None and row[1] <= now:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?", (str(key), now))
+            self._count("expirations")
+            row = None
+        if row is None:
+            self._count("misses")
+            return default
+        if now - row[2] > 1:
+            connection.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, str(key)))
+        self._count("hits")
+        return _decode(row[0])
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Stores ``value`` under ``key``, evicting least recently used entries until it fits.
+
+        Args:
+            key: Cache key.
+            value: Value to store; must be serializable as extended JSON.
+            ttl (float, optional): Seconds until the entry expires; defaults to ``default_ttl``. An entry whose
+                ttl is zero or negative is not stored.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        ttl = self.default_ttl if ttl is _MISSING else ttl
+        blob = _encode(value, self.level)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (str(key),))
+            if len(blob) > self.max_bytes or (ttl is not None and ttl <= 0):
+                connection.execute("COMMIT")
+                self._count("rejected")
+                return False
+            now = time.time()
+            expired = connection.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+            used = connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            evicted = 0
+            if used + len(blob) > self.max_bytes:
+                victims = []
+                for victim, size in connection.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+                    if used + len(blob) <= self.max_bytes:
+                        break
+                    victims.append((victim,))
+                    used -= size
+                connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+                evicted = len(victims)
+            connection.execute(f"INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?)",
+                               (str(key), blob, len(blob), None if ttl is None else now + ttl, now))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        with self.lock:
+            self.counters["sets"] += 1
+            self.counters["expirations"] += expired
+            self.counters["evictions"] += evicted
+        return True
+
+    def delete(self, key):
+        """
+        Removes ``key`` from the cache if present.
+        """
+        self._connection().execute(f"DELETE FROM {self.table} WHERE key = ?", (str(key),))
+
+    def __contains__(self, key):
+        row = self._connection().execute(f"SELECT expires_at FROM {self.table} WHERE key = ?", (str(key),)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns this process's hit/miss/eviction counters, the hit rate and the size shared by all processes.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        entries, size = self._connection().execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        stats["entries"] = entries
+        stats["bytes"] = size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["max_bytes"] = self.max_bytes
+        stats["backend"] = "sqlite"
+        return stats
+
+
+class RedisCache:
+    """
+    Cache in a Redis-protocol server (Redis, Valkey, KeyDB, ...), shared by every worker that connects to it.
+
+    Values are stored as compressed extended JSON under ``<prefix>:<key>`` with the server's own expiry. The
+    total size is bounded by the server (``maxmemory`` with an ``allkeys-lru`` policy); ``max_bytes`` only
+    rejects single values that are too large. Needs the ``redis`` package.
+
+    Args:
+        url (str): Server URL, e.g. ``redis://localhost:6379/0``.
+        name (str): Key prefix of this cache.
+        max_bytes (int): Largest compressed value that is stored.
+        default_ttl (float, optional): Seconds an entry lives when ``set`` gets no ``ttl`` (None = no expiry).
+        level (int, optional): zlib compression level.
+    """
+    def __init__(self, url, name, max_bytes, default_ttl=None, level=3):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CHAT_CACHE_BACKEND=redis needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = f"uxr:{name}:"
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.level = level
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "rejected": 0, "errors": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def get(self, key, default=None):
+        """
+        Returns a copy of the value stored under ``key``, or ``default`` if it is missing, expired or the server
+        cannot be reached.
+        """
+        try:
+            blob = self.client.get(self.prefix + str(key))
+        except Exception as e:
+            print(f"Chat cache read failed: {e}")
+            self._count("errors")
+            blob = None
+        if blob is None:
+            self._count("misses")
+            return default
+        self._count("hits")
+        return _decode(blob)
+
+    def set(self, key, value, ttl=_MISSING):
+        """
+        Stores ``value`` under ``key``.
+
+        Args:
+            key: Cache key.
+            value: Value to store; must be serializable as extended JSON.
+            ttl (float, optional): Seconds until the entry expires; defaults to ``default_ttl``. An entry whose
+                ttl is zero or negative is not stored.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        ttl = self.default_ttl if ttl is _MISSING else ttl
+        blob = _encode(value, self.level)
+        try:
+            if len(blob) > self.max_bytes or (ttl is not None and ttl <= 0):
+                self.client.delete(self.prefix + str(key))
+                self._count("rejected")
+                return False
+            self.client.set(self.prefix + str(key), blob, px=None if ttl is None else max(int(ttl * 1000), 1))
+        except Exception as e:
+            print(f"Chat cache write failed: {e}")
+            self._count("errors")
+            return False
+        self._count("sets")
+        return True
+
+    def delete(self, key):
+        """
+        Removes ``key`` from the cache if present.
+        """
+        self.client.delete(self.prefix + str(key))
+
+    def __contains__(self, key):
+        return bool(self.client.exists(self.prefix + str(key)))
+
+    def stats(self):
+        """
+        Returns this process's hit/miss counters, the hit rate and the server's memory use.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["max_bytes"] = self.max_bytes
+        stats["backend"] = "redis"
+        try:
+            stats["server_used_memory"] = self.client.info("memory").get("used_memory")
+        except Exception:
+            stats["server_used_memory"] = None
+        return stats
+
+
+def make_cache(name, max_bytes, default_ttl=None):
+    """
+    Creates the cache backend selected by ``CHAT_CACHE_BACKEND``.
+
+    Args:
+        name (str): Name of the cache; separates caches that share a SQLite file or Redis server.
+        max_bytes (int): Size limit of the cache.
+        default_ttl (float, optional): Seconds an entry lives by default.
+
+    Returns:
+        LRUCache | SQLiteCache | RedisCache: The cache.
+
+    Raises:
+        RuntimeError: If the backend is unknown or its dependency is missing.
+    """
+    backend = os.getenv("CHAT_CACHE_BACKEND", "memory").lower()
+    if backend == "memory":
+        return LRUCache(max_bytes, default_ttl=default_ttl)
+    if backend == "sqlite":
+        path = os.getenv("CHAT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "uxr-chat-cache.sqlite3"))
+        return SQLiteCache(path, name, max_bytes, default_ttl=default_ttl)
+    if backend == "redis":
+        return RedisCache(os.getenv("CHAT_CACHE_REDIS_URL", "redis://localhost:6379/0"), name, max_bytes, default_ttl=default_ttl)
+    raise RuntimeError(f"Unknown CHAT_CACHE_BACKEND: {backend}")
@@ -0,0 +1,187 @@
+"""
+This module persists chat turns to the ``chatsessions`` collection without rewriting whole sessions.
+
+Each finished turn becomes one update that appends the turn's messages with ``$push`` (``$slice`` keeps the
+saved history trimmed) and ``$set``s the few scalar fields, so a turn writes the same number of bytes whether it
+is the 2nd or the 1000th of the session. Turns are queued and written behind the response by a background
+task, batched into ordered ``bulk_write`` calls. Every update only applies while the stored
+``num_interactions`` is below the turn number, which makes retries and replays harmless; failed batches are
+retried a bounded number of times.
+
+Environment:
+    - ``CHAT_WRITE_BATCH``: Largest number of turns per ``bulk_write`` (100).
+    - ``CHAT_WRITE_INTERVAL``: Seconds a batch waits for more turns before it is written (0.1).
+    - ``CHAT_WRITE_RETRIES``: Extra attempts for a batch that failed with a transient error (3).
+    - ``CHAT_WRITE_QUEUE``: Turns that may wait to be written; further turns wait for room (10000).
+
+Classes:
+    - ChatTurnWriter: Write-behind queue of chat turn updates.
+
+Functions:
+    - turn_update: Builds the append-only update of one chat turn.
+"""
+
+import os
+import asyncio
+import traceback
+from datetime import datetime
+
+import bson
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+
+def turn_update(session_id, turn, history, conversation, history_limit, fields=None):
+    """
+    Builds the update appending one chat turn to a session document.
+
+    Args:
+        session_id (str): Id of the chat session.
+        turn (int): Number of interactions after this turn; the update is skipped if the stored session
+            already has this many.
+        history (list): Messages this turn added to the LLM history.
+        conversation (list): Messages this turn added to the visible conversation.
+        history_limit (int): Number of history messages kept in the session.
+        fields (dict, optional): Other fields to set, e.g. ``delete_time``.
+
+    Returns:
+        tuple: The filter and the update document.
+    """
+    return (
+        {"_id": ObjectId(session_id), "num_interactions": {"$not": {"$gte": turn}}},
+        {
+            "$push": {
+                "history": {"$each": history, "$slice": -history_limit},
+                "conversation": {"$each": conversation},
+            },
+            "$set": dict(fields or {}, num_interactions=turn, last_updated=datetime.utcnow()),
+        },
+    )
+
+
+class ChatTurnWriter:
+    """
+    Writes chat turn updates to Mongo in the background, in batches.
+
+    Args:
+        collection: Async (motor) collection of the chat sessions.
+        batch_size (int, optional): Largest number of updates per ``bulk_write``.
+        interval (float, optional): Seconds a batch waits for more updates.
+        retries (int, optional): Extra attempts for a batch that failed with a transient error.
+        max_pending (int, optional): Updates that may be queued before ``submit`` waits.
+    """
+    def __init__(self, collection, batch_size=None, interval=None, retries=None, max_pending=None):
+        self.collection = collection
+        self.batch_size = batch_size or int(os.getenv("CHAT_WRITE_BATCH", 100))
+        self.interval = float(os.getenv("CHAT_WRITE_INTERVAL", 0.1)) if interval is None else interval
+        self.retries = int(os.getenv("CHAT_WRITE_RETRIES", 3)) if retries is None else retries
+        self.max_pending = max_pending or int(os.getenv("CHAT_WRITE_QUEUE", 10000))
+        self.queue = None
+        self.worker = None
+        self.counters = {"submitted": 0, "written": 0, "skipped": 0, "failed": 0, "batches": 0, "retries": 0, "bytes": 0}
+
+    async def start(self):
+        """
+        Starts the background writer.
+        """
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Writes the queued updates and stops the background writer.
+        """
+        if self.worker is None:
+            return
+        await self.flush()
+        self.worker.cancel()
+        await asyncio.gather(self.worker, return_exceptions=True)
+        self.worker = None
+
+    async def flush(self):
+        """
+        Waits until every update submitted so far has been written (or given up on).
+        """
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def submit(self, filter, update):
+        """
+        Queues an update, usually built by ``turn_update``. Waits only if ``max_pending`` updates are already queued.
+
+        Args:
+            filter (dict): Selects the session document; must make the update safe to apply twice.
+            update (dict): The update document.
+        """
+        if self.worker is None:
+            await self.start()
+        self.counters["submitted"] += 1
+        self.counters["bytes"] += len(bson.encode(filter)) + len(bson.encode(update))
+        await self.queue.put(UpdateOne(filter, update))
+
+    def stats(self):
+        """
+        Returns the write counters, the queue length and the average update size.
+        """
+        stats = dict(self.counters)
+        stats["pending"] = self.queue.qsize() if self.queue is not None else 0
+        stats["bytes_per_turn"] = round(stats["bytes"] / stats["submitted"]) if stats["submitted"] else 0
+        return stats
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            except Exception:
+                traceback.print_exc()
+                self.counters["failed"] += len(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch):
+        attempt = 0
+        while batch:
+            try:
+                result = await self.collection.bulk_write(batch, ordered=True)
+            except BulkWriteError as e:
+                # An ordered bulk write stops at the first failing update: drop it and write the rest.
+                failed = e.details["writeErrors"][0]["index"]
+                print(f"Chat turn write failed: {e.details['writeErrors'][0].get('errmsg')}")
+                self._count_written(batch[:failed], e.details.get("nMatched", 0))
+                self.counters["failed"] += 1
+                batch = batch[failed + 1:]
+                continue
+            except PyMongoError as e:
+                if attempt >= self.retries:
+                    print(f"Chat turn write failed after {attempt + 1} attempts: {e}")
+                    self.counters["failed"] += len(batch)
+                    return
+                attempt += 1
+                self.counters["retries"] += 1
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+                continue
+            self._count_written(batch, result.matched_count)
+            return
+
+    def _count_written(self, updates, matched):
+        self.counters["batches"] += 1
+        self.counters["written"] += matched
+        self.counters["skipped"] += len(updates) - matched
@@ -0,0 +1,121 @@
+"""
+This module relays a streamed chat completion to the client, tuned for time to first token.
+
+The first piece of text is sent as soon as it arrives. After that, the small deltas of the stream are batched:
+text is held until ``CHAT_FLUSH_CHARS`` characters are waiting or ``CHAT_FLUSH_MS`` passed since the last
+flush, so a fast model does not cost one HTTP chunk per token while a slow one still shows progress. The
+streamed text is collected in a list of parts that the caller joins once the stream ends.
+
+Environment:
+    - ``CHAT_FLUSH_CHARS``: Characters that are flushed right away once waiting (32; 0 flushes every delta).
+    - ``CHAT_FLUSH_MS``: Longest time text waits for more before it is flushed (50).
+
+Classes:
+    - ChatStreamer: Batches the deltas of streamed completions and measures their latency.
+"""
+
+import os
+import time
+import asyncio
+from collections import deque
+
+LATENCY_SAMPLES = 1000
+
+
+def _percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else None
+
+
+class ChatStreamer:
+    """
+    Batches the deltas of streamed chat completions and measures time to first token and the gaps between
+    flushes.
+
+    Args:
+        flush_chars (int, optional): Characters flushed right away once waiting (``CHAT_FLUSH_CHARS``).
+        flush_ms (float, optional): Longest wait of text before it is flushed (``CHAT_FLUSH_MS``).
+    """
+    def __init__(self, flush_chars=None, flush_ms=None):
+        self.flush_chars = int(os.getenv("CHAT_FLUSH_CHARS", 32)) if flush_chars is None else flush_chars
+        self.flush_seconds = (float(os.getenv("CHAT_FLUSH_MS", 50)) if flush_ms is None else flush_ms) / 1000
+        self.first_token = deque(maxlen=LATENCY_SAMPLES)
+        self.gaps = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {"streams": 0, "completed": 0, "interrupted": 0, "deltas": 0, "flushes": 0, "chars": 0}
+
+    async def relay(self, response, parts, started):
+        """
+        Yields the text of a streamed completion in batches, collecting every delta in ``parts``.
+
+        Args:
+            response: Async iterator of completion chunks (``create(stream=True)``).
+            parts (list): Receives the text deltas; ``"".join(parts)`` is the full answer once the stream ends.
+            started (float): ``time.perf_counter()`` when the request arrived, for the time to first token.
+
+        Yields:
+            str: Batches of text.
+        """
+        self.counters["streams"] += 1
+        chunks = response.__aiter__()
+        pending, waiting, last = [], 0, None
+        upcoming = None
+        try:
+            while True:
+                if pending:
+                    # Held text goes out when its time is up, even if the model is slow to send more.
+                    upcoming = upcoming or asyncio.ensure_future(chunks.__anext__())
+                    timeout = last + self.flush_seconds - time.perf_counter()
+                    done = upcoming.done() or timeout > 0 and (await asyncio.wait({upcoming}, timeout=timeout))[0]
+                    if not done:
+                        yield self._flush(pending, waiting, last)
+                        pending, waiting, last = [], 0, time.perf_counter()
+                        continue
+                try:
+                    chunk = await (upcoming or chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                finally:
+                    upcoming = None
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if not content:
+                    continue
+                parts.append(content)
+                pending.append(content)
+                waiting += len(content)
+                self.counters["deltas"] += 1
+                if last is None or waiting >= self.flush_chars or time.perf_counter() - last >= self.flush_seconds:
+                    if last is None:
+                        self.first_token.append(time.perf_counter() - started)
+                    yield self._flush(pending, waiting, last)
+                    pending, waiting, last = [], 0, time.perf_counter()
+            if pending:
+                yield self._flush(pending, waiting, last)
+            self.counters["completed"] += 1
+        except BaseException:
+            # The client went away or the stream failed: the connection to the LLM is released right away.
+            self.counters["interrupted"] += 1
+            if upcoming is not None:
+                upcoming.cancel()
+            close = getattr(response, "close", None)
+            if close is not None:
+                await close()
+            raise
+
+    def stats(self):
+        """
+        Returns the stream counters and the recent p50/p95 time to first token and gap between flushes.
+        """
+        stats = dict(self.counters)
+        for name, samples in (("first_token", self.first_token), ("flush_gap", self.gaps)):
+            for share in (0.5, 0.95):
+                value = _percentile(samples, share)
+                stats[f"{name}_p{int(share * 100)}_ms"] = round(1000 * value, 1) if value is not None else None
+        stats["avg_flush_chars"] = round(stats["chars"] / stats["flushes"], 1) if stats["flushes"] else 0.0
+        return stats
+
+    def _flush(self, pending, waiting, last):
+        if last is not None:
+            self.gaps.append(time.perf_counter() - last)
+        self.counters["flushes"] += 1
+        self.counters["chars"] += waiting
+        return "".join(pending)
@@ -0,0 +1,279 @@
+"""
+This module provides the building blocks for chunked, parallel transcription of long recordings.
+
+A recording is cut on silence boundaries into chunks of roughly ``SARVAM_CHUNK_SECONDS``. Every chunk after the
+first starts ``SARVAM_CHUNK_OVERLAP`` seconds early, so neighbouring chunks share a short stretch of audio.
+Chunks are transcribed concurrently; a failed chunk is retried on its own. The diarized entries are then shifted
+to recording time and stitched in order, using the shared stretch to map each chunk's speaker labels onto the
+labels of the chunk before it.
+
+Functions:
+    - detect_silences: Finds the duration and the silent stretches of an audio file with ffmpeg.
+    - plan_chunks: Chooses chunk boundaries close to a target length, preferring silences.
+    - split_chunk: Cuts one chunk out of an audio file.
+    - transcribe_chunks: Transcribes chunks concurrently, retrying failed chunks only.
+    - stitch_entries: Merges per-chunk diarized entries into one ordered list with consistent speakers.
+"""
+
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+from fastapi import HTTPException
+
+
+class Chunk:
+    """
+    A slice of a recording.
+
+    Attributes:
+        index (int): Position of the chunk in the recording.
+        start (float): Start of the chunk's own stretch, in seconds.
+        end (float): End of the chunk's own stretch, in seconds.
+        audio_start (float): Start of the audio sent for this chunk (``start`` minus the overlap).
+        path (str): Path of the chunk's audio file, once split.
+        data (bytes): In-memory audio of the chunk, for streamed recordings.
+    """
+    def __init__(self, index, start, end, audio_start, data=None):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.audio_start = audio_start
+        self.path = None
+        self.data = data
+
+
+def detect_silences(file_path, noise_db=None, min_silence=None):
+    """
+    Finds the duration and the silent stretches of an audio file.
+
+    Args:
+        file_path (str): Path to the audio file.
+        noise_db (float, optional): Level below which audio counts as silence, in dB.
+        min_silence (float, optional): Shortest silence to report, in seconds.
+
+    Returns:
+        tuple: The duration in seconds and a list of ``(start, end)`` silences.
+
+    Raises:
+        HTTPException: If ffmpeg cannot read the file.
+    """
+    noise_db = noise_db if noise_db is not None else float(os.getenv("SARVAM_SILENCE_DB", -35))
+    min_silence = min_silence if min_silence is not None else float(os.getenv("SARVAM_SILENCE_SECONDS", 0.5))
+    try:
+        _, stderr = (
+            ffmpeg.input(file_path)
+            .filter("silencedetect", noise=f"{noise_db}dB", d=min_silence)
+            .output("-", format="null")
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    except ffmpeg.Error as e:
+        raise HTTPException(status_code=303, detail=f"Failed to analyse audio: {e.stderr.decode(errors='ignore')[-500:]}")
+
+    log = stderr.decode(errors="ignore")
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", log)
+    duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3)) if match else 0.0
+    # Without a container duration (e.g. raw streams) fall back to the last timestamp ffmpeg reported.
+    if not duration:
+        times = re.findall(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)", log)
+        if times:
+            h, m, sec = times[-1]
+            duration = int(h) * 3600 + int(m) * 60 + float(sec)
+
+    starts = [float(x) for x in re.findall(r"silence_start: (-?\d+(?:\.\d+)?)", log)]
+    ends = [float(x) for x in re.findall(r"silence_end: (\d+(?:\.\d+)?)", log)]
+    ends += [duration] * (len(starts) - len(ends))
+    return duration, [(max(0.0, s), e) for s, e in zip(starts, ends)]
+
+
+def plan_chunks(duration, silences, target=None, overlap=None):
+    """
+    Chooses chunk boundaries close to a target length, preferring the middle of a silence.
+
+    A boundary is placed in the silence nearest to ``target`` seconds after the previous boundary, looking
+    between half and one and a half times the target. When there is no silence in that window the chunk is cut
+    at ``target`` seconds.
+
+    Args:
+        duration (float): Duration of the recording in seconds.
+        silences (list): ``(start, end)`` silent stretches, in seconds.
+        target (float, optional): Preferred chunk length in seconds.
+        overlap (float, optional): Seconds of audio each chunk shares with the previous one.
+
+    Returns:
+        list: The chunks, in order.
+    """
+    target = target or float(os.getenv("SARVAM_CHUNK_SECONDS", 300))
+    overlap = overlap if overlap is not None else float(os.getenv("SARVAM_CHUNK_OVERLAP", 2))
+    midpoints = [(s + e) / 2 for s, e in silences]
+
+    chunks = []
+    start = 0.0
+    while duration - start > target * 1.5:
+        candidates = [m for m in midpoints if start + target * 0.5 <= m <= start + target * 1.5]
+        end = min(candidates, key=lambda m: abs(m - start - target)) if candidates else start + target
+        chunks.append(Chunk(len(chunks), start, end, max(0.0, start - overlap) if chunks else 0.0))
+        start = end
+    chunks.append(Chunk(len(chunks), start, duration, max(0.0, start - overlap) if chunks else 0.0))
+    return chunks
+
+
+def split_chunk(file_path, chunk, output_dir, audio_format="wav", acodec=None):
+    """
+    Cuts one chunk out of an audio file as 16 kHz mono audio.
+
+    Args:
+        file_path (str): Path to the audio file.
+        chunk (Chunk): Chunk from ``plan_chunks``; its ``path`` is filled in.
+        output_dir (str): Folder that receives the chunk file.
+        audio_format (str, optional): Container/extension of the chunk file.
+        acodec (str, optional): Audio codec of the chunk file; ffmpeg picks one from the extension if unset.
+
+    Returns:
+        str: Path of the chunk file.
+
+    Raises:
+        HTTPException: If ffmpeg fails to cut the chunk.
+    """
+    chunk.path = os.path.join(output_dir, f"chunk_{chunk.index:04d}.{audio_format}")
+    try:
+        (
+            ffmpeg.input(file_path, ss=chunk.audio_start, t=chunk.end - chunk.audio_start)
+            .output(chunk.path, ac=1, ar=16000, **({"acodec": acodec} if acodec else {}))
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        raise HTTPException(status_code=303, detail=f"Failed to split audio: {e.stderr.decode(errors='ignore')[-500:]}")
+    return chunk.path
+
+
+def transcribe_chunks(chunks, transcribe, concurrency=None, retries=None):
+    """
+    Transcribes chunks concurrently. A failing chunk is retried on its own with exponential backoff.
+
+    ``chunks`` may be a lazy iterator: the next chunk is only pulled once fewer than ``concurrency`` chunks are
+    in flight, and a chunk's in-memory ``data`` is dropped as soon as it is transcribed, so a streaming producer
+    never holds more than ``concurrency`` chunks at a time.
+
+    Args:
+        chunks (iterable): Chunks to transcribe.
+        transcribe (callable): ``transcribe(chunk) -> list`` returning the chunk's diarized entries.
+        concurrency (int, optional): Number of chunks transcribed at the same time.
+        retries (int, optional): Extra attempts per chunk.
+
+    Returns:
+        list: One entry list per chunk, in chunk order.
+
+    Raises:
+        HTTPException: If a chunk still fails after its retries.
+    """
+    concurrency = concurrency or int(os.getenv("SARVAM_CHUNK_CONCURRENCY", 4))
+    retries = retries if retries is not None else int(os.getenv("SARVAM_CHUNK_RETRIES", 2))
+    slots = threading.BoundedSemaphore(concurrency)
+    failed = threading.Event()
+
+    def attempt(chunk):
+        try:
+            for i in range(retries + 1):
+                try:
+                    return transcribe(chunk)
+                except Exception as e:
+                    if i == retries:
+                        failed.set()
+                        detail = e.detail if isinstance(e, HTTPException) else str(e)
+                        raise HTTPException(status_code=305, detail=f"Failed to transcribe audio chunk {chunk.index}: {detail}")
+                    time.sleep(2 ** i)
+        finally:
+            chunk.data = None
+            slots.release()
+
+    iterator = iter(chunks)
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while not failed.is_set():
+                slots.acquire()
+                chunk = next(iterator, None)
+                if chunk is None:
+                    slots.release()
+                    break
+                futures.append(executor.submit(attempt, chunk))
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+    return [future.result() for future in futures]
+
+
+def _overlap(a_start, a_end, b_start, b_end):
+    return max(0.0, min(a_end, b_end) - max(a_start, b_start))
+
+
+def stitch_entries(chunks, chunk_entries):
+    """
+    Merges per-chunk diarized entries into one ordered list with recording-wide speaker labels.
+
+    Entry times are shifted from chunk time to recording time. Entries of a chunk that fall mostly in the stretch
+    it shares with the previous chunk are used to map its speaker labels onto the previous chunk's labels (by
+    how much their speech overlaps in time). Entries ending inside that stretch are then dropped; an entry
+    running past it is kept whole, as the previous chunk's audio stopped at the boundary. Speakers that cannot be matched keep their
+    own label unless it is already taken in this chunk; then they take a known speaker that is still free in
+    this chunk, or a new label.
+
+    Args:
+        chunks (list): The chunks, in order.
+        chunk_entries (list): Sarvam diarized entries per chunk (``speaker_id``, ``transcript``,
+            ``start_time_seconds``, ``end_time_seconds``).
+
+    Returns:
+        list: Entries in recording order with ``speaker_id`` mapped to recording-wide labels.
+    """
+    stitched = []
+    known_speakers = set()
+    for chunk, entries in zip(chunks, chunk_entries):
+        shifted = []
+        for entry in entries:
+            entry = dict(entry)
+            entry["start_time_seconds"] = float(entry.get("start_time_seconds") or 0.0) + chunk.audio_start
+            entry["end_time_seconds"] = float(entry.get("end_time_seconds") or 0.0) + chunk.audio_start
+            shifted.append(entry)
+
+        shared = [e for e in shifted if (e["start_time_seconds"] + e["end_time_seconds"]) / 2 < chunk.start]
+        dropped = {id(e) for e in shifted if e["end_time_seconds"] <= chunk.start}
+        previous = [e for e in stitched if e["end_time_seconds"] > chunk.audio_start]
+
+        scores = {}
+        for entry in shared:
+            for earlier in previous:
+                amount = _overlap(entry["start_time_seconds"], entry["end_time_seconds"], earlier["start_time_seconds"], earlier["end_time_seconds"])
+                if amount:
+                    key = (entry.get("speaker_id"), earlier["speaker_id"])
+                    scores[key] = scores.get(key, 0.0) + amount
+
+        mapping = {}
+        for (local, global_label), _ in sorted(scores.items(), key=lambda item: -item[1]):
+            if local not in mapping and global_label not in mapping.values():
+                mapping[local] = global_label
+
+        for entry in shifted:
+            if id(entry) in dropped:
+                continue
+            local = entry.get("speaker_id", "Unknown Speaker")
+            if local not in mapping:
+                free = sorted(known_speakers - set(mapping.values()))
+                if local not in mapping.values():
+                    label = local
+                elif free:
+                    label = free[0]
+                else:
+                    label = f"speaker_{len(known_speakers)}"
+                    while label in known_speakers or label in mapping.values():
+                        label = f"{label}_"
+                mapping[local] = label
+            entry["speaker_id"] = mapping[local]
+            known_speakers.add(entry["speaker_id"])
+            stitched.append(entry)
+    return stitched
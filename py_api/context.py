@@ -0,0 +1,291 @@
+"""
+This module fits chat prompts into a token budget per model.
+
+A chat prompt is built from three parts:
+
+    - the source context (the transcript, or the transcripts found for a project chat), pinned once in the
+      system message instead of being repeated in the history
+    - a rolling summary of the older turns
+    - the most recent turns, verbatim
+
+The recent turns get at most ``CHAT_HISTORY_SHARE`` of the budget; the source context gets whatever the
+instructions, the summary, the recent turns and the question leave, and is cut if it is longer. Turns that no
+longer fit in the history share are folded into the summary by an extra LLM call that runs after the reply, so
+the prompt stays within the budget however long the session gets.
+
+Tokens are counted with ``tiktoken`` when it is installed and its encodings can be loaded; otherwise they are
+estimated at four characters per token.
+
+Environment:
+    - ``CHAT_TOKEN_BUDGET``: Prompt tokens per request (32000).
+    - ``CHAT_TOKEN_BUDGETS``: Per-model budgets, e.g. ``gpt-4o=60000,gpt-4o-mini=24000`` (unset).
+    - ``CHAT_HISTORY_SHARE``: Fraction of the budget used for verbatim recent turns (0.25).
+    - ``CHAT_SUMMARY_TOKENS``: Longest rolling summary, in tokens (400).
+    - ``CHAT_SUMMARY_MODEL``: Model writing the summaries (``CHAT_MODEL``).
+    - ``CHAT_SUMMARY_PROMPT``: Instructions for the summaries (built-in default).
+
+Classes:
+    - ContextWindow: Builds budgeted prompts and updates the rolling summaries.
+
+Functions:
+    - count_tokens: Counts the tokens of a text.
+    - truncate_tokens: Cuts a text to a number of tokens.
+    - message_tokens: Counts the prompt tokens of a list of chat messages.
+    - group_turns: Groups stored history messages by turn, leaving out summarized turns.
+"""
+
+import os
+import threading
+
+from fastapi import HTTPException
+
+# Tokens added by the chat format per message and once per reply (OpenAI's published counting rule).
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+CHARS_PER_TOKEN = 4
+
+DEFAULT_SUMMARY_PROMPT = (
+    "You maintain the memory of a conversation about user research. Merge the earlier summary and the new "
+    "turns into one short summary. Keep the questions asked, the findings and numbers given in the answers, "
+    "and anything the user asked to remember. Leave out pleasantries. Answer with the summary only."
+)
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model):
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                # Not installed, or the encoding files cannot be downloaded: fall back to the estimate.
+                print(f"Token counting for {model} falls back to an estimate: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model):
+    """
+    Counts the tokens of ``text`` for ``model``.
+
+    Args:
+        text (str): The text.
+        model (str): Model name, used to pick the tokenizer.
+
+    Returns:
+        int: Number of tokens.
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model):
+    """
+    Cuts ``text`` to its first ``max_tokens`` tokens.
+
+    Returns:
+        str: The text, unchanged if it already fits.
+    """
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def message_tokens(messages, model):
+    """
+    Counts the prompt tokens of chat ``messages``, including the per-message and reply overhead.
+    """
+    return REPLY_OVERHEAD + sum(MESSAGE_OVERHEAD + count_tokens(m["content"], model) for m in messages)
+
+
+def group_turns(history, summary_upto=0):
+    """
+    Groups stored history messages by turn, leaving out turns already covered by the summary.
+
+    Messages saved before turns were numbered count as turn 0; system messages (the context the chat used
+    to repeat in its history) are left out.
+
+    Args:
+        history (list): Stored history messages; each has ``role``, ``content`` and usually ``turn``.
+        summary_upto (int): Turns below this number are covered by the summary.
+
+    Returns:
+        list: ``(turn, messages)`` pairs in order, the messages reduced to ``role`` and ``content``.
+    """
+    turns = []
+    for message in history:
+        if message.get("role") == "system":
+            continue
+        turn = message.get("turn", 0)
+        if turn < summary_upto:
+            continue
+        if not turns or turns[-1][0] != turn:
+            turns.append((turn, []))
+        turns[-1][1].append({"role": message["role"], "content": message["content"]})
+    return turns
+
+
+class ContextWindow:
+    """
+    Builds chat prompts that fit the token budget of the model and keeps the rolling summaries up to date.
+
+    Args:
+        client (AsyncOpenAI): Client used for the summaries.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.default_budget = int(os.getenv("CHAT_TOKEN_BUDGET", 32000))
+        self.budgets = {}
+        for item in filter(None, os.getenv("CHAT_TOKEN_BUDGETS", "").split(",")):
+            model, _, tokens = item.partition("=")
+            self.budgets[model.strip()] = int(tokens)
+        self.history_share = float(os.getenv("CHAT_HISTORY_SHARE", 0.25))
+        self.summary_tokens = int(os.getenv("CHAT_SUMMARY_TOKENS", 400))
+        self.summary_prompt = os.getenv("CHAT_SUMMARY_PROMPT", DEFAULT_SUMMARY_PROMPT)
+        self.lock = threading.Lock()
+        self.counters = {"prompts": 0, "prompt_tokens": 0, "max_prompt_tokens": 0, "source_truncated": 0,
+                         "turns_left_out": 0, "summaries": 0, "summary_failures": 0, "turns_summarized": 0}
+
+    def budget(self, model):
+        """
+        Returns the prompt token budget of ``model``.
+        """
+        return self.budgets.get(model, self.default_budget)
+
+    def build(self, model, instructions, source, summary, turns, question):
+        """
+        Builds the messages of one chat request within the model's budget.
+
+        Args:
+            model (str): Chat model.
+            instructions (str): Chat instructions (prompt and answer format).
+            source (str): Source context; cut to the tokens left by the other parts.
+            summary (str): Rolling summary of the earlier turns.
+            turns (list): ``(turn, messages)`` pairs not covered by the summary, oldest first.
+            question (str): The user's question.
+
+        Returns:
+            tuple: The messages and their prompt token count.
+        """
+        budget = self.budget(model)
+        summary_part = f"\n\nSummary of the earlier conversation: {summary}" if summary else ""
+        question_message = {"role": "user", "content": question}
+        used = message_tokens([{"role": "system", "content": instructions + summary_part}, question_message], model)
+        counters = {"turns_left_out": 0, "source_truncated": 0}
+
+        # Newest turns first, whole turns only, within the history share.
+        recent = []
+        allowance = int(budget * self.history_share)
+        for index in range(len(turns) - 1, -1, -1):
+            tokens = message_tokens(turns[index][1], model) - REPLY_OVERHEAD
+            if tokens > allowance:
+                counters["turns_left_out"] = index + 1
+                break
+            allowance -= tokens
+            used += tokens
+            recent[:0] = turns[index][1]
+
+        source_part = ""
+        if source:
+            label = "\n\nContext: "
+            fitted = truncate_tokens(source, budget - used - count_tokens(label, model), model)
+            counters["source_truncated"] = int(len(fitted) < len(source))
+            if fitted:
+                source_part = label + fitted
+
+        messages = [{"role": "system", "content": instructions + source_part + summary_part}, *recent, question_message]
+        tokens = message_tokens(messages, model)
+        with self.lock:
+            for name, value in counters.items():
+                self.counters[name] += value
+            self.counters["prompts"] += 1
+            self.counters["prompt_tokens"] += tokens
+            self.counters["max_prompt_tokens"] = max(self.counters["max_prompt_tokens"], tokens)
+        return messages, tokens
+
+    def turns_to_fold(self, model, turns, max_turns=None):
+        """
+        Returns how many of the oldest ``turns`` should be folded into the summary.
+
+        Nothing is folded while the turns fit in the history share and, with ``max_turns``, are fewer than that.
+        Otherwise the oldest turns are folded until the rest fits in half of both limits, so a summary call
+        covers several turns.
+
+        Args:
+            model (str): Chat model.
+            turns (list): ``(turn, messages)`` pairs not covered by the summary, oldest first.
+            max_turns (int, optional): Most turns kept verbatim, e.g. the number of turns the session saves.
+
+        Returns:
+            int: Number of turns to fold.
+        """
+        allowance = int(self.budget(model) * self.history_share)
+        max_turns = max_turns or len(turns) + 1
+        sizes = [message_tokens(messages, model) - REPLY_OVERHEAD for _, messages in turns]
+        total = sum(sizes)
+        if total <= allowance and len(turns) < max_turns:
+            return 0
+        fold = 0
+        while fold < len(turns) - 1 and (total > allowance // 2 or len(turns) - fold > max_turns // 2):
+            total -= sizes[fold]
+            fold += 1
+        return fold
+
+    async def summarize(self, model, summary, turns):
+        """
+        Folds ``turns`` into ``summary`` with one LLM call.
+
+        Args:
+            model (str): Chat model; ``CHAT_SUMMARY_MODEL`` overrides it.
+            summary (str): Current summary.
+            turns (list): ``(turn, messages)`` pairs to fold in.
+
+        Returns:
+            str: The new summary.
+
+        Raises:
+            HTTPException: If the summary could not be generated.
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for _, messages in turns for m in messages)
+        try:
+            response = await self.client.chat.completions.create(
+                model=os.getenv("CHAT_SUMMARY_MODEL") or model,
+                messages=[
+                    {"role": "system", "content": self.summary_prompt},
+                    {"role": "user", "content": f"Earlier summary: {summary or '(none)'}\n\nNew turns:\n{transcript}"},
+                ],
+                max_tokens=self.summary_tokens,
+                n=1,
+            )
+        except Exception as e:
+            with self.lock:
+                self.counters["summary_failures"] += 1
+            raise HTTPException(status_code=404, detail=f"Failed to summarize chat history with error: {e}")
+        with self.lock:
+            self.counters["summaries"] += 1
+            self.counters["turns_summarized"] += len(turns)
+        return response.choices[0].message.content.strip()
+
+    def stats(self):
+        """
+        Returns the prompt counters, including the average prompt size.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        stats["avg_prompt_tokens"] = round(stats["prompt_tokens"] / stats["prompts"]) if stats["prompts"] else 0
+        return stats
@@ -0,0 +1,202 @@
+"""
+This module provides a content-addressed transcript store, so identical media is only transcribed once.
+
+A transcript is stored under a key made from the media fingerprint (S3 ETag and size, or a SHA-256 of the
+content) and the parameters that change the output (method, language, speaker count). Requests for a key that
+is already stored return the saved transcript. Requests for a key that is being transcribed wait for that run
+instead of starting another one, both within this process and across processes sharing the collection.
+
+Environment:
+    - ``TRANSCRIPT_DEDUP``: ``on`` (default) or ``off``.
+    - ``TRANSCRIPT_DEDUP_HASH``: ``etag`` (default, uses the S3 ETag and size) or ``sha256`` (streams the
+      object once to hash its bytes, which also matches copies uploaded with different part sizes).
+    - ``TRANSCRIPT_DEDUP_POLL``: Seconds between checks while another process transcribes the same media (2).
+    - ``TRANSCRIPT_DEDUP_HEARTBEAT``: Seconds between heartbeats of a running transcription (30).
+
+Classes:
+    - TranscriptStore: Looks up, coalesces and stores transcripts by content key.
+
+Functions:
+    - content_key: Builds the store key from a media fingerprint and transcription parameters.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+ENTRY_PENDING = "pending"
+ENTRY_DONE = "done"
+KEY_VERSION = 1
+
+
+def content_key(fingerprint, **params):
+    """
+    Builds the store key for a media fingerprint and the parameters that affect its transcript.
+
+    Args:
+        fingerprint (str): Fingerprint of the media content.
+        **params: Transcription parameters (e.g. method, language, speaker count). ``None`` values are kept,
+            so "no language given" and "en-IN" are different keys.
+
+    Returns:
+        str: Hex SHA-256 key.
+    """
+    payload = json.dumps({"v": KEY_VERSION, "media": fingerprint, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class TranscriptStore:
+    """
+    Stores transcripts by content key in Mongo and makes sure each key is transcribed at most once at a time.
+
+    Args:
+        collection: Async (motor) collection holding the transcripts.
+        poll_seconds (float, optional): Seconds between checks while another process transcribes a key.
+        heartbeat_seconds (float, optional): Seconds between heartbeats of a running transcription. A pending
+            entry without a heartbeat for three intervals is taken over by the next request.
+    """
+    def __init__(self, collection, poll_seconds=None, heartbeat_seconds=None):
+        self.collection = collection
+        self.enabled = os.getenv("TRANSCRIPT_DEDUP", "on") != "off"
+        self.poll_seconds = poll_seconds or float(os.getenv("TRANSCRIPT_DEDUP_POLL", 2))
+        self.heartbeat_seconds = heartbeat_seconds or float(os.getenv("TRANSCRIPT_DEDUP_HEARTBEAT", 30))
+        self.owner = uuid.uuid4().hex
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.counters = {"lookups": 0, "hits": 0, "coalesced": 0, "misses": 0, "errors": 0}
+        self.seconds_saved = 0.0
+
+    async def fetch(self, key, produce):
+        """
+        Returns the transcript stored under ``key``, producing and storing it if needed.
+
+        Args:
+            key (str): Content key from ``content_key``.
+            produce (callable): Coroutine function returning the transcript when it is not stored yet.
+
+        Returns:
+            str: The transcript.
+        """
+        if not self.enabled:
+            return await produce()
+        self._count("lookups")
+
+        entry = await self.collection.find_one({"_id": key, "status": ENTRY_DONE})
+        if entry is not None:
+            return await self._hit(entry)
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self._count("coalesced")
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._produce_once(key, produce))
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """
+        Returns the lookup counters and the hit rate (stored hits and coalesced requests over lookups).
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            seconds_saved = self.seconds_saved
+        lookups = counters["lookups"]
+        counters["hit_rate"] = round((counters["hits"] + counters["coalesced"]) / lookups, 3) if lookups else 0.0
+        counters["inflight"] = len(self.inflight)
+        counters["transcription_seconds_saved"] = round(seconds_saved, 1)
+        return counters
+
+    def _count(self, name, seconds_saved=0.0):
+        with self.lock:
+            self.counters[name] += 1
+            self.seconds_saved += seconds_saved
+
+    async def _hit(self, entry):
+        self._count("hits", entry.get("transcribe_seconds") or 0.0)
+        await self.collection.update_one(
+            {"_id": entry["_id"]}, {"$inc": {"hits": 1}, "$set": {"last_hit_at": datetime.utcnow()}}
+        )
+        return entry["transcript"]
+
+    async def _produce_once(self, key, produce):
+        while True:
+            now = datetime.utcnow()
+            try:
+                await self.collection.insert_one({
+                    "_id": key, "status": ENTRY_PENDING, "owner": self.owner, "hits": 0,
+                    "created_at": now, "heartbeat_at": now,
+                })
+                break
+            except DuplicateKeyError:
+                pass
+
+            entry = await self.collection.find_one({"_id": key})
+            if entry is None:
+                continue
+            if entry["status"] == ENTRY_DONE:
+                return await self._hit(entry)
+
+            # Another process is transcribing this media: take over if it stopped heartbeating, otherwise wait.
+            stale_before = now - timedelta(seconds=self.heartbeat_seconds * 3)
+            claimed = await self.collection.find_one_and_update(
+                {"_id": key, "status": ENTRY_PENDING, "heartbeat_at": {"$lt": stale_before}},
+                {"$set": {"owner": self.owner, "heartbeat_at": now}}
+            )
+            if claimed is not None:
+                break
+            entry = await self._wait_for_other(key)
+            if entry is not None:
+                self._count("coalesced")
+                return entry["transcript"]
+
+        self._count("misses")
+        heartbeat = asyncio.create_task(self._heartbeat(key))
+        started = time.monotonic()
+        try:
+            transcript = await produce()
+        except BaseException:
+            self._count("errors")
+            await self.collection.delete_one({"_id": key, "owner": self.owner})
+            raise
+        finally:
+            heartbeat.cancel()
+
+        await self.collection.update_one({"_id": key}, {"$set": {
+            "status": ENTRY_DONE, "transcript": transcript, "owner": None,
+            "transcribe_seconds": time.monotonic() - started, "completed_at": datetime.utcnow(),
+        }})
+        return transcript
+
+    async def _wait_for_other(self, key):
+        """
+        Polls a key pending in another process. Returns the finished entry, or None when the run was dropped
+        (failed or went stale) and this process should try to claim the key itself.
+        """
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            entry = await self.collection.find_one({"_id": key})
+            if entry is None:
+                return None
+            if entry["status"] == ENTRY_DONE:
+                return entry
+            if entry["heartbeat_at"] < datetime.utcnow() - timedelta(seconds=self.heartbeat_seconds * 3):
+                return None
+
+    async def _heartbeat(self, key):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self.collection.update_one(
+                    {"_id": key, "owner": self.owner}, {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+            except Exception as e:
+                print(f"Heartbeat of transcript cache entry {key} not stored: {e}")
@@ -0,0 +1,335 @@
+"""
+This module provides chunk embeddings for transcript retrieval and a memory-mapped store to search them.
+
+Each project's chunk embeddings are kept in one contiguous row-major matrix on disk (``{project}.vec``, raw
+``EMBEDDING_DTYPE`` values) with a JSON sidecar (``{project}.json``) mapping transcripts to row ranges. The matrix
+is memory-mapped read-only, so it is shared through the page cache instead of being copied into every worker, and
+survives restarts: a transcript is embedded once, when it is first indexed with new text. Rows of changed or
+removed transcripts are left in place and skipped; the file is rewritten once more than half of it is dead.
+Appends and rewrites take a file lock, so several workers can share the folder.
+
+A search is one matrix-vector product over the (normalized) rows followed by ``argpartition`` for the top k.
+
+Embedders have one coroutine, ``embed(texts)``, returning an ``(n, dimensions)`` float32 array of unit rows:
+
+    - ``openai``: the embeddings API (``EMBEDDING_MODEL``), in batches of ``EMBEDDING_BATCH`` texts
+    - ``hash``: a local, deterministic feature-hashing embedder (words and character trigrams); it needs no
+      network and is meant for tests and benchmarks, as it only matches shared words, not paraphrases
+
+Environment:
+    - ``EMBEDDING_BACKEND``: ``off``, ``openai`` or ``hash`` (off).
+    - ``EMBEDDING_MODEL``: OpenAI embedding model (text-embedding-3-small).
+    - ``EMBEDDING_DIMENSIONS``: Embedding size (256).
+    - ``EMBEDDING_BATCH``: Texts per embeddings request (256).
+    - ``EMBEDDING_DTYPE``: ``float32`` or ``float16`` storage (float32). float16 halves the files and the page
+      cache they use, but numpy has no fast float16 matrix product, so searches convert blocks of rows to
+      float32 and take several times longer.
+    - ``EMBEDDING_DIR``: Folder of the stores (``<system temp>/uxr-embeddings``).
+
+Classes:
+    - OpenAIEmbedder: Embeds texts with the OpenAI embeddings API.
+    - HashEmbedder: Deterministic local embedder.
+    - VectorStore: Memory-mapped embedding matrix of one project.
+
+Functions:
+    - make_embedder: Returns the embedder selected by ``EMBEDDING_BACKEND``.
+"""
+
+import os
+import json
+import fcntl
+import asyncio
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from fastapi import HTTPException
+
+# Rows converted to float32 at a time when scoring a float16 matrix (numpy has no BLAS path for float16).
+BLOCK_ROWS = 16384
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+class OpenAIEmbedder:
+    """
+    Embeds texts with the OpenAI embeddings API.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client.
+        model (str, optional): Embedding model.
+        dimensions (int, optional): Embedding size.
+        batch_size (int, optional): Texts per request.
+    """
+    def __init__(self, client, model=None, dimensions=None, batch_size=None):
+        self.client = client
+        self.model = model or os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        self.dimensions = dimensions or int(os.getenv("EMBEDDING_DIMENSIONS", 256))
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH", 256))
+
+    async def embed(self, texts):
+        """
+        Embeds ``texts``.
+
+        Returns:
+            np.ndarray: One unit row per text.
+
+        Raises:
+            HTTPException: If the embeddings request fails.
+        """
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            try:
+                response = await self.client.embeddings.create(
+                    model=self.model, input=texts[start:start + self.batch_size], dimensions=self.dimensions
+                )
+            except Exception as e:
+                raise HTTPException(status_code=405, detail=f"Failed to embed text with error: {e}")
+            rows.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return _normalize(np.asarray(rows, dtype=np.float32).reshape(len(rows), self.dimensions))
+
+
+class HashEmbedder:
+    """
+    Deterministic local embedder: words (as split by ``retrieval.tokenize``) and their character trigrams
+    hashed into signed buckets.
+
+    Args:
+        dimensions (int, optional): Embedding size.
+    """
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions or int(os.getenv("EMBEDDING_DIMENSIONS", 256))
+
+    async def embed(self, texts):
+        """
+        Embeds ``texts``.
+
+        Returns:
+            np.ndarray: One unit row per text.
+        """
+        return await asyncio.to_thread(self.embed_sync, texts)
+
+    def embed_sync(self, texts):
+        """
+        Embeds ``texts`` on the calling thread.
+        """
+        from retrieval import tokenize
+
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = {}
+            for word in tokenize(text):
+                features[word] = features.get(word, 0) + 1.0
+                padded = f"#{word}#"
+                for i in range(len(padded) - 2):
+                    features[padded[i:i + 3]] = features.get(padded[i:i + 3], 0) + 0.5
+            for feature, weight in features.items():
+                value = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                matrix[row, value % self.dimensions] += weight if value >> 63 else -weight
+        return _normalize(matrix)
+
+
+def make_embedder(client):
+    """
+    Returns the embedder selected by ``EMBEDDING_BACKEND``, or None when embeddings are off.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client, used by the ``openai`` backend.
+    """
+    backend = os.getenv("EMBEDDING_BACKEND", "off").lower()
+    if backend == "openai":
+        return OpenAIEmbedder(client)
+    if backend == "hash":
+        return HashEmbedder()
+    if backend != "off":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    return None
+
+
+class VectorStore:
+    """
+    Memory-mapped embedding matrix of one project's transcript chunks.
+
+    Rows are addressed by transcript id and chunk position. Every transcript entry records a ``key`` (the
+    digest of the text it was embedded from), so the caller can tell which transcripts need embedding again.
+
+    Args:
+        path (str): File path without extension.
+        dimensions (int): Embedding size.
+        dtype (str, optional): Storage type (``EMBEDDING_DTYPE``).
+    """
+    def __init__(self, path, dimensions, dtype=None):
+        self.path = path
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype or os.getenv("EMBEDDING_DTYPE", "float32"))
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def for_project(project_id, dimensions):
+        """
+        Returns the store of a project in ``EMBEDDING_DIR``.
+        """
+        folder = os.getenv("EMBEDDING_DIR") or os.path.join(tempfile.gettempdir(), "uxr-embeddings")
+        return VectorStore(os.path.join(folder, project_id), dimensions)
+
+    @property
+    def rows(self):
+        """
+        Number of rows in the matrix, dead rows included.
+        """
+        return self.meta["rows"]
+
+    def key(self, transcript_id):
+        """
+        Returns the key a transcript was embedded with, or None if it is not in the store.
+        """
+        entry = self.meta["transcripts"].get(transcript_id)
+        return entry["key"] if entry else None
+
+    def transcript_ids(self):
+        """
+        Returns the ids of the transcripts in the store.
+        """
+        return set(self.meta["transcripts"])
+
+    def refresh(self):
+        """
+        Reloads the store if another process changed it.
+        """
+        if self._meta_mtime() != self.loaded_mtime:
+            self._load()
+
+    def put(self, transcript_id, key, vectors):
+        """
+        Stores the chunk embeddings of a transcript, replacing its previous rows.
+
+        Args:
+            transcript_id (str): Transcript id.
+            key (str): Digest of the text the embeddings were made from.
+            vectors (np.ndarray): One row per chunk, in chunk order.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dimensions)
+        with self._file_lock():
+            meta = self._read_meta()
+            # Appended past the last committed row, so rows a crashed writer left behind are overwritten.
+            with open(self.path + ".vec", "r+b" if os.path.exists(self.path + ".vec") else "w+b") as f:
+                f.seek(meta["rows"] * self.dimensions * self.dtype.itemsize)
+                f.write(vectors.tobytes())
+                f.truncate()
+            meta["transcripts"][transcript_id] = {"key": key, "start": meta["rows"], "count": len(vectors)}
+            meta["rows"] += len(vectors)
+            self._commit(meta)
+
+    def remove(self, transcript_ids):
+        """
+        Drops transcripts from the store; their rows are skipped until the file is rewritten.
+        """
+        with self._file_lock():
+            meta = self._read_meta()
+            for transcript_id in transcript_ids:
+                meta["transcripts"].pop(transcript_id, None)
+            self._commit(meta)
+
+    def top_k(self, query, k):
+        """
+        Returns the ``k`` rows most similar to ``query``.
+
+        Args:
+            query (np.ndarray): Unit query vector.
+            k (int): Number of results.
+
+        Returns:
+            list: ``(transcript_id, position, similarity)`` tuples, most similar first.
+        """
+        with self.lock:
+            matrix, owners, positions, transcript_ids = self.matrix, self.owners, self.positions, self.ids
+        if matrix is None or not k:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        if matrix.dtype == np.float32:
+            scores = matrix @ query
+        else:
+            scores = np.empty(len(matrix), dtype=np.float32)
+            for start in range(0, len(matrix), BLOCK_ROWS):
+                block = matrix[start:start + BLOCK_ROWS]
+                scores[start:start + len(block)] = block.astype(np.float32) @ query
+        scores[owners < 0] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(transcript_ids[owners[row]], int(positions[row]), float(scores[row]))
+                for row in top if owners[row] >= 0]
+
+    @contextmanager
+    def _file_lock(self):
+        with self.lock, open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            with open(self.path + ".json") as f:
+                meta = json.load(f)
+            if meta["dimensions"] == self.dimensions and meta["dtype"] == self.dtype.name:
+                return meta
+        except (OSError, ValueError, KeyError):
+            pass
+        return {"dimensions": self.dimensions, "dtype": self.dtype.name, "rows": 0, "transcripts": {}}
+
+    def _commit(self, meta):
+        live = sum(entry["count"] for entry in meta["transcripts"].values())
+        if meta["rows"] > 2 * live + BLOCK_ROWS // 16:
+            meta = self._rewrite(meta)
+        temp_path = f"{self.path}.json.{os.getpid()}"
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self.path + ".json")
+        self._load(meta)
+
+    def _rewrite(self, meta):
+        # Live rows are copied into a new file that replaces the old one; open maps keep the old inode.
+        old = np.memmap(self.path + ".vec", dtype=self.dtype, mode="r", shape=(meta["rows"], self.dimensions))
+        temp_path = f"{self.path}.vec.{os.getpid()}"
+        rows = 0
+        with open(temp_path, "wb") as f:
+            for entry in meta["transcripts"].values():
+                f.write(np.ascontiguousarray(old[entry["start"]:entry["start"] + entry["count"]]).tobytes())
+                entry["start"] = rows
+                rows += entry["count"]
+        del old
+        os.replace(temp_path, self.path + ".vec")
+        meta["rows"] = rows
+        return meta
+
+    def _load(self, meta=None):
+        meta = meta or self._read_meta()
+        ids = list(meta["transcripts"])
+        owners = np.full(meta["rows"], -1, dtype=np.int32)
+        positions = np.zeros(meta["rows"], dtype=np.int32)
+        for number, transcript_id in enumerate(ids):
+            entry = meta["transcripts"][transcript_id]
+            owners[entry["start"]:entry["start"] + entry["count"]] = number
+            positions[entry["start"]:entry["start"] + entry["count"]] = np.arange(entry["count"])
+        matrix = None
+        if meta["rows"]:
+            matrix = np.memmap(self.path + ".vec", dtype=self.dtype, mode="r", shape=(meta["rows"], self.dimensions))
+        with self.lock:
+            self.meta = meta
+            self.matrix, self.owners, self.positions, self.ids = matrix, owners, positions, ids
+            self.loaded_mtime = self._meta_mtime()
+
+    def _meta_mtime(self):
+        try:
+            return os.stat(self.path + ".json").st_mtime_ns
+        except OSError:
+            return None
@@ -0,0 +1,142 @@
+"""
+This module extracts text from PDF and DOCX documents.
+
+PDFs are read with PyMuPDF. Small documents are read page by page in the calling thread. Large documents are
+split into page ranges that a shared process pool extracts in parallel, and the pages are yielded back in order
+as the ranges finish, so callers can consume the text while the rest of the file is still being read. DOCX
+documents are walked in body order, and table rows are emitted next to the paragraphs around them (nested
+tables included) instead of being skipped.
+
+Environment:
+    - ``PDF_EXTRACT_WORKERS``: Processes in the extraction pool (number of CPUs).
+    - ``PDF_PARALLEL_MIN_PAGES``: Smallest page count extracted with the pool (64).
+    - ``PDF_PAGES_PER_TASK``: Pages per range handed to a pool process (16).
+
+Functions:
+    - iter_pdf_pages: Yields the text of each page of a PDF.
+    - iter_docx_blocks: Yields the paragraphs and table rows of a DOCX in document order.
+    - shutdown_extraction_pool: Stops the shared process pool.
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pymupdf
+from docx import Document
+from docx.table import Table
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+            # spawn keeps the pool processes free of the server's threads, sockets and event loop.
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_extraction_pool():
+    """
+    Stops the shared PDF extraction process pool, if it was started.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_range_texts(file_path, start, stop):
+    with pymupdf.open(file_path) as document:
+        return [document[number].get_text() for number in range(start, stop)]
+
+
+def iter_pdf_pages(file_path, parallel_min_pages=None, pages_per_task=None):
+    """
+    Yields the text of each page of a PDF, in page order.
+
+    Args:
+        file_path (str): Path to the PDF file.
+        parallel_min_pages (int, optional): Smallest page count extracted with the process pool.
+        pages_per_task (int, optional): Pages per range handed to a pool process.
+
+    Yields:
+        str: Text of one page.
+    """
+    parallel_min_pages = parallel_min_pages or int(os.getenv("PDF_PARALLEL_MIN_PAGES", 64))
+    pages_per_task = pages_per_task or int(os.getenv("PDF_PAGES_PER_TASK", 16))
+
+    with pymupdf.open(file_path) as document:
+        page_count = document.page_count
+        workers = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+        if page_count < parallel_min_pages or workers < 2:
+            for page in document:
+                yield page.get_text()
+            return
+
+    # Keep a couple of ranges per process queued, so workers stay busy while finished ranges wait to be yielded.
+    pool = _extraction_pool()
+    pending = deque()
+    next_page = 0
+    try:
+        for start in range(0, page_count, pages_per_task):
+            pending.append(pool.submit(_page_range_texts, file_path, start, min(start + pages_per_task, page_count)))
+            while len(pending) >= workers * 2 or (pending and start + pages_per_task >= page_count):
+                for text in pending.popleft().result():
+                    next_page += 1
+                    yield text
+    except BrokenProcessPool:
+        # A pool process died (e.g. killed for memory): drop the pool and read the remaining pages here.
+        print(f"PDF extraction pool failed at page {next_page} of {file_path}, continuing in-process")
+        shutdown_extraction_pool()
+        yield from _page_range_texts(file_path, next_page, page_count)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _table_rows(table):
+    for row in table.rows:
+        cells = []
+        seen = set()
+        for cell in row.cells:
+            # Merged cells are returned once per grid column they span.
+            if id(cell._tc) in seen:
+                continue
+            seen.add(id(cell._tc))
+            parts = []
+            for block in cell.iter_inner_content():
+                if isinstance(block, Table):
+                    parts.extend(_table_rows(block))
+                elif block.text.strip():
+                    parts.append(block.text.strip())
+            cells.append(" ".join(parts))
+        if any(cells):
+            yield " | ".join(cells)
+
+
+def iter_docx_blocks(file_path):
+    """
+    Yields the text of a DOCX document in reading order: one item per paragraph and one per table row, with
+    the cells of a row separated by `` | ``.
+
+    Args:
+        file_path (str): Path to the DOCX file.
+
+    Yields:
+        str: Text of one paragraph or table row.
+    """
+    document = Document(file_path)
+    for block in document.iter_inner_content():
+        if isinstance(block, Table):
+            yield from _table_rows(block)
+        else:
+            yield block.text
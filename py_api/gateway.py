@@ -0,0 +1,317 @@
+"""
+This module provides the shared LLM gateway all OpenAI calls of the service go through.
+
+The gateway wraps the ``AsyncOpenAI`` client and exposes the same ``chat.completions.create`` and
+``embeddings.create`` calls, so callers do not change. Every call is made under the limits of its model:
+
+    - a requests-per-minute and a tokens-per-minute token bucket; the tokens of a call are estimated from the
+      prompt (four characters per token) plus ``max_tokens`` before it starts, and corrected with the usage the
+      API reports afterwards
+    - a limit on the calls in flight (a streamed call counts until its response starts)
+
+Calls that fail with 429, a 5xx status, a timeout or a connection error are retried up to ``LLM_RETRIES`` times
+after a jittered exponential backoff (or the ``Retry-After`` the API asks for). The client's own retries are
+turned off so they do not multiply.
+
+With ``LLM_HEDGE`` on, a non-streamed call still running after the model's recent p95 latency gets a duplicate
+request, if the limits have room for it right away and the model's hedges stay under ``LLM_HEDGE_MAX_SHARE`` of
+its calls; the first response is used and the other is cancelled. This trades a few extra calls for a shorter
+tail.
+
+Environment:
+    - ``LLM_RPM`` / ``LLM_TPM``: Requests and tokens per minute per model, 0 for no limit (0 / 0).
+    - ``LLM_CONCURRENCY``: Calls in flight per model (64).
+    - ``LLM_MODEL_LIMITS``: Per-model ``rpm:tpm:concurrency``, e.g. ``gpt-4o=500:30000:16,gpt-4o-mini=5000:200000:64``
+      (unset).
+    - ``LLM_RETRIES``: Retries of a failed call (3).
+    - ``LLM_BACKOFF_BASE`` / ``LLM_BACKOFF_MAX``: Seconds of the first backoff and the longest one (0.5 / 20).
+    - ``LLM_HEDGE``: ``on`` or ``off`` (off).
+    - ``LLM_HEDGE_MIN_SECONDS``: Shortest wait before a hedged request (1).
+    - ``LLM_HEDGE_MIN_SAMPLES``: Calls of a model measured before its p95 is used (20).
+    - ``LLM_HEDGE_MAX_SHARE``: Most hedged requests as a share of a model's calls (0.05).
+
+Classes:
+    - TokenBucket: Token bucket refilled at a rate per minute.
+    - LLMGateway: Rate-limited, retrying and hedging front of the OpenAI client.
+"""
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from types import SimpleNamespace
+
+import openai
+
+CHARS_PER_TOKEN = 4
+LATENCY_SAMPLES = 200
+RETRY_STATUSES = (408, 409, 429)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled with ``rate`` tokens per minute, holding at most ``burst``.
+
+    Args:
+        rate (float): Tokens per minute; 0 disables the limit.
+        burst (float, optional): Bucket size. Defaults to one second's worth (at least 1).
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate / 60
+        self.burst = burst or max(1, int(self.rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waited = 0.0
+
+    async def acquire(self, amount=1):
+        """
+        Waits until ``amount`` tokens are available and takes them. Amounts above the bucket size take a full
+        bucket.
+
+        Returns:
+            float: Seconds waited.
+        """
+        if not self.rate:
+            return 0.0
+        amount = min(amount, self.burst)
+        async with self.lock:
+            self._refill()
+            delay = 0.0
+            if self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.tokens -= amount
+            return delay
+
+    def try_acquire(self, amount=1):
+        """
+        Takes ``amount`` tokens if they are available now, without waiting.
+
+        Returns:
+            bool: Whether the tokens were taken.
+        """
+        if not self.rate:
+            return True
+        amount = min(amount, self.burst)
+        if self.lock.locked():
+            return False
+        self._refill()
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def adjust(self, amount):
+        """
+        Takes ``amount`` more tokens (or gives them back when negative), e.g. once the real usage is known.
+        """
+        if self.rate:
+            self._refill()
+            self.tokens = min(self.burst, self.tokens - amount)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class _ModelLimits:
+    """
+    Buckets, concurrency slots, recent latencies and counters of one model.
+    """
+    def __init__(self, rpm, tpm, concurrency):
+        self.requests = TokenBucket(rpm)
+        # Token limits are per minute and a single prompt can be large, so the bucket holds a full minute.
+        self.tokens = TokenBucket(tpm, burst=tpm or None)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.in_flight = 0
+        self.counters = {"calls": 0, "attempts": 0, "retries": 0, "rate_limited": 0, "server_errors": 0,
+                         "failed": 0, "hedges": 0, "hedge_wins": 0, "queue_seconds": 0.0, "backoff_seconds": 0.0,
+                         "estimated_tokens": 0, "used_tokens": 0}
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] if ordered else None
+
+
+class LLMGateway:
+    """
+    Rate-limited, retrying and hedging front of the OpenAI client, shared by every LLM call of the service.
+
+    Exposes ``chat.completions.create`` and ``embeddings.create`` like ``AsyncOpenAI``.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client; its own retries are turned off.
+        retries (int, optional): Retries of a failed call (``LLM_RETRIES``).
+        hedge (bool, optional): Send hedged requests (``LLM_HEDGE``).
+    """
+    def __init__(self, client, retries=None, hedge=None):
+        self.client = client.with_options(max_retries=0)
+        self.retries = int(os.getenv("LLM_RETRIES", 3)) if retries is None else retries
+        self.backoff_base = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+        self.backoff_max = float(os.getenv("LLM_BACKOFF_MAX", 20))
+        self.hedge = os.getenv("LLM_HEDGE", "off") == "on" if hedge is None else hedge
+        self.hedge_min_seconds = float(os.getenv("LLM_HEDGE_MIN_SECONDS", 1))
+        self.hedge_min_samples = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+        self.hedge_max_share = float(os.getenv("LLM_HEDGE_MAX_SHARE", 0.05))
+        self.default_limits = (float(os.getenv("LLM_RPM", 0)), float(os.getenv("LLM_TPM", 0)),
+                               int(os.getenv("LLM_CONCURRENCY", 64)))
+        self.model_limits = {}
+        for item in filter(None, os.getenv("LLM_MODEL_LIMITS", "").split(",")):
+            model, _, values = item.partition("=")
+            rpm, tpm, concurrency = (values.split(":") + ["", "", ""])[:3]
+            defaults = self.default_limits
+            self.model_limits[model.strip()] = (float(rpm or defaults[0]), float(tpm or defaults[1]),
+                                                int(concurrency or defaults[2]))
+        self.models = {}
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.chat_completion))
+        self.embeddings = SimpleNamespace(create=self.embedding)
+
+    async def chat_completion(self, **kwargs):
+        """
+        Creates a chat completion (``AsyncOpenAI.chat.completions.create``) under the model's limits.
+
+        Returns:
+            The completion, or the stream when ``stream`` is set.
+
+        Raises:
+            openai.OpenAIError: The error of the last attempt, when every attempt failed.
+        """
+        characters = sum(len(str(message.get("content") or "")) for message in kwargs.get("messages", []))
+        tokens = characters // CHARS_PER_TOKEN + (kwargs.get("max_tokens") or 0)
+        hedge = self.hedge and not kwargs.get("stream")
+        return await self._call(kwargs["model"], tokens, lambda: self.client.chat.completions.create(**kwargs), hedge)
+
+    async def embedding(self, **kwargs):
+        """
+        Creates embeddings (``AsyncOpenAI.embeddings.create``) under the model's limits.
+
+        Raises:
+            openai.OpenAIError: The error of the last attempt, when every attempt failed.
+        """
+        texts = kwargs.get("input")
+        texts = [texts] if isinstance(texts, str) else texts or []
+        tokens = sum(len(str(text)) for text in texts) // CHARS_PER_TOKEN
+        return await self._call(kwargs["model"], tokens, lambda: self.client.embeddings.create(**kwargs), False)
+
+    def stats(self):
+        """
+        Returns the counters, calls in flight and recent p95 latency of every model.
+        """
+        stats = {}
+        with self.lock:
+            models = dict(self.models)
+        for model, limits in models.items():
+            counters = dict(limits.counters)
+            for name in ("queue_seconds", "backoff_seconds"):
+                counters[name] = round(counters[name], 3)
+            counters["in_flight"] = limits.in_flight
+            p95 = limits.p95()
+            counters["p95_seconds"] = round(p95, 3) if p95 is not None else None
+            counters["rate_limit_wait_seconds"] = round(limits.requests.waited + limits.tokens.waited, 3)
+            stats[model] = counters
+        return stats
+
+    def _limits(self, model):
+        with self.lock:
+            if model not in self.models:
+                self.models[model] = _ModelLimits(*self.model_limits.get(model, self.default_limits))
+            return self.models[model]
+
+    async def _call(self, model, tokens, create, hedge):
+        limits = self._limits(model)
+        limits.counters["calls"] += 1
+        limits.counters["estimated_tokens"] += tokens
+        queued = time.monotonic()
+        async with limits.slots:
+            limits.in_flight += 1
+            try:
+                for attempt in range(self.retries + 1):
+                    await limits.requests.acquire()
+                    await limits.tokens.acquire(tokens)
+                    if attempt == 0:
+                        limits.counters["queue_seconds"] += time.monotonic() - queued
+                    try:
+                        if hedge:
+                            response = await self._hedged(limits, tokens, create)
+                        else:
+                            response = await self._attempt(limits, create)
+                    except Exception as e:
+                        delay = self._retry_delay(limits, e, attempt)
+                        if delay is None:
+                            limits.counters["failed"] += 1
+                            raise
+                        limits.counters["retries"] += 1
+                        limits.counters["backoff_seconds"] += delay
+                        await asyncio.sleep(delay)
+                        continue
+                    usage = getattr(response, "usage", None)
+                    used = getattr(usage, "total_tokens", None)
+                    if used is not None:
+                        limits.counters["used_tokens"] += used
+                        limits.tokens.adjust(used - tokens)
+                    return response
+            finally:
+                limits.in_flight -= 1
+
+    async def _attempt(self, limits, create):
+        limits.counters["attempts"] += 1
+        started = time.monotonic()
+        response = await create()
+        limits.latencies.append(time.monotonic() - started)
+        return response
+
+    async def _hedged(self, limits, tokens, create):
+        first = asyncio.ensure_future(self._attempt(limits, create))
+        p95 = limits.p95() if len(limits.latencies) >= self.hedge_min_samples else None
+        tasks = {first}
+        try:
+            if p95 is None:
+                return await first
+            done, _ = await asyncio.wait(tasks, timeout=max(self.hedge_min_seconds, p95))
+            # Hedge only within the budget and with room to spare; a duplicate that has to queue would not
+            # shorten anything, and hedging every slow call under load would only add to the load.
+            if done or limits.counters["hedges"] >= self.hedge_max_share * limits.counters["calls"] \
+                    or not limits.requests.try_acquire() or not limits.tokens.try_acquire(tokens):
+                return await first
+            limits.counters["hedges"] += 1
+            second = asyncio.ensure_future(self._attempt(limits, create))
+            tasks.add(second)
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        limits.counters["hedge_wins"] += task is second
+                        return task.result()
+                if not tasks:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _retry_delay(self, limits, error, attempt):
+        status = getattr(error, "status_code", None)
+        if status == 429:
+            limits.counters["rate_limited"] += 1
+        elif status is not None and status >= 500:
+            limits.counters["server_errors"] += 1
+        retryable = isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)) or status in RETRY_STATUSES \
+            or (status is not None and status >= 500)
+        if not retryable or attempt >= self.retries:
+            return None
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(self.backoff_max, float(retry_after))
+        except ValueError:
+            pass
+        # Full jitter: a random wait up to the exponential backoff, so retries of a burst spread out.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
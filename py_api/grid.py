@@ -0,0 +1,287 @@
+"""
+This module answers the analysis grid: a set of questions asked of many transcripts.
+
+Every transcript is sent to the LLM with its questions (in groups of ``GRID_QUESTIONS_PER_CALL``, or all at once)
+and the calls for all transcripts run concurrently. The number of calls in flight is capped by
+``GRID_CONCURRENCY`` and their start rate by ``GRID_RATE_LIMIT``. Both limits are shared by every grid request
+of the process, so several analyses running at once do not take the whole LLM quota (the per-model quota itself
+is enforced by the ``LLMGateway`` every call goes through). Answers are yielded cell
+by cell as soon as their call returns.
+
+Transcripts longer than ``GRID_LONG_TOKENS`` are answered with map-reduce instead of one prompt: the transcript
+is split into chunks, a BM25 prefilter keeps the chunks that match each question, the evidence for the
+questions is extracted from those chunks in parallel, and a final call answers from the evidence.
+
+Environment:
+    - ``GRID_CONCURRENCY``: LLM calls in flight (8).
+    - ``GRID_RATE_LIMIT``: LLM calls started per minute, 0 for no limit (0).
+    - ``GRID_QUESTIONS_PER_CALL``: Questions per LLM call, 0 for all questions of a transcript in one call (0).
+    - ``GRID_LONG_TOKENS``: Transcript tokens above which map-reduce is used (24000).
+    - ``GRID_CHUNK_TOKENS``: Chunk size of the map step (2000).
+    - ``GRID_MAP_CHUNKS``: Chunks read per question in the map step (6).
+    - ``GRID_MAP_MAX_TOKENS`` / ``GRID_MAP_PROMPT``: Reply size and instructions of the map calls (300 / built-in).
+    - ``QA_GRID_PROMPT``, ``QA_GRID_PROMPT_FORMAT``, ``QA_GRID_PROMPT_ROLE``, ``QA_GRID_MODEL``,
+      ``QA_GRID_MAX_TOKENS``: Prompt and model of the grid calls.
+
+Classes:
+    - GridRunner: Answers grids under the shared limits.
+
+Functions:
+    - parse_answers: Reads the answer dictionary returned by the LLM.
+"""
+
+import os
+import ast
+import asyncio
+from collections import defaultdict
+
+from fastapi import HTTPException
+
+from context import count_tokens
+from retrieval import ProjectIndex
+from answercache import answer_key
+from gateway import TokenBucket
+
+DEFAULT_MAP_PROMPT = (
+    "You read one excerpt of a long user research interview. For each question, copy or closely paraphrase "
+    "what the excerpt says that helps answer it, including who said it. Use an empty string when the excerpt "
+    "says nothing about a question. Do not answer from outside the excerpt."
+)
+GRID_ENV = ("QA_GRID_PROMPT", "QA_GRID_PROMPT_FORMAT", "QA_GRID_PROMPT_ROLE", "QA_GRID_MODEL", "QA_GRID_MAX_TOKENS")
+MAP_FORMAT = (
+    "A Python dictionary literal keyed by question number, with the evidence as the value. Output it as text, "
+    "not in code."
+)
+
+
+def parse_answers(content, question_ids):
+    """
+    Reads the answer dictionary returned by the LLM and keys it like the questions.
+
+    The model is asked for a Python dictionary literal keyed by question number; keys may come back as numbers
+    or strings.
+
+    Args:
+        content (str): Message content of the LLM response.
+        question_ids (list): Ids of the questions asked, as strings.
+
+    Returns:
+        dict: Answers by question id; questions the model did not answer are left out.
+
+    Raises:
+        ValueError: If the content is not a dictionary literal.
+    """
+    answers = ast.literal_eval(content.strip())
+    if not isinstance(answers, dict):
+        raise ValueError("LLM answer is not a dictionary")
+    answers = {str(key).strip(): value for key, value in answers.items()}
+    return {qid: answers[qid] for qid in question_ids if qid in answers}
+
+
+class GridRunner:
+    """
+    Answers grids of questions and transcripts under process-wide concurrency and rate limits.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client.
+        concurrency (int, optional): LLM calls in flight (``GRID_CONCURRENCY``).
+        rate_limit (float, optional): LLM calls started per minute (``GRID_RATE_LIMIT``).
+        questions_per_call (int, optional): Questions per LLM call (``GRID_QUESTIONS_PER_CALL``).
+        long_tokens (int, optional): Transcript size above which map-reduce is used (``GRID_LONG_TOKENS``).
+        cache (AnswerCache, optional): Cache of the answers.
+    """
+    def __init__(self, client, concurrency=None, rate_limit=None, questions_per_call=None, long_tokens=None, cache=None):
+        self.client = client
+        self.cache = cache
+        self.concurrency = concurrency or int(os.getenv("GRID_CONCURRENCY", 8))
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.limiter = TokenBucket(float(os.getenv("GRID_RATE_LIMIT", 0)) if rate_limit is None else rate_limit)
+        self.questions_per_call = int(os.getenv("GRID_QUESTIONS_PER_CALL", 0)) if questions_per_call is None else questions_per_call
+        self.long_tokens = long_tokens or int(os.getenv("GRID_LONG_TOKENS", 24000))
+        self.chunk_tokens = int(os.getenv("GRID_CHUNK_TOKENS", 2000))
+        self.map_chunks = int(os.getenv("GRID_MAP_CHUNKS", 6))
+        self.map_max_tokens = int(os.getenv("GRID_MAP_MAX_TOKENS", 300))
+        self.map_prompt = os.getenv("GRID_MAP_PROMPT", DEFAULT_MAP_PROMPT)
+        self.in_flight = 0
+        self.counters = {"grids": 0, "calls": 0, "failed_calls": 0, "prompt_tokens": 0, "cells": 0, "failed_cells": 0,
+                         "long_transcripts": 0, "chunks_total": 0, "chunks_mapped": 0}
+
+    async def answer(self, transcript_text, questions, bypass_cache=False):
+        """
+        Answers ``questions`` about one transcript.
+
+        Transcripts longer than ``GRID_LONG_TOKENS`` are answered with ``answer_long``; others with one LLM call.
+        With a cache, answers are stored by transcript, questions, prompts, model and map-reduce settings.
+
+        Args:
+            transcript_text (str): Transcript text.
+            questions (dict): Questions by id.
+            bypass_cache (bool, optional): Ask the LLM even if the answers are cached.
+
+        Returns:
+            dict: Answers by question id (as strings).
+
+        Raises:
+            HTTPException: If the LLM calls fail or their answer cannot be read.
+        """
+        async def produce():
+            usage = {"calls": 0, "tokens": 0}
+            if await asyncio.to_thread(count_tokens, transcript_text, os.getenv("QA_GRID_MODEL")) > self.long_tokens:
+                return await self.answer_long(transcript_text, questions, usage), usage
+            return await self._ask(os.getenv("QA_GRID_PROMPT"), f"Context: {transcript_text}", questions,
+                                   os.getenv("QA_GRID_PROMPT_FORMAT"), int(os.getenv("QA_GRID_MAX_TOKENS")), usage), usage
+
+        if self.cache is None:
+            return (await produce())[0]
+        key = answer_key(
+            "grid", transcript_text, questions, env=GRID_ENV, long_tokens=self.long_tokens,
+            chunk_tokens=self.chunk_tokens, map_chunks=self.map_chunks, map_max_tokens=self.map_max_tokens,
+            map_prompt=self.map_prompt,
+        )
+        return await self.cache.fetch(key, produce, bypass=bypass_cache)
+
+    async def answer_long(self, transcript_text, questions, usage=None):
+        """
+        Answers ``questions`` about a long transcript with a map and a reduce step.
+
+        The transcript is split into chunks of about ``GRID_CHUNK_TOKENS`` tokens. For every question, the
+        ``GRID_MAP_CHUNKS`` chunks that match it best (BM25) are kept; a question that matches no chunk gets
+        chunks spread evenly over the transcript. Every kept chunk is sent once, with the questions it was kept
+        for, to extract their evidence (map, in parallel). The evidence, in transcript order, then replaces the
+        transcript in the usual grid prompt (reduce).
+
+        Args:
+            transcript_text (str): Transcript text.
+            questions (dict): Questions by id.
+            usage (dict, optional): ``calls`` and ``tokens`` counters to add the LLM calls to.
+
+        Returns:
+            dict: Answers by question id (as strings).
+
+        Raises:
+            HTTPException: If every map call or the reduce call fails.
+        """
+        self.counters["long_transcripts"] += 1
+        index = ProjectIndex(chunk_tokens=self.chunk_tokens)
+        await asyncio.to_thread(index.add, "transcript", transcript_text)
+        chunk_ids = index.transcripts["transcript"]["chunks"]
+        count = len(chunk_ids)
+        wanted = defaultdict(dict)
+        for qid, question in questions.items():
+            passages = index.search(str(question), max_tokens=self.chunk_tokens * self.map_chunks * 2)[:self.map_chunks]
+            positions = [p["position"] for p in passages]
+            if not positions:
+                step = count / min(count, self.map_chunks)
+                positions = sorted({int(i * step) for i in range(min(count, self.map_chunks))})
+            for position in positions:
+                wanted[position][qid] = question
+        self.counters["chunks_total"] += count
+        self.counters["chunks_mapped"] += len(wanted)
+
+        async def extract(position):
+            text = index.chunks[chunk_ids[position]].text
+            try:
+                return position, await self._ask(self.map_prompt, f"Excerpt: {text}", wanted[position],
+                                                 MAP_FORMAT, self.map_max_tokens, usage)
+            except HTTPException as e:
+                print(f"Grid evidence of chunk {position} not extracted: {e.detail}")
+                return position, None
+
+        results = sorted(await asyncio.gather(*(extract(position) for position in wanted)))
+        if all(evidence is None for _, evidence in results):
+            raise HTTPException(status_code=401, detail="Failed to generate answers from LLM: no evidence could be extracted")
+        evidence = defaultdict(list)
+        for position, found in results:
+            for qid, text in (found or {}).items():
+                if text and str(text).strip():
+                    evidence[qid].append(f"[part {position + 1}/{count}] {str(text).strip()}")
+        context = "\n\n".join(
+            f"Evidence for question {qid}:\n" + ("\n".join(evidence[str(qid)]) or "(none found)") for qid in questions
+        )
+        return await self._ask(os.getenv("QA_GRID_PROMPT"), f"Context: Evidence extracted from the transcript.\n{context}",
+                               questions, os.getenv("QA_GRID_PROMPT_FORMAT"), int(os.getenv("QA_GRID_MAX_TOKENS")), usage)
+
+    async def _ask(self, instructions, context, questions, answer_format, max_tokens, usage=None):
+        prompt = "\n\n".join([
+            instructions,
+            context,
+            f"Question: {questions}",
+            f"Answer the question in the following format: {answer_format}"
+        ])
+        tokens = await asyncio.to_thread(count_tokens, prompt, os.getenv("QA_GRID_MODEL"))
+        async with self.slots:
+            await self.limiter.acquire()
+            self.in_flight += 1
+            self.counters["calls"] += 1
+            self.counters["prompt_tokens"] += tokens
+            if usage is not None:
+                usage["calls"] += 1
+                usage["tokens"] += tokens
+            try:
+                response = await self.client.chat.completions.create(
+                    model=os.getenv("QA_GRID_MODEL"),
+                    messages=[{"role": os.getenv("QA_GRID_PROMPT_ROLE"), "content": prompt}],
+                    max_tokens=max_tokens,
+                    n=1
+                )
+                return parse_answers(response.choices[0].message.content, [str(qid) for qid in questions])
+            except Exception as e:
+                self.counters["failed_calls"] += 1
+                raise HTTPException(status_code=401, detail=f"Failed to generate answers from LLM with error: {e}")
+            finally:
+                self.in_flight -= 1
+
+    async def run(self, transcripts, questions, bypass_cache=False):
+        """
+        Answers every question for every transcript, yielding each cell as soon as its call returns.
+
+        Args:
+            transcripts (list): ``(transcript_id, text)`` pairs.
+            questions (dict): Questions by id.
+            bypass_cache (bool, optional): Ask the LLM even for cached answers.
+
+        Yields:
+            dict: One cell: ``transcript_id``, ``question_id`` and either ``answer`` or ``error``
+                (``status_code`` and ``detail``).
+        """
+        self.counters["grids"] += 1
+        items = list(questions.items())
+        size = self.questions_per_call or len(items) or 1
+        groups = [dict(items[start:start + size]) for start in range(0, len(items), size)]
+
+        async def call(transcript_id, text, group):
+            try:
+                return transcript_id, group, await self.answer(text, group, bypass_cache), None
+            except HTTPException as e:
+                return transcript_id, group, None, e
+
+        tasks = [asyncio.create_task(call(tid, text, group)) for tid, text in transcripts for group in groups]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                transcript_id, group, answers, error = await next_done
+                for qid in group:
+                    qid = str(qid)
+                    self.counters["cells"] += 1
+                    if error is not None:
+                        self.counters["failed_cells"] += 1
+                        yield {"transcript_id": transcript_id, "question_id": qid,
+                               "error": {"status_code": error.status_code, "detail": error.detail}}
+                    elif qid not in answers:
+                        self.counters["failed_cells"] += 1
+                        yield {"transcript_id": transcript_id, "question_id": qid,
+                               "error": {"status_code": 401, "detail": "The LLM did not answer this question"}}
+                    else:
+                        yield {"transcript_id": transcript_id, "question_id": qid, "answer": answers[qid]}
+        finally:
+            # The client went away or the grid is done: calls still waiting for a slot are dropped.
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        """
+        Returns the call and cell counters, the calls in flight and the time spent waiting on the rate limit.
+        """
+        stats = dict(self.counters)
+        stats["in_flight"] = self.in_flight
+        stats["rate_limit_wait_seconds"] = round(self.limiter.waited, 3)
+        return stats
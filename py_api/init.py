@@ -5,22 +5,31 @@ OpenAI client setup, and application middleware. It also sets up caching mechani
 
 import os
 from dotenv import load_dotenv
-from collections import defaultdict
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from openai import OpenAI
-import boto3
+from motor.motor_asyncio import AsyncIOMotorClient
+from openai import AsyncOpenAI
+import httpx
+
+from utils import aws_client
+from gateway import LLMGateway
+from cache import make_cache
 
 load_dotenv()
 
 def init_classes():
     """
-    Initializes and returns the database client, OpenAI client, and FastAPI application instance.
+    Initializes and returns the async database client, async OpenAI client, FastAPI application instance,
+    S3 client and async HTTP client.
+
+    The OpenAI client is wrapped in an ``LLMGateway``, so every LLM call is rate limited and retried per model.
+
+    The S3 client is the regular boto3 client; callers running on the event loop must offload its
+    calls to a thread (e.g. ``asyncio.to_thread``).
 
     Returns:
-        tuple: A tuple containing the database client, OpenAI client, and FastAPI app instance.
+        tuple: A tuple containing the database, OpenAI client, FastAPI app instance, S3 client and HTTP client.
 
     Raises:
         RuntimeError: If required environment variables are missing.
@@ -31,10 +40,12 @@ def init_classes():
     if not OPENAI_API_KEY or not MONGO_URL or not DB_NAME:
         raise RuntimeError("Missing required environment variables")
 
-    client = MongoClient(MONGO_URL)
+    client = AsyncIOMotorClient(MONGO_URL)
     db = client[DB_NAME]
-    openaiclient = OpenAI(api_key=OPENAI_API_KEY) 
+    openaiclient = LLMGateway(AsyncOpenAI(api_key=OPENAI_API_KEY))
+    http_client = httpx.AsyncClient(timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", 60))), follow_redirects=True)
     app = FastAPI()
+    app.add_event_handler("shutdown", http_client.aclose)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -42,16 +53,22 @@ def init_classes():
         allow_methods=["*"],
         allow_headers=["*"],
     )
-    s3 = boto3.client("s3")
-    return db, openaiclient, app, s3
+    s3 = aws_client("s3")
+    return db, openaiclient, app, s3, http_client
 
 
 def init_cache():
     """
     Initializes and returns the cache settings for chat history and transcripts.
 
+    The caches are bounded LRU caches; their size limits are ``CHAT_SESSION_CACHE_MB`` (default 256) and
+    ``CHAT_TRANSCRIPT_CACHE_MB`` (default 512). Entries expire after 30 minutes. ``CHAT_CACHE_BACKEND`` selects
+    whether they live in each worker's memory or are shared by the workers of a host (see ``cache.make_cache``).
+
     Returns:
-        tuple: A tuple containing the maximum chat history save length and two defaultdicts for session and transcript caches.
+        tuple: A tuple containing the maximum chat history save length and the session and transcript caches.
     """
     MAX_CHAT_HISTORY_SAVE_LENGTH = int(os.getenv('MAX_CHAT_HISTORY_SAVE_LENGTH'))
-    return MAX_CHAT_HISTORY_SAVE_LENGTH, defaultdict(dict), defaultdict(dict)
+    session_cache = make_cache("sessions", int(float(os.getenv('CHAT_SESSION_CACHE_MB', 256)) * 1024 * 1024), default_ttl=30 * 60)
+    transcript_cache = make_cache("transcripts", int(float(os.getenv('CHAT_TRANSCRIPT_CACHE_MB', 512)) * 1024 * 1024), default_ttl=30 * 60)
+    return MAX_CHAT_HISTORY_SAVE_LENGTH, session_cache, transcript_cache
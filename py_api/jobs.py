@@ -0,0 +1,206 @@
+"""
+This module provides a background job queue for long running transcriptions.
+
+Submitting a job stores it in the ``transcriptionjobs`` collection and returns its id straight away. A bounded
+pool of asyncio workers picks jobs off an in-process queue and runs them through a runner coroutine. Job state
+is kept in Mongo, so queued jobs and jobs whose worker stopped heartbeating are picked up again on restart.
+
+Classes:
+    - TranscriptionJobManager: Persists, schedules and runs transcription jobs.
+"""
+
+import os
+import uuid
+import asyncio
+import traceback
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class TranscriptionJobManager:
+    """
+    Persists transcription jobs in Mongo and runs them on a bounded pool of workers.
+
+    Args:
+        collection: Async (motor) collection used to store the jobs.
+        runner (callable): Coroutine function ``runner(transcript_id, request) -> str`` doing the transcription.
+        http_client (httpx.AsyncClient): Client used to deliver completion callbacks.
+        max_workers (int, optional): Number of jobs allowed to run at the same time.
+    """
+    def __init__(self, collection, runner, http_client, max_workers=None):
+        self.collection = collection
+        self.runner = runner
+        self.http_client = http_client
+        self.max_workers = max_workers or int(os.getenv("TRANSCRIBE_JOB_WORKERS", 4))
+        self.heartbeat_seconds = int(os.getenv("TRANSCRIBE_JOB_HEARTBEAT", 30))
+        self.queue = None
+        self.workers = []
+        self.waiters = {}
+
+    async def start(self):
+        """
+        Starts the workers and re-queues jobs left over from a previous run.
+        """
+        self.queue = asyncio.Queue()
+        stale_before = datetime.utcnow() - timedelta(seconds=self.heartbeat_seconds * 3)
+        await self.collection.update_many(
+            {"status": JOB_RUNNING, "heartbeat_at": {"$lt": stale_before}},
+            {"$set": {"status": JOB_QUEUED, "updated_at": datetime.utcnow()}}
+        )
+        async for job in self.collection.find({"status": JOB_QUEUED}, {"_id": 1}).sort("created_at", 1):
+            self.queue.put_nowait(job["_id"])
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    async def stop(self):
+        """
+        Cancels the workers. Interrupted jobs stay ``running`` and are re-queued once their heartbeat is stale.
+        """
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, transcript_id, request, callback_url=None):
+        """
+        Stores a new job and queues it.
+
+        Args:
+            transcript_id (str): Transcript the job belongs to.
+            request (dict): Serialized transcription request.
+            callback_url (str, optional): URL that receives the job document once the job finishes.
+
+        Returns:
+            str: The job id.
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        await self.collection.insert_one({
+            "_id": job_id,
+            "transcript_id": transcript_id,
+            "request": request,
+            "callback_url": callback_url,
+            "status": JOB_QUEUED,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+        self.waiters[job_id] = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id):
+        """
+        Returns the stored job document, or None if the job does not exist.
+        """
+        return await self.collection.find_one({"_id": job_id})
+
+    async def wait(self, job_id):
+        """
+        Waits for a job submitted by this process to finish and returns its final document.
+        """
+        waiter = self.waiters.get(job_id)
+        if waiter is not None:
+            await asyncio.shield(waiter)
+        return await self.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.queue.task_done()
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self.collection.update_one({"_id": job_id}, {"$set": {"heartbeat_at": datetime.utcnow()}})
+            except Exception as e:
+                print(f"Heartbeat of job {job_id} not stored: {e}")
+
+    async def _run(self, job_id):
+        # Whatever happens, a request waiting for this job is released: with an error when the job document could
+        # not be claimed or written, otherwise to read the stored document.
+        error = None
+        try:
+            now = datetime.utcnow()
+            job = await self.collection.find_one_and_update(
+                {"_id": job_id, "status": JOB_QUEUED},
+                {"$set": {"status": JOB_RUNNING, "started_at": now, "heartbeat_at": now, "updated_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                return
+
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                transcript = await self.runner(job["transcript_id"], job["request"])
+                update = {"status": JOB_COMPLETED, "result": {"transcript": transcript}}
+            except HTTPException as e:
+                update = {"status": JOB_FAILED, "error": {"status_code": e.status_code, "detail": e.detail}}
+            except Exception as e:
+                update = {"status": JOB_FAILED, "error": {"status_code": 500, "detail": str(e)}}
+            finally:
+                heartbeat.cancel()
+
+            update["updated_at"] = update["finished_at"] = datetime.utcnow()
+            job = await self.collection.find_one_and_update(
+                {"_id": job_id}, {"$set": update}, return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            waiter = self.waiters.pop(job_id, None)
+            if waiter is not None and not waiter.done():
+                if error is not None:
+                    waiter.set_exception(HTTPException(status_code=500, detail=f"Job {job_id} could not be stored: {error}"))
+                    waiter.exception()  # jobs submitted without waiting must not log it as never retrieved
+                else:
+                    waiter.set_result(None)
+
+        if job.get("callback_url"):
+            await self._callback(job)
+
+    async def _callback(self, job):
+        try:
+            response = await self.http_client.post(job["callback_url"], json=job_to_dict(job, include_result=True))
+            callback_status = response.status_code
+        except Exception as e:
+            callback_status = f"error: {e}"
+        await self.collection.update_one({"_id": job["_id"]}, {"$set": {"callback_status": callback_status}})
+
+
+def job_to_dict(job, include_result=False):
+    """
+    Converts a stored job document into the JSON shape returned by the job endpoints.
+
+    Args:
+        job (dict): Job document from Mongo.
+        include_result (bool, optional): Whether to include the transcription result.
+
+    Returns:
+        dict: The job status (and result).
+    """
+    data = {
+        "job_id": job["_id"],
+        "transcript_id": job["transcript_id"],
+        "status": job["status"],
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat(),
+    }
+    if include_result:
+        data["result"] = job.get("result")
+    return data
@@ -0,0 +1,244 @@
+"""
+This module provides the audio normalization stage applied before transcription.
+
+Media is decoded to 16 kHz mono (all that speech recognition needs), long leading and trailing silences can be
+trimmed, and the result is re-encoded with a compact codec. Each transcription method has its own settings:
+
+    - ``<METHOD>_AUDIO_CODEC``: ``original`` (send the media as-is), ``wav``, ``flac`` or ``opus``.
+    - ``<METHOD>_TRIM_SILENCE``: trim leading/trailing silences longer than this many seconds (0 = off).
+
+Every normalized file produces a ``NormalizationReport`` with the bytes saved and the audio seconds trimmed
+(providers bill and process per audio second, so trimmed seconds are transcription time saved). Totals per
+method are kept in ``normalization_stats``.
+
+Classes:
+    - NormalizationReport: Sizes and durations of one file before and after normalization.
+    - NormalizationStats: Running totals per transcription method.
+
+Functions:
+    - audio_settings: Returns the codec and silence trimming settings of a transcription method.
+    - trim_pcm_silence: Measures a PCM stream and optionally drops its long leading/trailing silences.
+    - encode_audio: Encodes in-memory audio with a codec.
+    - encode_pcm_stream: Encodes a PCM stream with a codec.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+import ffmpeg
+import numpy as np
+
+from streaming import ffmpeg_pipe, SAMPLE_RATE, BYTES_PER_SECOND, FRAME_SAMPLES
+
+CODECS = {
+    "wav": {"format": "wav", "acodec": "pcm_s16le", "ext": "wav", "mime": "audio/wav"},
+    "flac": {"format": "flac", "acodec": "flac", "ext": "flac", "mime": "audio/flac"},
+    "opus": {"format": "ogg", "acodec": "libopus", "ext": "ogg", "mime": "audio/ogg"},
+}
+
+
+def audio_settings(method):
+    """
+    Returns the normalization settings of a transcription method.
+
+    Args:
+        method (str): Transcription method, e.g. 'aws' or 'sarvam'.
+
+    Returns:
+        tuple: The codec name (``original`` when normalization is off) and the silence trimming threshold in seconds.
+    """
+    defaults = {"sarvam": "flac", "aws": "original"}
+    codec = os.getenv(f"{method.upper()}_AUDIO_CODEC", defaults.get(method, "original")).lower()
+    if codec != "original" and codec not in CODECS:
+        raise ValueError(f"Unsupported audio codec for {method}: {codec}")
+    return codec, float(os.getenv(f"{method.upper()}_TRIM_SILENCE", 0))
+
+
+class NormalizationReport:
+    """
+    Sizes and durations of one file before and after normalization.
+    """
+    def __init__(self, method, codec, source, input_bytes=0):
+        self.method = method
+        self.codec = codec
+        self.source = source
+        self.input_bytes = input_bytes
+        self.output_bytes = 0
+        self.input_seconds = 0.0
+        self.output_seconds = 0.0
+        self.leading_trimmed = 0.0
+        self.started = time.perf_counter()
+        self.normalize_seconds = 0.0
+
+    @property
+    def bytes_saved(self):
+        return self.input_bytes - self.output_bytes
+
+    @property
+    def seconds_trimmed(self):
+        return self.input_seconds - self.output_seconds
+
+    def finish(self):
+        self.normalize_seconds = time.perf_counter() - self.started
+        return self
+
+    def as_dict(self):
+        return {
+            "method": self.method,
+            "codec": self.codec,
+            "source": self.source,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "bytes_saved": self.bytes_saved,
+            "input_seconds": round(self.input_seconds, 2),
+            "output_seconds": round(self.output_seconds, 2),
+            "seconds_trimmed": round(self.seconds_trimmed, 2),
+            "normalize_seconds": round(self.normalize_seconds, 2),
+        }
+
+
+class NormalizationStats:
+    """
+    Running normalization totals per transcription method, plus the most recent per-file reports.
+    """
+    def __init__(self, recent=100):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.recent = deque(maxlen=recent)
+
+    def record(self, report):
+        report = report.as_dict()
+        with self.lock:
+            totals = self.totals.setdefault(report["method"], {"files": 0, "input_bytes": 0, "output_bytes": 0, "bytes_saved": 0, "seconds_trimmed": 0.0, "normalize_seconds": 0.0})
+            totals["files"] += 1
+            for key in ("input_bytes", "output_bytes", "bytes_saved", "seconds_trimmed", "normalize_seconds"):
+                totals[key] += report[key]
+            self.recent.append(report)
+
+    def snapshot(self):
+        with self.lock:
+            return {"totals": {k: dict(v) for k, v in self.totals.items()}, "recent": list(self.recent)}
+
+
+normalization_stats = NormalizationStats()
+
+
+def _quiet_frames(block, threshold):
+    samples = np.frombuffer(block, dtype=np.int16)
+    frames = samples[:len(samples) - len(samples) % FRAME_SAMPLES].reshape(-1, FRAME_SAMPLES)
+    return np.abs(frames.astype(np.float32)).mean(axis=1) < threshold
+
+
+def trim_pcm_silence(pcm, report, min_silence=0.0, silence_db=None, max_hold_seconds=600):
+    """
+    Measures a 16 kHz mono PCM stream and optionally drops its long leading and trailing silences.
+
+    Leading silence longer than ``min_silence`` seconds is dropped (its length is kept in
+    ``report.leading_trimmed`` so timestamps can be shifted back). Other quiet audio is held back until speech
+    follows it; if the stream ends first and the held silence is longer than ``min_silence``, it is dropped.
+    At most ``max_hold_seconds`` of silence is held back at a time.
+
+    Args:
+        pcm (iterable): Blocks of 16 kHz mono 16-bit PCM.
+        report (NormalizationReport): Receives the input and output durations.
+        min_silence (float, optional): Shortest leading/trailing silence to trim, in seconds (0 = measure only).
+        silence_db (float, optional): Level below which audio counts as silence, in dB.
+        max_hold_seconds (float, optional): Longest stretch of silence held back in memory.
+
+    Yields:
+        bytes: The (trimmed) PCM stream.
+    """
+    frame_bytes = FRAME_SAMPLES * 2
+    if not min_silence:
+        for block in pcm:
+            report.input_seconds += len(block) / BYTES_PER_SECOND
+            report.output_seconds += len(block) / BYTES_PER_SECOND
+            yield block
+        return
+
+    silence_db = silence_db if silence_db is not None else float(os.getenv("SARVAM_SILENCE_DB", -35))
+    threshold = 32768 * 10 ** (silence_db / 20)
+    # A short pad of silence is kept next to speech so words are not clipped.
+    pad = int(0.25 * SAMPLE_RATE / FRAME_SAMPLES) * frame_bytes
+    leading = True
+    held = bytearray()
+    pending = b""
+
+    def emit(data):
+        report.output_seconds += len(data) / BYTES_PER_SECOND
+        return data
+
+    def drop_leading():
+        # Once the leading silence is known to be long enough to trim, drop it as it arrives (keeping the pad).
+        if report.leading_trimmed + len(held) / BYTES_PER_SECOND > min_silence and len(held) > pad:
+            report.leading_trimmed += (len(held) - pad) / BYTES_PER_SECOND
+            del held[:len(held) - pad]
+
+    for block in pcm:
+        report.input_seconds += len(block) / BYTES_PER_SECOND
+        block = pending + block
+        usable = len(block) - len(block) % frame_bytes
+        block, pending = block[:usable], block[usable:]
+        quiet = _quiet_frames(block, threshold)
+        loud = np.flatnonzero(~quiet)
+        if not loud.size:
+            held += block
+            if leading:
+                drop_leading()
+            elif len(held) > max_hold_seconds * BYTES_PER_SECOND:
+                yield emit(bytes(held))
+                held.clear()
+            continue
+
+        first, last = loud[0] * frame_bytes, (loud[-1] + 1) * frame_bytes
+        held += block[:first]
+        if leading:
+            drop_leading()
+            leading = False
+        yield emit(bytes(held) + block[first:last])
+        held = bytearray(block[last:])
+
+    held += pending
+    if len(held) > min_silence * BYTES_PER_SECOND:
+        held = held[:pad]
+    if held:
+        yield emit(bytes(held))
+
+
+def encode_pcm_stream(pcm, codec):
+    """
+    Encodes a 16 kHz mono PCM stream with one of the ``CODECS``.
+
+    Args:
+        pcm (iterable): Blocks of 16 kHz mono 16-bit PCM.
+        codec (str): Codec name.
+
+    Yields:
+        bytes: The encoded stream.
+    """
+    settings = CODECS[codec]
+    options = {"b:a": os.getenv("AUDIO_OPUS_BITRATE", "24k")} if codec == "opus" else {}
+    stream = (
+        ffmpeg.input("pipe:0", format="s16le", ac=1, ar=SAMPLE_RATE)
+        .output("pipe:1", format=settings["format"], acodec=settings["acodec"], ac=1, ar=SAMPLE_RATE, **options)
+    )
+    return ffmpeg_pipe(stream, pcm)
+
+
+def encode_audio(wav, codec):
+    """
+    Encodes an in-memory 16 kHz mono WAV file with one of the ``CODECS``.
+
+    Args:
+        wav (bytes): The WAV file.
+        codec (str): Codec name; ``original`` and ``wav`` return the input unchanged.
+
+    Returns:
+        bytes: The encoded audio.
+    """
+    if codec in ("original", "wav"):
+        return wav
+    # Skip the 44 byte WAV header written by ``wav_bytes`` and encode the raw samples.
+    return b"".join(encode_pcm_stream([wav[44:]], codec))
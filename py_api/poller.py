@@ -0,0 +1,215 @@
+"""
+This module provides a shared poller for outstanding AWS Transcribe jobs.
+
+Instead of one ``get_transcription_job`` loop per job, a single background thread tracks every outstanding job.
+When several jobs are due it looks them up together with paginated ``list_transcription_jobs`` calls, and it
+only calls ``get_transcription_job`` once per finished job to fetch the transcript location. Each job is first
+checked after a fraction of its media duration and then with a growing interval, so short clips finish
+quickly and long recordings are not polled needlessly.
+
+Throttling and server errors are retried at the job's next check. Any other error looking up a job (e.g. the job
+does not exist or access is denied) fails that job straight away instead of polling it until the caller times out.
+
+Classes:
+    - TranscribePoller: Tracks outstanding jobs and resolves a future per job when it finishes.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import Future
+
+from botocore.exceptions import ClientError
+
+# Error codes worth polling again; other client errors will not go away by waiting.
+RETRYABLE_ERRORS = {"ThrottlingException", "Throttling", "TooManyRequestsException", "RequestLimitExceeded",
+                    "LimitExceededException", "ServiceUnavailable", "ServiceUnavailableException", "InternalFailure",
+                    "InternalFailureException", "InternalServerError"}
+
+
+class _TrackedJob:
+    def __init__(self, name, media_duration, min_interval, ratio):
+        self.name = name
+        self.future = Future()
+        self.started = time.time()
+        if media_duration:
+            self.next_poll = self.started + max(min_interval, media_duration * ratio)
+            self.interval = max(min_interval, media_duration * ratio * 0.1)
+        else:
+            self.next_poll = self.started + min_interval
+            self.interval = min_interval
+        self.polls = 0
+
+
+class TranscribePoller:
+    """
+    Tracks outstanding AWS Transcribe jobs from one background thread.
+
+    Args:
+        client_factory (callable): Returns the (shared) boto3 ``transcribe`` client.
+        job_prefix (str): Prefix all job names share; used to narrow ``list_transcription_jobs``.
+        min_interval (float, optional): Shortest time between two checks of a job, in seconds.
+        max_interval (float, optional): Longest time between two checks of a job, in seconds.
+        ratio (float, optional): Fraction of the media duration to wait before the first check.
+        backoff (float, optional): Factor applied to a job's interval after each unfinished check.
+        batch_threshold (int, optional): Minimum number of due jobs for which a list lookup is used.
+        coalesce (float, optional): Jobs due within this fraction of their interval are checked early, together
+            with the jobs that are already due.
+    """
+    def __init__(self, client_factory, job_prefix, min_interval=None, max_interval=None, ratio=None, backoff=1.5, batch_threshold=3, coalesce=0.5):
+        self.client_factory = client_factory
+        self.job_prefix = job_prefix
+        self.min_interval = min_interval or float(os.getenv('AWS_TRANSCRIBE_POLL_INTERVAL', 5))
+        self.max_interval = max_interval or float(os.getenv('AWS_TRANSCRIBE_POLL_MAX_INTERVAL', 60))
+        self.ratio = ratio or float(os.getenv('AWS_TRANSCRIBE_POLL_RATIO', 0.25))
+        self.backoff = backoff
+        self.batch_threshold = batch_threshold
+        self.coalesce = coalesce
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.counters = {"get_calls": 0, "list_calls": 0, "poll_errors": 0, "completed_jobs": 0, "failed_jobs": 0,
+                         "lookup_failed_jobs": 0}
+
+    def watch(self, job_name, media_duration=None):
+        """
+        Starts tracking a job.
+
+        Args:
+            job_name (str): Name of a started transcription job.
+            media_duration (float, optional): Duration of the media in seconds, used to schedule the first check.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the ``TranscriptionJob`` description once the job is
+            ``COMPLETED`` or ``FAILED``, or to the ``ClientError`` of a lookup that cannot succeed.
+        """
+        job = _TrackedJob(job_name, media_duration, self.min_interval, self.ratio)
+        with self.condition:
+            self.jobs[job_name] = job
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return job.future
+
+    def forget(self, job_name):
+        """
+        Stops tracking a job, e.g. after its caller gave up waiting.
+        """
+        with self.condition:
+            self.jobs.pop(job_name, None)
+
+    def stats(self):
+        """
+        Returns the poll counters, including poll calls per completed job.
+        """
+        with self.condition:
+            stats = dict(self.counters, outstanding_jobs=len(self.jobs))
+        finished = stats["completed_jobs"] + stats["failed_jobs"]
+        stats["poll_calls"] = stats["get_calls"] + stats["list_calls"]
+        stats["poll_calls_per_completed_job"] = round(stats["poll_calls"] / finished, 2) if finished else None
+        return stats
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+                    if any(job.next_poll <= now for job in self.jobs.values()):
+                        # Pull in jobs that are nearly due as well, so one lookup covers as many jobs as possible.
+                        due = [job for job in self.jobs.values() if job.next_poll - now <= job.interval * self.coalesce]
+                        break
+                    wait = min((job.next_poll for job in self.jobs.values()), default=now + self.max_interval) - now
+                    self.condition.wait(timeout=wait)
+            try:
+                self._poll(due)
+            except Exception:
+                with self.condition:
+                    self.counters["poll_errors"] += 1
+            self._reschedule(due)
+
+    def _reschedule(self, due):
+        now = time.time()
+        with self.condition:
+            for job in due:
+                job.polls += 1
+                job.interval = min(self.max_interval, job.interval * self.backoff)
+                job.next_poll = now + job.interval
+
+    def _count(self, counter):
+        with self.condition:
+            self.counters[counter] += 1
+
+    def _poll(self, due):
+        client = self.client_factory()
+        if len(due) < self.batch_threshold:
+            statuses = {}
+            for job in due:
+                description = self._get(client, job)
+                if description is not None:
+                    statuses[job.name] = description
+        else:
+            statuses = self._list_statuses(client, due)
+
+        for job in due:
+            description = statuses.get(job.name)
+            if description is None or description['TranscriptionJobStatus'] not in ('COMPLETED', 'FAILED'):
+                continue
+            if description['TranscriptionJobStatus'] == 'COMPLETED' and 'Transcript' not in description:
+                # List summaries carry no transcript location; fetch it once for the finished job.
+                description = self._get(client, job)
+                if description is None:
+                    continue
+            self._resolve(job, description)
+
+    def _get(self, client, job):
+        """
+        Looks up one job. Returns its description, or None when the lookup should be retried at the next check;
+        a job whose lookup cannot succeed is failed with the error.
+        """
+        self._count("get_calls")
+        try:
+            return client.get_transcription_job(TranscriptionJobName=job.name)['TranscriptionJob']
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+            if code in RETRYABLE_ERRORS or status == 429 or status >= 500:
+                self._count("poll_errors")
+                return None
+            with self.condition:
+                self.jobs.pop(job.name, None)
+                self.counters["lookup_failed_jobs"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+            return None
+        except Exception:
+            # Connection errors and the like: try again at the next check.
+            self._count("poll_errors")
+            return None
+
+    def _list_statuses(self, client, due):
+        wanted = {job.name for job in due}
+        oldest = datetime.fromtimestamp(min(job.started for job in due) - 60, tz=timezone.utc)
+        statuses = {}
+        params = {'JobNameContains': self.job_prefix, 'MaxResults': 100}
+        while wanted - statuses.keys():
+            self._count("list_calls")
+            page = client.list_transcription_jobs(**params)
+            summaries = page.get('TranscriptionJobSummaries', [])
+            for summary in summaries:
+                if summary['TranscriptionJobName'] in wanted:
+                    statuses[summary['TranscriptionJobName']] = summary
+            # Results are newest first, so once a page reaches jobs older than ours the rest can be skipped.
+            created = [s['CreationTime'] for s in summaries if isinstance(s.get('CreationTime'), datetime)]
+            if not page.get('NextToken') or (created and min(created) < oldest):
+                break
+            params['NextToken'] = page['NextToken']
+        return statuses
+
+    def _resolve(self, job, description):
+        with self.condition:
+            self.jobs.pop(job.name, None)
+            self.counters["completed_jobs" if description['TranscriptionJobStatus'] == 'COMPLETED' else "failed_jobs"] += 1
+        if not job.future.done():
+            job.future.set_result(description)
@@ -0,0 +1,257 @@
+"""
+This module keeps an incremental, de-duplicated aggregate of the questions asked in a project's transcripts.
+
+Every transcript has its own generated ``questions`` (a list or dictionary of strings). The aggregate groups them
+into clusters of the same question: exact duplicates (same words, ignoring case and punctuation) and near
+duplicates (character trigram Jaccard similarity of the question without stop words of at least
+``QUESTION_DEDUP_THRESHOLD``). Each cluster keeps its first wording and the number of transcripts asking it.
+
+The aggregate is stored per project in the ``questionaggregates`` collection, with a digest of every
+transcript's questions and the clusters it counts towards. An update only merges the transcripts that are new or
+whose questions changed, and takes back the contributions of transcripts that were removed or changed, so adding
+one transcript to a project of hundreds only compares that transcript's questions with the existing clusters.
+
+Environment:
+    - ``QUESTION_DEDUP_THRESHOLD``: Similarity from which two questions are the same question (0.7).
+    - ``QUESTION_AGG_MAX_CLUSTERS``: Clusters sent to the LLM, the most asked first (300).
+
+Classes:
+    - QuestionAggregator: Keeps the question clusters of each project up to date in Mongo.
+
+Functions:
+    - flatten_questions: Returns the question strings of a transcript's ``questions`` value.
+    - top_clusters: Returns the most asked clusters, in the order they were first seen.
+    - format_clusters: Renders clusters as LLM prompt context.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from retrieval import tokenize
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def flatten_questions(value):
+    """
+    Returns the question strings of a transcript's ``questions`` value.
+
+    Args:
+        value: A list or dictionary of questions (possibly nested), or a string with one question per line.
+
+    Returns:
+        list: The non-empty questions, in order.
+    """
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return [question for item in value for question in flatten_questions(item)]
+    lines = (_LIST_MARKER.sub("", line).strip() for line in str(value).splitlines())
+    return [line for line in lines if line]
+
+
+def _normalize(question):
+    return " ".join(_NON_WORD.sub(" ", question.lower()).split())
+
+
+def _shingles(question):
+    text = " " + " ".join(tokenize(question) or _normalize(question).split()) + " "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _digest(questions):
+    return hashlib.sha256(json.dumps(questions, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def top_clusters(clusters, limit=None):
+    """
+    Returns the ``limit`` most asked clusters, in the order they were first seen.
+
+    Args:
+        clusters (list): Clusters from ``QuestionAggregator.update``.
+        limit (int, optional): Number of clusters (``QUESTION_AGG_MAX_CLUSTERS``).
+
+    Returns:
+        list: The selected clusters.
+    """
+    limit = int(os.getenv("QUESTION_AGG_MAX_CLUSTERS", 300)) if limit is None else limit
+    selected = sorted(clusters, key=lambda cluster: (-cluster["count"], cluster["id"]))[:limit]
+    return sorted(selected, key=lambda cluster: cluster["id"])
+
+
+def format_clusters(clusters):
+    """
+    Renders clusters as LLM prompt context, one question per line with the number of transcripts asking it.
+    """
+    return "Questions asked in the transcripts (number of transcripts asking each):\n" + "\n".join(
+        f"- {cluster['text']} ({cluster['count']})" for cluster in clusters
+    )
+
+
+class _Aggregate:
+    """
+    Question clusters of one project, with the lookup tables used to merge new questions.
+    """
+    def __init__(self, document, threshold):
+        document = document or {}
+        self.threshold = threshold
+        self.version = document.get("version", 0)
+        self.next_id = document.get("next_id", 0)
+        self.clusters = {cluster["id"]: cluster for cluster in document.get("clusters", [])}
+        self.transcripts = document.get("transcripts", {})
+        self.exact = None
+
+    def add(self, transcript_id, questions, digest):
+        if self.exact is None:
+            self._build()
+        ids = []
+        for question in flatten_questions(questions):
+            key = _normalize(question)
+            if not key:
+                continue
+            # Cluster ids are never reused, so an exact match of a deleted cluster is simply ignored.
+            cid = self.exact.get(key)
+            if cid not in self.clusters:
+                shingles = _shingles(question)
+                cid = self._nearest(shingles)
+                if cid is None:
+                    cid = self.next_id
+                    self.next_id += 1
+                    self.clusters[cid] = {"id": cid, "text": question, "count": 0}
+                    self._index(cid, shingles)
+                self.exact[key] = cid
+            if cid not in ids:
+                ids.append(cid)
+                self.clusters[cid]["count"] += 1
+        self.transcripts[transcript_id] = {"digest": digest, "clusters": ids}
+        return len(ids)
+
+    def remove(self, transcript_id):
+        if self.exact is None:
+            self._build()
+        for cid in self.transcripts.pop(transcript_id, {}).get("clusters", []):
+            cluster = self.clusters.get(cid)
+            if cluster is None:
+                continue
+            cluster["count"] -= 1
+            if cluster["count"] <= 0:
+                del self.clusters[cid]
+                for shingle in self.shingles.pop(cid, ()):
+                    self.postings[shingle].discard(cid)
+
+    def document(self, project_id):
+        return {
+            "_id": project_id,
+            "version": self.version + 1,
+            "next_id": self.next_id,
+            "clusters": sorted(self.clusters.values(), key=lambda cluster: cluster["id"]),
+            "transcripts": self.transcripts,
+            "updated_at": datetime.utcnow(),
+        }
+
+    def _build(self):
+        self.exact, self.shingles, self.postings = {}, {}, defaultdict(set)
+        for cid, cluster in self.clusters.items():
+            self.exact[_normalize(cluster["text"])] = cid
+            self._index(cid, _shingles(cluster["text"]))
+
+    def _index(self, cid, shingles):
+        self.shingles[cid] = shingles
+        for shingle in shingles:
+            self.postings[shingle].add(cid)
+
+    def _nearest(self, shingles):
+        overlaps = Counter(cid for shingle in shingles for cid in self.postings.get(shingle, ()))
+        best, best_score = None, self.threshold
+        for cid, overlap in overlaps.items():
+            score = overlap / (len(shingles) + len(self.shingles[cid]) - overlap)
+            if score >= best_score:
+                best, best_score = cid, score
+        return best
+
+
+class QuestionAggregator:
+    """
+    Keeps the question clusters of each project up to date in Mongo.
+
+    Args:
+        collection: Async (motor) collection holding one aggregate per project.
+        threshold (float, optional): Near-duplicate similarity (``QUESTION_DEDUP_THRESHOLD``).
+    """
+    def __init__(self, collection, threshold=None):
+        self.collection = collection
+        self.threshold = float(os.getenv("QUESTION_DEDUP_THRESHOLD", 0.7)) if threshold is None else threshold
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.counters = {"updates": 0, "transcripts_merged": 0, "transcripts_removed": 0, "questions_merged": 0,
+                         "conflicts": 0, "merge_seconds": 0.0}
+
+    async def update(self, project_id, transcripts):
+        """
+        Brings the aggregate of a project up to date with its transcripts' questions.
+
+        Only transcripts that are new, changed or gone since the last update are merged or taken back.
+
+        Args:
+            project_id (str): The project ID.
+            transcripts (dict): ``questions`` value of every transcript of the project, by transcript ID.
+
+        Returns:
+            list: The clusters (``id``, ``text``, ``count``), in the order they were first seen.
+        """
+        lock = self.locks.setdefault(project_id, asyncio.Lock())
+        async with lock:
+            document = await self.collection.find_one({"_id": project_id})
+            aggregate = _Aggregate(document, self.threshold)
+            digests = {tid: _digest(questions) for tid, questions in transcripts.items()}
+            changed = [tid for tid, digest in digests.items() if aggregate.transcripts.get(tid, {}).get("digest") != digest]
+            removed = [tid for tid in aggregate.transcripts if tid not in digests]
+            if changed or removed:
+                started = time.perf_counter()
+                merged = await asyncio.to_thread(self._merge, aggregate, transcripts, digests, changed, removed)
+                self._count(transcripts_merged=len(changed), transcripts_removed=len(removed), questions_merged=merged,
+                            merge_seconds=time.perf_counter() - started)
+                await self._save(project_id, aggregate)
+            self._count(updates=1)
+            return sorted(aggregate.clusters.values(), key=lambda cluster: cluster["id"])
+
+    def stats(self):
+        """
+        Returns the update counters.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+        stats["merge_seconds"] = round(stats["merge_seconds"], 3)
+        return stats
+
+    @staticmethod
+    def _merge(aggregate, transcripts, digests, changed, removed):
+        for tid in removed + changed:
+            aggregate.remove(tid)
+        return sum(aggregate.add(tid, transcripts[tid], digests[tid]) for tid in changed)
+
+    async def _save(self, project_id, aggregate):
+        try:
+            await self.collection.replace_one(
+                {"_id": project_id, "version": aggregate.version}, aggregate.document(project_id), upsert=True
+            )
+        except DuplicateKeyError:
+            # Another instance saved a newer aggregate first; the next update merges against that one.
+            self._count(conflicts=1)
+
+    def _count(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.counters[name] += value
@@ -0,0 +1,515 @@
+"""
+This module provides in-process BM25 retrieval over the transcripts of a project.
+
+Transcripts are split into chunks of consecutive speaker turns (the ``speaker: text`` lines of a diarized
+transcript) of about ``RETRIEVAL_CHUNK_TOKENS`` tokens; a turn longer than that is split between sentences.
+Every project gets its own inverted index of those chunks, scored with BM25. A search returns the best passages
+that fit a token budget instead of whole transcripts.
+
+A project's index is built the first time the project is searched and then kept up to date incrementally: a
+search first compares the project's transcript list and the transcripts' ``updatedAt`` with the index (at most
+every ``RETRIEVAL_SYNC_SECONDS``), and only added, changed or removed transcripts are indexed again.
+Transcriptions finished by this service are added to the loaded indexes right away. Token counts here are
+estimates (four characters per token); the chat prompt is fitted exactly afterwards.
+
+When an embedder is configured (``EMBEDDING_BACKEND``, see ``embeddings``), chunks are also embedded and kept in
+a memory-mapped ``VectorStore`` per project, and passages are ranked by a hybrid of embedding similarity and
+BM25, so answers worded differently from the question are found too.
+
+Environment:
+    - ``RETRIEVAL_CHUNK_TOKENS``: Target chunk size (200).
+    - ``RETRIEVAL_CONTEXT_TOKENS``: Passages returned per search, in tokens (6000).
+    - ``RETRIEVAL_MAX_PROJECTS``: Project indexes kept in memory (64).
+    - ``RETRIEVAL_SYNC_SECONDS``: Shortest time between two checks of a project against Mongo (5).
+    - ``RETRIEVAL_BM25_K1`` / ``RETRIEVAL_BM25_B``: BM25 parameters (1.2 / 0.75).
+    - ``RETRIEVAL_VECTOR_K``: Nearest chunks by embedding considered per search (100).
+    - ``RETRIEVAL_HYBRID_ALPHA``: Weight of the embedding similarity in the hybrid score (0.5).
+
+Classes:
+    - ProjectIndex: BM25 inverted index of the chunks of one project's transcripts.
+    - RetrievalIndex: Project indexes kept in sync with Mongo.
+
+Functions:
+    - tokenize: Splits text into lower-case search terms.
+    - split_turns: Splits a transcript into chunks of speaker turns.
+    - format_passages: Renders search results as prompt context.
+"""
+
+import os
+import re
+import math
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from embeddings import VectorStore
+
+CHARS_PER_TOKEN = 4
+
+# Any run of characters that are not whitespace or punctuation, so words in non-Latin scripts stay whole.
+_TERM = re.compile(r"[^\s!-/:-@\[-`{-~।॥–—‘-‟…]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have he her his how i if in is it its me my "
+    "no not of on or our she so that the their them then there they this to was we were what when where which "
+    "who why will with you your um uh yeah okay ok like just".split()
+)
+
+
+def tokenize(text):
+    """
+    Splits ``text`` into lower-case search terms, leaving out common English stop words.
+
+    Returns:
+        list: The terms, in order.
+    """
+    return [term for term in _TERM.findall(text.lower()) if term not in _STOPWORDS]
+
+
+def split_turns(text, max_tokens):
+    """
+    Splits a transcript into chunks of whole speaker turns of about ``max_tokens`` tokens.
+
+    Consecutive lines are packed into a chunk until it would get longer than ``max_tokens``. A single line
+    longer than that is split between sentences, keeping its speaker label on every piece.
+
+    Args:
+        text (str): Transcript text, usually one ``speaker: text`` line per turn.
+        max_tokens (int): Target chunk size.
+
+    Returns:
+        list: The chunk texts, in transcript order.
+    """
+    limit = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) <= limit:
+            pieces.append(line)
+            continue
+        speaker, separator, words = line.partition(": ")
+        prefix = f"{speaker}: " if separator and len(speaker) < 40 else ""
+        body = words if prefix else line
+        current = ""
+        for sentence in _SENTENCE_END.split(body):
+            while len(sentence) > limit:
+                pieces.append(prefix + sentence[:limit])
+                sentence = sentence[limit:]
+            if current and len(current) + len(sentence) + 1 > limit:
+                pieces.append(prefix + current)
+                current = ""
+            current = f"{current} {sentence}" if current else sentence
+        if current:
+            pieces.append(prefix + current)
+
+    chunks, current = [], []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def format_passages(passages):
+    """
+    Renders search results as prompt context: passages grouped per transcript, best transcript first, each
+    transcript's passages in transcript order.
+
+    Args:
+        passages (list): Results of ``ProjectIndex.search``.
+
+    Returns:
+        str: The context text.
+    """
+    groups = OrderedDict()
+    for passage in passages:
+        groups.setdefault(passage["transcript_id"], []).append(passage)
+    blocks = []
+    for group in groups.values():
+        group.sort(key=lambda p: p["position"])
+        name = group[0]["transcript_name"] or group[0]["transcript_id"]
+        blocks.append(f"Transcript: {name}\n" + "\n...\n".join(p["text"] for p in group))
+    return "\n\n".join(blocks)
+
+
+class _Chunk:
+    __slots__ = ("transcript_id", "position", "text", "length", "tokens")
+
+    def __init__(self, transcript_id, position, text, length):
+        self.transcript_id = transcript_id
+        self.position = position
+        self.text = text
+        self.length = length
+        self.tokens = -(-len(text) // CHARS_PER_TOKEN)
+
+
+class ProjectIndex:
+    """
+    BM25 inverted index of the chunks of one project's transcripts.
+
+    Not thread-safe on its own: ``RetrievalIndex`` serializes updates and searches with ``lock``.
+
+    Args:
+        chunk_tokens (int, optional): Target chunk size.
+        k1 (float, optional): BM25 term frequency saturation.
+        b (float, optional): BM25 length normalization.
+    """
+    def __init__(self, chunk_tokens=None, k1=None, b=None):
+        self.chunk_tokens = chunk_tokens or int(os.getenv("RETRIEVAL_CHUNK_TOKENS", 200))
+        self.k1 = float(os.getenv("RETRIEVAL_BM25_K1", 1.2)) if k1 is None else k1
+        self.b = float(os.getenv("RETRIEVAL_BM25_B", 0.75)) if b is None else b
+        self.postings = defaultdict(dict)
+        self.chunks = {}
+        self.transcripts = {}
+        self.total_length = 0
+        self.next_chunk = 0
+        self.lock = threading.Lock()
+        self.synced_at = 0.0
+        self.vectors = None
+
+    def add(self, transcript_id, text, name=None, stamp=None, chunks=None):
+        """
+        Indexes a transcript, replacing its previous chunks. An unchanged text only updates the stored stamp.
+
+        Args:
+            transcript_id (str): Transcript id.
+            text (str): Transcript text.
+            name (str, optional): Transcript name shown with its passages.
+            stamp (optional): Version of the text (``updatedAt``), compared on the next sync.
+            chunks (list, optional): The text already split into chunks (e.g. stored with the transcript's
+                artifacts); by default it is split here.
+
+        Returns:
+            bool: Whether the transcript was (re)indexed.
+        """
+        digest = hashlib.sha1(text.encode()).hexdigest()
+        entry = self.transcripts.get(transcript_id)
+        if entry is not None and entry["digest"] == digest:
+            entry["stamp"] = stamp
+            if name:
+                entry["name"] = name
+            return False
+        self.remove(transcript_id)
+        chunk_ids = []
+        for position, chunk_text in enumerate(split_turns(text, self.chunk_tokens) if chunks is None else chunks):
+            terms = tokenize(chunk_text)
+            chunk_id = self.next_chunk
+            self.next_chunk += 1
+            self.chunks[chunk_id] = _Chunk(transcript_id, position, chunk_text, len(terms))
+            self.total_length += len(terms)
+            counts = defaultdict(int)
+            for term in terms:
+                counts[term] += 1
+            for term, count in counts.items():
+                self.postings[term][chunk_id] = count
+            chunk_ids.append(chunk_id)
+        self.transcripts[transcript_id] = {"digest": digest, "stamp": stamp, "name": name, "chunks": chunk_ids}
+        return True
+
+    def remove(self, transcript_id):
+        """
+        Removes a transcript's chunks from the index.
+        """
+        entry = self.transcripts.pop(transcript_id, None)
+        if entry is None:
+            return
+        for chunk_id in entry["chunks"]:
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= chunk.length
+            for term in set(tokenize(chunk.text)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def vector_key(self, transcript_id):
+        """
+        Returns the key the chunk embeddings of a transcript must have to match its indexed chunks.
+        """
+        return f"{self.transcripts[transcript_id]['digest']}:{self.chunk_tokens}"
+
+    def keyword_scores(self, query):
+        """
+        Returns the BM25 score of every chunk matching a term of ``query``, by chunk id.
+        """
+        count = len(self.chunks)
+        average_length = self.total_length / count if count else 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length = self.chunks[chunk_id].length
+                norm = self.k1 * (1 - self.b + self.b * (length / average_length if average_length else 1))
+                scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def search(self, query, max_tokens, max_transcripts=None, vector_hits=None, alpha=0.5):
+        """
+        Returns the best-scoring chunks for ``query`` that fit in ``max_tokens``.
+
+        With ``vector_hits``, chunks are ranked by a hybrid score: ``alpha`` times the embedding similarity plus
+        ``1 - alpha`` times the BM25 score divided by the best BM25 score of the query.
+
+        Args:
+            query (str): Search text.
+            max_tokens (int): Token budget of the returned passages.
+            max_transcripts (int, optional): Most transcripts the passages may come from.
+            vector_hits (list, optional): ``(transcript_id, position, similarity)`` of the chunks nearest to the
+                query embedding, from embeddings matching ``vector_key``.
+            alpha (float, optional): Weight of the embedding similarity in the hybrid score.
+
+        Returns:
+            list: Passages (``transcript_id``, ``transcript_name``, ``position``, ``text``, ``score``), best first.
+        """
+        if not self.chunks:
+            return []
+        scores = self.keyword_scores(query)
+        if vector_hits:
+            best = max(scores.values(), default=0) or 1
+            scores = defaultdict(float, {chunk_id: (1 - alpha) * score / best for chunk_id, score in scores.items()})
+            for transcript_id, position, similarity in vector_hits:
+                entry = self.transcripts.get(transcript_id)
+                if entry is not None and position < len(entry["chunks"]):
+                    scores[entry["chunks"][position]] += alpha * max(similarity, 0.0)
+
+        passages, transcripts = [], set()
+        budget = max_tokens
+        for chunk_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if score <= 0:
+                break
+            chunk = self.chunks[chunk_id]
+            if chunk.tokens > budget:
+                if budget < self.chunk_tokens // 2:
+                    break
+                continue
+            if max_transcripts and chunk.transcript_id not in transcripts and len(transcripts) >= max_transcripts:
+                continue
+            transcripts.add(chunk.transcript_id)
+            budget -= chunk.tokens
+            passages.append({
+                "transcript_id": chunk.transcript_id,
+                "transcript_name": self.transcripts[chunk.transcript_id]["name"],
+                "position": chunk.position,
+                "text": chunk.text,
+                "score": round(score, 4),
+            })
+        return passages
+
+
+class RetrievalIndex:
+    """
+    BM25 indexes of the most recently searched projects, kept in sync with the ``projects`` and ``transcripts``
+    collections.
+
+    With an ``embedder``, every project index also has a ``VectorStore`` of its chunk embeddings; transcripts
+    are embedded when they are indexed with new text, and searches rank chunks by the hybrid score of
+    ``ProjectIndex.search`` over the BM25 matches and the ``RETRIEVAL_VECTOR_K`` nearest chunks.
+
+    Args:
+        db: Async (motor) database.
+        embedder (optional): Embedder from ``embeddings.make_embedder``; None searches with BM25 only.
+        max_projects (int, optional): Project indexes kept in memory.
+        sync_seconds (float, optional): Shortest time between two checks of a project against Mongo.
+        context_tokens (int, optional): Default token budget of a search.
+    """
+    def __init__(self, db, embedder=None, max_projects=None, sync_seconds=None, context_tokens=None):
+        self.db = db
+        self.embedder = embedder
+        self.vector_k = int(os.getenv("RETRIEVAL_VECTOR_K", 100))
+        self.alpha = float(os.getenv("RETRIEVAL_HYBRID_ALPHA", 0.5))
+        self.max_projects = max_projects or int(os.getenv("RETRIEVAL_MAX_PROJECTS", 64))
+        self.sync_seconds = float(os.getenv("RETRIEVAL_SYNC_SECONDS", 5)) if sync_seconds is None else sync_seconds
+        self.context_tokens = context_tokens or int(os.getenv("RETRIEVAL_CONTEXT_TOKENS", 6000))
+        self.projects = OrderedDict()
+        self.locks = {}
+        self.counters = {"searches": 0, "search_seconds": 0.0, "syncs": 0, "builds": 0, "indexed": 0, "removed": 0, "ingested": 0,
+                         "embedded_chunks": 0, "embed_failures": 0, "hybrid_searches": 0}
+
+    async def search(self, project_id, query, max_tokens=None, max_transcripts=None):
+        """
+        Returns the best passages of a project's transcripts for ``query``.
+
+        Args:
+            project_id (str): Project to search (an ``ObjectId`` is converted to its string id).
+            query (str): Search text, e.g. the chat question.
+            max_tokens (int, optional): Token budget of the passages (``RETRIEVAL_CONTEXT_TOKENS``).
+            max_transcripts (int, optional): Most transcripts the passages may come from.
+
+        Returns:
+            list: Passages, best first (see ``ProjectIndex.search``).
+
+        Raises:
+            HTTPException: If the project does not exist.
+        """
+        # Indexes are keyed by the string id, as in ``ingest``; chat sessions hold the project id as an ObjectId.
+        project_id = str(project_id)
+        loaded = self.projects.get(project_id)
+        embedding = None
+        if loaded is not None and loaded.vectors is not None and loaded.vectors.rows:
+            # The query is embedded while the project is checked against Mongo rather than after it.
+            embedding = asyncio.ensure_future(self._embed_query(project_id, query))
+        try:
+            index = await self._synced(project_id)
+        except BaseException:
+            if embedding is not None:
+                embedding.cancel()
+            raise
+        started = time.perf_counter()
+        query_vector = None
+        if index.vectors is not None and index.vectors.rows:
+            query_vector = await (embedding or self._embed_query(project_id, query))
+        elif embedding is not None:
+            embedding.cancel()
+
+        def run():
+            hits = None
+            if query_vector is not None:
+                hits = index.vectors.top_k(query_vector, self.vector_k)
+            with index.lock:
+                if hits is not None:
+                    hits = [hit for hit in hits if hit[0] in index.transcripts and index.vectors.key(hit[0]) == index.vector_key(hit[0])]
+                return index.search(query, max_tokens or self.context_tokens, max_transcripts, vector_hits=hits, alpha=self.alpha)
+
+        passages = await asyncio.to_thread(run)
+        self.counters["searches"] += 1
+        self.counters["hybrid_searches"] += query_vector is not None
+        self.counters["search_seconds"] += time.perf_counter() - started
+        return passages
+
+    async def ingest(self, transcript_id, text):
+        """
+        Adds a freshly produced transcript to the indexes of the projects it belongs to.
+
+        Without an embedder only loaded indexes are updated. With one, the projects are loaded so the transcript
+        is embedded now rather than on the next search.
+        """
+        if not text:
+            return
+        query = {"transcripts": ObjectId(transcript_id)}
+        if self.embedder is None:
+            if not self.projects:
+                return
+            query["_id"] = {"$in": [ObjectId(pid) for pid in self.projects]}
+        async for project in self.db.projects.find(query, {"_id": 1}):
+            index = await self._synced(str(project["_id"]))
+            await asyncio.to_thread(self._apply, index, [(transcript_id, text, None, None)], [])
+            await self._embed(index)
+            self.counters["ingested"] += 1
+
+    def stats(self):
+        """
+        Returns the search and indexing counters and the size of the loaded indexes.
+        """
+        stats = dict(self.counters)
+        stats["search_seconds"] = round(stats["search_seconds"], 3)
+        stats["avg_search_ms"] = round(1000 * stats["search_seconds"] / stats["searches"], 2) if stats["searches"] else 0.0
+        stats["projects"] = len(self.projects)
+        stats["chunks"] = sum(len(index.chunks) for index in self.projects.values())
+        return stats
+
+    async def _embed_query(self, project_id, query):
+        try:
+            return (await self.embedder.embed([query]))[0]
+        except HTTPException as e:
+            print(f"Retrieval for project {project_id} falls back to BM25: {e.detail}")
+            self.counters["embed_failures"] += 1
+            return None
+
+    async def _synced(self, project_id):
+        project_id = str(project_id)
+        lock = self.locks.setdefault(project_id, asyncio.Lock())
+        async with lock:
+            index = self.projects.get(project_id)
+            if index is not None:
+                self.projects.move_to_end(project_id)
+                if time.monotonic() - index.synced_at < self.sync_seconds:
+                    return index
+            else:
+                index = ProjectIndex()
+                if self.embedder is not None:
+                    index.vectors = await asyncio.to_thread(VectorStore.for_project, project_id, self.embedder.dimensions)
+                self.counters["builds"] += 1
+            await self._sync(project_id, index)
+            self.projects[project_id] = index
+            while len(self.projects) > self.max_projects:
+                evicted, _ = self.projects.popitem(last=False)
+                self.locks.pop(evicted, None)
+            return index
+
+    async def _sync(self, project_id, index):
+        project_id = str(project_id)
+        try:
+            project = await self.db.projects.find_one({"_id": ObjectId(project_id)}, {"transcripts": 1})
+        except Exception as e:
+            project = None
+        if project is None:
+            raise HTTPException(status_code=700, detail=f"Cannot find project ID: {project_id}")
+
+        ids = [ObjectId(tid) for tid in project.get("transcripts", [])]
+        stamps = {}
+        async for document in self.db.transcripts.find({"_id": {"$in": ids}, "text": {"$nin": [None, ""]}}, {"updatedAt": 1}):
+            stamps[str(document["_id"])] = document.get("updatedAt")
+        changed = [tid for tid, stamp in stamps.items()
+                   if tid not in index.transcripts or stamp is None or index.transcripts[tid]["stamp"] != stamp]
+        # Transcripts still waiting for their text in Mongo keep what ``ingest`` indexed.
+        listed = {str(tid) for tid in ids}
+        removed = [tid for tid in index.transcripts if tid not in listed]
+
+        updates = []
+        if changed:
+            async for document in self.db.transcripts.find(
+                {"_id": {"$in": [ObjectId(tid) for tid in changed]}}, {"text": 1, "updatedAt": 1, "transcriptName": 1}
+            ):
+                updates.append((str(document["_id"]), document.get("text") or "", document.get("transcriptName"), document.get("updatedAt")))
+        if updates or removed:
+            await asyncio.to_thread(self._apply, index, updates, removed)
+        await self._embed(index)
+        index.synced_at = time.monotonic()
+        self.counters["syncs"] += 1
+
+    def _apply(self, index, updates, removed):
+        with index.lock:
+            for transcript_id in removed:
+                index.remove(transcript_id)
+                self.counters["removed"] += 1
+            for transcript_id, text, name, stamp in updates:
+                if index.add(transcript_id, text, name=name or index.transcripts.get(transcript_id, {}).get("name"), stamp=stamp):
+                    self.counters["indexed"] += 1
+
+    async def _embed(self, index):
+        # Embeds the transcripts whose stored embeddings are missing or were made from another text.
+        store = index.vectors
+        if store is None:
+            return
+        await asyncio.to_thread(store.refresh)
+        with index.lock:
+            pending = [(tid, index.vector_key(tid), [index.chunks[c].text for c in entry["chunks"]])
+                       for tid, entry in index.transcripts.items() if store.key(tid) != index.vector_key(tid)]
+            gone = store.transcript_ids() - set(index.transcripts)
+        if gone:
+            await asyncio.to_thread(store.remove, gone)
+        for transcript_id, key, texts in pending:
+            try:
+                vectors = await self.embedder.embed(texts)
+            except HTTPException as e:
+                print(f"Transcript {transcript_id} not embedded: {e.detail}")
+                self.counters["embed_failures"] += 1
+                continue
+            await asyncio.to_thread(store.put, transcript_id, key, vectors)
+            self.counters["embedded_chunks"] += len(texts)
@@ -0,0 +1,284 @@
+"""
+This module streams files from a URL into S3 without staging them on disk.
+
+The response body is cut into parts as it arrives and the parts are sent with an S3 multipart upload, several
+at a time. Only the parts in flight are held in memory (about ``concurrency + 1`` parts), so large recordings
+need no temp disk. A failed part is retried on its own, and a download that drops midway is resumed with an
+HTTP range request from the last byte received. If the upload cannot be completed it is aborted, so no
+orphaned parts are left behind. Objects smaller than one part are stored with a single ``put_object``.
+
+Environment:
+    - ``S3_UPLOAD_PART_MB``: Part size in MB (8, at least 5 as required by S3).
+    - ``S3_UPLOAD_CONCURRENCY``: Parts uploaded at the same time (8).
+    - ``S3_UPLOAD_RETRIES``: Extra attempts per failed part and per dropped download (3).
+
+Functions:
+    - upload_settings: Reads the part size, concurrency and retry settings.
+    - stream_url_to_s3: Streams a URL into S3 (blocking).
+    - stream_url_to_s3_async: Streams a URL into S3 from an asyncio event loop.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import httpx
+import requests
+from fastapi import HTTPException
+from botocore.exceptions import BotoCoreError, ClientError
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def upload_settings(part_size=None, concurrency=None, retries=None):
+    """
+    Fills in the upload settings that were not given from the environment.
+
+    Returns:
+        tuple: Part size in bytes, number of concurrent part uploads and retries per part.
+    """
+    part_size = part_size or int(float(os.getenv("S3_UPLOAD_PART_MB", 8)) * 1024 * 1024)
+    concurrency = concurrency or int(os.getenv("S3_UPLOAD_CONCURRENCY", 8))
+    retries = int(os.getenv("S3_UPLOAD_RETRIES", 3)) if retries is None else retries
+    return max(part_size, MIN_PART_SIZE), max(concurrency, 1), retries
+
+
+class _Upload:
+    """
+    State of one multipart upload, shared by the blocking and asyncio drivers.
+    """
+    def __init__(self, s3_client, bucket_name, key, retries):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.retries = retries
+        self.upload_id = None
+        self.parts = []
+        self.bytes = 0
+        self.part_retries = 0
+        self.download_retries = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def put_small(self, data):
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=self.key, Body=data)
+        self.bytes = len(data)
+
+    def create(self):
+        response = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=self.key)
+        self.upload_id = response["UploadId"]
+
+    def upload_part(self, number, data):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.s3_client.upload_part(
+                    Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data
+                )
+                break
+            except (BotoCoreError, ClientError):
+                if attempt == self.retries:
+                    raise
+                with self.lock:
+                    self.part_retries += 1
+                time.sleep(min(0.5 * 2 ** attempt, 8))
+        with self.lock:
+            self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+            self.bytes += len(data)
+
+    def complete(self):
+        parts = sorted(self.parts, key=lambda part: part["PartNumber"])
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def abort(self):
+        if self.upload_id is None:
+            return
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        except (BotoCoreError, ClientError) as e:
+            print(f"Failed to abort multipart upload {self.upload_id} for {self.key}: {e}")
+
+    def summary(self):
+        return {
+            "bucket": self.bucket_name,
+            "key": self.key,
+            "bytes": self.bytes,
+            "parts": len(self.parts) or 1,
+            "part_retries": self.part_retries,
+            "download_retries": self.download_retries,
+            "seconds": round(time.monotonic() - self.started, 2),
+        }
+
+
+def _check_response(response, offset):
+    expected = 206 if offset else 200
+    if response.status_code != expected:
+        raise HTTPException(status_code=501, detail=f"Failed to download file from presigned URL (status {response.status_code})")
+
+
+def _download_blocks(session, url, upload):
+    offset = 0
+    while True:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=60) as response:
+                _check_response(response, offset)
+                for block in response.iter_content(READ_SIZE):
+                    offset += len(block)
+                    yield block
+            return
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout):
+            upload.download_retries += 1
+            if upload.download_retries > upload.retries:
+                raise
+
+
+def _cut_parts(blocks, part_size):
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    yield bytes(buffer)
+
+
+def stream_url_to_s3(url, s3_client, bucket_name, key, session=None, part_size=None, concurrency=None, retries=None):
+    """
+    Streams the body of ``url`` into an S3 object without writing it to disk. Blocks until the upload finishes.
+
+    Args:
+        url (str): URL to download (e.g. a presigned URL).
+        s3_client: boto3 S3 client.
+        bucket_name (str): Destination bucket.
+        key (str): Destination key.
+        session (requests.Session, optional): Session used for the download.
+        part_size (int, optional): Part size in bytes. Defaults to ``S3_UPLOAD_PART_MB``.
+        concurrency (int, optional): Parts uploaded at the same time. Defaults to ``S3_UPLOAD_CONCURRENCY``.
+        retries (int, optional): Extra attempts per part and per dropped download. Defaults to ``S3_UPLOAD_RETRIES``.
+
+    Returns:
+        dict: Summary of the transfer (bytes, parts, retries, seconds).
+
+    Raises:
+        HTTPException: If the download fails.
+        BotoCoreError, ClientError: If a part cannot be uploaded after all retries.
+    """
+    part_size, concurrency, retries = upload_settings(part_size, concurrency, retries)
+    upload = _Upload(s3_client, bucket_name, key, retries)
+    parts = _cut_parts(_download_blocks(session or requests.Session(), url, upload), part_size)
+
+    first = next(parts)
+    if len(first) < part_size:
+        upload.put_small(first)
+        return upload.summary()
+
+    upload.create()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            pending = set()
+            number = 1
+            data = first
+            while data:
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(pool.submit(upload.upload_part, number, data))
+                number += 1
+                data = next(parts, b"")
+            for future in pending:
+                future.result()
+        upload.complete()
+    except BaseException:
+        upload.abort()
+        raise
+    return upload.summary()
+
+
+async def _download_blocks_async(http_client, url, upload):
+    offset = 0
+    while True:
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            async with http_client.stream("GET", url, headers=headers) as response:
+                _check_response(response, offset)
+                async for block in response.aiter_bytes(READ_SIZE):
+                    offset += len(block)
+                    yield block
+            return
+        except (httpx.TransportError, httpx.RemoteProtocolError):
+            upload.download_retries += 1
+            if upload.download_retries > upload.retries:
+                raise
+
+
+async def stream_url_to_s3_async(url, s3_client, bucket_name, key, http_client, part_size=None, concurrency=None, retries=None):
+    """
+    Streams the body of ``url`` into an S3 object from an asyncio event loop.
+
+    The download runs on ``http_client`` and the blocking boto3 part uploads run in worker threads, so the
+    event loop stays free while large recordings are transferred.
+
+    Args:
+        url (str): URL to download (e.g. a presigned URL).
+        s3_client: boto3 S3 client.
+        bucket_name (str): Destination bucket.
+        key (str): Destination key.
+        http_client (httpx.AsyncClient): Client used for the download.
+        part_size (int, optional): Part size in bytes. Defaults to ``S3_UPLOAD_PART_MB``.
+        concurrency (int, optional): Parts uploaded at the same time. Defaults to ``S3_UPLOAD_CONCURRENCY``.
+        retries (int, optional): Extra attempts per part and per dropped download. Defaults to ``S3_UPLOAD_RETRIES``.
+
+    Returns:
+        dict: Summary of the transfer (bytes, parts, retries, seconds).
+
+    Raises:
+        HTTPException: If the download fails.
+        BotoCoreError, ClientError: If a part cannot be uploaded after all retries.
+    """
+    part_size, concurrency, retries = upload_settings(part_size, concurrency, retries)
+    upload = _Upload(s3_client, bucket_name, key, retries)
+    blocks = _download_blocks_async(http_client, url, upload)
+    buffer = bytearray()
+    pending = set()
+    number = 1
+
+    async def flush(data):
+        nonlocal pending, number
+        if upload.upload_id is None:
+            await asyncio.to_thread(upload.create)
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        pending.add(asyncio.create_task(asyncio.to_thread(upload.upload_part, number, data)))
+        number += 1
+
+    try:
+        async for block in blocks:
+            buffer += block
+            while len(buffer) >= part_size:
+                await flush(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+        if upload.upload_id is None:
+            await asyncio.to_thread(upload.put_small, bytes(buffer))
+            return upload.summary()
+        if buffer:
+            await flush(bytes(buffer))
+        for task in pending:
+            await task
+        await asyncio.to_thread(upload.complete)
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await asyncio.to_thread(upload.abort)
+        raise
+    finally:
+        await blocks.aclose()
+    return upload.summary()
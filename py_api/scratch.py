@@ -0,0 +1,221 @@
+"""
+This module hands out isolated scratch files for request processing, within a total size budget.
+
+Each request opens a ``ScratchSession``, reserves the space it expects to need and asks the session for file
+paths. Every session gets its own directory, so concurrent requests never share a file name, and the directory
+is removed when the session closes, whatever way the request ends. Small reservations are placed in a
+memory-backed directory (tmpfs, ``/dev/shm``) while its budget lasts, larger ones on disk. When the disk quota
+is used up, new reservations wait on the event loop until running sessions release space (or fail after a
+timeout), which keeps a burst of large uploads from filling the disk. Session directories left behind by
+processes that no longer exist are removed on start.
+
+Environment:
+    - ``SCRATCH_DIR``: Disk scratch root (``<system temp>/uxr-scratch``).
+    - ``SCRATCH_QUOTA_MB``: Total disk reserved by running sessions (10240).
+    - ``SCRATCH_MEMORY_DIR``: Memory-backed directory for small files, empty to disable (``/dev/shm``).
+    - ``SCRATCH_MEMORY_QUOTA_MB``: Total size of the memory-backed files (256).
+    - ``SCRATCH_MEMORY_FILE_MB``: Largest reservation placed in memory (32).
+    - ``SCRATCH_WAIT_SECONDS``: How long a reservation waits for disk space (600).
+
+Classes:
+    - ScratchSpace: Owns the scratch roots and the quotas.
+    - ScratchSession: Unique scratch files of one request, removed on close.
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+
+from fastapi import HTTPException
+
+MB = 1024 * 1024
+
+# Space reserved per downloaded media byte, covering the files derived from it (extracted or normalized audio,
+# chunk files) that are written to the same session directory.
+MEDIA_SIZE_FACTOR = 2
+
+
+class ScratchSpace:
+    """
+    Scratch roots and quotas shared by all sessions of the process.
+
+    Args:
+        root (str, optional): Disk scratch root.
+        quota_bytes (int, optional): Disk bytes that running sessions may reserve in total.
+        memory_dir (str, optional): Memory-backed directory for small files ("" disables it).
+        memory_quota_bytes (int, optional): Bytes that may be reserved in the memory-backed directory.
+        memory_file_bytes (int, optional): Largest reservation placed in the memory-backed directory.
+        wait_seconds (float, optional): How long a reservation waits for disk space before failing.
+    """
+    def __init__(self, root=None, quota_bytes=None, memory_dir=None, memory_quota_bytes=None, memory_file_bytes=None, wait_seconds=None):
+        self.root = root or os.getenv("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "uxr-scratch"))
+        self.quota = quota_bytes or int(float(os.getenv("SCRATCH_QUOTA_MB", 10240)) * MB)
+        memory_dir = os.getenv("SCRATCH_MEMORY_DIR", "/dev/shm") if memory_dir is None else memory_dir
+        self.memory_root = os.path.join(memory_dir, "uxr-scratch") if memory_dir and os.path.isdir(memory_dir) else None
+        self.memory_quota = memory_quota_bytes or int(float(os.getenv("SCRATCH_MEMORY_QUOTA_MB", 256)) * MB)
+        self.memory_file = memory_file_bytes or int(float(os.getenv("SCRATCH_MEMORY_FILE_MB", 32)) * MB)
+        self.wait_seconds = wait_seconds or float(os.getenv("SCRATCH_WAIT_SECONDS", 600))
+        self.lock = threading.Lock()
+        self.waiters = []
+        self.reserved = {"disk": 0, "memory": 0}
+        self.counters = {"sessions": 0, "open_sessions": 0, "disk_reservations": 0, "memory_reservations": 0,
+                         "waits": 0, "wait_seconds": 0.0, "timeouts": 0, "peak_disk_reserved": 0}
+        for base in (self.root, self.memory_root):
+            if base:
+                self._purge_stale(base)
+
+    def session(self):
+        """
+        Opens a new session. Use it as a context manager so its files are removed on every exit path.
+        """
+        with self.lock:
+            self.counters["sessions"] += 1
+            self.counters["open_sessions"] += 1
+        return ScratchSession(self)
+
+    def stats(self):
+        """
+        Returns the reserved bytes, the quotas and the session/backpressure counters.
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats["wait_seconds"] = round(stats["wait_seconds"], 2)
+            stats["disk_reserved_mb"] = round(self.reserved["disk"] / MB, 1)
+            stats["memory_reserved_mb"] = round(self.reserved["memory"] / MB, 1)
+        stats["disk_quota_mb"] = round(self.quota / MB, 1)
+        stats["memory_quota_mb"] = round(self.memory_quota / MB, 1) if self.memory_root else 0
+        return stats
+
+    def _try_acquire(self, size):
+        if self.memory_root and size <= self.memory_file and self.reserved["memory"] + size <= self.memory_quota:
+            self.reserved["memory"] += size
+            self.counters["memory_reservations"] += 1
+            return "memory"
+        # A reservation larger than the whole quota is let through once nothing else holds disk space.
+        if self.reserved["disk"] and self.reserved["disk"] + size > self.quota:
+            return None
+        self.reserved["disk"] += size
+        self.counters["disk_reservations"] += 1
+        self.counters["peak_disk_reserved"] = max(self.counters["peak_disk_reserved"], self.reserved["disk"])
+        return "disk"
+
+    async def _acquire(self, size):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self.lock:
+                tier = self._try_acquire(size)
+                if tier is not None:
+                    if waited:
+                        self.counters["waits"] += 1
+                        self.counters["wait_seconds"] += time.monotonic() - started
+                    return tier
+                waiter = loop.create_future()
+                self.waiters.append((loop, waiter))
+            waited = True
+            remaining = self.wait_seconds - (time.monotonic() - started)
+            try:
+                await asyncio.wait_for(waiter, max(remaining, 0))
+            except asyncio.TimeoutError:
+                with self.lock:
+                    self.counters["timeouts"] += 1
+                    in_use = self.reserved["disk"]
+                raise HTTPException(status_code=307, detail=f"Scratch space quota exhausted: {size / MB:.1f} MB requested, "
+                                                            f"{in_use / MB:.1f} of {self.quota / MB:.1f} MB in use")
+
+    def _release(self, reservations):
+        with self.lock:
+            for tier, size in reservations:
+                self.reserved[tier] -= size
+            self.counters["open_sessions"] -= 1
+            waiters, self.waiters = self.waiters, []
+        # Every waiter retries its reservation; the ones that still do not fit queue up again.
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+
+    @staticmethod
+    def _purge_stale(base):
+        if not os.path.isdir(base):
+            return
+        for name in os.listdir(base):
+            pid = name.split("-", 1)[0]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+            except PermissionError:
+                pass
+
+
+class ScratchSession:
+    """
+    Scratch files of one request. Paths are unique to the session and everything is removed on ``close``.
+
+    Args:
+        space (ScratchSpace): Space the session reserves from.
+    """
+    def __init__(self, space):
+        self.space = space
+        self.tier = None
+        self.directory = None
+        self.reservations = []
+        self.closed = False
+
+    async def reserve(self, size):
+        """
+        Reserves ``size`` bytes for the session's files, waiting while the disk quota is used up by other sessions.
+
+        The wait happens on the event loop before any worker thread starts writing, so waiting requests never
+        hold the threads that running requests need to finish and release their space.
+
+        Args:
+            size (int): Expected size of the files, including anything derived from them.
+
+        Raises:
+            HTTPException: If the disk quota stays exhausted for ``SCRATCH_WAIT_SECONDS``.
+        """
+        tier = await self.space._acquire(size)
+        self.reservations.append((tier, size))
+        if self.tier is None:
+            self.tier = tier
+
+    def path(self, name):
+        """
+        Returns a path for a new file in the session directory.
+
+        The directory is memory-backed when the session's first reservation fitted the memory budget.
+
+        Args:
+            name (str): File name; only its base name is used, so callers can pass names taken from URLs.
+
+        Returns:
+            str: Path inside the session directory. Files derived from it can be written next to it.
+        """
+        if self.directory is None:
+            base = self.space.memory_root if self.tier == "memory" else self.space.root
+            os.makedirs(base, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=base)
+        return os.path.join(self.directory, os.path.basename(name))
+
+    def close(self):
+        """
+        Removes the session's files and releases its reservations. Safe to call more than once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.space._release(self.reservations)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,189 @@
+"""
+This module coalesces identical concurrent work: requests for a key that is already being computed wait for that
+computation instead of starting another one (single-flight).
+
+Work is grouped in namespaces (e.g. ``transcript`` for Mongo reads of a transcript's text, or the kind of an
+answer-cache key for LLM calls). The first request for a key starts the work as its own task; later requests for
+the same key while it runs share its result or exception. Nothing is kept after the work finishes, so a failure
+is not remembered and the next request tries again.
+
+Cancellation is per waiter: a cancelled request stops waiting, but the work keeps running for the others. When
+every waiter of a flight is gone the work itself is cancelled, since nobody needs its result anymore.
+
+Environment:
+    - ``SINGLEFLIGHT``: ``on`` (default) or ``off``.
+    - ``SINGLEFLIGHT_HOT_KEYS``: Keys whose sharing counts are kept for ``stats`` (256).
+
+Classes:
+    - SingleFlight: Shares in-flight work between concurrent requests for the same key.
+"""
+
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+
+HOT_KEYS_REPORTED = 10
+
+
+class _Flight:
+    """
+    One running computation and the number of requests waiting for it.
+    """
+    def __init__(self, task, batch, keys):
+        self.task = task
+        self.batch = batch
+        self.keys = keys
+        self.waiters = 0
+
+    def result(self, key):
+        result = self.task.result()
+        return result.get(key) if self.batch else result
+
+
+class SingleFlight:
+    """
+    Shares in-flight work between concurrent requests for the same key.
+
+    Args:
+        enabled (bool, optional): Coalesce requests (``SINGLEFLIGHT``); when off, every request runs its own work
+            (and is still counted).
+        hot_keys (int, optional): Keys whose sharing counts are kept (``SINGLEFLIGHT_HOT_KEYS``).
+    """
+    def __init__(self, enabled=None, hot_keys=None):
+        self.enabled = os.getenv("SINGLEFLIGHT", "on") != "off" if enabled is None else enabled
+        self.max_hot_keys = int(os.getenv("SINGLEFLIGHT_HOT_KEYS", 256)) if hot_keys is None else hot_keys
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.namespaces = {}
+        self.hot_keys = OrderedDict()
+
+    async def do(self, namespace, key, produce):
+        """
+        Returns the result of ``produce()``, shared with concurrent requests for the same key.
+
+        Args:
+            namespace (str): Kind of work; counters are kept per namespace.
+            key (hashable): Key of the work within the namespace.
+            produce (callable): Coroutine function doing the work.
+
+        Returns:
+            The result of the work.
+
+        Raises:
+            Exception: Whatever the work raised, in every request sharing it.
+        """
+        if not self.enabled:
+            self._count(namespace, requests=1, flights=1)
+            return await produce()
+        flight = self.inflight.get((namespace, key))
+        if flight is None:
+            flight = self._start(namespace, [key], produce(), batch=False)
+        else:
+            self._shared(namespace, key)
+        self._count(namespace, requests=1)
+        return await self._wait(namespace, flight, key)
+
+    async def do_many(self, namespace, keys, produce_many):
+        """
+        Returns the results for ``keys``, computing the keys not already in flight with one ``produce_many`` call.
+
+        Keys in flight (from ``do`` with a batch, or from ``do_many``) are shared like in ``do``.
+
+        Args:
+            namespace (str): Kind of work; counters are kept per namespace.
+            keys (list): Keys of the work within the namespace.
+            produce_many (callable): Coroutine function taking the keys to compute and returning a dictionary of
+                results by key; keys left out have no result. The keys of that dictionary must be equal to the
+                given keys (e.g. ``str`` ids for ``str`` keys), or the results are not found.
+
+        Returns:
+            dict: Results by key, for the keys that have one.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        if not self.enabled:
+            self._count(namespace, requests=len(keys), flights=1)
+            return await produce_many(keys)
+        flights = {key: self.inflight.get((namespace, key)) for key in keys}
+        fresh = [key for key, flight in flights.items() if flight is None]
+        for key in keys:
+            if flights[key] is not None:
+                self._shared(namespace, key)
+        if fresh:
+            flight = self._start(namespace, fresh, produce_many(fresh), batch=True)
+            flights.update((key, flight) for key in fresh)
+        self._count(namespace, requests=len(keys))
+        results = await asyncio.gather(*(self._wait(namespace, flights[key], key) for key in keys))
+        return {key: result for key, result in zip(keys, results) if result is not None}
+
+    def stats(self):
+        """
+        Returns the counters of every namespace and the keys shared most.
+
+        Per namespace: ``requests`` (keys asked for), ``flights`` (work started), ``shared`` (requests that joined
+        running work), ``errors``, ``abandoned`` (work cancelled because every waiter left), ``max_waiters`` and
+        ``inflight``.
+        """
+        with self.lock:
+            namespaces = {name: dict(counters) for name, counters in self.namespaces.items()}
+            hot = sorted(self.hot_keys.items(), key=lambda item: -item[1])[:HOT_KEYS_REPORTED]
+        for name, counters in namespaces.items():
+            counters["inflight"] = sum(1 for namespace, _ in list(self.inflight) if namespace == name)
+            counters["shared_rate"] = round(counters["shared"] / counters["requests"], 3) if counters["requests"] else 0.0
+        return {"enabled": self.enabled, "namespaces": namespaces,
+                "hot_keys": [{"namespace": ns, "key": str(key), "shared": count} for (ns, key), count in hot]}
+
+    def _start(self, namespace, keys, work, batch):
+        flight = _Flight(asyncio.ensure_future(work), batch, keys)
+        for key in keys:
+            self.inflight[(namespace, key)] = flight
+
+        def done(task):
+            self._forget(namespace, flight)
+            if task.cancelled():
+                return
+            if task.exception() is not None:
+                # Retrieved here too, so work that failed after its waiters left is not reported as unhandled.
+                self._count(namespace, errors=1)
+
+        flight.task.add_done_callback(done)
+        self._count(namespace, flights=1)
+        return flight
+
+    async def _wait(self, namespace, flight, key):
+        flight.waiters += 1
+        with self.lock:
+            counters = self.namespaces[namespace]
+            counters["max_waiters"] = max(counters["max_waiters"], flight.waiters)
+        try:
+            await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Forgotten right away, so a request arriving before the cancellation lands starts new work.
+                self._forget(namespace, flight)
+                flight.task.cancel()
+                self._count(namespace, abandoned=1)
+        return flight.result(key)
+
+    def _forget(self, namespace, flight):
+        for key in flight.keys:
+            if self.inflight.get((namespace, key)) is flight:
+                del self.inflight[(namespace, key)]
+
+    def _shared(self, namespace, key):
+        self._count(namespace, shared=1)
+        with self.lock:
+            hot = (namespace, key)
+            self.hot_keys[hot] = self.hot_keys.pop(hot, 0) + 1
+            while len(self.hot_keys) > self.max_hot_keys:
+                self.hot_keys.popitem(last=False)
+
+    def _count(self, namespace, **values):
+        with self.lock:
+            counters = self.namespaces.setdefault(namespace, {"requests": 0, "flights": 0, "shared": 0, "errors": 0,
+                                                              "abandoned": 0, "max_waiters": 0})
+            for name, value in values.items():
+                counters[name] += value
@@ -0,0 +1,262 @@
+"""
+This module provides a streaming transcription pipeline that never writes the media to disk.
+
+The media is read from S3 and decoded by an ffmpeg subprocess into 16 kHz mono PCM on stdout. mp3 and wav
+objects are streamed from ``get_object`` into ffmpeg's stdin, resuming with a ranged read if the connection
+drops. mp4 files keep their index wherever the encoder put it (often at the end), so ffmpeg reads those itself
+from a presigned URL using HTTP range requests. The PCM stream is cut near silences as it arrives, and each
+chunk is wrapped as an in-memory WAV file for the transcriber. Together with ``transcribe_chunks`` this keeps
+at most a few chunks in memory, whatever the size of the recording.
+
+Functions:
+    - stream_s3_object: Yields the bytes of an S3 object, resuming after dropped connections.
+    - ffmpeg_pipe: Runs an ffmpeg command as a subprocess, streaming data in and out.
+    - decode_to_pcm: Decodes media to 16 kHz mono 16-bit PCM with ffmpeg.
+    - pcm_chunks: Cuts a PCM stream into chunks near silences.
+    - wav_bytes: Wraps PCM samples in a WAV header.
+
+Classes:
+    - IterableReader: Read-only file object over an iterable of byte blocks.
+"""
+
+import io
+import os
+import wave
+import threading
+from collections import deque
+
+import ffmpeg
+import numpy as np
+from fastapi import HTTPException
+from botocore.exceptions import BotoCoreError, ClientError
+
+from chunking import Chunk
+
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+FRAME_SAMPLES = SAMPLE_RATE // 50
+
+
+def stream_s3_object(s3_client, bucket_name, key, chunk_size=1024 * 1024, retries=3):
+    """
+    Yields the bytes of an S3 object without storing it.
+
+    Args:
+        s3_client: boto3 S3 client.
+        bucket_name (str): Bucket of the object.
+        key (str): Key of the object.
+        chunk_size (int, optional): Size of the blocks read from the response body.
+        retries (int, optional): Ranged re-reads allowed after a dropped connection.
+
+    Yields:
+        bytes: Consecutive blocks of the object.
+    """
+    offset = 0
+    attempts = 0
+    while True:
+        params = {'Bucket': bucket_name, 'Key': key}
+        if offset:
+            params['Range'] = f"bytes={offset}-"
+        try:
+            body = s3_client.get_object(**params)['Body']
+        except (BotoCoreError, ClientError) as e:
+            raise HTTPException(status_code=600, detail=f"Error streaming file from S3: {e}")
+        try:
+            for block in body.iter_chunks(chunk_size):
+                offset += len(block)
+                yield block
+            return
+        except (BotoCoreError, ConnectionError, OSError):
+            attempts += 1
+            if attempts > retries:
+                raise
+        finally:
+            body.close()
+
+
+def ffmpeg_pipe(stream, source=None, read_size=64 * 1024):
+    """
+    Runs an ffmpeg-python stream spec as a subprocess, streaming data in and out.
+
+    Args:
+        stream: ffmpeg-python output stream writing to ``pipe:1``.
+        source (iterable, optional): Blocks of bytes piped into ffmpeg's stdin (the spec must read ``pipe:0``).
+        read_size (int, optional): Size of the blocks read from ffmpeg's stdout.
+
+    Yields:
+        bytes: Consecutive blocks of ffmpeg's output.
+
+    Raises:
+        HTTPException: If ffmpeg fails.
+    """
+    piped = source is not None
+    process = stream.global_args("-hide_banner", "-loglevel", "error").run_async(pipe_stdin=piped, pipe_stdout=True, pipe_stderr=True)
+    errors = deque(maxlen=20)
+    feed_error = []
+
+    def feed():
+        try:
+            for block in source:
+                process.stdin.write(block)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            feed_error.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def drain_stderr():
+        for line in process.stderr:
+            errors.append(line.decode(errors="ignore").strip())
+
+    threads = [threading.Thread(target=drain_stderr, daemon=True)]
+    if piped:
+        threads.append(threading.Thread(target=feed, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            data = process.stdout.read(read_size)
+            if not data:
+                break
+            yield data
+        returncode = process.wait()
+        for thread in threads:
+            thread.join()
+        if feed_error:
+            raise feed_error[0]
+        if returncode != 0:
+            raise HTTPException(status_code=303, detail=f"Failed to process audio: {' '.join(errors)}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def decode_to_pcm(source):
+    """
+    Decodes media to 16 kHz mono 16-bit PCM with an ffmpeg subprocess.
+
+    Args:
+        source (str | iterable): A URL or path ffmpeg reads itself, or an iterable of bytes piped into ffmpeg.
+
+    Yields:
+        bytes: Consecutive blocks of PCM samples.
+    """
+    piped = not isinstance(source, str)
+    stream = ffmpeg.input("pipe:0" if piped else source).output("pipe:1", format="s16le", acodec="pcm_s16le", ac=1, ar=SAMPLE_RATE, vn=None)
+    return ffmpeg_pipe(stream, source if piped else None)
+
+
+class IterableReader(io.RawIOBase):
+    """
+    Read-only file object over an iterable of byte blocks, e.g. to hand a stream to ``upload_fileobj``.
+
+    Args:
+        blocks (iterable): Blocks of bytes.
+        on_read (callable, optional): Called with the size of every block taken from ``blocks``.
+    """
+    def __init__(self, blocks, on_read=None):
+        self.blocks = iter(blocks)
+        self.on_read = on_read
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.blocks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+            if self.on_read:
+                self.on_read(len(self.pending))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def wav_bytes(pcm):
+    """
+    Wraps 16 kHz mono 16-bit PCM samples in a WAV header.
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def _find_cut(buffer, low, high, target, silence_db):
+    """
+    Returns a byte offset between ``low`` and ``high`` seconds, at the quiet spot nearest ``target`` seconds.
+    """
+    # Whole 20 ms frames only: a limit that is not a multiple of 20 ms would leave a partial frame.
+    count = int(high * SAMPLE_RATE) // FRAME_SAMPLES * FRAME_SAMPLES
+    samples = np.frombuffer(buffer, dtype=np.int16, count=count)
+    first = int(low * SAMPLE_RATE) // FRAME_SAMPLES
+    frames = samples[first * FRAME_SAMPLES:].reshape(-1, FRAME_SAMPLES)
+    # Mean level per 20 ms frame, smoothed over half a second so single quiet frames inside speech are ignored.
+    level = np.abs(frames.astype(np.float32)).mean(axis=1)
+    smooth = np.convolve(level, np.ones(25) / 25, mode="same")
+    threshold = 32768 * 10 ** (silence_db / 20)
+    quiet = np.flatnonzero(smooth < threshold)
+    target_frame = int(target * SAMPLE_RATE) // FRAME_SAMPLES - first
+    if quiet.size:
+        frame = quiet[np.abs(quiet - target_frame).argmin()]
+    else:
+        frame = int(smooth.argmin())
+    return (first + int(frame)) * FRAME_SAMPLES * 2
+
+
+def pcm_chunks(pcm, target=None, overlap=None, silence_db=None):
+    """
+    Cuts a PCM stream into chunks near silences.
+
+    Chunks follow the same layout as ``plan_chunks``: about ``target`` seconds each, cut at the quiet spot
+    nearest the target within half to one and a half times the target, and every chunk after the first
+    starting ``overlap`` seconds early. At most one and a half chunks of audio are buffered.
+
+    Args:
+        pcm (iterable): Blocks of 16 kHz mono 16-bit PCM.
+        target (float, optional): Preferred chunk length in seconds.
+        overlap (float, optional): Seconds of audio each chunk shares with the previous one.
+        silence_db (float, optional): Level below which audio counts as silence, in dB.
+
+    Yields:
+        Chunk: Chunks with their WAV audio in ``data``.
+    """
+    target = target or float(os.getenv("SARVAM_CHUNK_SECONDS", 300))
+    overlap = overlap if overlap is not None else float(os.getenv("SARVAM_CHUNK_OVERLAP", 2))
+    silence_db = silence_db if silence_db is not None else float(os.getenv("SARVAM_SILENCE_DB", -35))
+    overlap_bytes = int(overlap * SAMPLE_RATE) * 2
+
+    buffer = bytearray()
+    tail = b""
+    start = 0.0
+    index = 0
+    pending = b""
+    for block in pcm:
+        # Keep the buffer sample aligned even if a block ends in the middle of a sample.
+        block = pending + block
+        pending = block[len(block) - len(block) % 2:]
+        buffer += block[:len(block) - len(pending)]
+        while len(buffer) >= target * 1.5 * BYTES_PER_SECOND:
+            cut = _find_cut(buffer, target * 0.5, target * 1.5, target, silence_db)
+            end = start + cut / BYTES_PER_SECOND
+            yield Chunk(index, start, end, start - len(tail) / BYTES_PER_SECOND, wav_bytes(tail + buffer[:cut]))
+            tail = bytes(buffer[max(0, cut - overlap_bytes):cut])
+            del buffer[:cut]
+            start = end
+            index += 1
+    if buffer or index == 0:
+        end = start + len(buffer) / BYTES_PER_SECOND
+        yield Chunk(index, start, end, start - len(tail) / BYTES_PER_SECOND, wav_bytes(tail + buffer))
@@ -0,0 +1,122 @@
+"""
+Answer cache: reopening the analysis page with and without cached LLM results.
+
+Stores a project of ``--transcripts`` transcripts and opens its analysis page ``--visits`` times. A visit is what
+the page asks for: ``/generate-questions`` for the project, then ``/get-all-answer-grid`` with ``--questions``
+questions. The fake OpenAI server answers after ``--latency`` seconds. Then:
+
+    - changes ``QA_GRID_PROMPT``: every grid answer must be asked again, the generated questions stay cached
+    - edits the text of one transcript: only its grid answers are asked again
+    - visits with ``no_cache``: everything is asked again and the entries are refreshed
+
+Reports seconds, LLM calls and prompt tokens sent per visit, and the ``answer_cache`` counters of ``/metrics``.
+
+Requires a reachable MongoDB (``MONGO_URL``); the transcripts are stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_answer_cache.py [--transcripts 20] [--questions 10] [--visits 3] [--latency 1.0]
+"""
+
+import os
+import re
+import ast
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+
+def reply(body):
+    prompt = body["messages"][0]["content"]
+    found = re.search(r"Question: (\{.*?\})\n\n", prompt, re.S)
+    if found is None:
+        # Question generation.
+        return repr([f"Generated question {i + 1}?" for i in range(10)])
+    return repr({key: f"Answer to {question}" for key, question in ast.literal_eval(found.group(1)).items()})
+
+
+async def visit(base_url, project_id, questions, no_cache=False):
+    async with httpx.AsyncClient(timeout=600) as http:
+        response = await http.post(f"{base_url}/generate-questions/{project_id}", json={"num_q": 10, "no_cache": no_cache})
+        response.raise_for_status()
+        cells = 0
+        body = {"project_id": project_id, "question": questions, "no_cache": no_cache}
+        async with http.stream("POST", f"{base_url}/get-all-answer-grid", json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line and "answer" in json.loads(line):
+                    cells += 1
+    return cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--visits", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    fake_app = fake_openai_app(latency=args.latency, content=reply)
+    fake = ServerThread(fake_app).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    for prefix, prompt in [("QA_GRID", "Answer each question for the given transcript context."),
+                           ("QUESTION_AGG", "Merge the questions below into <n> questions.")]:
+        os.environ.setdefault(f"{prefix}_PROMPT", prompt)
+        os.environ.setdefault(f"{prefix}_PROMPT_FORMAT", "A Python literal.")
+        os.environ.setdefault(f"{prefix}_PROMPT_ROLE", "system")
+        os.environ.setdefault(f"{prefix}_MODEL", "fake-model")
+        os.environ.setdefault(f"{prefix}_MAX_TOKENS", "1000")
+
+    import api
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    text = "spk_0: We mostly use spreadsheets and the dashboard.\nspk_1: Exports are slow.\n" * 200
+    ids = mongo.transcripts.insert_many([
+        {"text": f"Interview {i}\n{text}", "questions": ["What tools do you use?", "What is slow?"]}
+        for i in range(args.transcripts)
+    ]).inserted_ids
+    project_id = str(mongo.projects.insert_one({"projectName": "bench", "transcripts": list(ids)}).inserted_id)
+    questions = {str(i + 1): f"Question {i + 1}?" for i in range(args.questions)}
+
+    server = ServerThread(api.app).start()
+    rows = []
+
+    def measure(label, no_cache=False):
+        calls, tokens = fake_app.state.calls, api.grid_runner.counters["prompt_tokens"]
+        started = time.perf_counter()
+        cells = asyncio.run(visit(server.url, project_id, questions, no_cache))
+        rows.append((label, f"{time.perf_counter() - started:.2f}", fake_app.state.calls - calls,
+                     f"{api.grid_runner.counters['prompt_tokens'] - tokens:,}", cells))
+
+    try:
+        mongo.answercache.delete_many({})
+        for i in range(args.visits):
+            measure("first visit (cold)" if i == 0 else f"visit {i + 1}")
+        os.environ["QA_GRID_PROMPT"] += " Be concise."
+        measure("after changing QA_GRID_PROMPT")
+        mongo.transcripts.update_one({"_id": ids[0]}, {"$set": {"text": f"Interview 0 (edited)\n{text}"}})
+        measure("after editing one transcript")
+        measure("no_cache", no_cache=True)
+        stats = httpx.get(f"{server.url}/metrics", timeout=60).json()["answer_cache"]
+    finally:
+        server.stop()
+        fake.stop()
+        mongo.transcripts.delete_many({"_id": {"$in": ids}})
+        mongo.projects.delete_many({"projectName": "bench"})
+
+    print(f"{args.transcripts} transcripts x {args.questions} questions, LLM latency {args.latency}s, "
+          f"backend {stats['backend']}")
+    print_table(["visit", "seconds", "LLM calls", "grid prompt tokens", "cells"], rows)
+    print("answer_cache: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
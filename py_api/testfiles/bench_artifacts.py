@@ -0,0 +1,137 @@
+"""
+Transcript artifacts: what building them costs and what they save in transcript chats.
+
+For each size in ``--transcript-tokens``, stores an interview transcript of about that many tokens with one
+distinctive fact (the name of an export button) at 80% of the text, then:
+
+    - builds its artifacts with ``/transcript-artifacts/{id}`` (turns, token counts, chunks, LLM summary)
+    - asks a transcript chat about the fact, once with the full text as context (``TRANSCRIPT_ARTIFACTS`` off,
+      the text cut to ``CHAT_TOKEN_BUDGET``) and once with the summary and the best-matching chunks
+
+The fake OpenAI server adds ``--latency-per-1k`` seconds per 1000 prompt tokens (prompt processing time).
+Reports the build time and summary calls, and per chat the prompt tokens, time to first byte, total time and
+whether the fact was in the prompt.
+
+Requires a reachable MongoDB (``MONGO_URL``); the transcripts are stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_artifacts.py [--transcript-tokens 10000 40000 120000] [--latency-per-1k 0.02]
+"""
+
+import os
+import time
+import random
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+TOPICS = ["pricing", "onboarding", "exports", "notifications", "permissions", "search", "billing", "integrations",
+          "dashboards", "the mobile app", "support", "security", "reporting"]
+LINES = [
+    "spk_0: Can you tell me more about how you use {topic} day to day?",
+    "spk_1: Honestly {topic} is fine most of the time, but when the team is busy it gets in the way.",
+    "spk_1: We looked at other tools for {topic} last year and stayed because moving everything is painful.",
+    "spk_0: What would make {topic} better for you?",
+    "spk_1: Fewer clicks. With {topic} I always end up opening three screens to do one thing.",
+    "spk_1: My manager asks about {topic} in every weekly review, so it matters more than it should.",
+]
+FACT = "spk_1: The one export button we actually need is the one labelled Quarterly Ledger, buried in settings."
+QUESTION = "Which export button does the participant say they need, and what is it labelled?"
+
+
+def make_transcript(tokens, rng):
+    lines = []
+    while sum(len(line) + 1 for line in lines) < tokens * 4:
+        topic = rng.choice(TOPICS)
+        lines.extend(line.format(topic=topic) for line in rng.sample(LINES, 3))
+    lines.insert(int(len(lines) * 0.8), FACT)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcript-tokens", type=int, nargs="+", default=[10000, 40000, 120000])
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--latency-per-1k", type=float, default=0.02)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    os.environ.setdefault("MAX_CHAT_HISTORY_SAVE_LENGTH", "10")
+    os.environ.setdefault("CHAT_PROMPT", "Answer the question using the transcript.")
+    os.environ.setdefault("CHAT_PROMPT_FORMAT", "Short paragraphs, plain text.")
+    os.environ.setdefault("CHAT_MODEL", "gpt-4o-mini")
+    os.environ.setdefault("CHAT_MAX_TOKENS", "500")
+
+    from context import message_tokens
+
+    prompts = []
+
+    def reply(body):
+        if body.get("stream"):
+            prompts.append(body["messages"])
+            return "They need the export button labelled Quarterly Ledger."
+        return "The participant uses the product weekly and finds exports and dashboards slow. " * 5
+
+    fake_app = fake_openai_app(latency=args.latency, content=reply, latency_per_1k_tokens=args.latency_per_1k,
+                               stream_tokens=10, token_interval=0.0)
+    fake = ServerThread(fake_app).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+
+    import api
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    server = ServerThread(api.app).start()
+    rng = random.Random(0)
+    model = os.environ["CHAT_MODEL"]
+    rows, created = [], {"transcripts": [], "chatsessions": []}
+    try:
+        for size in args.transcript_tokens:
+            transcript_id = mongo.transcripts.insert_one({"text": make_transcript(size, rng)}).inserted_id
+            created["transcripts"].append(transcript_id)
+
+            calls = fake_app.state.calls
+            started = time.perf_counter()
+            built = httpx.post(f"{server.url}/transcript-artifacts/{transcript_id}", timeout=600)
+            built.raise_for_status()
+            build = (f"{time.perf_counter() - started:.2f}", fake_app.state.calls - calls)
+
+            for mode, enabled in (("full text", False), ("summary + chunks", True)):
+                api.transcript_artifacts.enabled = enabled
+                session_id = mongo.chatsessions.insert_one({
+                    "chatName": "bench", "chat_type": "transcript", "project_id": None, "transcript_id": str(transcript_id),
+                    "history": [], "conversation": [], "num_interactions": 0, "delete_time": None,
+                }).inserted_id
+                created["chatsessions"].append(session_id)
+                started = time.perf_counter()
+                with httpx.stream("POST", f"{server.url}/chat/{session_id}", json={"question": QUESTION, "top_n": 1},
+                                  timeout=600) as response:
+                    response.raise_for_status()
+                    first = None
+                    for chunk in response.iter_text():
+                        if chunk and first is None:
+                            first = time.perf_counter() - started
+                total = time.perf_counter() - started
+                messages = prompts[-1]
+                found = any("Quarterly Ledger" in m["content"] for m in messages)
+                rows.append((f"{built.json()['tokens']:,}", mode, *(build if enabled else ("-", "-")),
+                             f"{message_tokens(messages, model):,}", f"{first:.2f}", f"{total:.2f}", "yes" if found else "no"))
+        stats = api.transcript_artifacts.stats()
+    finally:
+        server.stop()
+        fake.stop()
+        for collection, ids in created.items():
+            mongo[collection].delete_many({"_id": {"$in": ids}})
+        mongo.transcriptartifacts.delete_many({"_id": {"$in": [str(i) for i in created["transcripts"]]}})
+
+    print(f"LLM latency {args.latency}s + {args.latency_per_1k}s per 1000 prompt tokens")
+    print_table(["transcript tokens", "chat context", "build s", "summary calls", "prompt tokens", "first byte s",
+                 "total s", "fact in prompt"], rows)
+    print("transcript_artifacts: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
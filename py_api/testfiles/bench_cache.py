@@ -0,0 +1,171 @@
+"""
+Memory benchmark for the chat session / transcript caches.
+
+Replays a chat workload against the previous unbounded ``defaultdict`` caches and the bounded ``LRUCache``
+(each in a fresh child process): ``--sessions`` chat sessions with ~20-message histories, each tied to one of
+``--transcripts`` multi-MB transcripts picked with a skewed (Zipf-like) popularity, for ``--requests`` chat
+turns. A cache miss "loads" the value again, as the API does from Mongo.
+
+Reports peak RSS, hit rates and lookups per second. A second check hammers both caches from several threads
+at once: the old sweep (``cleanup_cache``) iterates the dict while handlers write to it, which raises
+``RuntimeError: dictionary changed size during iteration`` and silently kills the cleanup thread.
+
+Usage:
+    python testfiles/bench_cache.py [--sessions 5000] [--transcripts 200] [--transcript-mb 2] [--requests 50000]
+"""
+
+import time
+import random
+import argparse
+import resource
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from collections import defaultdict
+
+from bench_utils import print_table
+
+
+def workload(args, seed=3):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(args.transcripts)]
+    session_transcripts = rng.choices(range(args.transcripts), weights=weights, k=args.sessions)
+    session_weights = [1 / (rank + 1) ** 0.8 for rank in range(args.sessions)]
+    return [(s, session_transcripts[s]) for s in rng.choices(range(args.sessions), weights=session_weights, k=args.requests)]
+
+
+def load_session(session_id):
+    return {
+        "history": [{"role": "user", "content": f"question {session_id} {i} " + "x" * 480} for i in range(20)],
+        "chat_type": "transcript",
+        "num_interactions": 1,
+        "delete_time": datetime.utcnow() + timedelta(minutes=30),
+    }
+
+
+def load_transcript(transcript_id, size_mb):
+    return {"text": f"transcript {transcript_id} " + "y" * int(size_mb * 1024 * 1024)}
+
+
+def run(mode, args, results):
+    import cache
+
+    if mode == "dict":
+        sessions, transcripts = defaultdict(dict), defaultdict(dict)
+        counts = {"session_hits": 0, "transcript_hits": 0}
+
+        def get(store, key, kind):
+            if key in store:
+                counts[f"{kind}_hits"] += 1
+                return store[key]
+            return None
+
+        def put(store, key, value):
+            store[key] = value
+    else:
+        sessions = cache.LRUCache(args.session_mb * 1024 * 1024, default_ttl=1800)
+        transcripts = cache.LRUCache(args.transcript_cache_mb * 1024 * 1024, default_ttl=1800)
+
+        def get(store, key, kind):
+            return store.get(key)
+
+        def put(store, key, value):
+            store.set(key, value)
+
+    requests = workload(args)
+    started = time.perf_counter()
+    for session_id, transcript_id in requests:
+        session = get(sessions, session_id, "session")
+        if session is None:
+            session = load_session(session_id)
+            put(sessions, session_id, session)
+        transcript = get(transcripts, transcript_id, "transcript")
+        if transcript is None:
+            transcript = load_transcript(transcript_id, args.transcript_mb)
+            put(transcripts, transcript_id, transcript)
+    elapsed = time.perf_counter() - started
+
+    if mode == "dict":
+        session_rate = counts["session_hits"] / len(requests)
+        transcript_rate = counts["transcript_hits"] / len(requests)
+    else:
+        session_rate = sessions.stats()["hit_rate"]
+        transcript_rate = transcripts.stats()["hit_rate"]
+    results[mode] = {
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "session_hit_rate": session_rate,
+        "transcript_hit_rate": transcript_rate,
+        "lookups_per_s": 2 * len(requests) / elapsed,
+        "entries": len(sessions) + len(transcripts),
+    }
+
+
+def race(mode, seconds=2.0, threads=8):
+    import cache
+
+    errors = []
+    stop = threading.Event()
+    store = defaultdict(dict) if mode == "dict" else cache.LRUCache(8 * 1024 * 1024, default_ttl=0.05)
+
+    def writer(offset):
+        rng = random.Random(offset)
+        while not stop.is_set():
+            key = rng.randrange(5000)
+            value = {"text": "z" * 100, "delete_time": datetime.utcnow() + timedelta(milliseconds=50)}
+            if mode == "dict":
+                store[key] = value
+            else:
+                store.set(key, value)
+                store.get(rng.randrange(5000))
+
+    def sweeper():
+        # The previous cleanup_cache loop, with CACHE_TIMER=0.
+        try:
+            while not stop.is_set():
+                now = datetime.utcnow()
+                for key in [k for k, v in store.items() if v["delete_time"] < now]:
+                    store.pop(key, None)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    if mode == "dict":
+        workers.append(threading.Thread(target=sweeper))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    if mode != "dict":
+        # The byte count must still match the entries after concurrent use.
+        consistent = store.bytes == sum(entry.size for entry in store.entries.values())
+        return "consistent" if consistent else "byte count drifted"
+    return f"sweeper crashed: {errors[0]}" if errors else "no error observed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--transcripts", type=int, default=200)
+    parser.add_argument("--transcript-mb", type=float, default=2)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--session-mb", type=int, default=32, help="LRU budget for sessions")
+    parser.add_argument("--transcript-cache-mb", type=int, default=128, help="LRU budget for transcripts")
+    args = parser.parse_args()
+
+    rows = []
+    with multiprocessing.Manager() as manager:
+        results = manager.dict()
+        for mode in ("dict", "lru"):
+            process = multiprocessing.get_context("fork").Process(target=run, args=(mode, args, results))
+            process.start()
+            process.join()
+            r = results[mode]
+            rows.append((mode, f"{r['rss_mb']:.0f}", f"{r['session_hit_rate']:.1%}", f"{r['transcript_hit_rate']:.1%}",
+                         f"{r['lookups_per_s']:.0f}", r["entries"], race(mode)))
+    print_table(["cache", "peak RSS MB", "session hits", "transcript hits", "lookups/s", "entries", "concurrent use"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Prompt tokens per turn of ``/chat/{session_id}`` over a long session.
+
+Runs ``api:app`` against a fake OpenAI server and replays ``--turns`` turns of a transcript chat on a transcript
+of about ``--transcript-tokens`` tokens. The prompt of every chat request the fake receives is counted with
+``context.message_tokens``. The "before" column replays the same questions and answers through the previous
+prompt building (transcript appended to the history every ``CHAT_CONTEXT_REPEAT`` turns, chat instructions in
+every user message, last ``MAX_CHAT_HISTORY_SAVE_LENGTH * 2`` messages kept whatever their size).
+
+Also reports the summary calls made and whether every prompt stayed within ``CHAT_TOKEN_BUDGET``.
+
+Requires a reachable MongoDB (``MONGO_URL``); the session is stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_chat_context.py [--turns 60] [--checkpoints 1 5 10 20 40 60] [--transcript-tokens 20000]
+"""
+
+import os
+import asyncio
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+TOPICS = "onboarding pricing export dashboard search billing support mobile integrations reports".split()
+
+
+def legacy_prompt_tokens(questions, answers, transcript, model, repeat, history_length):
+    from context import message_tokens
+
+    history, tokens = [], []
+    for turn, (question, answer) in enumerate(zip(questions, answers)):
+        if turn % repeat == 0:
+            history.append({"role": "system", "content": f"Context: Transcript: {transcript}"})
+        history.append({"role": "user", "content": "\n\n".join([
+            os.environ["CHAT_PROMPT"], f"Question: {question}", f"Format: {os.environ['CHAT_PROMPT_FORMAT']}"
+        ])})
+        tokens.append(message_tokens(history, model))
+        history.append({"role": "assistant", "content": answer})
+        history = history[-(history_length * 2):]
+    return tokens
+
+
+async def play(base_url, session_id, questions):
+    async with httpx.AsyncClient(timeout=60) as http:
+        answers = []
+        for question in questions:
+            response = await http.post(f"{base_url}/chat/{session_id}", json={"question": question, "top_n": 1})
+            response.raise_for_status()
+            answers.append(response.text)
+            await asyncio.sleep(0.05)  # lets a background summary finish, as the pause between user turns would
+        return answers, (await http.get(f"{base_url}/metrics")).json()["chat_context"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[1, 5, 10, 20, 40, 60])
+    parser.add_argument("--transcript-tokens", type=int, default=20000)
+    parser.add_argument("--answer-chars", type=int, default=1200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    os.environ.setdefault("MAX_CHAT_HISTORY_SAVE_LENGTH", "10")
+    os.environ.setdefault("CHAT_CONTEXT_REPEAT", "5")
+    os.environ.setdefault("CHAT_PROMPT", "You are a user research assistant. Answer the question using the transcript. "
+                                         "Quote the participant where it helps and say when the transcript does not cover it.")
+    os.environ.setdefault("CHAT_PROMPT_FORMAT", "Short paragraphs, plain text.")
+    os.environ.setdefault("CHAT_MODEL", "gpt-4o-mini")
+    os.environ.setdefault("CHAT_MAX_TOKENS", "500")
+    os.environ.setdefault("CHAT_WRITE_INTERVAL", "0.01")
+
+    from context import message_tokens
+
+    model = os.environ["CHAT_MODEL"]
+    prompts = []
+
+    def reply(body):
+        if body.get("stream"):
+            prompts.append(message_tokens(body["messages"], model))
+            topic = TOPICS[len(prompts) % len(TOPICS)]
+            return (f"On {topic}, the participant said the flow was slow and asked for clearer labels. " * 40)[:args.answer_chars]
+        return "The user asked about onboarding, pricing and exports; the participant found exports slow. " * 4
+
+    fake = ServerThread(fake_openai_app(latency=0, content=reply, stream_tokens=5, token_interval=0)).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+
+    import api
+
+    sentence = "spk_0: We mostly export the weekly report and the dashboard is slow when the team filters by region. "
+    transcript = sentence * (args.transcript_tokens * 4 // len(sentence))
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    transcript_id = mongo.transcripts.insert_one({"text": transcript}).inserted_id
+    session_id = mongo.chatsessions.insert_one({
+        "chatName": "bench", "chat_type": "transcript", "project_id": None, "transcript_id": str(transcript_id),
+        "history": [], "conversation": [], "num_interactions": 0, "delete_time": None,
+    }).inserted_id
+
+    questions = [f"What did the participant say about {TOPICS[i % len(TOPICS)]} (question {i + 1})?" for i in range(args.turns)]
+    server = ServerThread(api.app).start()
+    try:
+        answers, stats = asyncio.run(play(server.url, str(session_id), questions))
+    finally:
+        server.stop()
+        fake.stop()
+        mongo.chatsessions.delete_one({"_id": session_id})
+        mongo.transcripts.delete_one({"_id": transcript_id})
+
+    before = legacy_prompt_tokens(questions, answers, transcript, model, int(os.environ["CHAT_CONTEXT_REPEAT"]),
+                                  int(os.environ["MAX_CHAT_HISTORY_SAVE_LENGTH"]))
+    rows = [(turn, before[turn - 1], prompts[turn - 1]) for turn in args.checkpoints if turn <= args.turns]
+    rows.append(("mean", round(sum(before) / len(before)), round(sum(prompts) / len(prompts))))
+    rows.append(("max", max(before), max(prompts)))
+    rows.append(("total", sum(before), sum(prompts)))
+    print_table(["turn", "before tokens", "after tokens"], rows)
+    budget = api.context_window.budget(model)
+    print(f"budget {budget}: {sum(p > budget for p in prompts)} prompts over it after, {sum(p > budget for p in before)} before; "
+          f"{stats['summaries']} summary calls covering {stats['turns_summarized']} turns, "
+          f"{stats['source_truncated']} prompts with the transcript cut to fit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Time to first token and gaps between streamed chunks of ``/chat/{session_id}`` under concurrent chats.
+
+Runs ``api:app`` against a fake OpenAI server (in its own process) that starts streaming after ``--latency``
+seconds and then sends ``--stream-tokens`` deltas ``--token-interval`` seconds apart. For each number of
+concurrent chats in ``--chats``, every chat has its own transcript session and asks two questions: the first
+turn reads the session from Mongo, the second from the chat session cache.
+
+Each run is done twice: with every delta sent as its own chunk (``CHAT_FLUSH_CHARS=0``) and with the default
+batching. Measured on the client: time to first token (p50/p95), gaps between received chunks (p50/p95), chunks
+per reply and the time from the last text to the end of the response (what saving the turn used to add).
+
+Requires a reachable MongoDB (``MONGO_URL``); the sessions are stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_chat_ttft.py [--chats 1 20 100] [--latency 0.3] [--stream-tokens 200] [--token-interval 0.005]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerProcess, ServerThread, fake_openai_app, print_table, percentile
+
+ANSWER = ("The participant exports the weekly report every Monday and finds the dashboard slow when the team "
+          "filters by region; they asked for saved filters. ") * 8
+
+
+async def chats(base_url, sessions, question):
+    async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=None)) as http:
+        async def one(session_id):
+            started = time.perf_counter()
+            arrivals, text = [], []
+            async with http.stream("POST", f"{base_url}/chat/{session_id}", json={"question": question, "top_n": 1}) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_text():
+                    if chunk:
+                        arrivals.append(time.perf_counter())
+                        text.append(chunk)
+            ended = time.perf_counter()
+            assert "".join(text) == ANSWER, "reply came back incomplete"
+            return arrivals[0] - started, [b - a for a, b in zip(arrivals, arrivals[1:])], len(arrivals), ended - arrivals[-1]
+
+        return await asyncio.gather(*(one(str(session_id)) for session_id in sessions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--stream-tokens", type=int, default=200)
+    parser.add_argument("--token-interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    fake = ServerProcess(fake_openai_app, latency=args.latency, content=ANSWER, stream_tokens=args.stream_tokens,
+                         token_interval=args.token_interval).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    os.environ.setdefault("MAX_CHAT_HISTORY_SAVE_LENGTH", "10")
+    os.environ.setdefault("CHAT_PROMPT", "Answer the question using the transcript.")
+    os.environ.setdefault("CHAT_PROMPT_FORMAT", "Short paragraphs, plain text.")
+    os.environ.setdefault("CHAT_MODEL", "gpt-4o-mini")
+    os.environ.setdefault("CHAT_MAX_TOKENS", "500")
+
+    import api
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    transcript = "spk_0: We export the weekly report every Monday.\nspk_1: The dashboard is slow by region.\n" * 200
+    transcript_id = mongo.transcripts.insert_one({"text": transcript}).inserted_id
+    server = ServerThread(api.app).start()
+    defaults = (api.chat_streamer.flush_chars, api.chat_streamer.flush_seconds)
+    rows, created = [], []
+    try:
+        for count in args.chats:
+            for label, flush in (("every delta", (0, 0.0)), ("batched", defaults)):
+                api.chat_streamer.flush_chars, api.chat_streamer.flush_seconds = flush
+                sessions = mongo.chatsessions.insert_many([{
+                    "chatName": "bench", "chat_type": "transcript", "project_id": None, "transcript_id": str(transcript_id),
+                    "history": [], "conversation": [], "num_interactions": 0, "delete_time": None,
+                } for _ in range(count)]).inserted_ids
+                created.extend(sessions)
+                for turn, question in (("1st (Mongo)", "What do they export?"), ("2nd (cache)", "What is slow?")):
+                    results = asyncio.run(chats(server.url, sessions, question))
+                    first = [r[0] for r in results]
+                    gaps = [gap for r in results for gap in r[1]]
+                    rows.append((count, label, turn,
+                                 f"{1000 * percentile(first, 50):.0f}", f"{1000 * percentile(first, 95):.0f}",
+                                 f"{1000 * percentile(gaps, 50):.1f}", f"{1000 * percentile(gaps, 95):.1f}",
+                                 f"{sum(r[2] for r in results) / count:.0f}",
+                                 f"{1000 * percentile([r[3] for r in results], 95):.1f}"))
+        time.sleep(1)  # lets the last turns be written
+        stats = api.chat_streamer.stats()
+        saved = mongo.chatsessions.count_documents({"_id": {"$in": created}, "num_interactions": 2})
+    finally:
+        server.stop()
+        fake.stop()
+        mongo.chatsessions.delete_many({"_id": {"$in": created}})
+        mongo.transcripts.delete_one({"_id": transcript_id})
+
+    print(f"LLM first token after {args.latency}s, {args.stream_tokens} deltas {args.token_interval * 1000:.0f} ms apart")
+    print_table(["chats", "flush", "turn", "TTFT p50 ms", "TTFT p95 ms", "gap p50 ms", "gap p95 ms", "chunks/reply",
+                 "end after last text p95 ms"], rows)
+    print(f"{saved}/{len(created)} sessions saved with both turns; chat_stream: "
+          + ", ".join(f"{key} {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Bytes written per chat turn by ``/chat/{session_id}``.
+
+Runs ``api:app`` against a fake OpenAI server and plays ``--turns`` turns of one chat session (a new transcript
+context message every ``CHAT_CONTEXT_REPEAT`` turns, ``--answer-chars`` per answer). The bytes of each turn's
+append-only update are taken from the ``chat_writes`` counters in ``/metrics``. The size of the previous
+whole-session ``$set`` is rebuilt from the stored conversation: it grew with every turn, so its total over a
+session grows quadratically.
+
+Also checks the stored session: all turns in ``conversation``, ``history`` trimmed to
+``MAX_CHAT_HISTORY_SAVE_LENGTH * 2`` messages, and ``num_interactions`` equal to the number of turns.
+
+Requires a reachable MongoDB (``MONGO_URL``); the session is stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_chat_writes.py [--turns 1000] [--checkpoints 10 100 1000] [--answer-chars 1500]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+import bson
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+
+def old_update_size(session_id, document, turn, history_limit):
+    # The update the endpoint used to send after ``turn`` turns: every field, the full conversation included.
+    update = {"$set": {
+        "last_updated": datetime.utcnow(),
+        "history": document["history"][-history_limit:],
+        "delete_time": datetime.utcnow(),
+        "chat_type": document["chat_type"],
+        "project_id": document["project_id"],
+        "transcript_id": document["transcript_id"],
+        "num_interactions": turn,
+        "conversation": document["conversation"][:2 * turn],
+    }}
+    return len(bson.encode({"_id": session_id})) + len(bson.encode(update))
+
+
+async def play(base_url, session_id, turns):
+    sizes = []
+    async with httpx.AsyncClient(timeout=60) as http:
+        for turn in range(turns):
+            before = (await http.get(f"{base_url}/metrics")).json()["chat_writes"]["bytes"]
+            response = await http.post(f"{base_url}/chat/{session_id}", json={"question": f"What happened in part {turn}?", "top_n": 1})
+            response.raise_for_status()
+            after = (await http.get(f"{base_url}/metrics")).json()["chat_writes"]
+            sizes.append(after["bytes"] - before)
+        while (await http.get(f"{base_url}/metrics")).json()["chat_writes"]["pending"]:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(float(os.environ["CHAT_WRITE_INTERVAL"]) * 2)
+        return sizes, (await http.get(f"{base_url}/metrics")).json()["chat_writes"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--answer-chars", type=int, default=1500)
+    parser.add_argument("--transcript-chars", type=int, default=20000)
+    args = parser.parse_args()
+
+    answer = ("The participant found the export flow confusing and asked for a dashboard. " * 100)[:args.answer_chars]
+    fake = ServerThread(fake_openai_app(latency=0, content=answer, stream_tokens=5, token_interval=0)).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    os.environ.setdefault("MAX_CHAT_HISTORY_SAVE_LENGTH", "10")
+    os.environ.setdefault("CHAT_CONTEXT_REPEAT", "5")
+    os.environ.setdefault("CHAT_PROMPT", "Answer the question about the user research.")
+    os.environ.setdefault("CHAT_PROMPT_FORMAT", "Plain text.")
+    os.environ.setdefault("CHAT_MODEL", "fake-model")
+    os.environ.setdefault("CHAT_MAX_TOKENS", "500")
+    os.environ.setdefault("CHAT_WRITE_INTERVAL", "0.05")
+
+    import api
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    transcript_id = mongo.transcripts.insert_one({"text": "spk_0: " + "we talked about exports. " * (args.transcript_chars // 25)}).inserted_id
+    session_id = mongo.chatsessions.insert_one({
+        "chatName": "bench", "chat_type": "transcript", "project_id": None, "transcript_id": str(transcript_id),
+        "history": [], "conversation": [], "num_interactions": 0, "delete_time": None,
+    }).inserted_id
+
+    server = ServerThread(api.app).start()
+    try:
+        started = time.perf_counter()
+        sizes, stats = asyncio.run(play(server.url, str(session_id), args.turns))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+        fake.stop()
+
+    document = mongo.chatsessions.find_one({"_id": session_id})
+    history_limit = int(os.environ["MAX_CHAT_HISTORY_SAVE_LENGTH"]) * 2
+    old_sizes = [old_update_size(session_id, document, turn, history_limit) for turn in range(1, args.turns + 1)]
+    rows = []
+    for checkpoint in [c for c in args.checkpoints if c <= args.turns]:
+        rows.append((checkpoint, f"{old_sizes[checkpoint - 1] / 1024:.1f}", f"{sizes[checkpoint - 1] / 1024:.1f}",
+                     f"{sum(old_sizes[:checkpoint]) / 2 ** 20:.1f}", f"{sum(sizes[:checkpoint]) / 2 ** 20:.2f}"))
+    print_table(["turn", "old KB/turn", "new KB/turn", "old total MB", "new total MB"], rows)
+    print(f"{args.turns} turns in {elapsed:.1f}s, {stats['batches']} bulk writes, {stats['retries']} retries, "
+          f"{stats['failed']} failed, {stats['skipped']} skipped")
+    print(f"stored: {len(document['conversation'])} conversation messages (expected {2 * args.turns}), "
+          f"{len(document['history'])} history messages (limit {history_limit}), "
+          f"num_interactions {document['num_interactions']}")
+
+    mongo.chatsessions.delete_one({"_id": session_id})
+    mongo.transcripts.delete_one({"_id": transcript_id})
+
+
+if __name__ == "__main__":
+    main()
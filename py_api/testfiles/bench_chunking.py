@@ -0,0 +1,75 @@
+"""
+Benchmark for chunked Sarvam transcription.
+
+Generates a synthetic recording (tone bursts separated by short silences) with ffmpeg, serves a mock of
+``SARVAM_API_URL`` whose response time grows with the uploaded audio size, and compares a single whole-file
+request against chunked transcription at several chunk parallelism levels.
+
+Usage:
+    python testfiles/bench_chunking.py [--minutes 20] [--chunk-seconds 120] [--levels 1,2,4,8]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import ffmpeg
+
+from bench_utils import ServerThread, fake_transcription_app, print_table
+
+# 16 kHz mono 16-bit audio is 32 000 bytes per second; the mock processes one minute of audio in this many seconds.
+SECONDS_PER_AUDIO_MINUTE = 0.3
+
+
+def make_recording(path, minutes):
+    source = ffmpeg.input(f"aevalsrc='0.5*sin(2*PI*440*t)*lt(mod(t,9.5),8)':s=16000:d={minutes * 60}", f="lavfi")
+    source.output(path, ac=1, ar=16000).overwrite_output().run(quiet=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=20)
+    parser.add_argument("--chunk-seconds", type=float, default=120)
+    parser.add_argument("--levels", default="1,2,4,8")
+    args = parser.parse_args()
+
+    fake = ServerThread(fake_transcription_app(sarvam_latency=lambda size: size / 32000 / 60 * SECONDS_PER_AUDIO_MINUTE)).start()
+    os.environ["SARVAM_API_URL"] = f"{fake.url}/_sarvam"
+    os.environ["SARVAM_CHUNK_SECONDS"] = str(args.chunk_seconds)
+
+    import utils
+    from chunking import detect_silences, plan_chunks
+
+    work_dir = tempfile.mkdtemp()
+    recording = os.path.join(work_dir, "recording.wav")
+    make_recording(recording, args.minutes)
+
+    def run(chunked, concurrency=None):
+        path = os.path.join(work_dir, "input.wav")
+        shutil.copy(recording, path)
+        os.environ["SARVAM_CHUNKED"] = "auto" if chunked else "off"
+        if concurrency:
+            os.environ["SARVAM_CHUNK_CONCURRENCY"] = str(concurrency)
+        start = time.perf_counter()
+        transcript = utils.transcribe_audio_sarvam(path, "wav", "en-IN")
+        return time.perf_counter() - start, len(transcript)
+
+    try:
+        duration, silences = detect_silences(recording)
+        chunks = plan_chunks(duration, silences)
+        baseline, lines = run(chunked=False)
+        rows = [("whole file", 1, f"{baseline:.2f}", "1.00", lines)]
+        for level in [int(x) for x in args.levels.split(",")]:
+            elapsed, lines = run(chunked=True, concurrency=level)
+            rows.append(("chunked", level, f"{elapsed:.2f}", f"{baseline / elapsed:.2f}", lines))
+        print(f"{args.minutes:.0f} min recording, {len(silences)} silences, {len(chunks)} chunks of ~{args.chunk_seconds:.0f}s")
+        print_table(["mode", "parallel", "wall s", "speedup", "entries"], rows)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Concurrency benchmark for the async I/O layer.
+
+Runs ``api:app`` on a single uvicorn worker against a fake OpenAI server with a fixed reply latency and
+fires grid requests at increasing numbers of in-flight requests. With non-blocking handlers the throughput
+grows roughly linearly with the number of in-flight requests until the fake server latency is the only cost.
+
+Requires a reachable MongoDB (``MONGO_URL``); a throwaway transcript is written to ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_concurrency.py [--latency 0.5] [--levels 1,2,4,8,16,32,64]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, percentile, print_table
+
+
+async def run_level(base_url, transcript_id, in_flight, total):
+    semaphore = asyncio.Semaphore(in_flight)
+    latencies = []
+
+    async with httpx.AsyncClient(timeout=120) as http:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await http.post(
+                    f"{base_url}/get-all-answer-single-transcript-grid/{transcript_id}",
+                    json={"question": {"1": "What did the participant like?"}},
+                )
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed, percentile(latencies, 50), percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency in seconds")
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64", help="in-flight request levels")
+    args = parser.parse_args()
+
+    fake = ServerThread(fake_openai_app(latency=args.latency, content="{'1': 'They liked the onboarding.'}")).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+
+    import api
+
+    mongo = MongoClient(os.environ["MONGO_URL"])
+    transcripts = mongo[os.environ["DB_NAME"]].transcripts
+    inserted_id = transcripts.insert_one({"text": "spk_0: Hello\nspk_1: I liked the onboarding.\n"}).inserted_id
+    transcript_id = str(inserted_id)
+
+    server = ServerThread(api.app).start()
+    try:
+        rows = []
+        for level in [int(x) for x in args.levels.split(",")]:
+            throughput, p50, p95 = asyncio.run(run_level(server.url, transcript_id, level, max(32, level * 4)))
+            rows.append((level, f"{throughput:.1f}", f"{throughput * args.latency:.2f}", f"{p50 * 1000:.0f}", f"{p95 * 1000:.0f}"))
+        print(f"Single worker, fake LLM latency {args.latency * 1000:.0f} ms")
+        print_table(["in-flight", "req/s", "speedup", "p50 ms", "p95 ms"], rows)
+    finally:
+        server.stop()
+        fake.stop()
+        transcripts.delete_one({"_id": inserted_id})
+
+
+if __name__ == "__main__":
+    main()
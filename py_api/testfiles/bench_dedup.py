@@ -0,0 +1,106 @@
+"""
+Manual check for content-hash transcript deduplication.
+
+Starts a fake Transcribe/S3/Sarvam backend and ``api:app``, then sends ``/transcribe-file`` requests for a set
+of media files that are each uploaded several times under different keys (same bytes, like bot recordings and
+re-uploads). Two waves are sent:
+
+    - cold: every copy of every file at the same time, so copies have to be coalesced into one run
+    - warm: the same requests again, which should all be answered from the store
+
+Reports transcription calls made against the fake backend, latency per wave and the ``transcript_dedup``
+counters from ``/metrics``. Run it with ``TRANSCRIPT_DEDUP=off`` to compare with the old behaviour.
+
+Requires a reachable MongoDB (``MONGO_URL``); data is stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_dedup.py [--files 5] [--copies 4] [--method sarvam] [--transcribe-seconds 2]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from bench_utils import ServerThread, fake_transcription_app, percentile, print_table
+
+
+async def wave(http, base_url, files, copies, method):
+    async def one(i, copy):
+        t0 = time.perf_counter()
+        response = await http.post(f"{base_url}/transcribe-file/bench{i}-{copy}", json={
+            "url": f"s3://bench/upload-{copy}/interview-{i}.wav",
+            "transcribe_method": method,
+            "transcribe_lang": "en-IN",
+        })
+        response.raise_for_status()
+        return time.perf_counter() - t0, response.json()["transcript"]
+
+    return await asyncio.gather(*(one(i, copy) for i in range(files) for copy in range(copies)))
+
+
+async def run(base_url, args):
+    async with httpx.AsyncClient(timeout=300) as http:
+        cold = await wave(http, base_url, args.files, args.copies, args.method)
+        warm = await wave(http, base_url, args.files, args.copies, args.method)
+        metrics = (await http.get(f"{base_url}/metrics")).json()
+    return cold, warm, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--copies", type=int, default=4)
+    parser.add_argument("--method", default="sarvam", choices=["aws", "sarvam"])
+    parser.add_argument("--transcribe-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # A short valid WAV of a different length per file; every copy holds the same bytes under another key.
+    objects = {}
+    for i in range(args.files):
+        pcm = bytes([i % 256, 0]) * (16000 + 8000 * i)
+        wav = (b"RIFF" + (36 + len(pcm)).to_bytes(4, "little") + b"WAVEfmt " + (16).to_bytes(4, "little")
+               + (1).to_bytes(2, "little") + (1).to_bytes(2, "little") + (16000).to_bytes(4, "little")
+               + (32000).to_bytes(4, "little") + (2).to_bytes(2, "little") + (16).to_bytes(2, "little")
+               + b"data" + len(pcm).to_bytes(4, "little") + pcm)
+        for copy in range(args.copies):
+            objects[f"bench/upload-{copy}/interview-{i}.wav"] = wav
+
+    fake_app = fake_transcription_app(objects, transcribe_seconds=args.transcribe_seconds, sarvam_latency=args.transcribe_seconds)
+    fake = ServerThread(fake_app).start()
+
+    os.environ["AWS_TRANSCRIBE_ENDPOINT_URL"] = fake.url
+    os.environ["AWS_S3_ENDPOINT_URL"] = fake.url
+    os.environ["SARVAM_API_URL"] = f"{fake.url}/_sarvam"
+    os.environ["AWS_TRANSCRIBE_POLL_INTERVAL"] = "0.5"
+    os.environ["TRANSCRIBE_JOB_WORKERS"] = str(args.files * args.copies)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+
+    import api
+
+    server = ServerThread(api.app).start()
+    try:
+        cold, warm, metrics = asyncio.run(run(server.url, args))
+    finally:
+        server.stop()
+        fake.stop()
+
+    calls = fake_app.state.calls
+    transcription_calls = calls.get("sarvam", 0) + calls.get("StartTranscriptionJob", 0)
+    rows = []
+    for name, results in (("cold", cold), ("warm", warm)):
+        latencies = [latency for latency, _ in results]
+        rows.append((name, len(results), f"{percentile(latencies, 50):.2f}", f"{max(latencies):.2f}",
+                     len({transcript for _, transcript in results})))
+    print_table(["wave", "requests", "p50 s", "max s", "distinct transcripts"], rows)
+    print(f"\nTranscription calls: {transcription_calls} for {len(cold) + len(warm)} requests ({args.files} distinct files)")
+    print(f"transcript_dedup: {metrics.get('transcript_dedup')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Top-k search of the memory-mapped embedding store at 10k and 1M chunks.
+
+For each size in ``--sizes``, writes the same synthetic embeddings (unit vectors scattered around ``--clusters``
+topic centres, ``--dimensions`` wide) into a float32 and a float16 ``VectorStore`` in a temporary folder, in
+transcripts of ``--rows-per-transcript`` rows. Queries are points near a random centre.
+
+Reports per store:
+    - build time and file size
+    - query latency (p50 / p95) of ``VectorStore.top_k`` (one matrix-vector product plus ``argpartition``)
+    - recall@k against exact float32 scores; the float32 store is also checked against a full ``argsort``
+    - latency of the previous approach for the same work: scoring row by row in Python (10k only) and a full
+      ``argsort`` of the scores instead of ``argpartition``
+
+Also runs hybrid retrieval with the local ``hash`` embedder on a small synthetic project where half the
+questions use words absent from the answer, and reports hit rate for BM25 alone vs hybrid.
+
+Usage:
+    python testfiles/bench_embeddings.py [--sizes 10000 1000000] [--queries 100] [--k 10]
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from bench_utils import percentile, print_table
+
+
+def write_store(path, dtype, rows, dimensions, clusters, per_transcript, seed):
+    from embeddings import VectorStore
+
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    store = VectorStore(path, dimensions, dtype=dtype)
+    started = time.perf_counter()
+    for number, start in enumerate(range(0, rows, per_transcript)):
+        count = min(per_transcript, rows - start)
+        block = centres[rng.integers(0, clusters, count)] + 0.8 * rng.standard_normal((count, dimensions)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        store.put(f"t{number}", "bench", block)
+    return store, centres, time.perf_counter() - started
+
+
+def measure(store, queries, k, exact, loop_baseline):
+    latencies, recalls = [], []
+    for index, query in enumerate(queries):
+        started = time.perf_counter()
+        hits = store.top_k(query, k)
+        latencies.append(time.perf_counter() - started)
+        found = {(tid, position) for tid, position, _ in hits}
+        recalls.append(len(found & exact[index]) / k)
+
+    sort_latencies = []
+    for query in queries[:10]:
+        started = time.perf_counter()
+        scores = np.asarray(store.matrix, dtype=np.float32) @ query
+        np.argsort(-scores)[:k]
+        sort_latencies.append(time.perf_counter() - started)
+
+    loop_ms = ""
+    if loop_baseline:
+        started = time.perf_counter()
+        matrix = store.matrix
+        scores = [float(np.dot(matrix[row].astype(np.float32), queries[0])) for row in range(len(matrix))]
+        sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+        loop_ms = f"{(time.perf_counter() - started) * 1000:.0f}"
+    return latencies, recalls, sort_latencies, loop_ms
+
+
+def exact_top(store, queries, k, per_transcript):
+    matrix = np.asarray(store.matrix, dtype=np.float32)
+    results = []
+    for query in queries:
+        rows = np.argsort(-(matrix @ query))[:k]
+        results.append({(f"t{row // per_transcript}", int(row % per_transcript)) for row in rows})
+    return results
+
+
+def hybrid_hit_rate():
+    from embeddings import HashEmbedder
+    from retrieval import ProjectIndex
+
+    findings = [
+        ("spk_1: Paying for the premium plan felt expensive for a team of three.", "What did they think about pricing?"),
+        ("spk_1: The exporter kept timing out on big spreadsheets.", "Any problems with exporting?"),
+        ("spk_1: Notifications on my phone arrive hours late.", "How are the mobile notifications?"),
+        ("spk_1: Onboarding took us two weeks because the invites failed.", "How long did onboarding take?"),
+        ("spk_1: The search never finds older interviews.", "Is searching working for them?"),
+        ("spk_1: Our admins want single sign-on before rolling it out.", "What do admins need before rollout?"),
+    ]
+    filler = "spk_0: We went through the weekly review and talked about the team and the roadmap."
+    embedder = HashEmbedder(256)
+    index = ProjectIndex(chunk_tokens=40)
+    for number, (finding, _) in enumerate(findings):
+        index.add(f"t{number}", "\n".join([filler] * 6 + [finding] + [filler] * 6), f"Interview {number}")
+    texts, keys = [], []
+    for tid, entry in index.transcripts.items():
+        for position, chunk_id in enumerate(entry["chunks"]):
+            texts.append(index.chunks[chunk_id].text)
+            keys.append((tid, position))
+    vectors = embedder.embed_sync(texts)
+    keyword_hits = hybrid_hits = 0
+    for finding, question in findings:
+        keyword = index.search(question, max_tokens=60)
+        keyword_hits += any(finding in p["text"] for p in keyword)
+        query = embedder.embed_sync([question])[0]
+        scores = vectors @ query
+        vector_hits = [(*keys[row], float(scores[row])) for row in np.argsort(-scores)[:20]]
+        hybrid = index.search(question, max_tokens=60, vector_hits=vector_hits)
+        hybrid_hits += any(finding in p["text"] for p in hybrid)
+    return keyword_hits, hybrid_hits, len(findings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--rows-per-transcript", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench-embeddings-")
+    rows_out = []
+    try:
+        for size in args.sizes:
+            stores = {}
+            for dtype in ["float32", "float16"]:
+                stores[dtype] = write_store(os.path.join(folder, f"{size}-{dtype}"), dtype, size, args.dimensions,
+                                            args.clusters, args.rows_per_transcript, seed=size)
+            centres = stores["float32"][1]
+            rng = np.random.default_rng(1)
+            queries = centres[rng.integers(0, args.clusters, args.queries)] + 0.5 * rng.standard_normal((args.queries, args.dimensions)).astype(np.float32)
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+            exact = exact_top(stores["float32"][0], queries, args.k, args.rows_per_transcript)
+            for dtype, (store, _, build) in stores.items():
+                latencies, recalls, sort_latencies, loop_ms = measure(store, queries, args.k, exact, size <= 10000)
+                rows_out.append((
+                    f"{size:,}", dtype, f"{build:.1f}", f"{os.path.getsize(store.path + '.vec') / 2 ** 20:.0f}",
+                    f"{percentile(latencies, 50) * 1000:.2f}", f"{percentile(latencies, 95) * 1000:.2f}",
+                    f"{sum(recalls) / len(recalls):.3f}", f"{percentile(sort_latencies, 50) * 1000:.1f}", loop_ms or "-",
+                ))
+            for dtype in stores:
+                os.remove(stores[dtype][0].path + ".vec")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print_table(["chunks", "dtype", "build s", "file MB", "top-k p50 ms", "top-k p95 ms", f"recall@{args.k}",
+                 "full argsort ms", "python loop ms"], rows_out)
+    keyword_hits, hybrid_hits, total = hybrid_hit_rate()
+    print(f"findings retrieved with the hash embedder: BM25 only {keyword_hits}/{total}, hybrid {hybrid_hits}/{total}")
+
+
+if __name__ == "__main__":
+    main()
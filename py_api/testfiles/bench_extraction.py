@@ -0,0 +1,126 @@
+"""
+Benchmark for PDF/DOCX text extraction.
+
+Generates a corpus of text PDFs (``--pdf-pages``) and DOCX files with paragraphs and tables, then compares:
+
+    - pypdf2: the previous ``extract_text_from_pdf`` (PyPDF2, one thread)
+    - pymupdf: ``iter_pdf_pages`` with the process pool disabled
+    - pymupdf-pool: ``iter_pdf_pages`` with ``--workers`` pool processes (needs several CPUs to pay off)
+    - docx-paragraphs: the previous ``extract_text_from_docx`` (top-level paragraphs only)
+    - docx-blocks: ``iter_docx_blocks`` (paragraphs and table rows)
+
+Reports pages (or documents) per second and how much of the table text each DOCX method found.
+
+Usage:
+    python testfiles/bench_extraction.py [--pdf-pages 10 100 500] [--docx 20] [--workers 4] [--repeat 3]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+import pymupdf
+from docx import Document
+from PyPDF2 import PdfReader
+
+from bench_utils import print_table
+
+WORDS = ("interview participant research onboarding pricing dashboard feedback workflow export team "
+         "mobile checkout search friction delight expectation support billing integration report").split()
+
+
+def sentence(rng, words=14):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_pdf(path, pages, rng):
+    document = pymupdf.open()
+    for _ in range(pages):
+        page = document.new_page()
+        text = "\n".join(sentence(rng) for _ in range(40))
+        page.insert_textbox(pymupdf.Rect(50, 50, 560, 800), text, fontsize=9)
+    document.save(path)
+    document.close()
+
+
+def make_docx(path, rng, tables=3):
+    document = Document()
+    marker = 0
+    for _ in range(tables):
+        for _ in range(10):
+            document.add_paragraph(sentence(rng))
+        table = document.add_table(rows=6, cols=4)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = f"cell{marker}"
+                marker += 1
+    document.save(path)
+    return marker
+
+
+def legacy_pdf(path):
+    return "".join([page.extract_text() for page in PdfReader(path).pages]).strip()
+
+
+def legacy_docx(path):
+    return "\n".join([paragraph.text for paragraph in Document(path).paragraphs]).strip()
+
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--docx", type=int, default=20, help="number of DOCX files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    scratch = tempfile.mkdtemp(prefix="bench_extraction_")
+    os.environ["PDF_PARALLEL_MIN_PAGES"] = "32"
+    import extraction
+
+    rows = []
+    for pages in args.pdf_pages:
+        path = os.path.join(scratch, f"report_{pages}.pdf")
+        make_pdf(path, pages, rng)
+
+        os.environ["PDF_EXTRACT_WORKERS"] = "1"
+        baseline, _ = timed(lambda: legacy_pdf(path), args.repeat)
+        sequential, _ = timed(lambda: "\n".join(extraction.iter_pdf_pages(path)), args.repeat)
+        os.environ["PDF_EXTRACT_WORKERS"] = str(args.workers)
+        extraction.shutdown_extraction_pool()
+        list(extraction.iter_pdf_pages(path))  # start the pool outside the timing
+        pooled, _ = timed(lambda: "\n".join(extraction.iter_pdf_pages(path)), args.repeat)
+        for name, seconds in (("pypdf2", baseline), ("pymupdf", sequential), (f"pymupdf-pool x{args.workers}", pooled)):
+            rows.append((f"pdf {pages}p", name, f"{seconds:.3f}", f"{pages / seconds:.0f}", f"{baseline / seconds:.1f}x", "-"))
+    extraction.shutdown_extraction_pool()
+
+    paths = []
+    cells = 0
+    for i in range(args.docx):
+        path = os.path.join(scratch, f"notes_{i}.docx")
+        cells = make_docx(path, rng)
+        paths.append(path)
+    baseline, legacy_texts = timed(lambda: [legacy_docx(p) for p in paths], args.repeat)
+    blocks, block_texts = timed(lambda: ["\n".join(extraction.iter_docx_blocks(p)) for p in paths], args.repeat)
+    for name, seconds, texts in (("docx-paragraphs", baseline, legacy_texts), ("docx-blocks", blocks, block_texts)):
+        found = sum(text.count("cell") for text in texts) / (cells * len(paths))
+        rows.append((f"docx x{len(paths)}", name, f"{seconds:.3f}", f"{len(paths) / seconds:.0f} docs",
+                     f"{baseline / seconds:.1f}x", f"{found:.0%}"))
+
+    print_table(["corpus", "method", "best s", "pages/s", "vs old", "table text"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+LLM gateway under bursts, rate limits, transient errors and stragglers: the bare client vs ``LLMGateway``.
+
+Sends a burst of ``--calls`` concurrent chat completions (what a large analysis grid does) to a fake OpenAI
+server answering after ``--latency`` seconds, in three scenarios:
+
+    - rate limited: the server rejects requests above ``--server-rps`` per second with 429
+    - transient errors: ``--error-rate`` of the requests fail with 429 or 503
+    - stragglers: ``--slow-rate`` of the requests take ``--slow-latency`` seconds more
+
+Each scenario runs with the bare ``AsyncOpenAI`` client (its own retries off) and with the gateway: in the
+rate-limited scenario with ``LLM_RPM`` set just under the server's limit, in the others with retries, and for
+stragglers once more with hedging. ``LLM_CONCURRENCY`` is set to ``--calls`` so the concurrency limit does not
+hide the effect of the rest.
+
+Reports failed calls, requests sent to the server, retries, hedges, p50/p99/max latency and the mean time calls
+waited in the gateway for the rate limits.
+
+Usage:
+    python testfiles/bench_gateway.py [--calls 300] [--latency 0.5] [--server-rps 40]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+
+from bench_utils import ServerProcess, fake_openai_app, print_table, percentile
+
+MODEL = "bench-model"
+
+
+async def burst(client, calls):
+    async def one(i):
+        started = time.perf_counter()
+        try:
+            await client.chat.completions.create(
+                model=MODEL, messages=[{"role": "user", "content": f"Question {i}: " + "context " * 200}], max_tokens=100
+            )
+            return time.perf_counter() - started, True
+        except Exception:
+            return time.perf_counter() - started, False
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(calls)))
+    return time.perf_counter() - started, [seconds for seconds, ok in results if ok], sum(not ok for _, ok in results)
+
+
+async def run(label, mode, fake_url, calls, env, warmup=0):
+    from openai import AsyncOpenAI
+    from gateway import LLMGateway
+
+    os.environ.update(env)
+    raw = AsyncOpenAI(api_key="bench", base_url=f"{fake_url}/v1", max_retries=0)
+    client = raw if mode == "client" else LLMGateway(raw, hedge=mode == "gateway + hedging")
+    if warmup and client is not raw:
+        # The hedge delay comes from the measured p95, so the model needs a latency history first.
+        await burst(client, warmup)
+    before = client.stats().get(MODEL, {}) if client is not raw else {}
+    elapsed, latencies, failed = await burst(client, calls)
+    stats = client.stats().get(MODEL, {}) if client is not raw else {}
+    await raw.close()
+    for name in env:
+        del os.environ[name]
+    sent = stats["attempts"] - before.get("attempts", 0) if stats else calls
+    delta = {name: stats[name] - before.get(name, 0) for name in ("retries", "hedges", "queue_seconds")} if stats else {}
+    return (label, mode, failed, sent, delta.get("retries", "-"), delta.get("hedges", "-"),
+            f"{percentile(latencies, 50):.2f}", f"{percentile(latencies, 99):.2f}", f"{max(latencies, default=0):.2f}",
+            f"{elapsed:.1f}", f"{delta['queue_seconds'] / calls:.2f}" if delta else "-")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--server-rps", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    args = parser.parse_args()
+
+    rows = []
+    fast = {"LLM_BACKOFF_BASE": "0.25", "LLM_CONCURRENCY": str(args.calls)}
+
+    def scenario(label, modes, env=None, warmup=0, **server):
+        for mode in ("client",) + modes:
+            # A fresh server per run, in its own process, so the client's CPU time does not slow it down.
+            fake = ServerProcess(fake_openai_app, latency=args.latency, **server).start()
+            try:
+                rows.append(asyncio.run(run(label, mode, fake.url, args.calls,
+                                            dict(fast, **(env or {})) if mode != "client" else {}, warmup)))
+            finally:
+                fake.stop()
+
+    scenario(f"server limit {args.server_rps}/s", ("gateway",), env={"LLM_RPM": str(args.server_rps * 60 * 0.9)},
+             requests_per_second=args.server_rps)
+    scenario(f"{args.error_rate:.0%} 429s", ("gateway",), error_rate=args.error_rate)
+    scenario(f"{args.error_rate:.0%} 503s", ("gateway",), error_rate=args.error_rate, error_status=503)
+    scenario(f"{args.slow_rate:.0%} stragglers +{args.slow_latency:.0f}s", ("gateway", "gateway + hedging"),
+             env={"LLM_HEDGE_MIN_SECONDS": "0.5", "LLM_HEDGE_MAX_SHARE": "0.1"}, warmup=100,
+             slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+
+    print(f"{args.calls} concurrent calls per run, LLM latency {args.latency}s")
+    print_table(["scenario", "client", "failed", "sent", "retries", "hedges", "p50 s", "p99 s", "max s", "total s",
+                 "queue s/call"], rows)
+
+
+if __name__ == "__main__":
+    main()
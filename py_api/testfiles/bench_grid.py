@@ -0,0 +1,128 @@
+"""
+Analysis grid throughput: one bulk NDJSON request vs one request per transcript.
+
+Stores ``--transcripts`` transcripts and answers ``--questions`` questions for all of them against a fake
+OpenAI server answering after ``--latency`` seconds:
+
+    - per transcript: what ``AnalysisPage.js`` does, one ``/get-all-answer-single-transcript-grid`` request per
+      transcript fired at once, with the browser's limit of ``--browser-connections`` connections per host
+    - bulk: one ``/get-all-answer-grid`` request for the project, for each ``GRID_CONCURRENCY`` in
+      ``--concurrency``, and once more with ``--rate-limit`` calls per minute
+
+Reports wall time, cells per second and the time until the first cell reached the client.
+
+Requires a reachable MongoDB (``MONGO_URL``); the transcripts are stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_grid.py [--transcripts 50] [--questions 10] [--latency 1.0] [--concurrency 8 16 32]
+"""
+
+import os
+import re
+import ast
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+
+def reply(body):
+    # Answers every question of the prompt's question dictionary.
+    prompt = body["messages"][0]["content"]
+    questions = ast.literal_eval(re.search(r"Question: (\{.*?\})\n\n", prompt, re.S).group(1))
+    return repr({key: f"Answer to {question}" for key, question in questions.items()})
+
+
+async def per_transcript(base_url, transcript_ids, questions, connections):
+    started = time.perf_counter()
+    first = None
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as http:
+        async def one(tid):
+            nonlocal first
+            response = await http.post(f"{base_url}/get-all-answer-single-transcript-grid/{tid}",
+                                       json={"question": questions, "transcript_id": tid})
+            response.raise_for_status()
+            first = first or time.perf_counter() - started
+            return len(response.json())
+
+        cells = sum(await asyncio.gather(*(one(tid) for tid in transcript_ids)))
+    return time.perf_counter() - started, first, cells
+
+
+async def bulk(base_url, project_id, questions):
+    started = time.perf_counter()
+    first = None
+    cells = 0
+    async with httpx.AsyncClient(timeout=600) as http:
+        async with http.stream("POST", f"{base_url}/get-all-answer-grid", json={"project_id": project_id, "question": questions}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                cell = json.loads(line)
+                if "answer" in cell:
+                    cells += 1
+                    first = first or time.perf_counter() - started
+    return time.perf_counter() - started, first, cells
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--browser-connections", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--rate-limit", type=float, default=600)
+    args = parser.parse_args()
+
+    fake = ServerThread(fake_openai_app(latency=args.latency, content=reply)).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    os.environ.setdefault("QA_GRID_PROMPT", "Answer each question for the given transcript context.")
+    os.environ.setdefault("QA_GRID_PROMPT_FORMAT", "A Python dictionary keyed by question number.")
+    os.environ.setdefault("QA_GRID_PROMPT_ROLE", "system")
+    os.environ.setdefault("QA_GRID_MODEL", "fake-model")
+    os.environ.setdefault("QA_GRID_MAX_TOKENS", "1000")
+
+    import api
+    from grid import GridRunner
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    text = "spk_0: We mostly use spreadsheets and the dashboard.\nspk_1: Exports are slow.\n" * 200
+    ids = mongo.transcripts.insert_many([{"text": text} for _ in range(args.transcripts)]).inserted_ids
+    project_id = mongo.projects.insert_one({"projectName": "bench", "transcripts": list(ids)}).inserted_id
+    transcript_ids = [str(tid) for tid in ids]
+    questions = {str(i + 1): f"Question {i + 1}?" for i in range(args.questions)}
+
+    server = ServerThread(api.app).start()
+    rows = []
+    try:
+        api.grid_runner = GridRunner(api.client, concurrency=max(args.concurrency), rate_limit=0)
+        elapsed, first, cells = asyncio.run(per_transcript(server.url, transcript_ids, questions, args.browser_connections))
+        rows.append((f"per transcript ({args.browser_connections} browser connections)", f"{elapsed:.1f}", f"{cells / elapsed:.1f}", f"{first:.2f}", cells))
+        runs = [(c, 0) for c in args.concurrency] + [(max(args.concurrency), args.rate_limit)]
+        for concurrency, rate in runs:
+            api.grid_runner = GridRunner(api.client, concurrency=concurrency, rate_limit=rate)
+            elapsed, first, cells = asyncio.run(bulk(server.url, str(project_id), questions))
+            label = f"bulk NDJSON, concurrency {concurrency}" + (f", {rate:.0f} calls/min" if rate else "")
+            rows.append((label, f"{elapsed:.1f}", f"{cells / elapsed:.1f}", f"{first:.2f}", cells))
+    finally:
+        server.stop()
+        fake.stop()
+        mongo.transcripts.delete_many({"_id": {"$in": ids}})
+        mongo.projects.delete_one({"_id": project_id})
+
+    print(f"{args.transcripts} transcripts x {args.questions} questions, LLM latency {args.latency}s")
+    print_table(["run", "seconds", "cells/s", "first cell s", "cells"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Grid answers for long transcripts: one prompt vs map-reduce, by transcript length.
+
+For each length in ``--lengths`` (tokens), builds an interview of filler talk with one planted finding per
+question (``FACT<n>`` next to the question's topic word) at a random place, and answers ``--questions``
+questions about it twice with ``GridRunner.answer``:
+
+    - one prompt: the whole transcript in one call (the previous behaviour)
+    - map-reduce: the automatic long-document mode above ``GRID_LONG_TOKENS``
+
+The fake OpenAI server answers after ``--latency`` seconds plus ``--latency-per-1k`` seconds per 1000 prompt
+tokens, and rejects prompts over ``--context-tokens`` like the real API. Its answers quote the planted finding
+when it is in the prompt, so "correct" counts the questions whose finding reached the final answer.
+
+Reports latency, prompt tokens sent, LLM calls and correct answers per length and mode.
+
+Usage:
+    python testfiles/bench_grid_long.py [--lengths 5000 20000 50000 100000 200000] [--questions 8]
+"""
+
+import os
+import re
+import ast
+import time
+import random
+import asyncio
+import argparse
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+TOPICS = ["pricing", "onboarding", "exports", "notifications", "permissions", "search", "billing", "integrations",
+          "dashboards", "mobile", "support", "security"]
+FILLER = [
+    "We usually start the week by going through the numbers with the team.",
+    "Honestly it depends on who is in the office that day.",
+    "I think we talked about this in the last quarterly review.",
+    "The team has grown a lot since last year, so things changed.",
+    "My manager wants a summary every Friday before the meeting.",
+    "We try to keep things simple and not add another tool.",
+]
+
+
+def reply(body):
+    prompt = body["messages"][0]["content"]
+    questions = ast.literal_eval(re.search(r"Question: (\{.*?\})\n\n", prompt, re.S).group(1))
+    answers = {}
+    for qid in questions:
+        found = re.search(rf"[^\n]*FACT{qid}\b[^\n]*", prompt)
+        if "Excerpt: " in prompt:
+            answers[qid] = found.group(0) if found else ""
+        else:
+            answers[qid] = found.group(0) if found else "Not mentioned"
+    return repr(answers)
+
+
+def make_transcript(rng, tokens, questions):
+    lines, size = [], 0
+    while size < tokens * 4:
+        line = f"spk_{rng.randint(0, 1)}: " + " ".join(rng.sample(FILLER, 2))
+        lines.append(line)
+        size += len(line) + 1
+    for qid, topic in questions.items():
+        lines.insert(rng.randrange(len(lines)), f"spk_1: About {topic}, FACT{qid}: it took us weeks to sort out the {topic}.")
+    return "\n".join(lines)
+
+
+async def answer(runner, text, questions):
+    started = time.perf_counter()
+    calls, tokens = runner.counters["calls"], runner.counters["prompt_tokens"]
+    try:
+        answers = await runner.answer(text, {qid: f"What did they say about {topic}?" for qid, topic in questions.items()})
+        correct = sum(f"FACT{qid}" in str(answers.get(qid, "")) for qid in questions)
+        status = "ok"
+    except Exception as e:
+        correct, status = 0, f"error {getattr(e, 'status_code', '')}"
+    return (time.perf_counter() - started, runner.counters["prompt_tokens"] - tokens,
+            runner.counters["calls"] - calls, correct, status)
+
+
+async def run(args, fake_url, questions):
+    from openai import AsyncOpenAI
+    from grid import GridRunner
+
+    client = AsyncOpenAI(api_key="bench", base_url=f"{fake_url}/v1")
+    single = GridRunner(client, concurrency=16, rate_limit=0, long_tokens=10 ** 9)
+    mapped = GridRunner(client, concurrency=16, rate_limit=0)
+    rng = random.Random(0)
+    rows = []
+    for length in args.lengths:
+        text = make_transcript(rng, length, questions)
+        for label, runner in [("one prompt", single), ("map-reduce" if length > mapped.long_tokens else "auto (one prompt)", mapped)]:
+            seconds, tokens, calls, correct, status = await answer(runner, text, questions)
+            rows.append((f"{length:,}", label, f"{seconds:.2f}", f"{tokens:,}", calls, f"{correct}/{len(questions)}", status))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[5000, 20000, 50000, 100000, 200000])
+    parser.add_argument("--questions", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-per-1k", type=float, default=0.05)
+    parser.add_argument("--context-tokens", type=int, default=128000)
+    args = parser.parse_args()
+
+    fake = ServerThread(fake_openai_app(latency=args.latency, content=reply, latency_per_1k_tokens=args.latency_per_1k,
+                                        context_tokens=args.context_tokens)).start()
+    os.environ.setdefault("QA_GRID_PROMPT", "Answer each question for the given transcript context.")
+    os.environ.setdefault("QA_GRID_PROMPT_FORMAT", "A Python dictionary keyed by question number.")
+    os.environ.setdefault("QA_GRID_PROMPT_ROLE", "system")
+    os.environ.setdefault("QA_GRID_MODEL", "gpt-4o")
+    os.environ.setdefault("QA_GRID_MAX_TOKENS", "1000")
+
+    from grid import GridRunner
+
+    questions = {str(i + 1): TOPICS[i % len(TOPICS)] for i in range(args.questions)}
+    long_tokens = GridRunner(None).long_tokens
+    try:
+        rows = asyncio.run(run(args, fake.url, questions))
+    finally:
+        fake.stop()
+    print(f"{args.questions} questions, LLM {args.latency}s + {args.latency_per_1k}s per 1k prompt tokens, "
+          f"context {args.context_tokens:,} tokens, GRID_LONG_TOKENS {long_tokens:,}")
+    print_table(["transcript tokens", "mode", "seconds", "prompt tokens", "calls", "correct", "status"], rows)
+
+
+if __name__ == "__main__":
+    main()
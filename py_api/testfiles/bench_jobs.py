@@ -0,0 +1,95 @@
+"""
+Manual check for the background transcription job queue.
+
+Starts a fake Transcribe/S3/Sarvam backend, runs ``api:app`` on one uvicorn worker and submits a batch of jobs
+through ``/jobs/transcribe-file/{transcript_id}``. Reports how quickly submissions return, how long the batch
+takes with the configured worker pool, and checks that every job got its own transcript and callback.
+
+Requires a reachable MongoDB (``MONGO_URL``); jobs are stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_jobs.py [--jobs 20] [--workers 4] [--method aws] [--transcribe-seconds 2]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from bench_utils import ServerThread, fake_transcription_app, percentile, print_table
+
+
+async def run(base_url, fake_url, jobs, method):
+    async with httpx.AsyncClient(timeout=60) as http:
+        submit_times = []
+        job_ids = []
+        start = time.perf_counter()
+        for i in range(jobs):
+            t0 = time.perf_counter()
+            response = await http.post(f"{base_url}/jobs/transcribe-file/bench{i}", json={
+                "url": f"s3://bench/interview-{i}.wav",
+                "transcribe_method": method,
+                "transcribe_lang": "en-US",
+                "callback_url": f"{fake_url}/_callback",
+            })
+            response.raise_for_status()
+            submit_times.append(time.perf_counter() - t0)
+            job_ids.append(response.json()["job_id"])
+
+        results = {}
+        while len(results) < jobs:
+            for job_id in job_ids:
+                if job_id in results:
+                    continue
+                status = (await http.get(f"{base_url}/jobs/{job_id}")).json()
+                if status["status"] in ("completed", "failed"):
+                    results[job_id] = (await http.get(f"{base_url}/jobs/{job_id}/result")).json()
+            await asyncio.sleep(0.2)
+        return submit_times, time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--method", default="aws", choices=["aws", "sarvam"])
+    parser.add_argument("--transcribe-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    objects = {f"bench/interview-{i}.wav": f"RIFF fake audio {i}".encode() * 64 for i in range(args.jobs)}
+    fake_app = fake_transcription_app(objects, transcribe_seconds=args.transcribe_seconds, sarvam_latency=args.transcribe_seconds)
+    fake = ServerThread(fake_app).start()
+
+    os.environ["AWS_TRANSCRIBE_ENDPOINT_URL"] = fake.url
+    os.environ["AWS_S3_ENDPOINT_URL"] = fake.url
+    os.environ["SARVAM_API_URL"] = f"{fake.url}/_sarvam"
+    os.environ["AWS_TRANSCRIBE_POLL_INTERVAL"] = "1"
+    os.environ["TRANSCRIBE_JOB_WORKERS"] = str(args.workers)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+
+    import api
+
+    server = ServerThread(api.app).start()
+    try:
+        submit_times, elapsed, results = asyncio.run(run(server.url, fake.url, args.jobs, args.method))
+    finally:
+        server.stop()
+        fake.stop()
+
+    transcripts = [r.get("result", {}).get("transcript", "") for r in results.values()]
+    failed = [r for r in results.values() if "result" not in r]
+    distinct = len({t for t in transcripts if t})
+    print_table(
+        ["jobs", "workers", "submit p50 ms", "submit max ms", "batch s", "failed", "distinct", "callbacks"],
+        [(args.jobs, args.workers, f"{percentile(submit_times, 50) * 1000:.1f}", f"{max(submit_times) * 1000:.1f}",
+          f"{elapsed:.1f}", len(failed), distinct, len(fake_app.state.callbacks))]
+    )
+
+
+if __name__ == "__main__":
+    main()
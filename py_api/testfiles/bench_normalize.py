@@ -0,0 +1,98 @@
+"""
+Benchmark for the audio normalization stage.
+
+Generates a speech-like recording (44.1 kHz stereo mp3 with long leading/trailing silence), serves it from a
+fake S3 / Sarvam / Transcribe backend and transcribes it once per codec:
+
+    - sarvam: ``transcribe_s3_sarvam_streaming`` with ``SARVAM_AUDIO_CODEC`` set to each codec
+    - aws: ``transcribe_aws`` with ``AWS_AUDIO_CODEC`` set to each codec (the normalized copy is uploaded to
+      the fake S3 and removed afterwards)
+
+The fake Sarvam endpoint is given a latency proportional to the uploaded bytes (``--upload-mbps``) so the
+effect of smaller payloads on wall time is visible. The table reports bytes sent for transcription, audio
+seconds trimmed and wall time per codec.
+
+Usage:
+    python testfiles/bench_normalize.py [--minutes 20] [--silence 60] [--upload-mbps 20] [--trim 2]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+import ffmpeg
+
+from bench_utils import ServerProcess, fake_transcription_app, print_table
+
+
+def make_recording(path, minutes, silence):
+    seconds = int(minutes * 60)
+    # Tone bursts with short pauses stand in for speech; the silent head and tail are what trimming removes.
+    voice = f"0.5*sin(2*PI*220*t)*lt(mod(t,6),4.5)*gte(t,{silence})*lt(t,{seconds - silence})"
+    audio = ffmpeg.input(f"aevalsrc='{voice}|{voice}':s=44100:d={seconds}", f="lavfi")
+    ffmpeg.output(audio, path, acodec="libmp3lame", audio_bitrate="128k").overwrite_output().run(quiet=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=20)
+    parser.add_argument("--silence", type=int, default=60, help="seconds of silence at each end")
+    parser.add_argument("--upload-mbps", type=float, default=20, help="simulated upload bandwidth to Sarvam")
+    parser.add_argument("--trim", type=float, default=2, help="trim silences longer than this (0 = off)")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_normalize_")
+    source = os.path.join(scratch, "interview.mp3")
+    make_recording(source, args.minutes, args.silence)
+    print(f"Source: {os.path.getsize(source) / 1e6:.1f} MB, {args.minutes:.0f} min")
+
+    bytes_per_second = args.upload_mbps * 1e6 / 8
+    server = ServerProcess(
+        fake_transcription_app,
+        objects={"bench/interview.mp3": source},
+        transcribe_seconds=lambda uri: 0.5,
+        sarvam_latency=lambda size: 0.2 + size / bytes_per_second,
+    ).start()
+
+    os.environ["AWS_S3_ENDPOINT_URL"] = server.url
+    os.environ["AWS_TRANSCRIBE_ENDPOINT_URL"] = server.url
+    os.environ["SARVAM_API_URL"] = f"{server.url}/_sarvam"
+    os.environ["AWS_TRANSCRIBE_POLL_INTERVAL"] = "0.2"
+    # The fake finishes jobs at once, so skip the duration-based wait before the first status check.
+    os.environ["AWS_TRANSCRIBE_POLL_RATIO"] = "0.0001"
+    os.environ["SARVAM_TRIM_SILENCE"] = os.environ["AWS_TRIM_SILENCE"] = str(args.trim)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.chdir(scratch)
+    import utils
+
+    rows = []
+    try:
+        for method in ("sarvam", "aws"):
+            for codec in ("original", "wav", "flac", "opus"):
+                if method == "sarvam" and codec == "original":
+                    continue  # the streaming path always decodes; "original" behaves like wav
+                os.environ[f"{method.upper()}_AUDIO_CODEC"] = codec
+                seen = len(utils.normalization_stats.snapshot()["recent"])
+                started = time.perf_counter()
+                if method == "sarvam":
+                    utils.transcribe_s3_sarvam_streaming("s3://bench/interview.mp3", "mp3", "en-IN")
+                else:
+                    utils.transcribe_aws("s3://bench/interview.mp3", "mp3", "en-US", 2)
+                elapsed = time.perf_counter() - started
+                recent = utils.normalization_stats.snapshot()["recent"]
+                report = recent[-1] if len(recent) > seen else None
+                sent = report["output_bytes"] if report else os.path.getsize(source)
+                trimmed = report["seconds_trimmed"] if report else 0.0
+                rows.append([method, codec, f"{sent / 1e6:.2f}", f"{os.path.getsize(source) / max(sent, 1):.1f}x",
+                             f"{trimmed:.0f}", f"{elapsed:.2f}"])
+    finally:
+        server.stop()
+
+    print_table(["method", "codec", "sent MB", "smaller", "trimmed s", "wall s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark for the shared AWS Transcribe poller.
+
+Starts a fake Transcribe backend and many jobs with different media durations, tracks them all with one
+``TranscribePoller`` and reports Transcribe API calls per completed job and how late each completion was
+noticed. The baseline column is what a fixed-interval ``get_transcription_job`` loop per job would have cost.
+
+Usage:
+    python testfiles/bench_poller.py [--jobs 50] [--max-duration 120] [--speed 0.05]
+"""
+
+import os
+import math
+import time
+import random
+import argparse
+import uuid
+
+from bench_utils import ServerThread, fake_transcription_app, percentile, print_table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--max-duration", type=float, default=120, help="longest media duration in (scaled) seconds")
+    parser.add_argument("--speed", type=float, default=0.05, help="processing time as a fraction of media duration")
+    parser.add_argument("--fixed-interval", type=float, default=1.0, help="baseline per-job poll interval")
+    args = parser.parse_args()
+
+    random.seed(7)
+    durations = {}
+    fake_app = fake_transcription_app(transcribe_seconds=lambda uri: durations[uri] * args.speed)
+    fake = ServerThread(fake_app).start()
+    os.environ["AWS_TRANSCRIBE_ENDPOINT_URL"] = fake.url
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+
+    from utils import aws_client, TRANSCRIBE_JOB_PREFIX
+    from poller import TranscribePoller
+
+    client = aws_client("transcribe")
+    # The poller only gets a rough guess of the processing speed, as it would in production.
+    poller = TranscribePoller(lambda: client, TRANSCRIBE_JOB_PREFIX, min_interval=0.2, max_interval=5, ratio=args.speed / 2)
+    resolved_at = {}
+
+    futures = []
+    for i in range(args.jobs):
+        uri = f"s3://bench/interview-{i}.mp3"
+        durations[uri] = random.uniform(5, args.max_duration)
+        name = f"{TRANSCRIBE_JOB_PREFIX}{uuid.uuid4().hex[:8]}"
+        client.start_transcription_job(TranscriptionJobName=name, Media={"MediaFileUri": uri}, MediaFormat="mp3", LanguageCode="en-US")
+        future = poller.watch(name, durations[uri])
+        future.add_done_callback(lambda _, name=name: resolved_at.setdefault(name, time.time()))
+        futures.append((uri, name, future))
+
+    lateness = []
+    for uri, name, future in futures:
+        description = future.result(timeout=600)
+        assert description["TranscriptionJobStatus"] == "COMPLETED"
+        lateness.append(resolved_at[name] - fake_app.state.jobs[name]["done_at"])
+    fake.stop()
+
+    stats = poller.stats()
+    baseline = sum(math.ceil(durations[uri] * args.speed / args.fixed_interval) for uri, _, _ in futures) / args.jobs
+    print_table(
+        ["jobs", "get calls", "list calls", "calls/job", f"baseline calls/job @{args.fixed_interval}s", "late p50 s", "late p95 s"],
+        [(args.jobs, stats["get_calls"], stats["list_calls"], stats["poll_calls_per_completed_job"], f"{baseline:.1f}",
+          f"{percentile(lateness, 50):.2f}", f"{percentile(lateness, 95):.2f}")]
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Project question aggregation: one query per transcript and the full question list vs the de-duplicated aggregate.
+
+For each size in ``--transcripts``, stores a project whose transcripts each have ``--questions`` generated
+questions, drawn from a pool of interview questions written in a few wordings each (as the LLM words them
+differently per transcript). Then:
+
+    - legacy: what ``/generate-questions`` did before, one ``find_one`` per transcript and every transcript's
+      questions concatenated into the prompt (built here; no LLM call)
+    - aggregate, first call: ``/generate-questions`` building the aggregate from scratch
+    - aggregate, one transcript added: the next call, after one more transcript was added to the project
+    - aggregate, unchanged: a call with nothing new
+
+Reports Mongo queries, prompt tokens, questions sent, LLM calls and seconds. The fake OpenAI server answers
+after ``--latency`` seconds.
+
+Requires a reachable MongoDB (``MONGO_URL``); the transcripts are stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_question_agg.py [--transcripts 50 200 500] [--questions 12] [--latency 0.5]
+"""
+
+import os
+import time
+import random
+import argparse
+
+import httpx
+from bson import ObjectId
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table
+
+TOPICS = ["pricing", "onboarding", "exports", "notifications", "permissions", "search", "billing", "integrations",
+          "dashboards", "the mobile app", "support", "security", "reporting", "your team's workflow", "the API"]
+# Four questions per topic, in two or three wordings each.
+WORDINGS = [
+    "What frustrates you most about {topic}?",
+    "What frustrates you the most about {topic}?",
+    "What do you find frustrating about {topic}?",
+    "How often do you use {topic}?",
+    "How often do you use {topic} in a week?",
+    "What would you change about {topic}?",
+    "If you could change one thing about {topic}, what would it be?",
+    "What would you change about {topic}, if anything?",
+    "How did you first learn about {topic}?",
+    "How did you first hear about {topic}?",
+]
+
+
+def legacy_prompt(mongo, project_id):
+    project = mongo.projects.find_one({"_id": ObjectId(project_id)})
+    queries = 1
+    all_transcripts_questions = ""
+    for i, transcript_id in enumerate(project.get("transcripts", [])):
+        transcript = mongo.transcripts.find_one({"_id": ObjectId(transcript_id)})
+        queries += 1
+        all_transcripts_questions += f"Transcript {i} \n Questions asked in transcript: {transcript.get('questions')})\n\n"
+    return all_transcripts_questions, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--questions", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    prompts = []
+
+    def reply(body):
+        prompts.append(body["messages"][0]["content"])
+        return repr([f"Generated question {i + 1}?" for i in range(10)])
+
+    fake_app = fake_openai_app(latency=args.latency, content=reply)
+    fake = ServerThread(fake_app).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    os.environ.setdefault("QUESTION_AGG_PROMPT", "Merge the questions below into <n> questions.")
+    os.environ.setdefault("QUESTION_AGG_PROMPT_FORMAT", "A Python list of strings.")
+    os.environ.setdefault("QUESTION_AGG_PROMPT_ROLE", "system")
+    os.environ.setdefault("QUESTION_AGG_MODEL", "fake-model")
+    os.environ.setdefault("QUESTION_AGG_MAX_TOKENS", "1000")
+
+    import api
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    server = ServerThread(api.app).start()
+    rng = random.Random(0)
+    pool = [wording.format(topic=topic) for topic in TOPICS for wording in WORDINGS]
+
+    def transcript():
+        return {"text": "spk_0: ...", "questions": {str(i + 1): q for i, q in enumerate(rng.sample(pool, args.questions))}}
+
+    def call(project_id):
+        calls, count = fake_app.state.calls, len(prompts)
+        started = time.perf_counter()
+        response = httpx.post(f"{server.url}/generate-questions/{project_id}", json={"num_q": 10}, timeout=600)
+        response.raise_for_status()
+        seconds = time.perf_counter() - started
+        prompt = prompts[-1] if len(prompts) > count else ""
+        return seconds, fake_app.state.calls - calls, prompt
+
+    rows, created = [], []
+    try:
+        for size in args.transcripts:
+            ids = mongo.transcripts.insert_many([transcript() for _ in range(size)]).inserted_ids
+            project_id = str(mongo.projects.insert_one({"projectName": "bench", "transcripts": list(ids)}).inserted_id)
+            created.extend(ids)
+
+            started = time.perf_counter()
+            text, queries = legacy_prompt(mongo, project_id)
+            seconds = time.perf_counter() - started
+            rows.append((size, "legacy (prompt only)", queries, f"{len(text) // 4:,}", f"{size * args.questions:,}", "-",
+                         f"{seconds:.3f}"))
+
+            seconds, calls, prompt = call(project_id)
+            sent = prompt.count("\n- ")
+            rows.append((size, "aggregate, first call", "3 + 1 write", f"{len(prompt) // 4:,}", f"{sent:,}", calls, f"{seconds:.3f}"))
+
+            new_id = mongo.transcripts.insert_one(transcript()).inserted_id
+            created.append(new_id)
+            mongo.projects.update_one({"_id": ObjectId(project_id)}, {"$push": {"transcripts": new_id}})
+            seconds, calls, prompt = call(project_id)
+            rows.append((size, "aggregate, one transcript added", "3 + 1 write", "-", "-", calls, f"{seconds:.3f}"))
+
+            seconds, calls, prompt = call(project_id)
+            rows.append((size, "aggregate, unchanged", 3, "-", "-", calls, f"{seconds:.3f}"))
+        stats = httpx.get(f"{server.url}/metrics", timeout=60).json()["question_aggregates"]
+    finally:
+        server.stop()
+        fake.stop()
+        mongo.transcripts.delete_many({"_id": {"$in": created}})
+        mongo.projects.delete_many({"projectName": "bench"})
+        mongo.questionaggregates.delete_many({})
+
+    print(f"{args.questions} questions per transcript from {len(pool)} wordings of {len(TOPICS) * 4} questions, "
+          f"LLM latency {args.latency}s")
+    print_table(["transcripts", "run", "queries", "prompt tokens", "questions sent", "LLM calls", "seconds"], rows)
+    print("question_aggregates: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
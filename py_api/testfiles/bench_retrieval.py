@@ -0,0 +1,165 @@
+"""
+Project chat retrieval: index build, query latency and context size.
+
+Stores a synthetic project of ``--transcripts`` transcripts of about ``--transcript-tokens`` tokens each. Every
+transcript is generic interview talk with one planted finding (a rare term per transcript). Each query asks
+about one planted finding; a query is a hit if the returned context contains that finding.
+
+Reports:
+    - the cold build of the project index (first search) and a sync with nothing changed
+    - query latency (p50 / p95) of ``RetrievalIndex.search`` on a warm index
+    - an incremental update: one transcript changed and one added, then the next search
+    - context tokens per query: the passages returned vs the previous ``top_n`` whole transcripts (ranked here
+      by BM25 over whole transcripts, standing in for the Atlas ``$search`` the chat used)
+
+Requires a reachable MongoDB (``MONGO_URL``); the project is stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_retrieval.py [--transcripts 200] [--transcript-tokens 5000] [--queries 200] [--top-n 3]
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from bench_utils import percentile, print_table
+
+FILLER = [
+    "We usually start the week by going through the report with the team.",
+    "The dashboard takes a while to load when there are many filters.",
+    "Honestly most of the time we just export everything to a spreadsheet.",
+    "I would like the search to remember what I looked for last time.",
+    "Our manager asks for the numbers every Friday before the review.",
+    "The mobile app is fine for quick checks but not for real work.",
+    "Support answered quickly the last time something broke.",
+    "We tried the integration with our calendar but stopped using it.",
+]
+SPEAKERS = ["spk_0", "spk_1"]
+
+
+def make_transcript(rng, index, tokens):
+    finding = f"spk_1: The biggest problem is the zorblax{index} screen, it loses my notes every time I switch tabs."
+    lines = []
+    size = 0
+    while size < tokens * 4:
+        line = f"{rng.choice(SPEAKERS)}: " + " ".join(rng.sample(FILLER, 3))
+        lines.append(line)
+        size += len(line) + 1
+    lines.insert(rng.randrange(len(lines)), finding)
+    return "\n".join(lines), f"zorblax{index}"
+
+
+async def run(args, ids, project_id, mongo, needles):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from retrieval import RetrievalIndex, ProjectIndex, format_passages
+    from context import count_tokens
+
+    db = AsyncIOMotorClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    model = "gpt-4o-mini"
+    index = RetrievalIndex(db, sync_seconds=3600)
+
+    started = time.perf_counter()
+    await index.search(project_id, "warm up")
+    build = time.perf_counter() - started
+    index.projects[project_id].synced_at = 0
+    started = time.perf_counter()
+    await index.search(project_id, "warm up")
+    resync = time.perf_counter() - started
+
+    # Whole transcripts ranked by BM25, the context the chat used to send.
+    whole = ProjectIndex(chunk_tokens=10 ** 9)
+    texts = {str(t["_id"]): t["text"] for t in mongo.transcripts.find({"_id": {"$in": ids}})}
+    for tid, text in texts.items():
+        whole.add(tid, text)
+
+    rng = random.Random(1)
+    latencies, before_tokens, after_tokens, hits_before, hits_after = [], [], [], 0, 0
+    for _ in range(args.queries):
+        tid, needle = rng.choice(needles)
+        query = f"What did the participant say about the {needle} screen?"
+        started = time.perf_counter()
+        passages = await index.search(project_id, query, max_transcripts=args.top_n)
+        latencies.append(time.perf_counter() - started)
+        context = format_passages(passages)
+        after_tokens.append(count_tokens(context, model))
+        hits_after += needle in context
+        top = whole.search(query, max_tokens=10 ** 9, max_transcripts=args.top_n)[:args.top_n]
+        old_context = "\n\n".join(f"Transcript: {texts[p['transcript_id']]}" for p in top)
+        before_tokens.append(count_tokens(old_context, model))
+        hits_before += needle in old_context
+
+    # Incremental update: one transcript edited, one added to the project.
+    rng_text = random.Random(2)
+    edited = ids[0]
+    new_text, new_needle = make_transcript(rng_text, args.transcripts, args.transcript_tokens)
+    mongo.transcripts.update_one({"_id": edited}, {"$set": {"text": new_text, "updatedAt": datetime.utcnow()}})
+    added_text, added_needle = make_transcript(rng_text, args.transcripts + 1, args.transcript_tokens)
+    added = mongo.transcripts.insert_one({"transcriptName": "added", "text": added_text, "updatedAt": datetime.utcnow()}).inserted_id
+    mongo.projects.update_one({"_id": ObjectId(project_id)}, {"$push": {"transcripts": added}})
+    ids.append(added)
+    indexed = index.counters["indexed"]
+    index.projects[project_id].synced_at = 0
+    started = time.perf_counter()
+    passages = await index.search(project_id, f"What about the {added_needle} screen?", max_transcripts=args.top_n)
+    update = time.perf_counter() - started
+    found = added_needle in format_passages(passages)
+    edited_found = new_needle in format_passages(await index.search(project_id, f"the {new_needle} screen"))
+    return {
+        "build": build, "resync": resync, "update": update, "reindexed": index.counters["indexed"] - indexed,
+        "latencies": latencies, "before": before_tokens, "after": after_tokens,
+        "hits_before": hits_before, "hits_after": hits_after, "found_after_update": found and edited_found,
+        "stats": index.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", type=int, default=200)
+    parser.add_argument("--transcript-tokens", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    rng = random.Random(0)
+    documents, needles = [], []
+    for i in range(args.transcripts):
+        text, needle = make_transcript(rng, i, args.transcript_tokens)
+        documents.append({"transcriptName": f"Interview {i}", "text": text, "updatedAt": datetime.utcnow()})
+        needles.append((i, needle))
+    ids = mongo.transcripts.insert_many(documents).inserted_ids
+    project_id = mongo.projects.insert_one({"projectName": "bench", "transcripts": list(ids)}).inserted_id
+
+    try:
+        result = asyncio.run(run(args, ids, str(project_id), mongo, needles))
+    finally:
+        mongo.transcripts.delete_many({"_id": {"$in": ids}})
+        mongo.projects.delete_one({"_id": project_id})
+
+    stats = result["stats"]
+    print(f"{args.transcripts} transcripts x ~{args.transcript_tokens} tokens: {stats['chunks']} chunks")
+    print_table(["step", "ms"], [
+        ("cold build (first search)", f"{result['build'] * 1000:.0f}"),
+        ("sync, nothing changed", f"{result['resync'] * 1000:.1f}"),
+        (f"sync + search after 1 edit, 1 add ({result['reindexed']} re-indexed)", f"{result['update'] * 1000:.1f}"),
+        ("query p50", f"{percentile(result['latencies'], 50) * 1000:.2f}"),
+        ("query p95", f"{percentile(result['latencies'], 95) * 1000:.2f}"),
+    ])
+    before, after = result["before"], result["after"]
+    print_table(["context per query", f"top {args.top_n} whole transcripts", "BM25 passages"], [
+        ("mean tokens", round(sum(before) / len(before)), round(sum(after) / len(after))),
+        ("max tokens", max(before), max(after)),
+        ("finding in context", f"{result['hits_before']}/{args.queries}", f"{result['hits_after']}/{args.queries}"),
+    ])
+    print(f"new and edited transcripts found after the update: {result['found_after_update']}")
+
+
+if __name__ == "__main__":
+    main()
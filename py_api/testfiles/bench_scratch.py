@@ -0,0 +1,126 @@
+"""
+Concurrency stress test for the scratch-file path of ``run_transcription``.
+
+Uploads ``--files`` distinct recordings of the same type (plus a few PDFs and TXT files) to a fake S3 and runs
+``api.run_transcription`` for each of them, first one at a time to record the expected transcripts and then all
+at once. The temp-file path is forced (``SARVAM_STREAMING=off``) and deduplication is disabled, so every
+request downloads, converts and transcribes its own copy. It then checks that:
+
+    - every parallel transcript equals the one produced when that file ran alone
+    - all transcripts are distinct
+    - no scratch files are left behind
+
+``--quota-mb`` sets a small disk quota to exercise backpressure; the scratch counters show how often requests
+waited for space.
+
+Usage:
+    python testfiles/bench_scratch.py [--files 16] [--docs 4] [--quota-mb 0] [--no-memory]
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import ffmpeg
+import pymupdf
+
+from bench_utils import ServerThread, fake_transcription_app, print_table
+
+
+def make_recording(path, seconds, frequency):
+    audio = ffmpeg.input(f"sine=frequency={frequency}:duration={seconds}:sample_rate=44100", f="lavfi")
+    ffmpeg.output(audio, path, acodec="libmp3lame", audio_bitrate="128k").overwrite_output().run(quiet=True)
+
+
+def make_pdf(path, marker):
+    document = pymupdf.open()
+    for page_number in range(3):
+        document.new_page().insert_text((72, 72), f"{marker} page {page_number}")
+    document.save(path)
+    document.close()
+
+
+def files_left(*roots):
+    return sum(len(files) for root in roots if root and os.path.isdir(root) for _, _, files in os.walk(root))
+
+
+async def run_all(api, requests, parallel):
+    async def one(request):
+        started = time.perf_counter()
+        transcript = await api.run_transcription("bench", request)
+        return transcript, time.perf_counter() - started
+
+    if parallel:
+        return await asyncio.gather(*(one(request) for request in requests))
+    return [await one(request) for request in requests]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--docs", type=int, default=4, help="PDFs and TXT files each")
+    parser.add_argument("--quota-mb", type=float, default=0, help="disk quota for scratch files (0 = default)")
+    parser.add_argument("--no-memory", action="store_true", help="keep all scratch files on disk")
+    args = parser.parse_args()
+
+    corpus = tempfile.mkdtemp(prefix="bench_scratch_corpus_")
+    objects, requests = {}, []
+    for i in range(args.files):
+        path = os.path.join(corpus, f"interview-{i}.mp3")
+        make_recording(path, 20 + i, 200 + 20 * i)
+        objects[f"bench/interview-{i}.mp3"] = path
+        requests.append({"url": f"s3://bench/interview-{i}.mp3", "transcribe_method": "sarvam", "transcribe_lang": "en-IN"})
+    for i in range(args.docs):
+        pdf = os.path.join(corpus, f"report-{i}.pdf")
+        make_pdf(pdf, f"report marker {i}")
+        objects[f"bench/report-{i}.pdf"] = pdf
+        objects[f"bench/notes-{i}.txt"] = f"notes marker {i}\n".encode() * 100
+        requests.append({"url": f"s3://bench/report-{i}.pdf", "transcribe_method": "sarvam"})
+        requests.append({"url": f"s3://bench/notes-{i}.txt", "transcribe_method": "sarvam"})
+
+    fake = ServerThread(fake_transcription_app(objects, sarvam_latency=0.3)).start()
+    scratch_root = tempfile.mkdtemp(prefix="bench_scratch_")
+    os.environ["AWS_S3_ENDPOINT_URL"] = fake.url
+    os.environ["SARVAM_API_URL"] = f"{fake.url}/_sarvam"
+    os.environ["SARVAM_STREAMING"] = "off"
+    os.environ["TRANSCRIPT_DEDUP"] = "off"
+    os.environ["SCRATCH_DIR"] = scratch_root
+    if args.quota_mb:
+        os.environ["SCRATCH_QUOTA_MB"] = str(args.quota_mb)
+    if args.no_memory:
+        os.environ["SCRATCH_MEMORY_DIR"] = ""
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.chdir(scratch_root)
+
+    import api
+
+    try:
+        started = time.perf_counter()
+        sequential = asyncio.run(run_all(api, requests, parallel=False))
+        sequential_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        parallel = asyncio.run(run_all(api, requests, parallel=True))
+        parallel_seconds = time.perf_counter() - started
+    finally:
+        fake.stop()
+
+    expected = [transcript for transcript, _ in sequential]
+    got = [transcript for transcript, _ in parallel]
+    stats = api.scratch_space.stats()
+    print_table(
+        ["requests", "sequential s", "parallel s", "correct", "distinct", "files left", "quota waits", "peak disk MB", "in memory"],
+        [(len(requests), f"{sequential_seconds:.1f}", f"{parallel_seconds:.1f}",
+          f"{sum(a == b for a, b in zip(expected, got))}/{len(requests)}", len(set(got)),
+          files_left(scratch_root, api.scratch_space.memory_root), stats["waits"],
+          f"{stats['peak_disk_reserved'] / 2 ** 20:.1f}", stats["memory_reservations"])]
+    )
+
+
+if __name__ == "__main__":
+    main()
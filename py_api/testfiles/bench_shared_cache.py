@@ -0,0 +1,173 @@
+"""
+Per-host memory and hit-rate benchmark for the chat cache backends across several uvicorn-like workers.
+
+Starts ``--workers`` processes (1, 2, 4, 8 by default), each creating the session and transcript caches through
+``cache.make_cache`` like ``init_cache`` does, and replays ``--requests`` chat turns over ``--sessions`` sessions
+and ``--transcripts`` transcripts of ``--transcript-mb`` MB, spread round-robin over the workers (no sticky
+sessions). Each turn reads the session and its transcript, loads them from "Mongo" on a miss, and stores the
+session back with one more interaction, as ``/chat/{session_id}`` does.
+
+Backends:
+    - memory: ``LRUCache`` in every worker
+    - sqlite: one ``SQLiteCache`` file shared by the workers
+    - redis: ``RedisCache`` against a local Redis-protocol stand-in (needs the ``redis`` package)
+
+Reports the memory the caches use on the host (worker RSS growth plus the SQLite file or the stand-in's
+RSS growth), hit rates, stale session reads (a worker serving a session older than the latest turn) and
+the cache time per turn.
+
+Usage:
+    python testfiles/bench_shared_cache.py [--workers 1 2 4 8] [--backends memory sqlite redis] [--requests 4000]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+from bench_utils import FakeRedisProcess, print_table
+
+WORDS = ("so we tried the onboarding flow and the pricing page was confusing because the export button "
+         "never showed up in our team dashboard and support said billing integration would fix the search").split()
+MB = 1024 * 1024
+
+
+def rss(pid="self"):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def make_text(size, seed):
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+def workload(args, seed=5):
+    rng = random.Random(seed)
+    transcript_weights = [1 / (rank + 1) for rank in range(args.transcripts)]
+    session_transcripts = rng.choices(range(args.transcripts), weights=transcript_weights, k=args.sessions)
+    session_weights = [1 / (rank + 1) ** 0.8 for rank in range(args.sessions)]
+    return [(s, session_transcripts[s]) for s in rng.choices(range(args.sessions), weights=session_weights, k=args.requests)]
+
+
+def worker(connection, args, environment):
+    os.environ.update(environment)
+    import cache
+
+    corpus = make_text(int(args.transcript_mb * MB) + 4096, seed=1)
+    before = rss()
+    sessions = cache.make_cache("sessions", args.session_mb * MB, default_ttl=1800)
+    transcripts = cache.make_cache("transcripts", args.transcript_cache_mb * MB, default_ttl=1800)
+    counts = {"session_hits": 0, "transcript_hits": 0, "turns": 0, "stale": 0, "seconds": 0.0}
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        session_id, transcript_id, version = message
+        started = time.perf_counter()
+        session = sessions.get(f"s{session_id}")
+        if session is not None:
+            counts["session_hits"] += 1
+            counts["stale"] += session["num_interactions"] != version
+        else:
+            session = {"history": [{"role": "user", "content": make_text(500, session_id * 100 + i)} for i in range(20)],
+                       "num_interactions": version}
+            sessions.set(f"s{session_id}", session)
+        transcript = transcripts.get(f"t{transcript_id}")
+        if transcript is not None:
+            counts["transcript_hits"] += 1
+        else:
+            offset = transcript_id * 61 % 4096
+            transcript = {"text": f"transcript {transcript_id} " + corpus[offset:offset + int(args.transcript_mb * MB)]}
+            transcripts.set(f"t{transcript_id}", transcript)
+        session["num_interactions"] = version + 1
+        sessions.set(f"s{session_id}", session)
+        counts["seconds"] += time.perf_counter() - started
+        counts["turns"] += 1
+        connection.send(True)
+    counts["rss_growth"] = rss() - before
+    connection.send(counts)
+
+
+def run(backend, workers, args, requests):
+    environment = {"CHAT_CACHE_BACKEND": backend}
+    stand_in = None
+    shared_before = 0
+    if backend == "sqlite":
+        environment["CHAT_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_shared_cache_"), "chat.sqlite3")
+    elif backend == "redis":
+        stand_in = FakeRedisProcess(maxmemory=(args.session_mb + args.transcript_cache_mb) * MB).start()
+        environment["CHAT_CACHE_REDIS_URL"] = stand_in.url
+        shared_before = rss(stand_in.process.pid)
+
+    context = multiprocessing.get_context("fork")
+    pipes, processes = [], []
+    for _ in range(workers):
+        parent, child = context.Pipe()
+        process = context.Process(target=worker, args=(child, args, environment))
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+
+    versions = {}
+    for index, (session_id, transcript_id) in enumerate(requests):
+        version = versions.get(session_id, 0)
+        pipe = pipes[index % workers]
+        pipe.send((session_id, transcript_id, version))
+        pipe.recv()
+        versions[session_id] = version + 1
+
+    results = []
+    for pipe in pipes:
+        pipe.send(None)
+        results.append(pipe.recv())
+    for process in processes:
+        process.join()
+
+    shared = 0
+    if backend == "sqlite":
+        path = environment["CHAT_CACHE_PATH"]
+        shared = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    elif backend == "redis":
+        shared = rss(stand_in.process.pid) - shared_before
+        stand_in.stop()
+
+    turns = sum(r["turns"] for r in results)
+    return (backend, workers,
+            f"{(sum(r['rss_growth'] for r in results) + shared) / MB:.0f}",
+            f"{sum(r['session_hits'] for r in results) / turns:.1%}",
+            f"{sum(r['transcript_hits'] for r in results) / turns:.1%}",
+            sum(r["stale"] for r in results),
+            f"{1000 * sum(r['seconds'] for r in results) / turns:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite", "redis"])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--transcripts", type=int, default=60)
+    parser.add_argument("--transcript-mb", type=float, default=1)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--session-mb", type=int, default=16, help="session cache budget")
+    parser.add_argument("--transcript-cache-mb", type=int, default=64, help="transcript cache budget")
+    args = parser.parse_args()
+
+    requests = workload(args)
+    rows = [run(backend, workers, args, requests) for backend in args.backends for workers in args.workers]
+    print_table(["backend", "workers", "host cache MB", "session hits", "transcript hits", "stale reads", "cache ms/turn"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Single-flight load test: ``--requests`` identical concurrent requests, with and without request coalescing.
+
+Simulates researchers opening the same project at once. For each endpoint, fires ``--requests`` identical
+requests at the same moment against a cold answer cache, once with ``SINGLEFLIGHT`` off and once on:
+
+    - ``/get-all-answer-single-transcript-grid/{id}`` (transcript read + grid LLM call)
+    - ``/generate-transcript-questions/{id}`` (transcript read + question LLM call)
+    - ``/generate-questions/{project}`` (project reads + aggregate update + aggregation LLM call)
+    - ``/chat/{session}`` on ``--requests`` sessions of the same transcript (chat transcript cache misses)
+
+The fake OpenAI server answers after ``--latency`` seconds and the Mongo reads take ``--mongo-latency`` seconds
+more (a remote database). Reports the Mongo read rounds (single-flight ``flights`` of the transcript and project
+reads), LLM calls and the p50/max request latency.
+
+Requires a reachable MongoDB (``MONGO_URL``); the data is stored in ``BENCH_DB_NAME``.
+
+Usage:
+    python testfiles/bench_singleflight.py [--requests 20] [--latency 1.0]
+"""
+
+import os
+import re
+import ast
+import time
+import asyncio
+import argparse
+
+import httpx
+from pymongo import MongoClient
+
+from bench_utils import ServerThread, fake_openai_app, print_table, percentile
+
+
+def reply(body):
+    prompt = body["messages"][0]["content"]
+    found = re.search(r"Question: (\{.*?\})\n\n", prompt, re.S)
+    if body.get("stream"):
+        return "They mostly export the weekly report."
+    if found is None:
+        return repr([f"Generated question {i + 1}?" for i in range(10)])
+    return repr({key: f"Answer to {question}" for key, question in ast.literal_eval(found.group(1)).items()})
+
+
+async def burst(requests):
+    async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=None)) as http:
+        async def one(method, url, body):
+            started = time.perf_counter()
+            response = await http.request(method, url, json=body)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        return await asyncio.gather(*(one(*request) for request in requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--mongo-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake_app = fake_openai_app(latency=args.latency, content=reply, token_interval=0.0)
+    fake = ServerThread(fake_app).start()
+    os.environ["OPENAI_BASE_URL"] = f"{fake.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["DB_NAME"] = os.getenv("BENCH_DB_NAME", "uxr_bench")
+    for prefix in ["QA_GRID", "QUESTION", "QUESTION_AGG", "CHAT"]:
+        os.environ.setdefault(f"{prefix}_PROMPT", "Answer from the transcript.")
+        os.environ.setdefault(f"{prefix}_PROMPT_FORMAT", "A Python literal.")
+        os.environ.setdefault(f"{prefix}_PROMPT_ROLE", "system")
+        os.environ.setdefault(f"{prefix}_MODEL", "fake-model")
+        os.environ.setdefault(f"{prefix}_MAX_TOKENS", "500")
+    os.environ.setdefault("MAX_CHAT_HISTORY_SAVE_LENGTH", "10")
+
+    import api
+
+    # Every Mongo read of the coalesced paths goes through single-flight; delaying the work it runs simulates
+    # a remote database without touching the driver.
+    do, do_many = api.single_flight.do, api.single_flight.do_many
+
+    async def slow(produce, *keys):
+        await asyncio.sleep(args.mongo_latency)
+        return await produce(*keys)
+
+    api.single_flight.do = lambda ns, key, produce: do(ns, key, lambda: slow(produce))
+    api.single_flight.do_many = lambda ns, keys, produce_many: do_many(ns, keys, lambda ids: slow(produce_many, ids))
+
+    mongo = MongoClient(os.environ["MONGO_URL"])[os.environ["DB_NAME"]]
+    server = ServerThread(api.app).start()
+    questions = {str(i + 1): f"Question {i + 1}?" for i in range(5)}
+    rows, created = [], {"transcripts": [], "projects": [], "chatsessions": []}
+    try:
+        for enabled in (False, True):
+            api.single_flight.enabled = enabled
+            text = f"spk_0: We mostly export the weekly report ({enabled}).\nspk_1: The dashboard is slow.\n" * 100
+            tid = mongo.transcripts.insert_one({"text": text, "questions": [f"What do you export ({enabled})?", "What is slow?"]}).inserted_id
+            pid = mongo.projects.insert_one({"projectName": "bench", "transcripts": [tid]}).inserted_id
+            sessions = mongo.chatsessions.insert_many([{
+                "chatName": "bench", "chat_type": "transcript", "project_id": None, "transcript_id": str(tid),
+                "history": [], "conversation": [], "num_interactions": 0, "delete_time": None,
+            } for _ in range(args.requests)]).inserted_ids
+            created["transcripts"].append(tid)
+            created["projects"].append(pid)
+            created["chatsessions"].extend(sessions)
+
+            runs = [
+                ("grid (single transcript)", [("POST", f"{server.url}/get-all-answer-single-transcript-grid/{tid}",
+                                               {"question": questions})] * args.requests),
+                ("generate-transcript-questions", [("POST", f"{server.url}/generate-transcript-questions/{tid}", None)] * args.requests),
+                ("generate-questions", [("POST", f"{server.url}/generate-questions/{pid}", {"num_q": 10})] * args.requests),
+                ("chat (transcript cache misses)", [("POST", f"{server.url}/chat/{sid}", {"question": "What is slow?", "top_n": 1})
+                                                    for sid in sessions]),
+            ]
+            for label, requests in runs:
+                before = {ns: dict(c) for ns, c in api.single_flight.stats()["namespaces"].items()}
+                calls = fake_app.state.calls
+                latencies = asyncio.run(burst(requests))
+                after = api.single_flight.stats()["namespaces"]
+                reads = sum(c["flights"] - before.get(ns, {}).get("flights", 0) for ns, c in after.items()
+                            if ns in ("transcript", "project_question_clusters"))
+                rows.append((label, "on" if enabled else "off", len(requests), reads, fake_app.state.calls - calls,
+                             f"{percentile(latencies, 50):.2f}", f"{max(latencies):.2f}"))
+        stats = api.single_flight.stats()
+    finally:
+        server.stop()
+        fake.stop()
+        for collection, ids in created.items():
+            mongo[collection].delete_many({"_id": {"$in": ids}})
+        mongo.answercache.delete_many({})
+        mongo.questionaggregates.delete_many({})
+
+    print(f"{args.requests} identical concurrent requests, LLM latency {args.latency}s, Mongo latency {args.mongo_latency}s")
+    print_table(["endpoint", "single-flight", "requests", "Mongo read rounds", "LLM calls", "p50 s", "max s"], rows)
+    print("single_flight: " + ", ".join(f"{ns} {c['requests']} requests / {c['flights']} flights"
+                                        for ns, c in stats["namespaces"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark for the zero-temp-file Sarvam pipeline.
+
+Generates a large mp4 (about ``--size-mb`` MB, index at the end of the file), serves it from a fake S3 in a
+separate process and transcribes it twice, each run in a fresh child process:
+
+    - download: ``s3_to_temp`` followed by ``transcribe_audio_sarvam`` (temp download, extracted mp3, chunk files)
+    - streaming: ``transcribe_s3_sarvam_streaming`` (S3 -> ffmpeg -> in-memory chunks)
+
+For each run it reports bytes written to disk by the process and its ffmpeg children, the peak size of the
+scratch folders during the run, and peak RSS.
+
+Usage:
+    python testfiles/bench_streaming.py [--size-mb 1024] [--video /path/to/cached.mp4]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import ffmpeg
+
+from bench_utils import ServerProcess, fake_transcription_app, print_table
+
+
+def make_video(path, size_mb):
+    # testsrc2 at 720p with mpeg4 -q:v 1 comes out at about 1.6 MB per second of video.
+    seconds = max(10, int(size_mb / 1.6))
+    video = ffmpeg.input(f"testsrc2=size=1280x720:rate=30:duration={seconds}", f="lavfi")
+    audio = ffmpeg.input(f"aevalsrc='0.5*sin(2*PI*440*t)*lt(mod(t,9.5),8)':s=16000:d={seconds}", f="lavfi")
+    ffmpeg.output(video, audio, path, vcodec="mpeg4", acodec="aac", **{"q:v": 1}).overwrite_output().run(quiet=True)
+
+
+def folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def child(mode, fake_url):
+    os.environ["AWS_S3_ENDPOINT_URL"] = fake_url
+    os.environ["SARVAM_API_URL"] = f"{fake_url}/_sarvam"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    import utils
+
+    scratch = os.getcwd()
+    peak = [0]
+    done = threading.Event()
+
+    def watch():
+        while not done.is_set():
+            peak[0] = max(peak[0], folder_size(scratch))
+            time.sleep(0.05)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    start = time.perf_counter()
+    if mode == "download":
+        path = utils.s3_to_temp("s3://bench/video.mp4")
+        transcript = utils.transcribe_audio_sarvam(path, "mp4", "en-IN")
+        if os.path.exists(path):
+            os.remove(path)
+    else:
+        transcript = utils.transcribe_s3_sarvam_streaming("s3://bench/video.mp4", "mp4", "en-IN")
+    elapsed = time.perf_counter() - start
+    done.set()
+    watcher.join()
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    print(json.dumps({
+        "elapsed": elapsed,
+        "disk_written": (own.ru_oublock + children.ru_oublock) * 512,
+        "peak_scratch": peak[0],
+        "peak_rss": max(own.ru_maxrss, children.ru_maxrss) * 1024,
+        "entries": len(transcript),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, default=1024)
+    parser.add_argument("--video", help="reuse (or create) the test video at this path")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--fake-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.fake_url)
+        return
+
+    work_dir = tempfile.mkdtemp()
+    video = args.video or os.path.join(work_dir, "video.mp4")
+    if not os.path.exists(video):
+        make_video(video, args.size_mb)
+
+    video_mb = os.path.getsize(video) / 2**20
+    fake = ServerProcess(fake_transcription_app, objects={"bench/video.mp4": video}, sarvam_latency=0.2).start()
+    rows = []
+    try:
+        for mode in ["download", "streaming"]:
+            scratch = tempfile.mkdtemp(dir=work_dir)
+            env = dict(os.environ, TMPDIR=scratch)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, "--fake-url", fake.url],
+                cwd=scratch, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            rows.append((mode, f"{result['elapsed']:.1f}", f"{result['disk_written'] / 2**20:.1f}",
+                         f"{result['peak_scratch'] / 2**20:.1f}", f"{result['peak_rss'] / 2**20:.1f}", result["entries"]))
+    finally:
+        fake.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Input video: {video_mb:.0f} MB")
+    print_table(["mode", "wall s", "disk written MB", "peak scratch MB", "peak RSS MB", "entries"], rows)
+
+
+if __name__ == "__main__":
+    main()
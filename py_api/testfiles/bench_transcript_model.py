@@ -0,0 +1,165 @@
+"""
+Building, storing and slicing long diarized transcripts: the old ``speaker: text`` strings against ``Transcript``.
+
+For each length in ``--hours``, makes the diarized output of a recording of that length (one turn every
+``--turn-seconds`` on average, two speakers, about 2.5 words per second) in the shape of both backends (Sarvam
+entries and AWS Transcribe ``audio_segments``), then measures:
+
+    - build: what ``transcribe_aws`` / ``transcribe_audio_sarvam`` did before (``+=`` per segment, and
+      ``format_diarized_entries``), keeping the entries as a list of dicts (the only way to keep the times
+      before), and ``Transcript.from_aws`` / ``Transcript.from_sarvam``
+    - memory: peak and retained Python allocations of the build (``tracemalloc``), without the backend output
+    - storage: BSON size of the text alone (no times), of the entries and of ``Transcript.to_document()``
+    - use: rendering ``to_text()`` (first call, then cached), loading the document, and finding the turns of a
+      one-minute window (scanning the entries against ``Transcript.between`` and ``slice``)
+
+Every build is checked to render the same text as the old code.
+
+Usage:
+    python testfiles/bench_transcript_model.py [--hours 1 10] [--turn-seconds 3] [--repeat 5]
+"""
+
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+import bson
+
+from bench_utils import print_table
+from transcript import Transcript
+
+WORDS = ("the export report dashboard filter team weekly slow because we usually need quarterly numbers before "
+         "review and then someone asks again so I open three screens to check it myself").split()
+
+
+def make_entries(hours, turn_seconds, rng):
+    entries, position = [], 0.0
+    while position < hours * 3600:
+        length = rng.uniform(0.3, 1.7) * turn_seconds
+        words = max(1, int(length * 2.5))
+        entries.append({
+            "speaker_id": f"SPEAKER_0{rng.randint(0, 1)}", "transcript": " ".join(rng.choices(WORDS, k=words)),
+            "start_time_seconds": round(position, 2), "end_time_seconds": round(position + length, 2),
+        })
+        position += length + rng.uniform(0.1, 0.8)
+    return entries
+
+
+def to_segments(entries):
+    return [{"id": i, "speaker_label": e["speaker_id"].replace("SPEAKER_0", "spk_"), "transcript": e["transcript"],
+             "start_time": f"{e['start_time_seconds']:.3f}", "end_time": f"{e['end_time_seconds']:.3f}", "items": []}
+            for i, e in enumerate(entries)]
+
+
+def legacy_aws(segments):
+    transcript_text = ""
+    for item in segments:
+        if 'speaker_label' in item:
+            speaker = item['speaker_label']
+            transcript = item['transcript']
+            transcript_text += f"{speaker}: {transcript}\n"
+    return transcript_text
+
+
+def legacy_aws_kept(segments):
+    # The text plus the segments as dicts with their times, the only way to keep them without a model.
+    kept = [{"speaker": s["speaker_label"], "start_ms": int(float(s["start_time"]) * 1000),
+             "end_ms": int(float(s["end_time"]) * 1000), "text": s["transcript"]} for s in segments if "speaker_label" in s]
+    return legacy_aws(segments), kept
+
+
+def legacy_sarvam(entries):
+    return "".join(f"{entry.get('speaker_id', 'Unknown Speaker')}: {entry.get('transcript')} \n" for entry in entries)
+
+
+def measure(build, source, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build(source)
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(source)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(times), peak - before, retained - before
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def window_scan(kept, start_ms, end_ms):
+    return [turn for turn in kept if turn["start_ms"] < end_ms and turn["end_ms"] > start_ms]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--turn-seconds", type=float, default=3.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    build_rows, use_rows = [], []
+    for hours in args.hours:
+        entries = make_entries(hours, args.turn_seconds, rng)
+        segments = to_segments(entries)
+        window = (int(hours * 3600 * 1000 * 0.7), int(hours * 3600 * 1000 * 0.7) + 60000)
+        label = f"{hours:g} h / {len(entries):,} turns"
+
+        cases = (
+            ("aws", "+= text", legacy_aws, segments),
+            ("aws", "+= text + dicts", legacy_aws_kept, segments),
+            ("aws", "Transcript", Transcript.from_aws, segments),
+            ("sarvam", "join text", legacy_sarvam, entries),
+            ("sarvam", "Transcript", Transcript.from_sarvam, entries),
+        )
+        results = {}
+        for backend, name, build, source in cases:
+            result, seconds, peak, retained = measure(build, source, args.repeat)
+            results[backend, name] = result
+            if isinstance(result, Transcript):
+                stored = bson.encode(result.to_document())
+                expected = results[backend, "+= text" if backend == "aws" else "join text"]
+                assert result.to_text() == expected, f"{backend} rendering differs from the old text"
+            elif isinstance(result, tuple):
+                stored = bson.encode({"transcript": result[0], "turns": result[1]})
+            else:
+                stored = bson.encode({"transcript": result})
+            build_rows.append((label, backend, name, f"{1000 * seconds:.1f}", f"{peak / 2**20:.1f}",
+                               f"{retained / 2**20:.1f}", f"{len(stored) / 2**20:.2f}"))
+
+        transcript = results["aws", "Transcript"]
+        text, kept = results["aws", "+= text + dicts"]
+        document = bson.encode(transcript.to_document())
+        _, render_first = timed(lambda: Transcript.from_document(bson.decode(document)).to_text(), 1)
+        _, render_cached = timed(transcript.to_text, args.repeat)
+        _, load = timed(lambda: Transcript.from_document(bson.decode(document)), args.repeat)
+        _, load_dicts = timed(lambda: bson.decode(bson.encode({"transcript": text, "turns": kept})), args.repeat)
+        scanned, scan = timed(lambda: window_scan(kept, *window), args.repeat)
+        found, between = timed(lambda: transcript.between(*window), args.repeat)
+        part, sliced = timed(lambda: transcript.slice(*window), args.repeat)
+        assert [t["text"] for t in scanned] == [transcript[i][3] for i in found] == [turn[3] for turn in part]
+        use_rows.append((label, f"{1000 * render_first:.1f}", f"{1000 * render_cached:.3f}", f"{1000 * load:.1f}",
+                         f"{1000 * load_dicts:.1f}", f"{1e6 * scan:.0f}", f"{1e6 * between:.0f}", f"{1e6 * sliced:.0f}",
+                         len(found)))
+
+    print(f"Python {sys.version.split()[0]}, one turn every ~{args.turn_seconds:g}s, best of {args.repeat}")
+    print_table(["recording", "backend", "build", "build ms", "peak MiB", "retained MiB", "BSON MiB"], build_rows)
+    print()
+    print_table(["recording", "to_text ms (load+render)", "to_text ms (cached)", "load doc ms", "load dicts ms",
+                 "1-min window scan us", "between us", "slice us", "turns in window"], use_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark for copying bot recordings from a presigned URL into S3.
+
+Serves a generated file of ``--size-mb`` MB from a fake S3 (which doubles as the presigned-URL host) in a
+separate process, with a simulated per-connection upload bandwidth, then copies it three ways, each in a fresh
+child process:
+
+    - temp-file: the previous endpoint code (async download to ``./temp/``, then ``upload_fileobj``)
+    - stream: ``stream_url_to_s3`` (blocking, parts uploaded from a thread pool)
+    - stream-async: ``stream_url_to_s3_async`` on an event loop, which also reports the worst event loop stall
+
+Reports wall time, bytes written to disk, peak RSS, part retries and whether the stored copy is intact.
+
+Usage:
+    python testfiles/bench_upload.py [--size-mb 256] [--part-mb 8] [--concurrency 8] [--mbps 200] [--error-rate 0.05]
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+import httpx
+import requests
+
+from bench_utils import ServerProcess, fake_transcription_app, print_table
+
+
+def make_file(path, size_mb):
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+
+def disk_writes():
+    with open("/proc/self/io") as f:
+        return int(next(line for line in f if line.startswith("write_bytes")).split()[1])
+
+
+async def temp_file_copy(s3, url, key):
+    # The pre-streaming endpoint body.
+    os.makedirs("./temp/", exist_ok=True)
+    path = os.path.join("./temp/", "recording")
+    try:
+        async with httpx.AsyncClient(timeout=60) as http:
+            async with http.stream("GET", url) as response:
+                with open(path, "wb") as file:
+                    async for chunk in response.aiter_bytes(chunk_size=8192):
+                        file.write(chunk)
+        with open(path, "rb") as file:
+            await asyncio.to_thread(s3.upload_fileobj, file, "bench", key)
+    finally:
+        os.remove(path)
+    return {"part_retries": "-"}
+
+
+async def watch_loop(stop, lag):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lag[0] = max(lag[0], time.perf_counter() - t0 - 0.01)
+
+
+async def run_async(mode, s3, url, key, args):
+    import s3upload
+
+    stop, lag = asyncio.Event(), [0.0]
+    watcher = asyncio.create_task(watch_loop(stop, lag))
+    try:
+        if mode == "temp-file":
+            summary = await temp_file_copy(s3, url, key)
+        else:
+            async with httpx.AsyncClient(timeout=60) as http:
+                summary = await s3upload.stream_url_to_s3_async(url, s3, "bench", key, http, args.part_mb * 1024 * 1024, args.concurrency)
+    finally:
+        stop.set()
+        await watcher
+    return summary, lag[0]
+
+
+def child(mode, fake_url, args, results):
+    os.environ["AWS_S3_ENDPOINT_URL"] = fake_url
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    import utils
+    import s3upload
+
+    s3 = utils.aws_client("s3")
+    url = f"{fake_url}/bench/recording.mp4"
+    key = f"copies/{mode}.mp4"
+    writes = disk_writes()
+    started = time.perf_counter()
+    if mode == "stream":
+        summary = s3upload.stream_url_to_s3(url, s3, "bench", key, requests.Session(), args.part_mb * 1024 * 1024, args.concurrency)
+        lag = None
+    else:
+        summary, lag = asyncio.run(run_async(mode, s3, url, key, args))
+    elapsed = time.perf_counter() - started
+    disk_mb = (disk_writes() - writes) / 1e6
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    digest = hashlib.md5()
+    for block in s3.get_object(Bucket="bench", Key=key)["Body"].iter_chunks(1024 * 1024):
+        digest.update(block)
+    results[mode] = {
+        "seconds": elapsed,
+        "disk_mb": disk_mb,
+        "rss_mb": rss_mb,
+        "retries": summary["part_retries"],
+        "loop_lag_ms": None if lag is None else lag * 1000,
+        "md5": digest.hexdigest(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--part-mb", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mbps", type=float, default=200, help="simulated upload bandwidth per S3 connection")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fraction of part uploads that fail")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_upload_")
+    source = os.path.join(scratch, "recording.mp4")
+    make_file(source, args.size_mb)
+    expected = hashlib.md5()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            expected.update(block)
+    expected = expected.hexdigest()
+
+    bytes_per_second = args.mbps * 1e6 / 8
+    server = ServerProcess(
+        fake_transcription_app,
+        objects={"bench/recording.mp4": source},
+        s3_put_latency=lambda size: 0.02 + size / bytes_per_second,
+        s3_put_error_rate=args.error_rate,
+    ).start()
+
+    os.chdir(scratch)
+    rows = []
+    try:
+        with multiprocessing.Manager() as manager:
+            results = manager.dict()
+            for mode in ("temp-file", "stream", "stream-async"):
+                process = multiprocessing.get_context("fork").Process(target=child, args=(mode, server.url, args, results))
+                process.start()
+                process.join()
+                if mode not in results:
+                    rows.append((mode, "failed", "", "", "", "", ""))
+                    continue
+                r = results[mode]
+                rows.append((mode, f"{r['seconds']:.2f}", f"{r['disk_mb']:.0f}", f"{r['rss_mb']:.0f}", r["retries"],
+                             "-" if r["loop_lag_ms"] is None else f"{r['loop_lag_ms']:.0f}", r["md5"] == expected))
+    finally:
+        server.stop()
+
+    print_table(["mode", "seconds", "disk MB", "peak RSS MB", "part retries", "max loop lag ms", "intact"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+"""
+Shared helpers for the manual benchmark scripts in this folder.
+
+Provides a fake OpenAI-compatible server with configurable latency and error injection, a fake transcription
+backend (AWS Transcribe JSON API, S3 object reads and uploads, and the Sarvam speech-to-text endpoint), a
+small Redis-protocol server, a helper that runs an ASGI app under uvicorn in a background thread, and small timing/reporting helpers. The benchmarks add the
+parent folder to ``sys.path`` through this module so they can import ``api`` and ``utils`` directly.
+"""
+
+import os
+import sys
+import json
+import uuid
+import time
+import socket
+import random
+import hashlib
+import asyncio
+import threading
+import multiprocessing
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port():
+    """
+    Returns a free TCP port on localhost.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    """
+    Runs an ASGI app with a single uvicorn worker in a daemon thread.
+    """
+    def __init__(self, app, port=None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", workers=1)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+class ServerProcess:
+    """
+    Runs ``factory(**kwargs)`` under uvicorn in a separate process, so its memory is not counted in the
+    benchmark process.
+    """
+    def __init__(self, factory, port=None, **kwargs):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = multiprocessing.get_context("fork").Process(target=self._serve, args=(factory, kwargs), daemon=True)
+
+    def _serve(self, factory, kwargs):
+        uvicorn.run(factory(**kwargs), host="127.0.0.1", port=self.port, log_level="warning")
+
+    def start(self):
+        self.process.start()
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.1):
+                    return self
+            except OSError:
+                time.sleep(0.05)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(timeout=5)
+
+
+def fake_openai_app(latency=0.2, content="{}", stream_tokens=20, token_interval=0.01, error_rate=0.0, error_status=429,
+                    latency_per_1k_tokens=0.0, context_tokens=None, slow_rate=0.0, slow_latency=0.0,
+                    requests_per_second=None):
+    """
+    Builds a fake OpenAI-compatible server exposing ``/v1/chat/completions``.
+
+    Settings live on ``app.state`` so a benchmark can change them between runs.
+
+    Args:
+        latency (float): Seconds to wait before answering (or before the first streamed token).
+        content (str | callable): Reply text, or a callable taking the request body and returning the text.
+        stream_tokens (int): Number of chunks a streamed reply is split into.
+        token_interval (float): Seconds between streamed chunks.
+        error_rate (float): Probability of answering with ``error_status`` instead of a completion.
+        error_status (int): HTTP status used for injected errors.
+        latency_per_1k_tokens (float): Extra seconds per 1000 prompt tokens (prompt processing time).
+        context_tokens (int, optional): Context size; longer prompts get a 400 ``context_length_exceeded``.
+        slow_rate (float): Probability of a straggler answering after ``slow_latency`` extra seconds.
+        slow_latency (float): Extra seconds of a straggler.
+        requests_per_second (int, optional): Rate limit; requests above it within a second get a 429.
+
+    Returns:
+        FastAPI: The fake server app. ``app.state.calls`` counts the requests received and
+        ``app.state.rate_limited`` those rejected by ``requests_per_second``.
+    """
+    app = FastAPI()
+    app.state.latency = latency
+    app.state.content = content
+    app.state.stream_tokens = stream_tokens
+    app.state.token_interval = token_interval
+    app.state.error_rate = error_rate
+    app.state.error_status = error_status
+    app.state.latency_per_1k_tokens = latency_per_1k_tokens
+    app.state.context_tokens = context_tokens
+    app.state.slow_rate = slow_rate
+    app.state.slow_latency = slow_latency
+    app.state.requests_per_second = requests_per_second
+    app.state.window = [0, 0]
+    app.state.calls = 0
+    app.state.rate_limited = 0
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        state = request.app.state
+        state.calls += 1
+        if state.requests_per_second:
+            second = int(time.monotonic())
+            if state.window[0] != second:
+                state.window[:] = [second, 0]
+            state.window[1] += 1
+            if state.window[1] > state.requests_per_second:
+                state.rate_limited += 1
+                return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests",
+                                               "code": "rate_limit_exceeded"}}, status_code=429)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        if state.context_tokens and prompt_tokens + body.get("max_tokens", 0) > state.context_tokens:
+            return JSONResponse({"error": {"message": f"This model's maximum context length is {state.context_tokens} tokens.",
+                                           "type": "invalid_request_error", "code": "context_length_exceeded"}}, status_code=400)
+        slow = state.slow_latency if random.random() < state.slow_rate else 0.0
+        await asyncio.sleep(state.latency + slow + state.latency_per_1k_tokens * prompt_tokens / 1000)
+        if random.random() < state.error_rate:
+            return JSONResponse({"error": {"message": "injected error", "type": "fake"}}, status_code=state.error_status)
+
+        text = state.content(body) if callable(state.content) else state.content
+        model = body.get("model", "fake-model")
+
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4, "total_tokens": prompt_tokens + len(text) // 4},
+            }
+
+        step = max(1, len(text) // max(1, state.stream_tokens))
+        pieces = [text[i:i + step] for i in range(0, len(text), step)] or [""]
+
+        async def events():
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(state.token_interval)
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def fake_transcription_app(objects=None, transcribe_seconds=2.0, sarvam_latency=0.5, s3_put_latency=0.0, s3_put_error_rate=0.0):
+    """
+    Builds a fake transcription backend.
+
+    Point ``AWS_TRANSCRIBE_ENDPOINT_URL`` and ``AWS_S3_ENDPOINT_URL`` at the server root and ``SARVAM_API_URL``
+    at ``/_sarvam``. Every transcript mentions the media it was produced from, so callers can check that
+    concurrent jobs got their own result.
+
+    Args:
+        objects (dict, optional): S3 objects served by the fake, keyed by ``"bucket/key"``. Values are bytes,
+            or a path to a file on disk for large objects. Uploads (single and multipart) are stored here too.
+        transcribe_seconds (float | callable): Time a Transcribe job stays in progress, or a callable taking
+            the media URI and returning that time.
+        sarvam_latency (float | callable): Seconds the Sarvam endpoint takes to answer, or a callable taking
+            the uploaded byte count and returning that time.
+        s3_put_latency (float | callable): Seconds an S3 upload (single or part) takes, or a callable taking
+            the uploaded byte count and returning that time.
+        s3_put_error_rate (float): Fraction of S3 part uploads answered with a 500 error.
+
+    Returns:
+        FastAPI: The fake app. ``app.state`` exposes ``objects``, ``jobs``, ``calls`` (per operation) and
+        ``callbacks`` (bodies posted to ``/_callback``).
+    """
+    app = FastAPI()
+    app.state.objects = objects if objects is not None else {}
+    app.state.jobs = {}
+    app.state.calls = {}
+    app.state.callbacks = []
+    app.state.uploads = {}
+    app.state.transcribe_seconds = transcribe_seconds
+    app.state.sarvam_latency = sarvam_latency
+    app.state.s3_put_latency = s3_put_latency
+    app.state.s3_put_error_rate = s3_put_error_rate
+
+    def job_view(job, base_url):
+        status = "COMPLETED" if time.time() >= job["done_at"] else "IN_PROGRESS"
+        view = {
+            "TranscriptionJobName": job["name"],
+            "TranscriptionJobStatus": status,
+            "CreationTime": job["created_at"],
+            "Media": {"MediaFileUri": job["uri"]},
+        }
+        if status == "COMPLETED":
+            view["CompletionTime"] = job["done_at"]
+            view["Transcript"] = {"TranscriptFileUri": f"{base_url}_transcripts/{job['name']}.json"}
+        return view
+
+    @app.post("/")
+    async def transcribe(request: Request):
+        operation = request.headers.get("x-amz-target", "").split(".")[-1]
+        body = await request.json()
+        state = request.app.state
+        state.calls[operation] = state.calls.get(operation, 0) + 1
+        base_url = str(request.base_url)
+
+        if operation == "StartTranscriptionJob":
+            seconds = state.transcribe_seconds
+            seconds = seconds(body["Media"]["MediaFileUri"]) if callable(seconds) else seconds
+            job = {"name": body["TranscriptionJobName"], "uri": body["Media"]["MediaFileUri"], "created_at": time.time()}
+            job["done_at"] = job["created_at"] + seconds
+            state.jobs[job["name"]] = job
+            return JSONResponse({"TranscriptionJob": job_view(job, base_url)}, media_type="application/x-amz-json-1.1")
+
+        if operation == "GetTranscriptionJob":
+            job = state.jobs.get(body["TranscriptionJobName"])
+            if job is None:
+                return JSONResponse({"__type": "BadRequestException", "message": "job not found"}, status_code=400)
+            return JSONResponse({"TranscriptionJob": job_view(job, base_url)}, media_type="application/x-amz-json-1.1")
+
+        if operation == "ListTranscriptionJobs":
+            views = [job_view(job, base_url) for job in sorted(state.jobs.values(), key=lambda j: -j["created_at"])]
+            views = [v for v in views if body.get("JobNameContains", "") in v["TranscriptionJobName"]]
+            if body.get("Status"):
+                views = [v for v in views if v["TranscriptionJobStatus"] == body["Status"]]
+            offset = int(body.get("NextToken") or 0)
+            limit = body.get("MaxResults", 100)
+            page = {"TranscriptionJobSummaries": views[offset:offset + limit]}
+            if offset + limit < len(views):
+                page["NextToken"] = str(offset + limit)
+            return JSONResponse(page, media_type="application/x-amz-json-1.1")
+
+        return JSONResponse({"__type": "UnknownOperationException"}, status_code=400)
+
+    @app.get("/_transcripts/{name}.json")
+    async def transcript_file(name: str, request: Request):
+        job = request.app.state.jobs[name]
+        segments = [
+            {"speaker_label": "spk_0", "transcript": f"Transcript of {job['uri']}", "start_time": "0.0", "end_time": "1.5"},
+            {"speaker_label": "spk_1", "transcript": "Thanks for having me.", "start_time": "1.5", "end_time": "3.0"},
+        ]
+        return {"jobName": name, "results": {"audio_segments": segments}}
+
+    @app.post("/_sarvam")
+    async def sarvam(request: Request):
+        form = await request.form()
+        upload = form["file"]
+        data = await upload.read()
+        state = request.app.state
+        state.calls["sarvam"] = state.calls.get("sarvam", 0) + 1
+        latency = state.sarvam_latency(len(data)) if callable(state.sarvam_latency) else state.sarvam_latency
+        await asyncio.sleep(latency)
+        entries = [
+            {"speaker_id": "speaker_0", "transcript": f"Transcript of {upload.filename} ({len(data)} bytes)", "start_time_seconds": 0.0, "end_time_seconds": 1.5},
+            {"speaker_id": "speaker_1", "transcript": "Thanks for having me.", "start_time_seconds": 1.5, "end_time_seconds": 3.0},
+        ]
+        return {"transcript": " ".join(e["transcript"] for e in entries), "diarized_transcript": {"entries": entries}}
+
+    @app.post("/_callback")
+    async def callback(request: Request):
+        request.app.state.callbacks.append(await request.json())
+        return {"ok": True}
+
+    @app.api_route("/{bucket}/{key:path}", methods=["PUT", "POST", "DELETE"])
+    async def s3_write(bucket: str, key: str, request: Request):
+        state = request.app.state
+        name, params = f"{bucket}/{key}", request.query_params
+        state.calls[f"s3_{request.method.lower()}"] = state.calls.get(f"s3_{request.method.lower()}", 0) + 1
+        if request.method == "DELETE":
+            state.objects.pop(name, None)
+            return Response(status_code=204)
+        if request.method == "POST" and "uploads" in params:
+            upload_id = uuid.uuid4().hex
+            state.uploads[upload_id] = {}
+            body = (f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                    f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+            return Response(content=body, media_type="application/xml")
+        if request.method == "POST" and "uploadId" in params:
+            parts = state.uploads.pop(params["uploadId"])
+            state.objects[name] = b"".join(parts[number] for number in sorted(parts))
+            body = f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>\"done\"</ETag></CompleteMultipartUploadResult>"
+            return Response(content=body, media_type="application/xml")
+        data = await request.body()
+        latency = state.s3_put_latency(len(data)) if callable(state.s3_put_latency) else state.s3_put_latency
+        await asyncio.sleep(latency)
+        if "uploadId" in params and random.random() < state.s3_put_error_rate:
+            state.calls["s3_put_errors"] = state.calls.get("s3_put_errors", 0) + 1
+            body = "<Error><Code>InternalError</Code><Message>injected failure</Message></Error>"
+            return Response(content=body, status_code=500, media_type="application/xml")
+        if "uploadId" in params:
+            state.uploads[params["uploadId"]][int(params["partNumber"])] = data
+        else:
+            state.objects[name] = data
+        return Response(status_code=200, headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+
+    @app.api_route("/{bucket}/{key:path}", methods=["GET", "HEAD"])
+    async def s3_object(bucket: str, key: str, request: Request):
+        data = request.app.state.objects.get(f"{bucket}/{key}")
+        if data is None:
+            return Response(status_code=404)
+        size = os.path.getsize(data) if isinstance(data, str) else len(data)
+        headers = {"ETag": f'"{hash(data) & 0xffffffff:08x}"', "Accept-Ranges": "bytes"}
+        first, last, status = 0, size - 1, 200
+        byte_range = request.headers.get("range")
+        if byte_range:
+            first, last = byte_range.split("=")[1].split("-")
+            first, last = int(first), min(int(last) if last else size - 1, size - 1)
+            headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+            status = 206
+        headers["Content-Length"] = str(last - first + 1)
+        if request.method == "HEAD":
+            return Response(status_code=status, headers=headers)
+        if not isinstance(data, str):
+            return Response(content=data[first:last + 1], status_code=status, headers=headers, media_type="application/octet-stream")
+
+        def read_file():
+            with open(data, "rb") as f:
+                f.seek(first)
+                remaining = last - first + 1
+                while remaining > 0:
+                    block = f.read(min(1024 * 1024, remaining))
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    yield block
+
+        return StreamingResponse(read_file(), status_code=status, headers=headers, media_type="application/octet-stream")
+
+    return app
+
+
+class FakeRedisProcess:
+    """
+    Runs a small Redis-protocol server in a separate process, standing in for Redis in the cache benchmarks.
+
+    Supports the commands the cache uses (``GET``, ``SET`` with ``PX``/``EX``, ``DEL``, ``EXISTS``, ``INFO``,
+    ``PING``, ``HELLO``, ``DBSIZE``, ``FLUSHALL``) and evicts least recently used keys once the stored values exceed
+    ``maxmemory`` bytes (0 = unbounded).
+    """
+    def __init__(self, port=None, maxmemory=0):
+        self.port = port or free_port()
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+        self.maxmemory = maxmemory
+        self.process = multiprocessing.get_context("fork").Process(target=self._serve, daemon=True)
+
+    def _serve(self):
+        from collections import OrderedDict
+
+        store = OrderedDict()  # key -> (value, expires_at)
+        used = [0]
+
+        def drop(key):
+            value, _ = store.pop(key)
+            used[0] -= len(value)
+
+        def lookup(key):
+            entry = store.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                drop(key)
+                entry = None
+            if entry is not None:
+                store.move_to_end(key)
+            return entry
+
+        def execute(command, args, connection):
+            def bulk(value):
+                if value is None:
+                    return b"_\r\n" if connection["proto"] == 3 else b"$-1\r\n"
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+
+            if command == b"PING":
+                return b"+PONG\r\n"
+            if command == b"GET":
+                entry = lookup(args[0])
+                return bulk(entry and entry[0])
+            if command == b"SET":
+                key, value, expires_at = args[0], args[1], None
+                options = [a.upper() for a in args[2:]]
+                if b"PX" in options:
+                    expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+                elif b"EX" in options:
+                    expires_at = time.monotonic() + int(args[2 + options.index(b"EX") + 1])
+                if key in store:
+                    drop(key)
+                store[key] = (value, expires_at)
+                used[0] += len(value)
+                while self.maxmemory and used[0] > self.maxmemory and len(store) > 1:
+                    drop(next(iter(store)))
+                return b"+OK\r\n"
+            if command in (b"DEL", b"EXISTS"):
+                found = [key for key in args if lookup(key) is not None]
+                if command == b"DEL":
+                    for key in found:
+                        drop(key)
+                return b":%d\r\n" % len(found)
+            if command == b"DBSIZE":
+                return b":%d\r\n" % len(store)
+            if command == b"FLUSHALL":
+                store.clear()
+                used[0] = 0
+                return b"+OK\r\n"
+            if command == b"INFO":
+                return bulk(f"# Memory\r\nused_memory:{used[0]}\r\nmaxmemory:{self.maxmemory}\r\n".encode())
+            if command == b"HELLO":
+                connection["proto"] = int(args[0] if args else 2)
+                return b"%%1\r\n$5\r\nproto\r\n:%d\r\n" % int(args[0] if args else 2)
+            if command in (b"CLIENT", b"SELECT"):
+                return b"+OK\r\n"
+            return b"-ERR unknown command '%s'\r\n" % command
+
+        async def handle(reader, writer):
+            connection = {"proto": 2}
+            try:
+                while True:
+                    header = await reader.readline()
+                    if not header:
+                        break
+                    args = []
+                    for _ in range(int(header[1:])):
+                        length = int((await reader.readline())[1:])
+                        args.append((await reader.readexactly(length + 2))[:-2])
+                    writer.write(execute(args[0].upper(), args[1:], connection))
+                    await writer.drain()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            writer.close()
+
+        async def serve():
+            server = await asyncio.start_server(handle, "127.0.0.1", self.port)
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(serve())
+
+    def start(self):
+        self.process.start()
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.1):
+                    return self
+            except OSError:
+                time.sleep(0.05)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(timeout=5)
+
+
+def percentile(values, p):
+    """
+    Returns the ``p``-th percentile (0-100) of ``values`` using nearest-rank.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def print_table(headers, rows):
+    """
+    Prints ``rows`` as a fixed-width table under ``headers``.
+    """
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
@@ -0,0 +1,336 @@
+"""
+This module provides the structured form of a diarized transcript: speaker turns with their times, kept in
+arrays over one shared text buffer.
+
+A ``Transcript`` stores, per turn, the index of its speaker, its start and end in milliseconds and its end offset
+in a buffer holding the text of all turns back to back. Building one appends to lists and joins the buffer once,
+so it takes linear time however long the recording is, and a turn costs a few array slots instead of a
+dictionary. The ``speaker: text`` rendering used by the rest of the service is produced on demand by
+``to_text`` (and kept), and is identical to what the transcription backends produced before.
+
+``between`` finds the turns of a time range by bisection over the start times (a linear scan if the backend
+returned them out of order), without parsing the text, and ``spans`` gives the position of every turn in the
+rendered text, for citations.
+
+In Mongo, a transcript is one document with the speakers, the buffer and the arrays as binary fields
+(``to_document`` / ``from_document``). ``TranscriptTurns`` keeps them in the ``transcriptturns`` collection, one
+document per transcript id.
+
+Environment:
+    - ``TRANSCRIPT_TURNS``: ``on`` (default) or ``off`` (the structured turns of new transcripts are not stored).
+
+Classes:
+    - Transcript: Speaker turns with times over one shared text buffer.
+    - TranscriptTurns: Stores and loads the structured turns of transcripts.
+"""
+
+import os
+import sys
+from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+
+DOCUMENT_SCHEMA = 1
+NO_SPEAKER = -1
+NO_TIME = -1
+UNKNOWN_SPEAKER = "Unknown Speaker"
+
+
+def _to_bytes(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _milliseconds(seconds):
+    if seconds is None or seconds == "":
+        return NO_TIME
+    return int(float(seconds) * 1000 + 0.5)
+
+
+class Transcript:
+    """
+    Speaker turns with times over one shared text buffer.
+
+    Use the ``from_*`` constructors, or ``add`` turns in time order to an empty transcript and call ``to_text``
+    once done.
+
+    Args:
+        separator (str, optional): Text ending every line of the rendering (``"\\n"``; the Sarvam rendering used
+            ``" \\n"``).
+    """
+    __slots__ = ("speakers", "speaker", "start_ms", "end_ms", "ends", "separator", "ordered", "_parts", "_buffer", "_text",
+                 "_positions")
+
+    def __init__(self, separator="\n"):
+        self.speakers = []
+        self.speaker = array("h")
+        self.start_ms = array("i")
+        self.end_ms = array("i")
+        self.ends = array("i")
+        self.separator = separator
+        self.ordered = True
+        self._parts = []
+        self._buffer = ""
+        self._text = None
+        self._positions = {}
+
+    @classmethod
+    def from_sarvam(cls, entries):
+        """
+        Builds a transcript from Sarvam diarized entries (``speaker_id``, ``transcript``, ``start_time_seconds``,
+        ``end_time_seconds``).
+        """
+        transcript = cls(separator=" \n")
+        transcript.extend((str(entry.get("speaker_id", UNKNOWN_SPEAKER)), str(entry.get("transcript")),
+                           _milliseconds(entry.get("start_time_seconds")), _milliseconds(entry.get("end_time_seconds")))
+                          for entry in entries)
+        return transcript
+
+    @classmethod
+    def from_aws(cls, segments):
+        """
+        Builds a transcript from the ``audio_segments`` of an AWS Transcribe result; segments without a speaker
+        label are left out.
+        """
+        transcript = cls()
+        transcript.extend((segment["speaker_label"], segment["transcript"],
+                           _milliseconds(segment.get("start_time")), _milliseconds(segment.get("end_time")))
+                          for segment in segments if "speaker_label" in segment)
+        return transcript
+
+    @classmethod
+    def from_document(cls, document):
+        """
+        Loads a transcript stored with ``to_document``.
+        """
+        transcript = cls(separator=document["separator"])
+        transcript.speakers = list(document["speakers"])
+        transcript.speaker = _from_bytes("h", document["speaker"])
+        transcript.start_ms = _from_bytes("i", document["start_ms"])
+        transcript.end_ms = _from_bytes("i", document["end_ms"])
+        transcript.ends = _from_bytes("i", document["ends"])
+        transcript.ordered = document.get("ordered", True)
+        transcript._buffer = document["buffer"]
+        transcript._positions = {name: i for i, name in enumerate(transcript.speakers)}
+        return transcript
+
+    def add(self, speaker, text, start_ms=NO_TIME, end_ms=NO_TIME):
+        """
+        Appends a turn.
+
+        Args:
+            speaker (str): Speaker label, or None.
+            text (str): Text of the turn.
+            start_ms (int, optional): Start of the turn in milliseconds.
+            end_ms (int, optional): End of the turn in milliseconds.
+        """
+        self.extend(((speaker, text, start_ms, end_ms),))
+
+    def extend(self, turns):
+        """
+        Appends ``(speaker, text, start_ms, end_ms)`` turns, as ``add`` does one by one.
+        """
+        positions, speakers = self._positions, self.speakers
+        speaker_append, start_append, end_append = self.speaker.append, self.start_ms.append, self.end_ms.append
+        ends_append, parts_append = self.ends.append, self._parts.append
+        offset = self.ends[-1] if self.ends else 0
+        last_start = self.start_ms[-1] if self.start_ms else NO_TIME
+        ordered = self.ordered
+        for speaker, text, start_ms, end_ms in turns:
+            if speaker is None:
+                index = NO_SPEAKER
+            else:
+                index = positions.get(speaker)
+                if index is None:
+                    index = positions[speaker] = len(speakers)
+                    speakers.append(speaker)
+            if start_ms != NO_TIME:
+                ordered = ordered and start_ms >= last_start
+                last_start = start_ms
+            offset += len(text)
+            speaker_append(index)
+            start_append(start_ms)
+            end_append(end_ms)
+            ends_append(offset)
+            parts_append(text)
+        self.ordered = ordered
+        self._text = None
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, index):
+        """
+        Returns turn ``index`` as ``(speaker, start_ms, end_ms, text)``; the speaker is None for a turn without
+        one and the times are -1 when unknown.
+        """
+        if index < 0:
+            index += len(self)
+        buffer = self.buffer
+        speaker = self.speaker[index]
+        return (self.speakers[speaker] if speaker != NO_SPEAKER else None, self.start_ms[index], self.end_ms[index],
+                buffer[self.ends[index - 1] if index else 0:self.ends[index]])
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    @property
+    def buffer(self):
+        """
+        The text of all turns back to back; turn ``i`` ends at ``ends[i]``.
+        """
+        if self._parts:
+            self._buffer += "".join(self._parts)
+            self._parts = []
+        return self._buffer
+
+    @property
+    def duration_ms(self):
+        """
+        End of the last timed turn, in milliseconds (0 without times).
+        """
+        return max(self.end_ms, default=0) if len(self) else 0
+
+    def to_text(self):
+        """
+        Returns the ``speaker: text`` rendering of the transcript, one line per turn.
+        """
+        if self._text is None:
+            buffer, names, separator = self.buffer, self.speakers, self.separator
+            start = 0
+            lines = []
+            for speaker, end in zip(self.speaker, self.ends):
+                text = buffer[start:end]
+                lines.append(f"{names[speaker]}: {text}{separator}" if speaker != NO_SPEAKER else f"{text}{separator}")
+                start = end
+            self._text = "".join(lines)
+        return self._text
+
+    def spans(self):
+        """
+        Returns the ``(start, end)`` position of every turn's text (without its label) in ``to_text()``.
+        """
+        spans = []
+        position, start = 0, 0
+        label_lengths = [len(name) + 2 for name in self.speakers]
+        for speaker, end in zip(self.speaker, self.ends):
+            position += label_lengths[speaker] if speaker != NO_SPEAKER else 0
+            spans.append((position, position + end - start))
+            position += end - start + len(self.separator)
+            start = end
+        return spans
+
+    def between(self, start_ms, end_ms):
+        """
+        Returns the indexes of the turns overlapping ``[start_ms, end_ms)``, in order; turns without times are
+        never included.
+
+        Args:
+            start_ms (int): Start of the range in milliseconds.
+            end_ms (int): End of the range in milliseconds.
+
+        Returns:
+            list: Turn indexes.
+        """
+        if self.ordered:
+            # The first candidate is the last turn starting before the range, which may still be running.
+            candidates = range(max(0, bisect_right(self.start_ms, start_ms) - 1), bisect_left(self.start_ms, end_ms))
+        else:
+            candidates = range(len(self))
+        starts, ends = self.start_ms, self.end_ms
+        return [index for index in candidates
+                if starts[index] != NO_TIME and starts[index] < end_ms and max(ends[index], starts[index] + 1) > start_ms]
+
+    def slice(self, start_ms, end_ms):
+        """
+        Returns the turns overlapping ``[start_ms, end_ms)`` as a new transcript, with their original times.
+
+        Args:
+            start_ms (int): Start of the range in milliseconds.
+            end_ms (int): End of the range in milliseconds.
+
+        Returns:
+            Transcript: The turns of the range.
+        """
+        part = Transcript(separator=self.separator)
+        part.extend((speaker, text, turn_start, turn_end)
+                    for speaker, turn_start, turn_end, text in map(self.__getitem__, self.between(start_ms, end_ms)))
+        return part
+
+    def to_document(self):
+        """
+        Returns the transcript as a compact Mongo document: the speakers, the buffer and the per-turn arrays as
+        little-endian binary fields.
+        """
+        return {
+            "schema": DOCUMENT_SCHEMA,
+            "turns": len(self),
+            "duration_ms": self.duration_ms,
+            "separator": self.separator,
+            "ordered": self.ordered,
+            "speakers": self.speakers,
+            "speaker": _to_bytes(self.speaker),
+            "start_ms": _to_bytes(self.start_ms),
+            "end_ms": _to_bytes(self.end_ms),
+            "ends": _to_bytes(self.ends),
+            "buffer": self.buffer,
+        }
+
+
+class TranscriptTurns:
+    """
+    Stores and loads the structured turns of transcripts, one ``to_document`` document per transcript id.
+
+    Args:
+        collection: Async (motor) ``transcriptturns`` collection.
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        self.enabled = os.getenv("TRANSCRIPT_TURNS", "on") != "off"
+        self.counters = {"saved": 0, "saved_turns": 0, "saved_bytes": 0, "loaded": 0, "missing": 0}
+
+    async def save(self, transcript_id, transcript):
+        """
+        Stores the turns of a transcript, replacing earlier ones.
+
+        Args:
+            transcript_id (str): Transcript id.
+            transcript (Transcript): The transcript.
+        """
+        if not self.enabled:
+            return
+        document = transcript.to_document()
+        document.update({"_id": transcript_id, "created_at": datetime.utcnow()})
+        await self.collection.replace_one({"_id": transcript_id}, document, upsert=True)
+        self.counters["saved"] += 1
+        self.counters["saved_turns"] += len(transcript)
+        self.counters["saved_bytes"] += len(document["buffer"]) + sum(
+            len(document[name]) for name in ("speaker", "start_ms", "end_ms", "ends"))
+
+    async def load(self, transcript_id):
+        """
+        Returns the stored turns of a transcript, or None if there are none (documents, transcripts made before
+        turns were stored).
+        """
+        document = await self.collection.find_one({"_id": transcript_id})
+        if document is None:
+            self.counters["missing"] += 1
+            return None
+        self.counters["loaded"] += 1
+        return Transcript.from_document(document)
+
+    def stats(self):
+        """
+        Returns the save and load counters.
+        """
+        return dict(self.counters)
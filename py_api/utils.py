@@ -2,13 +2,21 @@
 This module provides utility functions and classes for processing files, transcribing audio, and handling requests.
 
 Functions:
-    - cleanup_cache: Periodically cleans up expired cache entries for chat sessions and transcripts.
     - extract_text_from_pdf: Extracts text from a PDF file.
     - extract_text_from_docx: Extracts text from a DOCX file.
     - extract_text_from_txt: Extracts text from a TXT file.
     - extract_audio_from_video: Extracts audio from a video file.
+    - sarvam_request: Sends one audio file to the Sarvam API and returns its diarized entries.
+    - transcribe_audio_sarvam_chunked: Transcribes a long recording as parallel chunks.
     - transcribe_audio_sarvam: Transcribes audio using the Sarvam API.
-    - s3_to_temp: Downloads a file from an S3 URL to a temporary file.
+    - aws_client: Returns a shared boto3 client, honouring endpoint overrides from the environment.
+    - probe_media_duration: Reads the duration of a media file in S3 without downloading it.
+    - parse_s3_url: Splits an S3 URL into bucket name and key.
+    - media_fingerprint: Fingerprints the content of a file in S3 for transcript deduplication.
+    - s3_object_size: Returns the size of a file in S3.
+    - s3_to_temp: Downloads a file from an S3 URL to a scratch file.
+    - transcribe_s3_sarvam_streaming: Transcribes media in S3 with the Sarvam API without touching disk.
+    - normalize_audio_file / normalize_s3_media: Convert media to speech-optimized 16 kHz mono audio.
     - transcribe_aws: Transcribes audio using AWS Transcribe.
 
 Classes:
@@ -20,36 +28,63 @@ Classes:
     - FileProcessing: Request model for file processing.
 """
 
+import io
 import os
 import time
+import uuid
+import shutil
+import hashlib
+import tempfile
 import requests
 import ffmpeg
+from functools import lru_cache
 from typing import Optional
-from datetime import datetime
 from dotenv import load_dotenv
 
-from PyPDF2 import PdfReader
-from docx import Document
-
 from pydantic import BaseModel
 from fastapi import HTTPException
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 
+from poller import TranscribePoller
+from transcript import Transcript
+from chunking import detect_silences, plan_chunks, split_chunk, transcribe_chunks, stitch_entries
+from streaming import stream_s3_object, decode_to_pcm, pcm_chunks, IterableReader
+from extraction import iter_pdf_pages, iter_docx_blocks
+from normalize import CODECS, NormalizationReport, audio_settings, trim_pcm_silence, encode_audio, encode_pcm_stream, normalization_stats
+
 load_dotenv()
 
+TRANSCRIBE_JOB_PREFIX = "transcription-job-"
+AUDIO_MIME_TYPES = {"mp3": "audio/mpeg", "wav": "audio/wav", "flac": "audio/flac", "ogg": "audio/ogg"}
+
+# Shared HTTP session so transcript downloads reuse pooled connections.
+http_session = requests.Session()
+
 class generateQuestions(BaseModel):
     """
     Request model for project ID.
     """
     num_q: int = 10
+    no_cache: bool = False
 
 class QuestionSingleRequestGrid(BaseModel):
     """
     Request model for generating answers in a grid format.
     """
     question: dict
+    no_cache: bool = False
+
+class QuestionGridRequest(BaseModel):
+    """
+    Request model for answering questions over many transcripts in a grid format.
+    """
+    question: dict
+    project_id: Optional[str] = None
+    transcript_ids: Optional[list[str]] = None
+    no_cache: bool = False
 
 class ChatRequest(BaseModel):
     """
@@ -66,33 +101,18 @@ class transcribeCall(BaseModel):
     transcribe_method: str = 'aws'
     transcribe_lang: str = None
     transcribe_speaker_number: int = 2
+    callback_url: Optional[str] = None
 
 class s3Upload(BaseModel):
     bot_url: str
     s3_file_path: str  
 
-def cleanup_cache(CHAT_SESSION_CACHE_DICT, CHAT_TRANSCRIPT_CACHE_DICT):
-    """
-    Periodically cleans up expired cache entries for chat sessions and transcripts.
-
-    Args:
-        CHAT_SESSION_CACHE_DICT (dict): Dictionary containing chat session cache.
-        CHAT_TRANSCRIPT_CACHE_DICT (dict): Dictionary containing chat transcript cache.
-    """
-    while True:
-        now = datetime.utcnow()
-        expired_sessions = [key for key, session in CHAT_SESSION_CACHE_DICT.items() if session["delete_time"] < now]
-        for session_id in expired_sessions:
-            del CHAT_SESSION_CACHE_DICT[session_id]
-        expired_transcripts = [key for key, transcript in CHAT_TRANSCRIPT_CACHE_DICT.items() if transcript["delete_time"] < now]
-        for transcript_id in expired_transcripts:
-            del CHAT_TRANSCRIPT_CACHE_DICT[transcript_id]
-        time.sleep(int(os.getenv('CACHE_TIMER')))
-
 def extract_text_from_pdf(file_path):
     """
     Extracts text from a PDF file.
 
+    Pages are read with PyMuPDF; large documents are split across the shared extraction process pool.
+
     Args:
         file_path (str): Path to the PDF file.
 
@@ -103,9 +123,11 @@ def extract_text_from_pdf(file_path):
         HTTPException: If there is an error extracting text from the PDF.
     """
     try:
-        pdf_reader = PdfReader(file_path)
-        text = "".join([page.extract_text() for page in pdf_reader.pages])
-        return text.strip()
+        text = io.StringIO()
+        for page_text in iter_pdf_pages(file_path):
+            text.write(page_text)
+            text.write("\n")
+        return text.getvalue().strip()
     except Exception as e:
         raise HTTPException(status_code=300, detail=f"Failed to extract text from PDF: {str(e)}")
     finally:
@@ -114,7 +136,7 @@ def extract_text_from_pdf(file_path):
 
 def extract_text_from_docx(file_path):
     """
-    Extracts text from a DOCX file.
+    Extracts text from a DOCX file, including the rows of its tables.
 
     Args:
         file_path (str): Path to the DOCX file.
@@ -126,8 +148,7 @@ def extract_text_from_docx(file_path):
         HTTPException: If there is an error extracting text from the DOCX.
     """
     try:
-        document = Document(file_path)
-        return "\n".join([paragraph.text for paragraph in document.paragraphs]).strip()
+        return "\n".join(iter_docx_blocks(file_path)).strip()
     except Exception as e:
         raise HTTPException(status_code=301, detail=f"Failed to extract text from DOCX: {str(e)}")
     finally:
@@ -172,76 +193,175 @@ def extract_audio_from_video(video_path, output_audio_path):
     except ffmpeg.Error as e:
         raise HTTPException(status_code=303, detail=f"Failed to extract audio from video: {str(e)}")
 
+def normalize_audio_file(file_path, method, codec, trim):
+    """
+    Converts an audio or video file into speech-optimized 16 kHz mono audio next to it, and removes the input.
+
+    Args:
+        file_path (str): Path to the media file.
+        method (str): Transcription method the audio is meant for (used in the report).
+        codec (str): Target codec (one of ``CODECS``).
+        trim (float): Trim leading/trailing silences longer than this many seconds (0 = off).
+
+    Returns:
+        tuple: Path of the normalized file and the seconds of leading silence that were trimmed.
+    """
+    report = NormalizationReport(method, codec, os.path.basename(file_path), os.path.getsize(file_path))
+    output_path = f"{os.path.splitext(file_path)[0]}_normalized.{CODECS[codec]['ext']}"
+    try:
+        with open(output_path, "wb") as output:
+            for block in encode_pcm_stream(trim_pcm_silence(decode_to_pcm(file_path), report, trim), codec):
+                output.write(block)
+                report.output_bytes += len(block)
+    finally:
+        os.remove(file_path)
+    normalization_stats.record(report.finish())
+    return output_path, report.leading_trimmed
+
+def sarvam_request(file_path, media_format, language_code, audio=None):
+    """
+    Sends one audio file to the Sarvam API.
+
+    Args:
+        file_path (str): Path to the audio file, or just its file name when ``audio`` is given.
+        media_format (str): Format of the audio file (e.g., 'mp3', 'wav').
+        language_code (str): Language code for transcription.
+        audio (bytes, optional): In-memory audio to send instead of reading ``file_path``.
+
+    Returns:
+        list: The diarized transcript entries.
+
+    Raises:
+        HTTPException: If the API call fails or returns no diarized transcript.
+    """
+    with (io.BytesIO(audio) if audio is not None else open(file_path, "rb")) as file_file:
+        files = [("file", (os.path.basename(file_path), file_file, AUDIO_MIME_TYPES.get(media_format, "audio/wav")))]
+        payload = {
+            'model': 'saarika:v2',
+            'language_code': language_code,
+            'with_timesteps': 'true',
+            'with_diarization': 'true'
+        }
+        headers = {'api-subscription-key': os.getenv('SARVAM_API_KEY')}
+        response = http_session.post(os.getenv('SARVAM_API_URL'), headers=headers, data=payload, files=files)
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    result = response.json()
+    if not result.get('diarized_transcript'):
+        raise HTTPException(status_code=304, detail="Diarized transcript not found in the API response.")
+    return result['diarized_transcript']['entries']
+
+def shift_entries(entries, seconds):
+    """
+    Moves diarized entry timestamps by ``seconds`` (e.g. to undo trimmed leading silence).
+    """
+    if seconds:
+        for entry in entries:
+            entry["start_time_seconds"] = float(entry.get("start_time_seconds") or 0.0) + seconds
+            entry["end_time_seconds"] = float(entry.get("end_time_seconds") or 0.0) + seconds
+    return entries
+
+def transcribe_audio_sarvam_chunked(file_path, chunks, language_code, codec="wav"):
+    """
+    Transcribes a recording chunk by chunk with the Sarvam API.
+
+    Args:
+        file_path (str): Path to the audio file.
+        chunks (list): Chunks from ``plan_chunks``.
+        language_code (str): Language code for transcription.
+        codec (str, optional): Codec of the chunk files (one of ``CODECS``).
+
+    Returns:
+        list: Stitched diarized entries for the whole recording.
+    """
+    work_dir = tempfile.mkdtemp(prefix="sarvam_chunks_", dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        # Each worker cuts its own chunk right before sending it, so splitting runs in parallel too.
+        settings = CODECS[codec]
+        chunk_entries = transcribe_chunks(chunks, lambda chunk: sarvam_request(
+            chunk.path or split_chunk(file_path, chunk, work_dir, settings["ext"], settings["acodec"]), settings["ext"], language_code
+        ))
+        return stitch_entries(chunks, chunk_entries)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
 def transcribe_audio_sarvam(file_path, media_format, language_code):
     """
     Transcribes audio using the Sarvam API.
 
+    The audio is first normalized according to ``SARVAM_AUDIO_CODEC`` / ``SARVAM_TRIM_SILENCE``. Recordings
+    longer than about one and a half ``SARVAM_CHUNK_SECONDS`` are cut on silences and transcribed as parallel
+    chunks, unless ``SARVAM_CHUNKED`` is ``off``.
+
     Args:
         file_path (str): Path to the audio file.
         media_format (str): Format of the audio file (e.g., 'mp3', 'wav').
         language_code (str): Language code for transcription.
 
     Returns:
-        str: Transcribed text.
+        Transcript: Speaker turns with their times.
 
     Raises:
         HTTPException: If there is an error transcribing the audio.
     """
-    if media_format == 'mp4':
-        audio_path = f"extracted_audio_{int(time.time())}.mp3"
-        extract_audio_from_video(file_path, audio_path)
+    codec, trim = audio_settings('sarvam')
+    leading_trimmed = 0.0
+    if codec != 'original':
+        file_path, leading_trimmed = normalize_audio_file(file_path, 'sarvam', codec, trim)
+        media_format = CODECS[codec]["ext"]
+    elif media_format == 'mp4':
+        audio_path = f"{os.path.splitext(file_path)[0]}_audio.mp3"
+        try:
+            extract_audio_from_video(file_path, audio_path)
+        finally:
+            os.remove(file_path)
         file_path = audio_path
         media_format = 'mp3'
 
     try:
-        with open(file_path, "rb") as file_file:
-            files = [("file", (file_path, file_file, "audio/mpeg" if media_format == 'mp3' else "audio/wav"))]
-            payload = {
-                'model': 'saarika:v2',
-                'language_code': language_code,
-                'with_timesteps': 'true',
-                'with_diarization': 'true'
-            }
-            headers = {'api-subscription-key': os.getenv('SARVAM_API_KEY')}
-            response = requests.post(os.getenv('SARVAM_API_URL'), headers=headers, data=payload, files=files)
-
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('diarized_transcript'):
-                transcript = ""
-                for entry in result['diarized_transcript']['entries']:
-                    speaker = entry.get('speaker_id', 'Unknown Speaker')
-                    transcript += f"{speaker}: {entry.get('transcript')} \n"
-                return transcript
-            else:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                raise HTTPException(status_code=304, detail="Diarized transcript not found in the API response.")
-        else:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-        
+        if os.getenv('SARVAM_CHUNKED', 'auto') != 'off':
+            duration, silences = detect_silences(file_path)
+            chunks = plan_chunks(duration, silences)
+            if len(chunks) > 1:
+                entries = transcribe_audio_sarvam_chunked(file_path, chunks, language_code, codec if codec != 'original' else 'wav')
+                return Transcript.from_sarvam(shift_entries(entries, leading_trimmed))
+        return Transcript.from_sarvam(shift_entries(sarvam_request(file_path, media_format, language_code), leading_trimmed))
     except Exception as e:
-        raise HTTPException(status_code=305, detail=f"Failed to transcribe audio: {str(e)}")
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        raise HTTPException(status_code=305, detail=f"Failed to transcribe audio: {detail}")
     finally:
         if os.path.exists(file_path):
             os.remove(file_path)
 
-def s3_to_temp(url):
+@lru_cache(maxsize=None)
+def aws_client(service_name):
     """
-    Downloads a file from an S3 URL to a temporary file.
+    Returns a shared boto3 client for an AWS service.
+
+    boto3 clients are thread-safe, so one client (and its connection pool) is created per service and reused.
+    The endpoint can be redirected (e.g. to a local fake backend) with ``AWS_<SERVICE>_ENDPOINT_URL``,
+    for example ``AWS_TRANSCRIBE_ENDPOINT_URL``.
 
     Args:
-        url (str): S3 URL of the file.
+        service_name (str): boto3 service name, e.g. 's3' or 'transcribe'.
 
     Returns:
-        str: Path to the temporary file.
+        botocore.client.BaseClient: The client.
+    """
+    endpoint_url = os.getenv(f"AWS_{service_name.upper()}_ENDPOINT_URL")
+    config = Config(max_pool_connections=int(os.getenv('AWS_MAX_POOL_CONNECTIONS', 50)))
+    if endpoint_url and service_name == "s3":
+        config = config.merge(Config(s3={"addressing_style": "path"}))
+    return boto3.client(service_name, region_name=os.getenv('AWS_REGION', 'ap-south-1'), endpoint_url=endpoint_url, config=config)
+
+def parse_s3_url(url):
+    """
+    Splits an ``s3://bucket/key`` URL into bucket name and key.
 
     Raises:
-        HTTPException: If there is an error downloading the file from the S3 URL.
+        HTTPException: If the URL is not a valid S3 URL.
     """
-    # Parse the S3 URL
     if not url.startswith("s3://"):
         raise HTTPException(status_code=400, detail="Invalid S3 URL")
 
@@ -249,13 +369,73 @@ def s3_to_temp(url):
         bucket_name, key = url[5:].split('/', 1)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid S3 URL format")
+    return bucket_name, key
+
+def media_fingerprint(url, mode=None):
+    """
+    Fingerprints the content of a file in S3.
+
+    Args:
+        url (str): S3 URL of the file.
+        mode (str, optional): ``etag`` to use the object's ETag and size, or ``sha256`` to hash its bytes.
+            Defaults to ``TRANSCRIPT_DEDUP_HASH`` (``etag``).
+
+    Returns:
+        str: A fingerprint that is equal for files with equal content.
+
+    Raises:
+        HTTPException: If the object cannot be read.
+    """
+    mode = mode or os.getenv('TRANSCRIPT_DEDUP_HASH', 'etag')
+    bucket_name, key = parse_s3_url(url)
+    s3_client = aws_client('s3')
+    if mode == 'sha256':
+        digest = hashlib.sha256()
+        for block in stream_s3_object(s3_client, bucket_name, key):
+            digest.update(block)
+        return f"sha256:{digest.hexdigest()}"
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except (BotoCoreError, ClientError) as e:
+        raise HTTPException(status_code=600, detail=f"Error reading file from S3: {e}")
+    etag = head['ETag'].strip('"')
+    return f"etag:{etag}:{head['ContentLength']}"
+
+def s3_object_size(url):
+    """
+    Returns the size in bytes of a file in S3.
+
+    Raises:
+        HTTPException: If the object cannot be read.
+    """
+    bucket_name, key = parse_s3_url(url)
+    try:
+        return aws_client('s3').head_object(Bucket=bucket_name, Key=key)['ContentLength']
+    except (BotoCoreError, ClientError) as e:
+        raise HTTPException(status_code=600, detail=f"Error reading file from S3: {e}")
+
+def s3_to_temp(url, scratch):
+    """
+    Downloads a file from an S3 URL to a scratch file.
+
+    Args:
+        url (str): S3 URL of the file.
+        scratch (ScratchSession): Session the file is created in; space for it must already be reserved.
+
+    Returns:
+        str: Path to the temporary file.
+
+    Raises:
+        HTTPException: If there is an error downloading the file from the S3 URL.
+    """
+    bucket_name, key = parse_s3_url(url)
 
     # Extract the file extension for the temporary file
     file_extension = os.path.splitext(key)[1]
-    temp_file_path = f"temp_from_url{file_extension}"
+    temp_file_path = scratch.path(f"source{file_extension}")
 
     # Initialize the S3 client
-    s3_client = boto3.client('s3')
+    s3_client = aws_client('s3')
 
     try:
         # Download the file from S3
@@ -266,11 +446,108 @@ def s3_to_temp(url):
 
     return temp_file_path
 
+def transcribe_s3_sarvam_streaming(url, media_format, language_code):
+    """
+    Transcribes media in S3 with the Sarvam API without writing it to disk.
+
+    The object is streamed through ffmpeg into 16 kHz mono PCM, cut into chunks near silences and each chunk
+    is sent as an in-memory WAV file while the rest of the recording is still being read.
+
+    Args:
+        url (str): S3 URL of the media file.
+        media_format (str): Format of the media file (e.g., 'mp3', 'wav', 'mp4').
+        language_code (str): Language code for transcription.
+
+    Returns:
+        Transcript: Speaker turns with their times.
 
-def transcribe_aws(file_url: str, media_format: str, language_code: str = None, max_speakers: int = 2) -> str:
+    Raises:
+        HTTPException: If there is an error reading or transcribing the media.
+    """
+    bucket_name, key = parse_s3_url(url)
+    s3_client = aws_client('s3')
+    if media_format == 'mp4':
+        source = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=3600)
+    else:
+        source = stream_s3_object(s3_client, bucket_name, key)
+
+    codec, trim = audio_settings('sarvam')
+    report = NormalizationReport('sarvam', codec, url, s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength'])
+    extension = CODECS.get(codec, CODECS["wav"])["ext"]
+
+    chunks = []
+    def produce():
+        for chunk in pcm_chunks(trim_pcm_silence(decode_to_pcm(source), report, trim)):
+            chunk.data = encode_audio(chunk.data, codec)
+            report.output_bytes += len(chunk.data)
+            chunks.append(chunk)
+            yield chunk
+
+    try:
+        chunk_entries = transcribe_chunks(produce(), lambda chunk: sarvam_request(f"chunk_{chunk.index:04d}.{extension}", extension, language_code, audio=chunk.data))
+        entries = shift_entries(stitch_entries(chunks, chunk_entries), report.leading_trimmed)
+        normalization_stats.record(report.finish())
+        return Transcript.from_sarvam(entries)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        raise HTTPException(status_code=305, detail=f"Failed to transcribe audio: {detail}")
+
+def normalize_s3_media(url, method, codec, trim):
+    """
+    Writes a speech-optimized 16 kHz mono copy of media in S3 next to it, streaming through ffmpeg.
+
+    Args:
+        url (str): S3 URL of the media file.
+        method (str): Transcription method the audio is meant for (used in the report).
+        codec (str): Target codec (one of ``CODECS``).
+        trim (float): Trim leading/trailing silences longer than this many seconds (0 = off).
+
+    Returns:
+        tuple: S3 URL of the normalized copy and its ``NormalizationReport``.
+    """
+    bucket_name, key = parse_s3_url(url)
+    s3_client = aws_client('s3')
+    report = NormalizationReport(method, codec, url, s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength'])
+    source = s3_client.generate_presigned_url('get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=3600)
+    normalized_key = f"normalized/{os.path.splitext(key)[0]}-{uuid.uuid4().hex[:8]}.{CODECS[codec]['ext']}"
+
+    def count(size):
+        report.output_bytes += size
+
+    encoded = encode_pcm_stream(trim_pcm_silence(decode_to_pcm(source), report, trim), codec)
+    s3_client.upload_fileobj(IterableReader(encoded, count), bucket_name, normalized_key)
+    normalization_stats.record(report.finish())
+    return f"s3://{bucket_name}/{normalized_key}", report
+
+transcribe_poller = TranscribePoller(lambda: aws_client('transcribe'), TRANSCRIBE_JOB_PREFIX)
+
+def probe_media_duration(url):
+    """
+    Reads the duration of a media file in S3 without downloading it.
+
+    ffprobe only fetches the container headers through a presigned URL.
+
+    Args:
+        url (str): S3 URL of the media file.
+
+    Returns:
+        float | None: Duration in seconds, or None if it cannot be determined.
+    """
+    try:
+        bucket_name, key = parse_s3_url(url)
+        presigned_url = aws_client('s3').generate_presigned_url('get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=300)
+        return float(ffmpeg.probe(presigned_url)['format']['duration'])
+    except Exception:
+        return None
+
+def transcribe_aws(file_url: str, media_format: str, language_code: str = None, max_speakers: int = 2) -> Transcript:
     """
     Transcribes audio using AWS Transcribe with speaker diarization.
 
+    When ``AWS_AUDIO_CODEC`` is not ``original``, a normalized copy of the media is transcribed instead and
+    removed afterwards. The job is tracked by the shared ``transcribe_poller``; this call blocks until the
+    poller reports the job as finished.
+
     Args:
         file_url (str): URL of the audio file.
         media_format (str): Format of the audio file (e.g., 'mp3', 'wav').
@@ -278,14 +555,25 @@ def transcribe_aws(file_url: str, media_format: str, language_code: str = None,
         max_speakers (int, optional): Maximum number of speakers to identify.
 
     Returns:
-        str: Transcribed text with speaker diarization.
+        Transcript: Speaker turns with their times.
 
     Raises:
         HTTPException: If there is an error during the transcription process.
     """
 
-    transcribe_client = boto3.client('transcribe', region_name=os.getenv('AWS_REGION', 'ap-south-1'))
-    job_name = f"transcription-job-{int(time.time())}"
+    transcribe_client = aws_client('transcribe')
+    job_name = f"{TRANSCRIBE_JOB_PREFIX}{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+    codec, trim = audio_settings('aws')
+    normalized_url = None
+    if codec != 'original':
+        try:
+            normalized_url, report = normalize_s3_media(file_url, 'aws', codec, trim)
+        except Exception as e:
+            raise HTTPException(status_code=603, detail=f"HTTP error occurred: {e}")
+        file_url, media_format, media_duration = normalized_url, CODECS[codec]["format"], report.output_seconds
+    else:
+        media_duration = probe_media_duration(file_url)
 
     transcription_job_params = {
         'TranscriptionJobName': job_name,
@@ -308,29 +596,26 @@ def transcribe_aws(file_url: str, media_format: str, language_code: str = None,
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
             raise HTTPException(status_code=601, detail=f"Failed to start transcription job. HTTP Status: {response['ResponseMetadata']['HTTPStatusCode']}")
 
-        while True:
-            status_response = transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
-            status = status_response['TranscriptionJob']['TranscriptionJobStatus']
+        job = transcribe_poller.watch(job_name, media_duration)
+        try:
+            status_response = job.result(timeout=int(os.getenv('AWS_TRANSCRIBE_TIMEOUT', 4 * 60 * 60)))
+        finally:
+            transcribe_poller.forget(job_name)
 
-            if status == 'COMPLETED':
-                transcript_url = status_response['TranscriptionJob']['Transcript']['TranscriptFileUri']
-                transcript_response = requests.get(transcript_url)
-                transcript_response.raise_for_status()
-                transcript_json = transcript_response.json()
+        if status_response['TranscriptionJobStatus'] == 'FAILED':
+            raise HTTPException(status_code=602, detail="Transcription job failed.")
 
-                transcript_text = ""
-                for item in transcript_json['results']['audio_segments']:
-                    if 'speaker_label' in item:
-                        speaker = item['speaker_label']
-                        transcript = item['transcript']
-                        transcript_text += f"{speaker}: {transcript}\n"
-                return transcript_text
+        transcript_url = status_response['Transcript']['TranscriptFileUri']
+        transcript_response = http_session.get(transcript_url)
+        transcript_response.raise_for_status()
+        transcript_json = transcript_response.json()
 
-            elif status == 'FAILED':
-                raise HTTPException(status_code=602, detail="Transcription job failed.")
-
-            time.sleep(10)
+        return Transcript.from_aws(transcript_json['results']['audio_segments'])
 
     except Exception as e:
         print(e)
         raise HTTPException(status_code=603, detail=f"HTTP error occurred: {e}")
+    finally:
+        if normalized_url:
+            bucket_name, key = parse_s3_url(normalized_url)
+            aws_client('s3').delete_object(Bucket=bucket_name, Key=key)